@@ -0,0 +1,237 @@
+"""
+Controle de admissão e descarte de carga na frente do pipeline do agente
+
+Cada etapa (a requisição inteira e as etapas intent, sql, execute e answer) tem
+um limite de concorrência adaptativo e uma fila limitada. O limite segue o
+gradiente da latência: enquanto a latência observada fica perto da latência de
+referência (sem carga), o limite cresce; quando ela sobe (o Gemini ficou lento e
+as requisições começam a se acumular), o limite encolhe na proporção, e cai
+multiplicativamente quando a etapa estoura o prazo ou uma dependência falha.
+Requisições além do limite esperam na fila por pouco tempo; com a fila cheia ou
+a espera esgotada, são recusadas com `Overloaded`, que o agente trata como uma
+dependência indisponível (resposta em cache, só o SQL ou recusa imediata).
+"""
+
+import logging
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, Optional
+
+from config import ADMISSION_CONFIG
+from deadline import DependencyUnavailable
+
+logger = logging.getLogger("admission_control")
+
+
+class Overloaded(DependencyUnavailable):
+    """Requisição recusada pelo controle de admissão (fila cheia ou espera esgotada)"""
+
+    def __init__(self, stage: str, reason: str):
+        super().__init__(f"Serviço sobrecarregado na etapa '{stage}': {reason}")
+        self.stage = stage
+        self.reason = reason
+
+
+class AdaptiveLimiter:
+    """
+    Limite de concorrência por gradiente de latência, com fila FIFO limitada
+
+    A cada conclusão: gradiente = tolerância x latência de referência / latência
+    observada (entre 0,5 e 1), novo limite = limite x gradiente + folga (raiz do
+    limite), suavizado. Falhas por prazo ou dependência reduzem o limite pelo
+    fator `backoff_ratio` (AIMD).
+    """
+
+    def __init__(self, name: str, config: Dict[str, Any] = None, clock=time.monotonic):
+        """
+        Args:
+            name: Etapa controlada
+            config: Configuração da etapa (padrão: ADMISSION_CONFIG)
+            clock: Relógio monotônico (substituível nos testes)
+        """
+        config = config or ADMISSION_CONFIG
+        self.name = name
+        self.clock = clock
+        self.min_limit = config.get("min_limit", 1)
+        self.max_limit = config.get("max_limit", 64)
+        self.limit = float(min(self.max_limit, max(self.min_limit, config.get("initial_limit", 8))))
+        self.max_queue = config.get("max_queue", 16)
+        self.max_queue_wait = config.get("max_queue_wait_seconds", 2.0)
+        self.tolerance = config.get("tolerance", 1.5)
+        self.smoothing = config.get("smoothing", 0.2)
+        self.backoff_ratio = config.get("backoff_ratio", 0.9)
+        # Janela (em amostras) da média longa que serve de latência de referência
+        self.baseline_window = config.get("baseline_window", 100)
+
+        self._cond = threading.Condition()
+        self._waiting: deque = deque()
+        self.inflight = 0
+        self.baseline: Optional[float] = None
+        self.latency: Optional[float] = None
+        self._metrics = {
+            "admitted": 0,
+            "rejected": 0,
+            "timed_out": 0,
+            "dropped": 0,
+            "queue_wait_total": 0.0,
+            "queue_wait_max": 0.0,
+            "queued": 0,
+            "dequeued": 0
+        }
+
+    def acquire(self, timeout: float = None) -> None:
+        """
+        Obtém uma vaga na etapa, esperando na fila no máximo `max_queue_wait` (ou `timeout`)
+
+        Raises:
+            Overloaded: Fila cheia ou espera esgotada
+        """
+        with self._cond:
+            if not self._waiting and self.inflight < int(self.limit):
+                self.inflight += 1
+                self._metrics["admitted"] += 1
+                return
+            if len(self._waiting) >= self.max_queue:
+                self._metrics["rejected"] += 1
+                raise Overloaded(self.name, f"fila cheia ({len(self._waiting)} aguardando, limite "
+                                            f"{int(self.limit)} em execução)")
+            wait = self.max_queue_wait if timeout is None else min(timeout, self.max_queue_wait)
+            ticket = object()
+            enqueued = self.clock()
+            self._waiting.append(ticket)
+            self._metrics["queued"] += 1
+            try:
+                while self._waiting[0] is not ticket or self.inflight >= int(self.limit):
+                    left = enqueued + wait - self.clock()
+                    if left <= 0:
+                        self._metrics["timed_out"] += 1
+                        raise Overloaded(self.name, f"espera na fila acima de {wait:.2f}s")
+                    self._cond.wait(left)
+            finally:
+                self._waiting.remove(ticket)
+                self._cond.notify_all()
+            waited = self.clock() - enqueued
+            self.inflight += 1
+            self._metrics["admitted"] += 1
+            self._metrics["dequeued"] += 1
+            self._metrics["queue_wait_total"] += waited
+            self._metrics["queue_wait_max"] = max(self._metrics["queue_wait_max"], waited)
+
+    def release(self, latency: float, dropped: bool = False) -> None:
+        """
+        Libera a vaga e ajusta o limite pela latência da execução
+
+        Args:
+            latency: Duração da etapa em segundos (sem a espera na fila)
+            dropped: A etapa estourou o prazo ou a dependência falhou
+        """
+        with self._cond:
+            saturated = self.inflight >= int(self.limit) // 2
+            self.inflight = max(0, self.inflight - 1)
+            if dropped:
+                self._metrics["dropped"] += 1
+                self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+                logger.info("Limite da etapa %s reduzido para %.1f após descarte", self.name, self.limit)
+            else:
+                self._update_limit(latency, saturated)
+            self._cond.notify_all()
+
+    def _update_limit(self, latency: float, saturated: bool) -> None:
+        self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+        if self.baseline is None or latency < self.baseline:
+            # Referência cai de imediato e sobe devagar (média longa)
+            self.baseline = latency
+        else:
+            self.baseline += (latency - self.baseline) / self.baseline_window
+        if latency <= 0:
+            return
+        gradient = max(0.5, min(1.0, self.tolerance * self.baseline / latency))
+        # Sem usar nem metade das vagas, não há sinal para crescer (só para encolher)
+        headroom = math.sqrt(self.limit) if saturated else 0.0
+        target = self.limit * gradient + headroom
+        if target < self.limit or saturated:
+            limit = (1 - self.smoothing) * self.limit + self.smoothing * target
+            self.limit = max(self.min_limit, min(self.max_limit, limit))
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._cond:
+            waited = self._metrics["dequeued"]
+            return {
+                "limit": int(self.limit),
+                "inflight": self.inflight,
+                "queue_depth": len(self._waiting),
+                "max_queue": self.max_queue,
+                "queued": self._metrics["queued"],
+                "admitted": self._metrics["admitted"],
+                "rejected": self._metrics["rejected"],
+                "timed_out": self._metrics["timed_out"],
+                "dropped": self._metrics["dropped"],
+                "queue_wait_avg": self._metrics["queue_wait_total"] / waited if waited else 0.0,
+                "queue_wait_max": self._metrics["queue_wait_max"],
+                "latency": self.latency,
+                "baseline_latency": self.baseline
+            }
+
+
+class AdmissionController:
+    """Limitadores adaptativos da requisição e de cada etapa do pipeline"""
+
+    def __init__(self, config: Dict[str, Any] = None, clock=time.monotonic):
+        """
+        Args:
+            config: Configuração (padrão: ADMISSION_CONFIG); `stages` sobrepõe os
+                parâmetros de cada etapa, ex.: {"execute": {"max_limit": 32}}
+            clock: Relógio monotônico (substituível nos testes)
+        """
+        self.config = config or ADMISSION_CONFIG
+        self.clock = clock
+        overrides = self.config.get("stages", {})
+        self.limiters = {
+            stage: AdaptiveLimiter(stage, dict(self.config, **overrides.get(stage, {})), clock)
+            for stage in ("request", "intent", "sql", "execute", "answer")
+        }
+
+    def acquire(self, stage: str, timeout: float = None) -> float:
+        """
+        Obtém uma vaga da etapa
+
+        Returns:
+            Instante da admissão, a ser informado em `release`
+
+        Raises:
+            Overloaded: Sem vaga dentro da espera permitida
+        """
+        self.limiters[stage].acquire(timeout)
+        return self.clock()
+
+    def release(self, stage: str, admitted_at: float, dropped: bool = False) -> None:
+        """Libera a vaga, informando a latência desde a admissão e se houve descarte"""
+        self.limiters[stage].release(self.clock() - admitted_at, dropped)
+
+    @contextmanager
+    def admit(self, stage: str, timeout: float = None) -> Iterator[None]:
+        """
+        Executa o bloco com uma vaga da etapa
+
+        Prazos esgotados e dependências indisponíveis dentro do bloco contam como
+        descarte (redução multiplicativa do limite); as exceções seguem adiante.
+
+        Raises:
+            Overloaded: Sem vaga dentro da espera permitida
+        """
+        admitted_at = self.acquire(stage, timeout)
+        dropped = False
+        try:
+            yield
+        except DependencyUnavailable:
+            dropped = True
+            raise
+        finally:
+            self.release(stage, admitted_at, dropped)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Limite, vagas em uso, profundidade da fila e recusas por etapa"""
+        return {stage: limiter.get_stats() for stage, limiter in self.limiters.items()}
@@ -3,13 +3,15 @@ Módulo de análise de intenção para o Agente de Inteligência
 """
 
 import json
-import re
 import logging
 from typing import Dict, Any, Tuple
 
-from google import genai
-from google.genai import types
-from config import NLP_CONFIG, GEMINI_CONFIG
+from llm_client import LLMClient
+from log_pipeline import log_payload
+from json_stream import consume_json_object
+from llm_scheduler import LLMRequestError, PRIORITY_INTERACTIVE
+from model_router import estimate_complexity
+from deadline import DependencyUnavailable
 
 logger = logging.getLogger("agent_analyzer")
 
@@ -17,70 +19,49 @@ class IntentAnalyzer:
     def __init__(self, agent_config: Dict[str, Any]):
         self.model_name = agent_config["model_name"]
         self.db_schema = agent_config["db_schema"]
+        # Serializado uma vez (no modo prefork, já vem pronto do processo pai)
+        self.schema_json = agent_config.get("schema_json") or json.dumps(self.db_schema, ensure_ascii=False)
+        self.llm_client = LLMClient()
     
-    def analyze_intent(self, query: str) -> Tuple[str, Dict[str, Any]]:
-        return self._analyze_with_gemini(query)
+    def analyze_intent(self, query: str, priority: int = PRIORITY_INTERACTIVE,
+                       timeout: float = None) -> Tuple[str, Dict[str, Any]]:
+        return self._analyze_with_gemini(query, priority, timeout)
     
-    def _analyze_with_gemini(self, query: str) -> Tuple[str, Dict[str, Any]]:
+    def _analyze_with_gemini(self, query: str, priority: int = PRIORITY_INTERACTIVE,
+                             timeout: float = None) -> Tuple[str, Dict[str, Any]]:
         system_message = (
             "Você é um assistente especializado em analisar consultas e identificar a intenção do usuário. "
             "Para cada consulta, determine:\n"
             "1. O tipo de operação (consulta, inserção, atualização)\n"
             "2. As entidades mencionadas (tabelas, campos)\n"
             "3. Os filtros ou condições mencionados\n"
-            "4. Retorne sempre um JSON com type (sql ou api), entities, conditions e fields.\n\n"
+            "4. Retorne sempre um JSON com type (sql ou api), entities, conditions, fields (campos a exibir), "
+            "aggregation (count quando a pergunta pede uma contagem, senão null), group_by "
+            "(campos ou períodos de agrupamento da contagem, ex.: [\"mes\"]) e sub_queries "
+            "(quando a consulta reúne perguntas independentes, como \"quantos ativos e quantos inativos "
+            "hoje\", a lista dessas perguntas escritas por completo; senão, null).\n\n"
         )
         
-        context = f"Esquema do banco: {json.dumps(self.db_schema, ensure_ascii=False)}"
+        # Esquema como contexto estático (prefixo do cache de contexto); só a consulta varia
+        context = f"Esquema do banco: {self.schema_json}\n\n"
         
-        prompt = f"{context}\n\nConsulta: {query}"
+        prompt = f"Consulta: {query}"
         
-        print(prompt)
+        log_payload(logger, "Prompt de análise de intenção", prompt)
+        complexity = estimate_complexity(query, self.db_schema)
 
         try:
-            client = genai.Client(
-                api_key="",
-            )
-            
-            content = [
-                types.Content(
-                    role="user",
-                    parts=[types.Part.from_text(text=prompt)]
-                )
-            ]
-            
-            generate_config = types.GenerateContentConfig(
-                temperature=NLP_CONFIG["temperature"],
-                top_p=NLP_CONFIG["top_p"],
-                top_k=NLP_CONFIG["top_k"],
-                max_output_tokens=NLP_CONFIG["max_tokens"],
-                response_mime_type=GEMINI_CONFIG["response_mime_type"],
-                system_instruction=[
-                    types.Part.from_text(text=system_message)
-                ]
-            )
-            
-            response_text = ""
-            for chunk in client.models.generate_content_stream(
-                model="gemini-2.0-flash",
-                contents=content,
-                config=generate_config,
-            ):
-                if chunk.text:
-                    response_text += chunk.text
-
-            try:
-                intent_data = json.loads(response_text)
-            except json.JSONDecodeError:
-                match = re.search(r'({.*})', response_text, re.DOTALL)
-                if match:
-                    intent_data = json.loads(match.group(1))
-                else:
-                    raise Exception("Falha ao extrair JSON da resposta")
+            # O stream é encerrado assim que o objeto JSON de nível superior fecha
+            intent_data = self.llm_client.generate("intent", system_message, prompt, priority=priority,
+                                                   consume=consume_json_object, complexity=complexity["level"],
+                                                   timeout=timeout, static_context=context)
 
             query_type = intent_data.get("type", "sql")
 
-            print(f"Intenção analisada: {json.dumps(intent_data, ensure_ascii=False, indent=2)}")
+            log_payload(logger, "Intenção analisada", intent_data)
             return query_type, intent_data
+        except (LLMRequestError, DependencyUnavailable):
+            raise
         except Exception as e:
-            print(f"Erro ao analisar intenção com Gemini: {str(e)}")
\ No newline at end of file
+            logger.error("Erro ao analisar intenção com Gemini: %s", e)
+            raise LLMRequestError("intent", str(e)) from e
@@ -140,6 +140,12 @@ class AgentInitializer:
                         reg_data = json.load(file)
                         regulations.update(reg_data)
                     logger.info(f"Regulamento carregado de {file_path}")
+                elif filename.endswith('.txt'):
+                    # Documentos em texto livre ficam disponíveis pelo nome do arquivo
+                    file_path = os.path.join(regulations_path, filename)
+                    with open(file_path, 'r', encoding='utf-8') as file:
+                        regulations[os.path.splitext(filename)[0]] = file.read()
+                    logger.info(f"Regulamento carregado de {file_path}")
         except Exception as e:
             logger.error(f"Erro ao carregar regulamentos: {str(e)}")
         
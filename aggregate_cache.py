@@ -0,0 +1,450 @@
+"""
+Agregados locais de Cadastro (por Ativo e por dia de inclusão), mantidos de forma incremental
+
+Contagens e quebras frequentes ("quantos ativos", "cadastros de hoje", "por mês")
+são respondidas a partir de contadores em memória em vez de irem ao SQL Server.
+A atualização lê apenas as linhas alteradas desde a última marca d'água de
+DataAlteracao/DataInclusao.
+"""
+
+import calendar
+import datetime
+import logging
+import math
+import operator
+import re
+import threading
+import time
+from collections import Counter
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+from config import AGGREGATE_CONFIG
+from result_serializer import encode_value
+from sql_templates import render_sql
+
+logger = logging.getLogger("aggregate_cache")
+
+_FULL_SQL = "SELECT CadastroId, Ativo, DataInclusao, DataAlteracao FROM Cadastro WITH (NOLOCK)"
+_INCREMENTAL_SQL = _FULL_SQL + " WHERE DataAlteracao >= ? OR DataInclusao >= ?"
+
+_QUERY = re.compile(
+    r"^SELECT (?:TOP \(?(?P<top>\d+)\)? )?(?P<items>.+?) FROM (?:dbo\.)?Cadastro"
+    r"(?: (?:AS )?(?!(?:WHERE|GROUP|ORDER)\b)(?P<alias>\w+))?"
+    r"(?: WHERE (?P<where>.+?))?(?: GROUP BY (?P<group>.+?))?(?: ORDER BY (?P<order>.+?))?$",
+    re.IGNORECASE
+)
+_ITEM = re.compile(r"^(?P<expr>.+?)(?:\s+(?:AS\s+)?(?P<alias>\w+|'[^']*'))?$", re.IGNORECASE)
+_COUNT = re.compile(r"^count(?:_big)?\((?:\*|1|cadastroid)\)$")
+_COMPARISON = re.compile(r"^(?P<left>.+?)\s*(?P<op><>|!=|>=|<=|=|<|>)\s*(?P<right>.+)$")
+_BETWEEN = re.compile(r"^(?P<left>.+?)\s+BETWEEN\s+(?P<low>.+?)\s+AND\s+(?P<high>.+)$", re.IGNORECASE)
+_AND = re.compile(r"\s+AND\s+", re.IGNORECASE)
+_ORDER_ITEM = re.compile(r"^(?P<expr>.+?)(?:\s+(?P<direction>ASC|DESC))?$", re.IGNORECASE)
+
+_NOW = r"(?:getdate\(\)|sysdatetime\(\)|current_timestamp)"
+_DATE_LITERAL = re.compile(r"^n?'(\d{4})-?(\d{2})-?(\d{2})(?:t?00:00(?::00(?:\.0+)?)?)?'$")
+_TODAY = re.compile(rf"^(?:cast\({_NOW}asdate\)|convert\(date,{_NOW}\))$")
+_SHIFTED_TODAY = re.compile(
+    rf"^(?:cast\(dateadd\((?P<u1>\w+),(?P<n1>[-+]?\d+),{_NOW}\)asdate\)"
+    rf"|convert\(date,dateadd\((?P<u2>\w+),(?P<n2>[-+]?\d+),{_NOW}\)\)"
+    rf"|dateadd\((?P<u3>\w+),(?P<n3>[-+]?\d+),(?:cast\({_NOW}asdate\)|convert\(date,{_NOW}\))\))$"
+)
+_DATEFROMPARTS = re.compile(r"^datefromparts\((\d{4}),(\d{1,2}),(\d{1,2})\)$")
+
+# Expressões de agrupamento/filtro suportadas, já normalizadas (minúsculas, sem espaços)
+_KEYS = {
+    "ativo": "ativo",
+    "cast(datainclusaoasdate)": "day", "convert(date,datainclusao)": "day",
+    "year(datainclusao)": "year", "month(datainclusao)": "month", "day(datainclusao)": "day_of_month",
+}
+_KEYS.update({f"datepart({part},datainclusao)": key for part, key in (
+    ("year", "year"), ("yy", "year"), ("yyyy", "year"), ("month", "month"), ("mm", "month"), ("m", "month"),
+    ("day", "day_of_month"), ("dd", "day_of_month"), ("d", "day_of_month"))})
+
+_KEY_VALUES: Dict[str, Callable[[bool, datetime.date], Any]] = {
+    "ativo": lambda ativo, day: ativo,
+    "day": lambda ativo, day: day,
+    "year": lambda ativo, day: day.year,
+    "month": lambda ativo, day: day.month,
+    "day_of_month": lambda ativo, day: day.day,
+}
+
+_OPERATORS = {
+    "=": operator.eq, "<>": operator.ne, "!=": operator.ne,
+    ">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le
+}
+_UNITS = {"day": "day", "dd": "day", "d": "day", "week": "week", "wk": "week", "ww": "week",
+          "month": "month", "mm": "month", "m": "month", "year": "year", "yy": "year", "yyyy": "year"}
+
+
+def _normalize_sql(sql: str) -> str:
+    sql = re.sub(r"\bWITH\s*\(\s*NOLOCK\s*\)", " ", sql.strip().rstrip(";"), flags=re.IGNORECASE)
+    sql = re.sub(r"\[(\w+)\]", r"\1", sql)
+    return re.sub(r"\s+", " ", sql).strip()
+
+
+def _compact(expr: str, alias: Optional[str]) -> str:
+    expr = re.sub(r"\s+", "", expr).lower()
+    if alias:
+        expr = re.sub(rf"\b{alias.lower()}\.", "", expr)
+    return expr
+
+
+def _split_top_level(text: str, separator: "re.Pattern") -> List[str]:
+    """Divide o texto pelo separador apenas fora de parênteses e literais"""
+    parts, depth, quoted, start, position = [], 0, False, 0, 0
+    while position < len(text):
+        char = text[position]
+        if char == "'":
+            quoted = not quoted
+        elif not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+        elif not quoted and depth == 0:
+            match = separator.match(text, position)
+            if match:
+                parts.append(text[start:position])
+                start = position = match.end()
+                continue
+        position += 1
+    parts.append(text[start:])
+    return [part.strip() for part in parts]
+
+
+def _conditions(where: str) -> List[str]:
+    # "x BETWEEN a AND b" é dividido em dois pedaços pelo AND; junta de volta
+    conditions: List[str] = []
+    for part in _split_top_level(where, _AND):
+        if conditions and re.search(r"\bBETWEEN\b", conditions[-1], re.IGNORECASE) \
+                and not _AND.search(conditions[-1]):
+            conditions[-1] = f"{conditions[-1]} AND {part}"
+        else:
+            conditions.append(part)
+    return conditions
+
+
+def _shift(day: datetime.date, unit: str, amount: int) -> datetime.date:
+    """DATEADD sobre uma data (meses e anos ajustados ao último dia do mês, como no SQL Server)"""
+    if unit == "day":
+        return day + datetime.timedelta(days=amount)
+    if unit == "week":
+        return day + datetime.timedelta(weeks=amount)
+    months = amount if unit == "month" else amount * 12
+    index = day.year * 12 + day.month - 1 + months
+    year, month = divmod(index, 12)
+    return datetime.date(year, month + 1, min(day.day, calendar.monthrange(year, month + 1)[1]))
+
+
+class _Unsupported(Exception):
+    """A consulta não pode ser respondida pelos agregados locais"""
+
+
+class AggregatePlan:
+    """
+    Consulta de contagem sobre Cadastro traduzida para os agregados locais
+
+    Cada balde dos agregados é um par (Ativo, dia de inclusão); filtros e
+    agrupamentos suportados são funções desse par.
+    """
+
+    def __init__(self, sql: str, today: datetime.date):
+        match = _QUERY.match(_normalize_sql(sql))
+        if not match:
+            raise _Unsupported("formato")
+        self.today = today
+        self.alias = match.group("alias")
+        self.top = int(match.group("top")) if match.group("top") else None
+        self.columns: List[Tuple[str, Optional[str]]] = []  # (nome da coluna, chave ou None para COUNT)
+        for item in _split_top_level(match.group("items"), re.compile(",")):
+            self.columns.append(self._column(item))
+        self.predicates = [self._predicate(condition) for condition in _conditions(match.group("where"))] \
+            if match.group("where") else []
+        self.group_keys = [self._key(expr) for expr in _split_top_level(match.group("group"), re.compile(","))] \
+            if match.group("group") else []
+        selected_keys = [key for _, key in self.columns if key is not None]
+        if not any(key is None for _, key in self.columns) or not set(selected_keys) <= set(self.group_keys):
+            raise _Unsupported("colunas")
+        self.order = self._order(match.group("order")) if match.group("order") else []
+
+    def _column(self, item: str) -> Tuple[str, Optional[str]]:
+        match = _ITEM.match(item)
+        expr, alias = match.group("expr"), match.group("alias")
+        compact = _compact(expr, self.alias)
+        if _COUNT.match(compact):
+            return (alias or "").strip("'"), None
+        key = self._key(expr)
+        return (alias or expr.split(".")[-1] if key == "ativo" else alias or "").strip("'"), key
+
+    def _key(self, expr: str) -> str:
+        key = _KEYS.get(_compact(expr, self.alias))
+        if key is None:
+            raise _Unsupported(f"expressão {expr}")
+        return key
+
+    def _date(self, expr: str) -> datetime.date:
+        compact = _compact(expr, None)
+        match = _DATE_LITERAL.match(compact) or _DATEFROMPARTS.match(compact)
+        if match:
+            return datetime.date(*(int(part) for part in match.groups()))
+        if _TODAY.match(compact):
+            return self.today
+        match = _SHIFTED_TODAY.match(compact)
+        if match:
+            unit = _UNITS.get(match.group("u1") or match.group("u2") or match.group("u3"))
+            if unit is None:
+                raise _Unsupported(f"unidade {expr}")
+            return _shift(self.today, unit, int(match.group("n1") or match.group("n2") or match.group("n3")))
+        raise _Unsupported(f"data {expr}")
+
+    def _value(self, key: str, expr: str) -> Any:
+        if key == "day":
+            return self._date(expr)
+        compact = _compact(expr, None).strip("'")
+        if key == "ativo" and compact in ("true", "false"):
+            return compact == "true"
+        if not compact.isdigit():
+            raise _Unsupported(f"valor {expr}")
+        return bool(int(compact)) if key == "ativo" else int(compact)
+
+    def _predicate(self, condition: str) -> Callable[[bool, datetime.date], bool]:
+        between = _BETWEEN.match(condition)
+        if between:
+            key = self._key(between.group("left"))
+            low, high = self._value(key, between.group("low")), self._value(key, between.group("high"))
+            value_of = _KEY_VALUES[key]
+            return lambda ativo, day: low <= value_of(ativo, day) <= high
+        comparison = _COMPARISON.match(condition)
+        if not comparison:
+            raise _Unsupported(f"condição {condition}")
+        left, op = _compact(comparison.group("left"), self.alias), comparison.group("op")
+        if left == "datainclusao":
+            # Sobre o datetime completo, só limites à meia-noite coincidem com dias inteiros
+            if op not in (">=", "<"):
+                raise _Unsupported(f"condição {condition}")
+            key = "day"
+        else:
+            key = self._key(comparison.group("left"))
+        value, compare, value_of = self._value(key, comparison.group("right")), _OPERATORS[op], _KEY_VALUES[key]
+        return lambda ativo, day: compare(value_of(ativo, day), value)
+
+    def _order(self, order: str) -> List[Tuple[int, bool]]:
+        names = [name.lower() for name, _ in self.columns]
+        result = []
+        for item in _split_top_level(order, re.compile(",")):
+            match = _ORDER_ITEM.match(item)
+            expr, descending = match.group("expr"), (match.group("direction") or "").upper() == "DESC"
+            compact = _compact(expr, self.alias)
+            if compact.isdigit() and 0 < int(compact) <= len(self.columns):
+                index = int(compact) - 1
+            elif compact in names and compact:
+                index = names.index(compact)
+            else:
+                key = None if _COUNT.match(compact) else self._key(expr)
+                positions = [i for i, (_, column_key) in enumerate(self.columns) if column_key == key]
+                if not positions:
+                    raise _Unsupported(f"ordenação {item}")
+                index = positions[0]
+            result.append((index, descending))
+        return result
+
+    def evaluate(self, buckets: Counter) -> List[Dict[str, Any]]:
+        """Aplica filtros, agrupamento, ordenação e TOP sobre os baldes (Ativo, dia)"""
+        groups: Dict[Tuple[Any, ...], int] = {}
+        for (ativo, day), count in buckets.items():
+            if count and all(predicate(ativo, day) for predicate in self.predicates):
+                group = tuple(_KEY_VALUES[key](ativo, day) for key in self.group_keys)
+                groups[group] = groups.get(group, 0) + count
+        if not self.group_keys and not groups:
+            groups[()] = 0
+
+        rows = []
+        for group, count in groups.items():
+            values = dict(zip(self.group_keys, group))
+            rows.append([count if key is None else values[key] for _, key in self.columns])
+        for index, descending in reversed(self.order):
+            rows.sort(key=lambda row: row[index], reverse=descending)
+        if self.top is not None:
+            rows = rows[:self.top]
+        names = [name for name, _ in self.columns]
+        return [{name: encode_value(value) for name, value in zip(names, row)} for row in rows]
+
+
+class AggregateCache:
+    """
+    Contadores locais de Cadastro por (Ativo, dia de DataInclusao)
+
+    A primeira consulta reconhecida carrega a tabela inteira; as seguintes, se
+    os agregados tiverem mais de `max_staleness_seconds`, leem só as linhas com
+    DataAlteracao/DataInclusao a partir da marca d'água (menos uma margem), e o
+    estado guardado por CadastroId torna a releitura de uma linha idempotente.
+    Exclusões não aparecem na leitura incremental e só são refletidas na
+    recarga completa a cada `rebuild_seconds`.
+
+    As cargas completas rodam em uma thread de fundo, fora do caminho das
+    requisições: até a primeira terminar, as consultas vão ao banco; durante
+    uma recarga, os agregados atuais continuam respondendo.
+    """
+
+    def __init__(self, registry, database: str = None, config: Dict[str, Any] = None,
+                 today: Callable[[], datetime.date] = datetime.date.today):
+        self.config = config or AGGREGATE_CONFIG
+        self.registry = registry
+        self.database = database or registry.default
+        self.today = today
+        self.max_staleness = self.config.get("max_staleness_seconds", 30.0)
+        self.rebuild_seconds = self.config.get("rebuild_seconds", 3600.0)
+        self.overlap = datetime.timedelta(seconds=self.config.get("watermark_overlap_seconds", 60.0))
+        self.fetch_batch = self.config.get("fetch_batch", 5000)
+        self.build_timeout = self.config.get("build_timeout_seconds", 300.0)
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._rows: Dict[Any, Tuple[bool, datetime.date]] = {}
+        self._buckets: Counter = Counter()
+        self._watermark: Optional[datetime.datetime] = None
+        self._refreshed_at: Optional[float] = None
+        self._rebuilt_at: Optional[float] = None
+        self._building = False
+        self.stats = {"hits": 0, "misses": 0, "full_refreshes": 0, "incremental_refreshes": 0, "rows_read": 0}
+
+    def plan(self, sql: str, params: List[Any] = None) -> Optional[AggregatePlan]:
+        """Traduz a consulta para os agregados locais, ou None quando não for possível"""
+        try:
+            return AggregatePlan(render_sql(sql, params) if params else sql, self.today())
+        except _Unsupported:
+            return None
+
+    def answer(self, sql: str, params: List[Any] = None, timeout: float = None) -> Optional[List[Dict[str, Any]]]:
+        """
+        Responde a consulta a partir dos agregados locais
+
+        Args:
+            sql: Consulta SQL (parametrizada ou não)
+            params: Parâmetros da consulta
+            timeout: Orçamento da etapa em segundos para a leitura incremental
+
+        Returns:
+            Linhas no mesmo formato do executor, ou None para executar no banco
+        """
+        plan = self.plan(sql, params)
+        if plan is None:
+            self.stats["misses"] += 1
+            return None
+        if self._watermark is None:
+            # Primeira carga em segundo plano: o banco responde enquanto isso
+            self.build_in_background()
+            self.stats["misses"] += 1
+            return None
+        if self._rebuild_due():
+            self.build_in_background()
+        stale = self._refreshed_at is None or time.monotonic() - self._refreshed_at > self.max_staleness
+        # Com uma carga em andamento, responde pelos agregados atuais em vez de esperar por ela
+        if stale and self._refresh_lock.acquire(blocking=False):
+            try:
+                self._refresh(False, timeout)
+            except Exception as e:
+                logger.warning("Falha ao atualizar agregados locais, consultando o banco: %s", e)
+                self.stats["misses"] += 1
+                return None
+            finally:
+                self._refresh_lock.release()
+        with self._lock:
+            rows = plan.evaluate(self._buckets)
+        self.stats["hits"] += 1
+        return rows
+
+    def _rebuild_due(self) -> bool:
+        return self._watermark is None or time.monotonic() - (self._rebuilt_at or 0) > self.rebuild_seconds
+
+    def build_in_background(self) -> None:
+        """Inicia a carga completa em uma thread de fundo (no máximo uma por vez)"""
+        with self._lock:
+            if self._building:
+                return
+            self._building = True
+        threading.Thread(target=self._build, name="aggregate-build", daemon=True).start()
+
+    def _build(self) -> None:
+        try:
+            self.refresh(full=True, timeout=self.build_timeout)
+        except Exception as e:
+            logger.warning("Falha na carga completa dos agregados locais: %s", e)
+        finally:
+            with self._lock:
+                self._building = False
+
+    def refresh(self, full: bool = False, timeout: float = None) -> int:
+        """
+        Atualiza os agregados a partir do banco
+
+        Args:
+            full: Força a recarga completa (também feita na primeira vez e a cada `rebuild_seconds`)
+            timeout: Limite em segundos para obter a conexão e executar a leitura
+
+        Returns:
+            Quantidade de linhas lidas
+        """
+        with self._refresh_lock:
+            return self._refresh(full or self._rebuild_due(), timeout)
+
+    def _refresh(self, full: bool, timeout: Optional[float]) -> int:
+        now = time.monotonic()
+        full = full or self._watermark is None
+        if full:
+            rows: Dict[Any, Tuple[bool, datetime.date]] = {}
+            buckets: Counter = Counter()
+            watermark, read = self._load(_FULL_SQL, None, rows, buckets, None, timeout)
+            with self._lock:
+                self._rows, self._buckets = rows, buckets
+            self._rebuilt_at = now
+            self.stats["full_refreshes"] += 1
+        else:
+            since = self._watermark - self.overlap
+            with self._lock:
+                rows, buckets = self._rows, self._buckets
+            watermark, read = self._load(_INCREMENTAL_SQL, [since, since], rows, buckets, self._watermark, timeout)
+            self.stats["incremental_refreshes"] += 1
+        self._watermark = watermark
+        self._refreshed_at = now
+        self.stats["rows_read"] += read
+        logger.info("Agregados locais atualizados (%s): %s linhas lidas", "completa" if full else "incremental",
+                    read)
+        return read
+
+    def _load(self, sql: str, params: Optional[List[Any]], rows: Dict[Any, Tuple[bool, datetime.date]],
+              buckets: Counter, watermark: Optional[datetime.datetime],
+              timeout: Optional[float]) -> Tuple[Any, int]:
+        read = 0
+        with self.registry.pool(self.database).connection(timeout) as conn:
+            if timeout is not None:
+                conn.timeout = max(1, math.ceil(timeout))
+            with conn.cursor() as cursor:
+                if params:
+                    cursor.execute(sql, params)
+                else:
+                    cursor.execute(sql)
+                while True:
+                    batch = cursor.fetchmany(self.fetch_batch)
+                    if not batch:
+                        break
+                    read += len(batch)
+                    with self._lock:
+                        for cadastro_id, ativo, inclusao, alteracao in batch:
+                            day = inclusao.date() if isinstance(inclusao, datetime.datetime) else inclusao
+                            state = (bool(ativo), day)
+                            previous = rows.get(cadastro_id)
+                            if previous != state:
+                                if previous is not None:
+                                    buckets[previous] -= 1
+                                buckets[state] += 1
+                                rows[cadastro_id] = state
+                            changed = alteracao or inclusao
+                            if changed is not None and (watermark is None or changed > watermark):
+                                watermark = changed
+                    if len(batch) < self.fetch_batch:
+                        break
+        return watermark, read
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.stats, rows=len(self._rows), buckets=len(self._buckets), watermark=self._watermark,
+                        building=self._building)
@@ -0,0 +1,170 @@
+"""
+Cliente HTTP para as APIs internas, com sessão compartilhada, limites por host e cache condicional
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import API_CONFIG, EXECUTOR_CONFIG
+
+logger = logging.getLogger("api_client")
+
+
+class APIClient:
+    """
+    Executa chamadas às APIs descritas em `api_references`.
+
+    Todas as chamadas usam uma única `requests.Session` (pool de conexões
+    keep-alive), com um semáforo por host para limitar a concorrência. Respostas
+    GET com ETag/Last-Modified são guardadas e revalidadas com requisições
+    condicionais (304 reutiliza o corpo armazenado).
+    """
+
+    def __init__(self, api_references: Dict[str, Any], config: Dict[str, Any] = None,
+                 session: requests.Session = None, timeout: float = None):
+        self.config = config or API_CONFIG
+        self.endpoints = (api_references or {}).get("endpoints", {})
+        self.timeout = timeout if timeout is not None else EXECUTOR_CONFIG["timeout"]
+        self.session = session or self._create_session()
+        self.per_host_limit = self.config.get("per_host_limit", 8)
+        self.cache_max_entries = self.config.get("cache_max_entries", 512)
+
+        self._lock = threading.Lock()
+        self._host_slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._cache: "OrderedDict[Tuple, Dict[str, Any]]" = OrderedDict()
+        self._fan_out = ThreadPoolExecutor(max_workers=self.config.get("fan_out_workers", 8),
+                                           thread_name_prefix="api-fan-out")
+        self._stats = {"requests": 0, "not_modified": 0, "cache_stored": 0}
+
+    def _create_session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.config.get("pool_connections", 10),
+                              pool_maxsize=self.config.get("pool_maxsize", 20))
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        if self.config.get("auth_token"):
+            session.headers["Authorization"] = f"Bearer {self.config['auth_token']}"
+        session.headers["Accept"] = "application/json"
+        return session
+
+    def build_url(self, endpoint: str) -> str:
+        if endpoint.startswith(("http://", "https://")):
+            return endpoint
+        base_url = self.config.get("base_url", "")
+        if base_url and not endpoint.startswith(base_url):
+            endpoint = base_url.rstrip("/") + "/" + endpoint.lstrip("/")
+        return f"{self.config.get('scheme', 'http')}://{self.config['host']}:{self.config['port']}{endpoint}"
+
+    def validate(self, endpoint: str, method: str, params: Dict[str, Any]) -> None:
+        """
+        Confere a chamada contra as referências de API
+
+        Raises:
+            ValueError: Endpoint, método ou parâmetro não permitido
+        """
+        reference = self.endpoints.get(endpoint)
+        if reference is None:
+            raise ValueError(f"Endpoint não suportado: {endpoint}")
+        allowed_methods = [allowed.upper() for allowed in reference.get("metodos", ["GET"])]
+        if method not in allowed_methods:
+            raise ValueError(f"Método {method} não permitido para {endpoint} (permitidos: {', '.join(allowed_methods)})")
+        allowed_params = reference.get("parametros", {})
+        unknown = [name for name in params if name not in allowed_params]
+        if unknown:
+            raise ValueError(f"Parâmetros não permitidos para {endpoint}: {', '.join(unknown)}")
+
+    def _host_slot(self, url: str) -> threading.BoundedSemaphore:
+        host = urlsplit(url).netloc
+        with self._lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = threading.BoundedSemaphore(self.per_host_limit)
+                self._host_slots[host] = slot
+            return slot
+
+    def _cache_key(self, url: str, params: Dict[str, Any]) -> Tuple:
+        return (url, tuple(sorted((str(key), str(value)) for key, value in params.items())))
+
+    def execute(self, call: Dict[str, Any], timeout: float = None) -> Any:
+        """
+        Executa uma chamada de API
+
+        Args:
+            call: Dicionário com endpoint, params e method (padrão GET)
+            timeout: Limite da chamada em segundos (no máximo o timeout do cliente)
+
+        Returns:
+            Corpo da resposta decodificado de JSON
+        """
+        endpoint = call.get("endpoint")
+        params = call.get("params") or {}
+        method = (call.get("method") or "GET").upper()
+        self.validate(endpoint, method, params)
+
+        url = self.build_url(endpoint)
+        timeout = self.timeout if timeout is None else min(timeout, self.timeout)
+        headers: Dict[str, str] = {}
+        cache_key = self._cache_key(url, params) if method == "GET" else None
+        cached = None
+        if cache_key is not None:
+            with self._lock:
+                cached = self._cache.get(cache_key)
+            if cached:
+                if cached.get("etag"):
+                    headers["If-None-Match"] = cached["etag"]
+                if cached.get("last_modified"):
+                    headers["If-Modified-Since"] = cached["last_modified"]
+
+        with self._host_slot(url):
+            if method == "GET":
+                response = self.session.get(url, params=params, headers=headers, timeout=timeout)
+            else:
+                response = self.session.request(method, url, json=params, headers=headers, timeout=timeout)
+
+        with self._lock:
+            self._stats["requests"] += 1
+
+        if response.status_code == 304 and cached is not None:
+            with self._lock:
+                self._stats["not_modified"] += 1
+                self._cache.move_to_end(cache_key)
+            logger.debug(f"Resposta não modificada, usando cache: {url}")
+            return cached["body"]
+
+        response.raise_for_status()
+        body = response.json() if response.content else None
+
+        if cache_key is not None and (response.headers.get("ETag") or response.headers.get("Last-Modified")):
+            with self._lock:
+                self._cache[cache_key] = {
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                    "body": body
+                }
+                self._cache.move_to_end(cache_key)
+                self._stats["cache_stored"] += 1
+                while len(self._cache) > self.cache_max_entries:
+                    self._cache.popitem(last=False)
+        return body
+
+    def execute_many(self, calls: List[Dict[str, Any]], timeout: float = None) -> List[Any]:
+        """Executa várias chamadas em paralelo, preservando a ordem dos resultados"""
+        for call in calls:
+            self.validate(call.get("endpoint"), (call.get("method") or "GET").upper(), call.get("params") or {})
+        futures = [self._fan_out.submit(self.execute, call, timeout) for call in calls]
+        return [future.result() for future in futures]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats, cached_entries=len(self._cache))
+
+    def close(self) -> None:
+        self._fan_out.shutdown(wait=False)
+        self.session.close()
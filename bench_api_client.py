@@ -0,0 +1,68 @@
+"""
+Benchmark do caminho de execução de APIs contra o servidor simulado local
+"""
+
+import argparse
+import time
+
+import requests
+
+from api_client import APIClient
+from stub_api_server import start_stub_server
+
+REFERENCES = {
+    "endpoints": {
+        "/api/cadastro": {"metodos": ["GET"], "parametros": {"nome": "", "email": "", "status": "", "dataInclusao": ""}}
+    }
+}
+
+
+def gerar_chamadas(quantidade: int):
+    status = ["Ativo", "Inativo"]
+    return [{"endpoint": "/api/cadastro", "params": {"status": status[i % 2]}} for i in range(quantidade)]
+
+
+def abordagem_ingenua(base: str, chamadas) -> None:
+    """Uma conexão nova por chamada, em sequência e sem cache"""
+    for chamada in chamadas:
+        requests.get(base + chamada["endpoint"], params=chamada["params"], timeout=30).json()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.005, help="Atraso simulado por requisição (segundos)")
+    args = parser.parse_args()
+
+    server, _ = start_stub_server(latency=args.latency)
+    port = server.server_address[1]
+    config = {"host": "127.0.0.1", "port": port, "base_url": "/api", "per_host_limit": 8,
+              "fan_out_workers": 8, "pool_maxsize": 8}
+    chamadas = gerar_chamadas(args.calls)
+    print(f"Chamadas: {args.calls} | Latência simulada: {args.latency * 1000:.0f} ms\n")
+
+    inicio = time.perf_counter()
+    abordagem_ingenua(f"http://127.0.0.1:{port}", chamadas)
+    base = time.perf_counter() - inicio
+    print(f"{'ingênua (sequencial, sem pool)':<36} {base * 1000:>10.1f} ms")
+
+    client = APIClient(REFERENCES, config)
+    inicio = time.perf_counter()
+    for chamada in chamadas:
+        client.execute(chamada)
+    sequencial = time.perf_counter() - inicio
+    print(f"{'sessão + cache condicional':<36} {sequencial * 1000:>10.1f} ms  ({base / sequencial:.1f}x)")
+
+    client = APIClient(REFERENCES, config)
+    inicio = time.perf_counter()
+    client.execute_many(chamadas)
+    paralelo = time.perf_counter() - inicio
+    print(f"{'sessão + cache + paralelo':<36} {paralelo * 1000:>10.1f} ms  ({base / paralelo:.1f}x)")
+    print(f"\nEstatísticas do cliente: {client.get_stats()}")
+
+    client.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark da serialização de resultados: abordagem atual (por linha) vs plano de codificação
+"""
+
+import argparse
+import datetime
+import decimal
+import json
+import time
+
+from result_serializer import EncoderPlan, to_ndjson, to_columnar_json, to_binary_columnar
+
+DESCRIPTION = [
+    ("CadastroId", int), ("Nome", str), ("Email", str), ("Celular", str),
+    ("Ativo", bool), ("Status", str), ("Saldo", decimal.Decimal),
+    ("DataInclusao", datetime.datetime), ("DataAlteracao", datetime.datetime)
+]
+
+
+def gerar_linhas(quantidade: int):
+    """Gera linhas no formato retornado pelo pyodbc"""
+    base = datetime.datetime(2023, 1, 1, 8, 0, 0)
+    status = ["Ativo", "Inativo", "Bloqueado"]
+    return [
+        (
+            i, f"Pessoa {i}", f"pessoa{i}@{'gmail' if i % 2 else 'empresa'}.com", f"1199{i:07d}",
+            i % 4 != 0, status[i % 3], decimal.Decimal(f"{i % 1000}.{i % 100:02d}"),
+            base + datetime.timedelta(minutes=i), None if i % 5 else base + datetime.timedelta(days=1, minutes=i)
+        )
+        for i in range(quantidade)
+    ]
+
+
+def abordagem_atual(description, rows) -> str:
+    """Como os consumidores fazem hoje: dict por linha e json.dumps(indent=2) com default=str"""
+    columns = [column[0] for column in description]
+    results = [dict(zip(columns, row)) for row in rows]
+    return json.dumps(results, ensure_ascii=False, indent=2, default=str)
+
+
+def medir(nome: str, func, repeticoes: int):
+    melhor = float("inf")
+    saida = None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        saida = func()
+        melhor = min(melhor, time.perf_counter() - inicio)
+    tamanho = len(saida.encode("utf-8")) if isinstance(saida, str) else len(saida)
+    print(f"{nome:<32} {melhor * 1000:>10.1f} ms {tamanho / 1024:>12.1f} KiB")
+    return melhor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rows = gerar_linhas(args.rows)
+    print(f"Linhas: {args.rows} | Repetições: {args.repeat} (melhor tempo)\n")
+    print(f"{'Formato':<32} {'Tempo':>13} {'Tamanho':>16}")
+
+    base = medir("atual (dict + json indent=2)", lambda: abordagem_atual(DESCRIPTION, rows), args.repeat)
+
+    def plano_json():
+        plan = EncoderPlan.from_description(DESCRIPTION)
+        return json.dumps(plan.to_records(rows), ensure_ascii=False, separators=(",", ":"))
+
+    resultados = {
+        "plano + json compacto": medir("plano + json compacto", plano_json, args.repeat),
+        "plano + ndjson": medir("plano + ndjson",
+                                lambda: to_ndjson(EncoderPlan.from_description(DESCRIPTION), rows), args.repeat),
+        "plano + json colunar": medir("plano + json colunar",
+                                      lambda: to_columnar_json(EncoderPlan.from_description(DESCRIPTION), rows),
+                                      args.repeat),
+        "plano + binário colunar": medir("plano + binário colunar",
+                                         lambda: to_binary_columnar(EncoderPlan.from_description(DESCRIPTION), rows),
+                                         args.repeat),
+    }
+
+    print("\nGanho em relação à abordagem atual:")
+    for nome, tempo in resultados.items():
+        print(f"  {nome:<30} {base / tempo:>6.2f}x")
+
+
+if __name__ == "__main__":
+    main()
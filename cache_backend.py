@@ -0,0 +1,347 @@
+"""
+Backends de cache plugáveis (NL→SQL, resultados SQL e respostas): LRU em memória e SQLite compartilhado
+
+O backend em memória atende um único processo. O backend SQLite (modo WAL) é um
+arquivo local que todos os workers do mesmo host leem e escrevem ao mesmo tempo,
+de modo que um worker novo já encontra o cache aquecido pelos demais.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, Hashable, Iterator, Optional
+
+from config import CACHE_CONFIG
+from result_serializer import encode_value
+
+logger = logging.getLogger("cache_backend")
+
+_MISSING = object()
+
+
+class _KeyLocks:
+    """Um lock por chave, criado sob demanda e descartado quando ninguém mais o usa"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._locks: Dict[Hashable, list] = {}
+
+    @contextmanager
+    def hold(self, key: Hashable) -> Iterator[None]:
+        with self._lock:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[key]
+
+
+class CacheBackend:
+    """
+    Interface dos backends de cache.
+
+    Chaves são strings; valores precisam ser serializáveis em JSON nos backends
+    compartilhados. `ttl` em segundos (None usa o padrão do namespace; 0 não expira).
+    """
+
+    def __init__(self, namespace: str, ttl: float = None, max_entries: int = 1000):
+        self.namespace = namespace
+        self.default_ttl = ttl
+        self.max_entries = max_entries
+        self._key_locks = _KeyLocks()
+        self._stats_lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "sets": 0, "evictions": 0, "computed": 0}
+
+    def get(self, key: str, default: Any = None) -> Any:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: float = None) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def _expires_at(self, ttl: Optional[float]) -> Optional[float]:
+        ttl = self.default_ttl if ttl is None else ttl
+        return time.time() + ttl if ttl else None
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any], ttl: float = None,
+                       should_cache: Callable[[Any], bool] = None) -> Any:
+        """
+        Retorna o valor em cache ou calcula, grava e retorna
+
+        Chamadas concorrentes para a mesma chave aguardam um único cálculo.
+        Exceções de `compute` não são gravadas e chegam ao chamador.
+
+        Args:
+            key: Chave no namespace
+            compute: Função sem argumentos que produz o valor
+            ttl: Validade em segundos (padrão do namespace)
+            should_cache: Decide se o valor calculado deve ser gravado (padrão: sempre)
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        with self._key_locks.hold(key):
+            value = self.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+            return self._compute_and_store(key, compute, ttl, should_cache)
+
+    def _compute_and_store(self, key: str, compute: Callable[[], Any], ttl: Optional[float],
+                           should_cache: Optional[Callable[[Any], bool]]) -> Any:
+        value = compute()
+        self._count("computed")
+        if should_cache is None or should_cache(value):
+            self.set(key, value, ttl)
+        return value
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["entries"] = len(self)
+        return stats
+
+
+class LRUCache(CacheBackend):
+    """Cache do próprio processo: LRU limitado por quantidade de entradas, com TTL"""
+
+    def __init__(self, namespace: str, ttl: float = None, max_entries: int = 1000):
+        super().__init__(namespace, ttl, max_entries)
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is not None and entry[1] <= time.time():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self._stats["misses"] += 1
+                return default
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry[0]
+
+    def set(self, key: str, value: Any, ttl: float = None) -> None:
+        with self._lock:
+            self._entries[key] = (value, self._expires_at(ttl))
+            self._entries.move_to_end(key)
+            self._stats["sets"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._stats[name] += amount
+
+
+class SQLiteCache(CacheBackend):
+    """
+    Cache compartilhado entre processos do mesmo host em um arquivo SQLite (WAL).
+
+    Leitores não bloqueiam escritores. A ordem de uso (LRU aproximado) é
+    atualizada no máximo a cada `touch_seconds` por entrada, para que leituras
+    não virem escritas. `get_or_compute` usa uma concessão (lease) por chave na
+    própria base, então apenas um processo calcula cada valor; os demais
+    aguardam o valor gravado até o fim da concessão.
+    """
+
+    def __init__(self, namespace: str, path: str, ttl: float = None, max_entries: int = 1000,
+                 config: Dict[str, Any] = None):
+        super().__init__(namespace, ttl, max_entries)
+        self.config = config or CACHE_CONFIG
+        self.path = path
+        self.busy_timeout = self.config.get("busy_timeout", 5.0)
+        self.lease_seconds = self.config.get("lease_seconds", 30.0)
+        self.poll_interval = self.config.get("poll_interval", 0.05)
+        self.touch_seconds = self.config.get("touch_seconds", 5.0)
+        self.evict_every = self.config.get("evict_every", 50)
+        self._owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._local = threading.local()
+        self._sets_since_evict = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries (namespace TEXT NOT NULL, key TEXT NOT NULL, "
+            "value TEXT NOT NULL, expires_at REAL, accessed_at REAL NOT NULL, PRIMARY KEY (namespace, key))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS cache_entries_lru ON cache_entries (namespace, accessed_at)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_leases (namespace TEXT NOT NULL, key TEXT NOT NULL, "
+            "owner TEXT NOT NULL, expires_at REAL NOT NULL, PRIMARY KEY (namespace, key))"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str, default: Any = None) -> Any:
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT value, expires_at, accessed_at FROM cache_entries WHERE namespace = ? AND key = ?",
+            (self.namespace, key)
+        ).fetchone()
+        now = time.time()
+        if row is None or (row[1] is not None and row[1] <= now):
+            if row is not None:
+                conn.execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ? AND expires_at <= ?",
+                             (self.namespace, key, now))
+            self._count("misses")
+            return default
+        if now - row[2] > self.touch_seconds:
+            conn.execute("UPDATE cache_entries SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                         (now, self.namespace, key))
+        self._count("hits")
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: float = None) -> None:
+        payload = json.dumps(value, ensure_ascii=False, default=encode_value)
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache_entries (namespace, key, value, expires_at, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (self.namespace, key, payload, self._expires_at(ttl), time.time())
+        )
+        self._count("sets")
+        with self._stats_lock:
+            self._sets_since_evict += 1
+            evict = self._sets_since_evict >= self.evict_every
+            if evict:
+                self._sets_since_evict = 0
+        if evict or self.max_entries < self.evict_every:
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        """Remove entradas expiradas e, acima do limite, as usadas há mais tempo"""
+        conn.execute("DELETE FROM cache_entries WHERE namespace = ? AND expires_at <= ?",
+                     (self.namespace, time.time()))
+        excess = len(self) - self.max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND key IN (SELECT key FROM cache_entries "
+                "WHERE namespace = ? ORDER BY accessed_at LIMIT ?)",
+                (self.namespace, self.namespace, excess)
+            )
+            self._count("evictions", excess)
+
+    def delete(self, key: str) -> None:
+        self._conn().execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, key))
+
+    def clear(self) -> None:
+        self._conn().execute("DELETE FROM cache_entries WHERE namespace = ?", (self.namespace,))
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM cache_entries WHERE namespace = ?",
+                                    (self.namespace,)).fetchone()[0]
+
+    def _acquire_lease(self, key: str) -> bool:
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT owner, expires_at FROM cache_leases WHERE namespace = ? AND key = ?",
+                               (self.namespace, key)).fetchone()
+            if row is not None and row[0] != self._owner and row[1] > now:
+                conn.execute("COMMIT")
+                return False
+            conn.execute("INSERT OR REPLACE INTO cache_leases (namespace, key, owner, expires_at) VALUES (?, ?, ?, ?)",
+                         (self.namespace, key, self._owner, now + self.lease_seconds))
+            conn.execute("COMMIT")
+            return True
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _release_lease(self, key: str) -> None:
+        self._conn().execute("DELETE FROM cache_leases WHERE namespace = ? AND key = ? AND owner = ?",
+                             (self.namespace, key, self._owner))
+
+    def _compute_and_store(self, key: str, compute: Callable[[], Any], ttl: Optional[float],
+                           should_cache: Optional[Callable[[Any], bool]]) -> Any:
+        give_up_at = time.monotonic() + self.lease_seconds
+        leased = False
+        while not leased:
+            leased = self._acquire_lease(key)
+            if leased:
+                break
+            # Outro processo está calculando: aguarda o valor gravado
+            value = self.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+            if time.monotonic() >= give_up_at:
+                break
+            time.sleep(self.poll_interval)
+        try:
+            value = self.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+            return super()._compute_and_store(key, compute, ttl, should_cache)
+        finally:
+            if leased:
+                self._release_lease(key)
+
+
+def create_cache(namespace: str, config: Dict[str, Any] = None) -> Optional[CacheBackend]:
+    """
+    Cria o backend configurado para o namespace (nl_sql, sql_result, answer)
+
+    Args:
+        namespace: Nome do cache; TTL e limite vêm de config["namespaces"][namespace]
+        config: Configuração (padrão: CACHE_CONFIG)
+
+    Returns:
+        O backend, ou None quando o namespace está desabilitado
+    """
+    config = config or CACHE_CONFIG
+    settings = config.get("namespaces", {}).get(namespace, {})
+    if not settings.get("enabled", True):
+        return None
+    ttl = settings.get("ttl_seconds")
+    max_entries = settings.get("max_entries", 1000)
+    if config.get("backend") == "sqlite":
+        return SQLiteCache(namespace, config["sqlite_path"], ttl, max_entries, config)
+    return LRUCache(namespace, ttl, max_entries)
@@ -2,6 +2,7 @@
 Configurações para o sistema de Agentes SQL Inteligentes
 """
 
+import json
 import os
 import logging
 from dotenv import load_dotenv
@@ -13,7 +14,15 @@ load_dotenv()
 LOGGING_CONFIG = {
     "level": logging.INFO,
     "format": '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    "file_path": os.getenv("LOG_FILE_PATH", "agent_log.log")
+    "file_path": os.getenv("LOG_FILE_PATH", "agent_log.log"),
+    "console": os.getenv("LOG_CONSOLE", "False").lower() == "true",
+    "queue_size": int(os.getenv("LOG_QUEUE_SIZE", "10000")),
+    # Com a fila cheia, erros esperam por espaço até este limite e depois são gravados diretamente
+    "error_block_seconds": float(os.getenv("LOG_ERROR_BLOCK_SECONDS", "0.5")),
+    # Prompts, intenções e resultados: registrados em DEBUG, amostrados e truncados
+    "payload_level": os.getenv("LOG_PAYLOAD_LEVEL", "DEBUG"),
+    "payload_sample_rate": float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "1.0")),
+    "payload_max_chars": int(os.getenv("LOG_PAYLOAD_MAX_CHARS", "2000"))
 }
 
 # Configurações do Agente de Inteligência
@@ -34,7 +43,7 @@ NLP_CONFIG = {
 
 # Configurações específicas do Gemini
 GEMINI_CONFIG = {
-    "model": "gemini-2.0-flash",
+    "model": os.getenv("GEMINI_MODEL", AGENT_CONFIG["model_name"]),
     "response_mime_type": "text/plain",
 }
 
@@ -54,13 +63,20 @@ API_CONFIG = {
     "port": int(os.getenv("API_PORT", "5000")),
     "debug": os.getenv("API_DEBUG", "False").lower() == "true",
     "base_url": os.getenv("API_BASE_URL", "/api"),
-    "auth_token": os.getenv("API_AUTH_TOKEN", "")
+    "auth_token": os.getenv("API_AUTH_TOKEN", ""),
+    "scheme": os.getenv("API_SCHEME", "http"),
+    "pool_connections": int(os.getenv("API_POOL_CONNECTIONS", "10")),
+    "pool_maxsize": int(os.getenv("API_POOL_MAXSIZE", "20")),
+    "per_host_limit": int(os.getenv("API_PER_HOST_LIMIT", "8")),
+    "fan_out_workers": int(os.getenv("API_FAN_OUT_WORKERS", "8")),
+    "cache_max_entries": int(os.getenv("API_CACHE_MAX_ENTRIES", "512"))
 }
 
 # Configurações do Executor
 EXECUTOR_CONFIG = {
     "timeout": int(os.getenv("EXECUTOR_TIMEOUT", "30")),
-    "max_rows": int(os.getenv("EXECUTOR_MAX_ROWS", "1000")),
+    # Acima de RESULT_MEMORY_ROWS as linhas vão para disco; o corte em max_rows marca o resultado como truncado
+    "max_rows": int(os.getenv("EXECUTOR_MAX_ROWS", "50000")),
     "simulate": os.getenv("EXECUTOR_SIMULATE", "True").lower() == "true"
 }
 
@@ -81,4 +97,261 @@ SECURITY_CONFIG = {
     "allowed_tables": ["Cadastro"],
     "max_query_length": 4000,
     "require_nolock": True
-} 
\ No newline at end of file
+} 
+
+# Configurações do agendador de requisições ao LLM
+SCHEDULER_CONFIG = {
+    "requests_per_minute": int(os.getenv("LLM_REQUESTS_PER_MINUTE", "60")),
+    "tokens_per_minute": int(os.getenv("LLM_TOKENS_PER_MINUTE", "1000000")),
+    "expected_output_tokens": int(os.getenv("LLM_EXPECTED_OUTPUT_TOKENS", "512")),
+    "stage_concurrency": {
+        "intent": int(os.getenv("LLM_INTENT_CONCURRENCY", "4")),
+        "sql": int(os.getenv("LLM_SQL_CONCURRENCY", "4")),
+        "answer": int(os.getenv("LLM_ANSWER_CONCURRENCY", "4"))
+    },
+    "max_retries": int(os.getenv("LLM_MAX_RETRIES", "4")),
+    "backoff_base": float(os.getenv("LLM_BACKOFF_BASE", "0.5")),
+    "backoff_max": float(os.getenv("LLM_BACKOFF_MAX", "20.0")),
+    "retryable_status_codes": [429, 500, 502, 503, 504]
+}
+
+# Configurações do índice de similaridade de perguntas (MinHash/LSH)
+SIMILARITY_CONFIG = {
+    "enabled": os.getenv("SIMILARITY_ENABLED", "True").lower() == "true",
+    "threshold": float(os.getenv("SIMILARITY_THRESHOLD", "0.8")),
+    "num_perm": 64,
+    "bands": 16,
+    "shingle_size": 3,
+    "max_entries": int(os.getenv("SIMILARITY_MAX_ENTRIES", "5000")),
+    "index_path": os.getenv("SIMILARITY_INDEX_PATH", "data/cache/similarity_index.json"),
+    "autosave_every": int(os.getenv("SIMILARITY_AUTOSAVE_EVERY", "20"))
+}
+
+# Configurações dos templates de SQL parametrizado
+TEMPLATE_CONFIG = {
+    "enabled": os.getenv("TEMPLATES_ENABLED", "True").lower() == "true",
+    "max_templates": int(os.getenv("TEMPLATES_MAX", "1000"))
+}
+
+# Configurações de serialização de resultados
+SERIALIZATION_CONFIG = {
+    "decimal_as": os.getenv("SERIALIZATION_DECIMAL_AS", "float"),  # float ou str
+    "dictionary_max_cardinality": int(os.getenv("SERIALIZATION_DICT_MAX_CARDINALITY", "1024")),
+    "dictionary_max_ratio": float(os.getenv("SERIALIZATION_DICT_MAX_RATIO", "0.5"))
+}
+
+# Registro de bancos de dados e pools de conexão
+DATABASES_CONFIG = {
+    "registry_path": os.getenv("DB_REGISTRY_PATH", os.path.join(TRAINING_DATA["base_path"], "databases.json")),
+    "default_database": os.getenv("DB_DEFAULT_NAME", "default"),
+    "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+    "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+    "fan_out_workers": int(os.getenv("DB_FAN_OUT_WORKERS", "8"))
+}
+
+# Armazenamento de resultados grandes (linhas excedentes vão para disco e são lidas via mmap)
+RESULT_STORE_CONFIG = {
+    "memory_rows": int(os.getenv("RESULT_MEMORY_ROWS", "2000")),
+    "spill_batch": int(os.getenv("RESULT_SPILL_BATCH", "1000")),
+    "fetch_batch": int(os.getenv("RESULT_FETCH_BATCH", "500")),
+    "spill_dir": os.getenv("RESULT_SPILL_DIR") or None
+}
+
+# Contexto de conversa por sessão (perguntas de acompanhamento)
+SESSION_CONFIG = {
+    "enabled": os.getenv("SESSIONS_ENABLED", "True").lower() == "true",
+    "max_sessions": int(os.getenv("SESSIONS_MAX", "1000")),
+    "ttl_seconds": float(os.getenv("SESSIONS_TTL", "1800"))
+}
+
+# Captura de tráfego (JSONL compactado e rotativo) para testes de carga com o replay
+CAPTURE_CONFIG = {
+    "enabled": os.getenv("TRAFFIC_CAPTURE", "False").lower() == "true",
+    "directory": os.getenv("TRAFFIC_CAPTURE_DIR", "logs/traffic"),
+    "max_bytes": int(os.getenv("TRAFFIC_CAPTURE_MAX_BYTES", str(20 * 1024 * 1024))),
+    "backup_count": int(os.getenv("TRAFFIC_CAPTURE_BACKUPS", "10")),
+    "flush_every": int(os.getenv("TRAFFIC_CAPTURE_FLUSH_EVERY", "20")),
+    "record_responses": os.getenv("TRAFFIC_CAPTURE_RESPONSES", "True").lower() == "true"
+}
+
+# Agregados locais de Cadastro (por Ativo e por dia de inclusão), atualizados pela marca d'água de DataAlteracao
+AGGREGATE_CONFIG = {
+    "enabled": os.getenv("LOCAL_AGGREGATES_ENABLED", "True").lower() == "true",
+    "max_staleness_seconds": float(os.getenv("LOCAL_AGGREGATES_MAX_STALENESS", "30")),
+    "rebuild_seconds": float(os.getenv("LOCAL_AGGREGATES_REBUILD", "3600")),
+    "watermark_overlap_seconds": float(os.getenv("LOCAL_AGGREGATES_OVERLAP", "60")),
+    "fetch_batch": int(os.getenv("LOCAL_AGGREGATES_FETCH_BATCH", "5000")),
+    # Limite da carga completa, feita em thread de fundo
+    "build_timeout_seconds": float(os.getenv("LOCAL_AGGREGATES_BUILD_TIMEOUT", "300"))
+}
+
+# Atualização incremental de resultados por chave primária e marca d'água de DataAlteracao
+INCREMENTAL_CONFIG = {
+    "enabled": os.getenv("INCREMENTAL_REFRESH_ENABLED", "True").lower() == "true",
+    "min_refresh_seconds": float(os.getenv("INCREMENTAL_REFRESH_MIN_INTERVAL", "5")),
+    "rebuild_seconds": float(os.getenv("INCREMENTAL_REFRESH_REBUILD", "3600")),
+    "watermark_overlap_seconds": float(os.getenv("INCREMENTAL_REFRESH_OVERLAP", "60")),
+    "max_results": int(os.getenv("INCREMENTAL_REFRESH_MAX_RESULTS", "64")),
+    "fetch_batch": int(os.getenv("INCREMENTAL_REFRESH_FETCH_BATCH", "5000")),
+    "change_columns": ["DataAlteracao", "DataInclusao"]
+}
+
+# Roteamento de modelos por etapa e complexidade, com SLO de latência e fallback por tempo limite
+MODEL_ROUTER_CONFIG = {
+    "enabled": os.getenv("LLM_ROUTING_ENABLED", "True").lower() == "true",
+    "models": {
+        "fast": os.getenv("LLM_MODEL_FAST", "gemini-2.0-flash-lite"),
+        "default": GEMINI_CONFIG["model"],
+        "strong": os.getenv("LLM_MODEL_STRONG", GEMINI_CONFIG["model"])
+    },
+    # Preferência por nível de complexidade; os demais modelos da lista são fallback.
+    # Perguntas simples só vão primeiro para o modelo rápido com LLM_DOWNGRADE_SIMPLE=true
+    "routes": {
+        "simple": (["fast", "default"] if os.getenv("LLM_DOWNGRADE_SIMPLE", "False").lower() == "true"
+                   else ["default", "fast"]),
+        "moderate": ["default", "fast"],
+        "complex": ["strong", "default"]
+    },
+    # Rotas específicas por etapa, ex.: {"answer": {"simple": ["fast"]}}
+    "stage_routes": json.loads(os.getenv("LLM_STAGE_ROUTES", "{}")),
+    "slo_seconds": {
+        "intent": float(os.getenv("LLM_INTENT_SLO", "3")),
+        "sql": float(os.getenv("LLM_SQL_SLO", "6")),
+        "answer": float(os.getenv("LLM_ANSWER_SLO", "8"))
+    },
+    "timeout_factor": float(os.getenv("LLM_TIMEOUT_FACTOR", "2.0")),
+    "window": int(os.getenv("LLM_ROUTING_WINDOW", "50")),
+    "min_samples": int(os.getenv("LLM_ROUTING_MIN_SAMPLES", "5")),
+    "max_failure_rate": float(os.getenv("LLM_ROUTING_MAX_FAILURE_RATE", "0.2")),
+    "complexity_thresholds": {"moderate": 2.0, "complex": 5.0}
+}
+
+# Cache de contexto no provedor para o prefixo estático dos prompts (instruções + esquema)
+CONTEXT_CACHE_CONFIG = {
+    "enabled": os.getenv("LLM_CONTEXT_CACHE_ENABLED", "True").lower() == "true",
+    "ttl_seconds": float(os.getenv("LLM_CONTEXT_CACHE_TTL", "3600")),
+    # Renovação quando faltar menos que isso para expirar
+    "renew_margin_seconds": float(os.getenv("LLM_CONTEXT_CACHE_RENEW_MARGIN", "300")),
+    # Prefixos menores não são aceitos pelo provedor (mínimo de tokens por modelo)
+    "min_tokens": int(os.getenv("LLM_CONTEXT_CACHE_MIN_TOKENS", "1024")),
+    # Após falha na criação, chamadas seguem sem cache por este tempo
+    "retry_seconds": float(os.getenv("LLM_CONTEXT_CACHE_RETRY", "600"))
+}
+
+# Controle de admissão: limites de concorrência adaptativos e filas limitadas por etapa
+ADMISSION_CONFIG = {
+    "enabled": os.getenv("ADMISSION_CONTROL_ENABLED", "True").lower() == "true",
+    "initial_limit": int(os.getenv("ADMISSION_INITIAL_LIMIT", "8")),
+    "min_limit": int(os.getenv("ADMISSION_MIN_LIMIT", "1")),
+    "max_limit": int(os.getenv("ADMISSION_MAX_LIMIT", "64")),
+    "max_queue": int(os.getenv("ADMISSION_MAX_QUEUE", "16")),
+    # Espera máxima na fila; acima disso a requisição é recusada ou degradada
+    "max_queue_wait_seconds": float(os.getenv("ADMISSION_MAX_QUEUE_WAIT", "2")),
+    # Latência aceita acima da referência antes de reduzir o limite
+    "tolerance": float(os.getenv("ADMISSION_TOLERANCE", "1.5")),
+    "smoothing": 0.2,
+    "backoff_ratio": float(os.getenv("ADMISSION_BACKOFF_RATIO", "0.9")),
+    "baseline_window": 100,
+    # Parâmetros específicos por etapa (request, intent, sql, execute, answer)
+    "stages": {
+        "request": {
+            "initial_limit": int(os.getenv("ADMISSION_REQUEST_INITIAL_LIMIT", "16")),
+            "max_limit": int(os.getenv("ADMISSION_REQUEST_MAX_LIMIT", "128")),
+            "max_queue": int(os.getenv("ADMISSION_REQUEST_MAX_QUEUE", "32"))
+        }
+    }
+}
+
+# Prazo de ponta a ponta por requisição, repartido entre as etapas, e disjuntores por dependência
+DEADLINE_CONFIG = {
+    "request_seconds": float(os.getenv("REQUEST_DEADLINE", "30")),
+    # Peso de cada etapa na divisão do tempo restante
+    "stage_budgets": {"intent": 1.0, "sql": 1.5, "execute": 1.5, "answer": 1.0},
+    "breaker_failure_threshold": int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5")),
+    "breaker_reset_seconds": float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+}
+
+# Configuração dos caches de NL→SQL, resultados SQL e respostas
+CACHE_CONFIG = {
+    # memory: LRU de cada processo; sqlite: arquivo compartilhado pelos workers do host
+    "backend": os.getenv("CACHE_BACKEND", "memory"),
+    "sqlite_path": os.getenv("CACHE_SQLITE_PATH", os.path.join("data", "cache", "shared_cache.sqlite3")),
+    "busy_timeout": float(os.getenv("CACHE_BUSY_TIMEOUT", "5")),
+    # Tempo máximo que um worker aguarda outro calcular o mesmo valor
+    "lease_seconds": float(os.getenv("CACHE_LEASE_SECONDS", "30")),
+    "poll_interval": 0.05,
+    # Intervalo mínimo entre atualizações da ordem de uso de uma entrada
+    "touch_seconds": 5.0,
+    "evict_every": 50,
+    "namespaces": {
+        "nl_sql": {
+            "enabled": os.getenv("NL_SQL_CACHE_ENABLED", "true").lower() == "true",
+            "ttl_seconds": float(os.getenv("NL_SQL_CACHE_TTL", "86400")),
+            "max_entries": int(os.getenv("NL_SQL_CACHE_SIZE", "5000"))
+        },
+        "sql_result": {
+            "enabled": os.getenv("SQL_RESULT_CACHE_ENABLED", "true").lower() == "true",
+            "ttl_seconds": float(os.getenv("SQL_RESULT_CACHE_TTL", "30")),
+            "max_entries": int(os.getenv("SQL_RESULT_CACHE_SIZE", "500"))
+        },
+        # Últimas respostas completas, usadas nas respostas degradadas
+        "answer": {
+            "enabled": True,
+            "ttl_seconds": float(os.getenv("ANSWER_CACHE_TTL", "86400")),
+            "max_entries": int(os.getenv("DEGRADED_CACHE_SIZE", "500"))
+        }
+    }
+}
+
+# Modo prefork: dados do agente carregados uma vez no processo pai e compartilhados (copy-on-write)
+PREFORK_CONFIG = {
+    "workers": int(os.getenv("PREFORK_WORKERS", str(os.cpu_count() or 2))),
+    "host": os.getenv("PREFORK_HOST", "127.0.0.1"),
+    "port": int(os.getenv("PREFORK_PORT", "8765")),
+    "backlog": int(os.getenv("PREFORK_BACKLOG", "128")),
+    # Conexões atendidas em paralelo por worker
+    "worker_threads": int(os.getenv("PREFORK_WORKER_THREADS", "8")),
+    # Intervalo (segundos) do relatório de memória por worker; 0 desabilita
+    "report_interval": float(os.getenv("PREFORK_REPORT_INTERVAL", "300"))
+}
+
+# Reescrita do SQL gerado para predicados sargáveis (intervalos sobre a coluna em vez de funções)
+SQL_REWRITE_CONFIG = {
+    "enabled": os.getenv("SQL_REWRITE_ENABLED", "True").lower() == "true",
+    # Colunas bit de status; condições repetidas sobre elas são removidas
+    "status_columns": ["Ativo"],
+    "email_columns": ["Email"],
+    # Coluna (computada e indexada) com o domínio do email; sem ela, LIKE '%@dominio' é mantido
+    "email_domain_column": os.getenv("SQL_EMAIL_DOMAIN_COLUMN") or None,
+    # Com collation case-insensitive (padrão do SQL Server), UPPER/LOWER sobre a coluna são redundantes
+    "case_insensitive_collation": os.getenv("SQL_CASE_INSENSITIVE_COLLATION", "True").lower() == "true",
+    # SELECT * vira as colunas pedidas na intenção (fields)
+    "projection_pruning": os.getenv("SQL_PROJECTION_PRUNING", "True").lower() == "true",
+    # Perguntas de contagem viram COUNT(*)/GROUP BY no banco
+    "aggregate_pushdown": os.getenv("SQL_AGGREGATE_PUSHDOWN", "True").lower() == "true",
+    # Coluna usada nos agrupamentos por dia, mês e ano
+    "date_column": os.getenv("SQL_DATE_COLUMN", "DataInclusao")
+}
+
+# Políticas de acesso (LGPD) aplicadas aos resultados: máscaras, remoção de colunas e filtros por perfil
+POLICY_CONFIG = {
+    "enabled": os.getenv("POLICY_ENABLED", "True").lower() == "true",
+    # Chave das políticas nos regulamentos (data/regulations/politicas_mascaramento.json)
+    "policy_key": "politicas_mascaramento",
+    # Perfil usado quando a requisição não informa um; vazio usa o perfil_padrao das políticas
+    "default_role": os.getenv("POLICY_DEFAULT_ROLE", ""),
+    # Reconhece e-mails e cartões pelo conteúdo em colunas renomeadas no SQL
+    "detect_by_content": os.getenv("POLICY_DETECT_BY_CONTENT", "True").lower() == "true",
+    "sample_size": int(os.getenv("POLICY_SAMPLE_SIZE", "20"))
+}
+
+# Planejador de perguntas compostas ("quantos ativos e quantos inativos hoje e no último mês")
+PLANNER_CONFIG = {
+    "enabled": os.getenv("QUERY_PLANNER_ENABLED", "True").lower() == "true",
+    # Acima deste número de subconsultas a pergunta segue como uma única consulta
+    "max_sub_queries": int(os.getenv("QUERY_PLANNER_MAX_SUB_QUERIES", "8")),
+    # Subconsultas executadas em paralelo
+    "workers": int(os.getenv("QUERY_PLANNER_WORKERS", "8")),
+    # Linhas de cada subconsulta enviadas ao processador de resultados
+    "rows_per_sub_query": int(os.getenv("QUERY_PLANNER_ROWS_PER_SUB_QUERY", "20"))
+}
@@ -0,0 +1,99 @@
+"""
+Pool de conexões ODBC por banco de dados
+"""
+
+import logging
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, Iterator
+
+logger = logging.getLogger("connection_pool")
+
+
+def build_connection_string(db_config: Dict[str, Any]) -> str:
+    """Monta a string de conexão ODBC para um banco registrado"""
+    return (
+        f"DRIVER={{ODBC Driver 17 for SQL Server}};"
+        f"SERVER={db_config['server']};"
+        f"DATABASE={db_config['database']};"
+        f"UID={db_config.get('username', '')};"
+        f"PWD={db_config.get('password', '')}"
+    )
+
+
+def _pyodbc_connect(connection_string: str) -> Any:
+    import pyodbc
+    return pyodbc.connect(connection_string)
+
+
+class ConnectionPool:
+    """
+    Pool de conexões com tamanho máximo fixo.
+
+    As conexões são criadas sob demanda e reaproveitadas (LIFO, para manter
+    aquecidas as mais recentes). Uma conexão que participou de um erro é
+    descartada em vez de voltar ao pool.
+    """
+
+    def __init__(self, name: str, connection_string: str, size: int = 5, timeout: float = 30.0,
+                 connect: Callable[[str], Any] = None):
+        self.name = name
+        self.connection_string = connection_string
+        self.size = size
+        self.timeout = timeout
+        self._connect = connect or _pyodbc_connect
+        self._idle: "queue.LifoQueue" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._stats = {"created": 0, "reused": 0, "discarded": 0}
+
+    @contextmanager
+    def connection(self, timeout: float = None) -> Iterator[Any]:
+        """Empresta uma conexão do pool pelo tempo do bloco `with` (espera no máximo `timeout` segundos)"""
+        if not self._slots.acquire(timeout=self.timeout if timeout is None else min(timeout, self.timeout)):
+            raise TimeoutError(f"Tempo esgotado aguardando conexão do banco '{self.name}'")
+        conn = None
+        try:
+            try:
+                conn = self._idle.get_nowait()
+                with self._lock:
+                    self._stats["reused"] += 1
+            except queue.Empty:
+                conn = self._connect(self.connection_string)
+                with self._lock:
+                    self._stats["created"] += 1
+            yield conn
+        except BaseException:
+            if conn is not None:
+                self._discard(conn)
+                conn = None
+            raise
+        finally:
+            if conn is not None:
+                self._idle.put(conn)
+            self._slots.release()
+
+    def _discard(self, conn: Any) -> None:
+        with self._lock:
+            self._stats["discarded"] += 1
+        try:
+            conn.close()
+        except Exception as e:
+            logger.debug(f"Erro ao fechar conexão descartada do banco '{self.name}': {str(e)}")
+
+    def close_all(self) -> None:
+        """Fecha todas as conexões ociosas"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats, idle=self._idle.qsize(), size=self.size)
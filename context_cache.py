@@ -0,0 +1,235 @@
+"""
+Cache de contexto no provedor (cached contents do Gemini) para o prefixo estático dos prompts
+
+O esquema do banco e as instruções numeradas de SQL formam um prefixo idêntico
+em toda chamada de intenção e de geração de SQL. O prefixo (instrução de sistema
++ conteúdo estático) é registrado no provedor uma vez por versão dos dados (hash
+do conteúdo) e por modelo; as chamadas seguintes enviam só a parte variável e
+referenciam o handle, pagando os tokens em cache com desconto. O handle é
+renovado antes de expirar e, quando o cache não está disponível (conteúdo abaixo
+do mínimo de tokens, erro na criação ou handle expirado no provedor), a chamada
+segue sem cache com o prompt completo.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from typing import Dict, Any, Callable, Iterator, Optional, Tuple
+
+from config import CONTEXT_CACHE_CONFIG, GEMINI_CONFIG
+
+logger = logging.getLogger("context_cache")
+
+
+def is_cache_miss(error: Exception) -> bool:
+    """Erros do provedor causados pelo handle (expirado, removido ou de outro modelo)"""
+    message = str(error).lower().replace("_", "").replace(" ", "")
+    return "cachedcontent" in message
+
+
+def fallback_stream(open_cached: Callable[[], Iterator[str]], open_plain: Callable[[], Iterator[str]],
+                    on_miss: Callable[[Exception], None]) -> Iterator[str]:
+    """
+    Stream com o handle de cache; se o provedor recusar o handle antes do primeiro
+    trecho, descarta o handle e refaz a chamada com o prompt completo
+    """
+    chunks = None
+    emitted = False
+    try:
+        try:
+            chunks = open_cached()
+            for chunk in chunks:
+                emitted = True
+                yield chunk
+            return
+        except Exception as e:
+            if emitted or not is_cache_miss(e):
+                raise
+            on_miss(e)
+        chunks = open_plain()
+        yield from chunks
+    finally:
+        close = getattr(chunks, "close", None)
+        if close:
+            close()
+
+
+class GeminiCacheAPI:
+    """Operações de cached contents do SDK google-genai"""
+
+    def __init__(self, get_client: Callable[[], Any]):
+        """
+        Args:
+            get_client: Retorna o `genai.Client` compartilhado (criado na primeira chamada)
+        """
+        self.get_client = get_client
+
+    def create(self, model: str, system_instruction: str, content: str, ttl_seconds: float,
+               display_name: str) -> str:
+        from google.genai import types
+
+        cached = self.get_client().caches.create(
+            model=model,
+            config=types.CreateCachedContentConfig(
+                display_name=display_name,
+                system_instruction=system_instruction,
+                contents=[types.Content(role="user", parts=[types.Part.from_text(text=content)])],
+                ttl=f"{int(ttl_seconds)}s"
+            )
+        )
+        return cached.name
+
+    def update(self, name: str, ttl_seconds: float) -> None:
+        from google.genai import types
+
+        self.get_client().caches.update(name=name, config=types.UpdateCachedContentConfig(ttl=f"{int(ttl_seconds)}s"))
+
+    def delete(self, name: str) -> None:
+        self.get_client().caches.delete(name=name)
+
+
+class _Handle:
+    def __init__(self, name: str, expires_at: float):
+        self.name = name
+        self.expires_at = expires_at
+
+
+class ContextCache:
+    """Handles de cache por (modelo, versão do prefixo), renovados antes de expirar"""
+
+    def __init__(self, api, config: Dict[str, Any] = None, clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            api: Operações de cache do provedor (create, update, delete)
+            config: Configuração (padrão: CONTEXT_CACHE_CONFIG)
+            clock: Relógio monotônico (substituível nos testes)
+        """
+        self.api = api
+        self.config = config or CONTEXT_CACHE_CONFIG
+        self.clock = clock
+        self.ttl = self.config.get("ttl_seconds", 3600.0)
+        self.renew_margin = self.config.get("renew_margin_seconds", 300.0)
+        self.min_tokens = self.config.get("min_tokens", 1024)
+        self.retry_seconds = self.config.get("retry_seconds", 600.0)
+        self._lock = threading.Lock()
+        self._key_locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._handles: Dict[Tuple[str, str], _Handle] = {}
+        # Versão atual por (modelo, rótulo), para remover o handle da versão anterior
+        self._versions: Dict[Tuple[str, str], str] = {}
+        self._unavailable_until: Dict[str, float] = {}
+        self.stats = {"created": 0, "renewed": 0, "hits": 0, "fallbacks": 0, "errors": 0}
+
+    @staticmethod
+    def version(system_instruction: str, content: str) -> str:
+        """Versão dos dados do prefixo: muda quando o esquema ou as instruções mudam"""
+        digest = hashlib.sha256()
+        digest.update(system_instruction.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(content.encode("utf-8"))
+        return digest.hexdigest()[:16]
+
+    def handle(self, model: Optional[str], system_instruction: str, content: str, label: str) -> Optional[str]:
+        """
+        Handle do prefixo para o modelo, registrando ou renovando quando necessário
+
+        Args:
+            model: Modelo da chamada (padrão: GEMINI_CONFIG["model"])
+            system_instruction: Instrução de sistema estática
+            content: Conteúdo estático enviado antes da parte variável (ex.: esquema)
+            label: Etapa do pipeline (nome de exibição do cache)
+
+        Returns:
+            Nome do cached content no provedor, ou None para seguir sem cache
+        """
+        model = model or GEMINI_CONFIG["model"]
+        if (len(system_instruction) + len(content)) // 4 < self.min_tokens:
+            return None
+        now = self.clock()
+        if self._unavailable_until.get(model, 0) > now:
+            self.stats["fallbacks"] += 1
+            return None
+        version = self.version(system_instruction, content)
+        key = (model, version)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # Uma única criação/renovação por versão, mesmo com chamadas concorrentes
+        with key_lock:
+            handle = self._handles.get(key)
+            try:
+                if handle is not None and handle.expires_at <= now:
+                    # Expirou no provedor sem ser renovado (etapa ociosa por mais que o TTL)
+                    del self._handles[key]
+                    handle = None
+                if handle is None:
+                    handle = self._create(model, version, system_instruction, content, label)
+                elif handle.expires_at - now < self.renew_margin:
+                    try:
+                        self.api.update(handle.name, self.ttl)
+                        handle.expires_at = now + self.ttl
+                        self.stats["renewed"] += 1
+                        logger.info("Cache de contexto %s renovado por %ss", handle.name, int(self.ttl))
+                    except Exception as e:
+                        # Handle removido no provedor: registra a mesma versão de novo
+                        logger.info("Falha ao renovar o cache de contexto %s (%s); registrando novamente",
+                                    handle.name, e)
+                        del self._handles[key]
+                        handle = self._create(model, version, system_instruction, content, label)
+            except Exception as e:
+                self.stats["errors"] += 1
+                self.stats["fallbacks"] += 1
+                self._handles.pop(key, None)
+                self._unavailable_until[model] = now + self.retry_seconds
+                logger.warning("Cache de contexto indisponível para %s (%s); seguindo sem cache por %ss",
+                               model, e, int(self.retry_seconds))
+                return None
+        self.stats["hits"] += 1
+        return handle.name
+
+    def _create(self, model: str, version: str, system_instruction: str, content: str, label: str) -> _Handle:
+        name = self.api.create(model, system_instruction, content, self.ttl, f"{label}-{version}")
+        handle = self._handles[(model, version)] = _Handle(name, self.clock() + self.ttl)
+        self.stats["created"] += 1
+        logger.info("Cache de contexto %s registrado para %s (%s, versão %s)", name, model, label, version)
+        previous = self._versions.get((model, label))
+        self._versions[(model, label)] = version
+        if previous and previous != version:
+            old = self._handles.pop((model, previous), None)
+            if old is not None:
+                self._delete(old.name)
+        return handle
+
+    def _delete(self, name: str) -> None:
+        try:
+            self.api.delete(name)
+        except Exception as e:
+            # O provedor remove o conteúdo ao fim do TTL de qualquer forma
+            logger.info("Falha ao remover o cache de contexto %s: %s", name, e)
+
+    def invalidate(self, name: str, error: Exception = None) -> None:
+        """Descarta o handle recusado pelo provedor; a próxima chamada registra de novo"""
+        with self._lock:
+            for key, handle in list(self._handles.items()):
+                if handle.name == name:
+                    del self._handles[key]
+        self.stats["fallbacks"] += 1
+        logger.warning("Cache de contexto %s recusado pelo provedor (%s); seguindo sem cache", name, error)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(self.stats, handles=len(self._handles))
+
+
+_context_cache: Optional[ContextCache] = None
+_context_cache_lock = threading.Lock()
+
+
+def get_context_cache(get_client: Callable[[], Any]) -> Optional[ContextCache]:
+    """Retorna o cache de contexto compartilhado do processo (None quando desabilitado)"""
+    global _context_cache
+    if not CONTEXT_CACHE_CONFIG.get("enabled"):
+        return None
+    with _context_cache_lock:
+        if _context_cache is None:
+            _context_cache = ContextCache(GeminiCacheAPI(get_client))
+        return _context_cache
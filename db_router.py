@@ -0,0 +1,300 @@
+"""
+Roteamento de consultas entre múltiplos bancos e mesclagem local de resultados
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+from config import DB_CONFIG, DATABASES_CONFIG
+from connection_pool import ConnectionPool, build_connection_string
+
+logger = logging.getLogger("db_router")
+
+_AGGREGATE = re.compile(r"^\s*(COUNT_BIG|COUNT|SUM|MIN|MAX|AVG)\s*\(", re.IGNORECASE)
+_AGGREGATE_CALL = re.compile(r"\b(?:COUNT_BIG|COUNT|SUM|MIN|MAX|AVG)\s*\(", re.IGNORECASE)
+_ALIAS = re.compile(r"^\s*(?:(?:AS\s+)?(?:\[[^\]]+\]|\w+|'[^']*'|\"[^\"]*\"))?\s*$", re.IGNORECASE)
+_TABLES = re.compile(r"\b(?:FROM|JOIN)\s+((?:\[?\w+\]?\.)*\[?\w+\]?)", re.IGNORECASE)
+_SELECT = re.compile(
+    r"^\s*SELECT\s+(?:DISTINCT\s+)?(?:TOP\s*\(?\s*(?P<top>\d+|\?)\s*\)?\s+)?(?P<items>.*?)\s+FROM\s",
+    re.IGNORECASE | re.DOTALL
+)
+_TOP = re.compile(r"\bSELECT\s+(?:DISTINCT\s+)?TOP\s*\(?\s*(?P<top>\d+|\?)", re.IGNORECASE)
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_GROUP_BY = re.compile(r"\bGROUP\s+BY\b", re.IGNORECASE)
+_ORDER_BY = re.compile(r"\bORDER\s+BY\s+(?P<items>.+?)(?:\bOFFSET\b|\bFOR\b|\bOPTION\b|;|$)",
+                       re.IGNORECASE | re.DOTALL)
+
+
+class DatabaseRegistry:
+    """
+    Registro de bancos nomeados, cada um com seu próprio pool de conexões.
+
+    O banco padrão vem de DB_CONFIG; bancos adicionais (ex.: bancos regionais
+    com o mesmo esquema) são lidos do arquivo indicado em DATABASES_CONFIG.
+    """
+
+    def __init__(self, databases: Dict[str, Dict[str, Any]] = None, config: Dict[str, Any] = None,
+                 connect=None):
+        self.config = config or DATABASES_CONFIG
+        self.default = self.config.get("default_database", "default")
+        self._connect = connect
+        self._pools: Dict[str, ConnectionPool] = {}
+        self._lock = threading.Lock()
+        self.databases = databases if databases is not None else self._load_databases()
+        if self.default not in self.databases:
+            self.databases[self.default] = dict(DB_CONFIG)
+
+    def _load_databases(self) -> Dict[str, Dict[str, Any]]:
+        databases: Dict[str, Dict[str, Any]] = {}
+        path = self.config.get("registry_path")
+        if not path or not os.path.exists(path):
+            return databases
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                entries = json.load(file).get("databases", {})
+            for name, entry in entries.items():
+                db_config = dict(DB_CONFIG)
+                db_config.update({key: value for key, value in entry.items() if not key.endswith("_env")})
+                # Credenciais podem ser referenciadas por variável de ambiente (ex.: "password_env")
+                for key, value in entry.items():
+                    if key.endswith("_env"):
+                        db_config[key[:-4]] = os.getenv(value, "")
+                databases[name] = db_config
+            logger.info(f"Registro de bancos carregado de {path}: {', '.join(databases)}")
+        except Exception as e:
+            logger.error(f"Erro ao carregar registro de bancos: {str(e)}")
+        return databases
+
+    def names(self) -> List[str]:
+        return list(self.databases)
+
+    def pool(self, name: str) -> ConnectionPool:
+        """Retorna (criando sob demanda) o pool do banco informado"""
+        if name not in self.databases:
+            raise ValueError(f"Banco de dados não registrado: {name}")
+        with self._lock:
+            pool = self._pools.get(name)
+            if pool is None:
+                pool = ConnectionPool(
+                    name,
+                    build_connection_string(self.databases[name]),
+                    size=self.config.get("pool_size", 5),
+                    timeout=self.config.get("pool_timeout", 30.0),
+                    connect=self._connect
+                )
+                self._pools[name] = pool
+            return pool
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {name: pool.get_stats() for name, pool in self._pools.items()}
+
+
+_registry: Optional[DatabaseRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_database_registry() -> DatabaseRegistry:
+    """Retorna o registro de bancos compartilhado do processo"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = DatabaseRegistry()
+        return _registry
+
+
+def _clean_identifier(identifier: str) -> str:
+    return identifier.split(".")[-1].strip("[]").strip()
+
+
+def extract_tables(sql: str) -> List[str]:
+    """Tabelas referenciadas em cláusulas FROM/JOIN"""
+    tables = []
+    for match in _TABLES.finditer(sql):
+        table = _clean_identifier(match.group(1))
+        if table not in tables:
+            tables.append(table)
+    return tables
+
+
+def route_query(sql: str, db_schema: Dict[str, Any], default: str) -> List[str]:
+    """
+    Determina em quais bancos a consulta deve ser executada
+
+    Cada tabela do esquema pode declarar a lista "databases" onde existe;
+    tabelas sem essa chave ficam no banco padrão. Tabelas combinadas na mesma
+    consulta precisam coexistir nos mesmos bancos.
+    """
+    schema_by_name = {name.lower(): table for name, table in (db_schema or {}).items() if isinstance(table, dict)}
+    targets: Optional[List[str]] = None
+    for table in extract_tables(sql):
+        table_schema = schema_by_name.get(table.lower(), {})
+        databases = table_schema.get("databases") or [default]
+        targets = databases if targets is None else [name for name in targets if name in databases]
+    if targets is None:
+        return [default]
+    if not targets:
+        raise ValueError("As tabelas da consulta não estão disponíveis em um mesmo banco de dados")
+    return list(targets)
+
+
+def _split_top_level(text: str) -> List[str]:
+    items, depth, current = [], 0, []
+    for char in text:
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        if char == "," and depth == 0:
+            items.append("".join(current).strip())
+            current = []
+        else:
+            current.append(char)
+    if current:
+        items.append("".join(current).strip())
+    return items
+
+
+def _aggregate_item(item: str) -> Optional[Tuple[str, str]]:
+    """
+    Função e argumento quando o item do SELECT é só uma agregação (com alias opcional)
+
+    Expressões com agregações, como SUM(a)/COUNT(*) ou MAX(a) - MIN(a), não contam.
+    """
+    match = _AGGREGATE.match(item)
+    if not match:
+        return None
+    depth = 1
+    for position in range(match.end(), len(item)):
+        if item[position] == "(":
+            depth += 1
+        elif item[position] == ")":
+            depth -= 1
+            if depth == 0:
+                if not _ALIAS.match(item[position + 1:]):
+                    return None
+                return match.group(1).upper(), item[match.end():position]
+    return None
+
+
+def _merge_aggregates(rows: List[Dict[str, Any]], functions: List[Optional[str]]) -> List[Dict[str, Any]]:
+    """Reagrega linhas parciais: COUNT/SUM somam, MIN/MAX comparam; demais colunas formam o grupo"""
+    groups: Dict[tuple, List[Any]] = {}
+    keys: List[str] = []
+    for row in rows:
+        keys = list(row.keys())
+        values = list(row.values())
+        group_key = tuple(value for value, function in zip(values, functions) if function is None)
+        current = groups.get(group_key)
+        if current is None:
+            groups[group_key] = values
+            continue
+        for index, function in enumerate(functions):
+            if function is None or values[index] is None:
+                continue
+            if current[index] is None:
+                current[index] = values[index]
+            elif function in ("COUNT", "COUNT_BIG", "SUM"):
+                current[index] += values[index]
+            elif function == "MIN":
+                current[index] = min(current[index], values[index])
+            elif function == "MAX":
+                current[index] = max(current[index], values[index])
+    return [dict(zip(keys, values)) for values in groups.values()]
+
+
+def _sort_rows(rows: List[Dict[str, Any]], order_items: List[str]) -> List[Dict[str, Any]]:
+    if not rows:
+        return rows
+    columns = list(rows[0].keys())
+    lowered = {column.lower(): column for column in columns}
+    # Ordenações estáveis aplicadas da última chave para a primeira
+    for item in reversed(order_items):
+        parts = item.split()
+        descending = len(parts) > 1 and parts[-1].upper() == "DESC"
+        expression = parts[0] if parts else ""
+        if expression.isdigit() and 0 < int(expression) <= len(columns):
+            column = columns[int(expression) - 1]
+        else:
+            column = lowered.get(_clean_identifier(expression).lower())
+        if column is None:
+            logger.warning(f"Não foi possível reordenar localmente pela expressão '{item}'")
+            continue
+        present = [row for row in rows if row.get(column) is not None]
+        missing = [row for row in rows if row.get(column) is None]
+        present.sort(key=lambda row: row[column], reverse=descending)
+        # No SQL Server, NULL é o menor valor
+        rows = present + missing if descending else missing + present
+    return rows
+
+
+def _top_limit(sql: str, params: List[Any] = None) -> Optional[int]:
+    """
+    TOP do SELECT externo da consulta
+
+    Subconsultas e CTEs (entre parênteses) são ignoradas; em TOP (?) o valor é o
+    parâmetro na posição do marcador, contando os "?" anteriores fora de literais.
+    """
+    masked = _STRING_LITERAL.sub(lambda match: "''", sql)
+    for match in _TOP.finditer(masked):
+        before = masked[:match.start()]
+        if before.count("(") != before.count(")"):
+            continue
+        if match.group("top") != "?":
+            return int(match.group("top"))
+        index = masked[:match.start("top")].count("?")
+        if params is None or index >= len(params):
+            logger.warning("Parâmetro do TOP (?) não informado; resultado combinado limitado só por max_rows")
+            return None
+        return int(params[index])
+    return None
+
+
+def merge_results(sql: str, partials: List[List[Dict[str, Any]]], max_rows: int = None,
+                  params: List[Any] = None) -> List[Dict[str, Any]]:
+    """
+    Combina os resultados de uma mesma consulta executada em vários bancos
+
+    Args:
+        sql: Consulta executada (parametrizada ou não)
+        partials: Lista de resultados, um por banco
+        max_rows: Limite máximo de linhas do resultado combinado
+        params: Parâmetros da consulta (usado para resolver TOP (?))
+
+    Returns:
+        Linhas combinadas: concatenadas, reagregadas, reordenadas e limitadas
+    """
+    rows = [row for partial in partials if partial for row in partial]
+    select = _SELECT.match(sql)
+    top = _top_limit(sql, params)
+    if select:
+        items = _split_top_level(select.group("items"))
+        aggregates = [_aggregate_item(item) for item in items]
+        functions = [aggregate[0] if aggregate else None for aggregate in aggregates]
+        # Agregações dentro de expressões não podem ser recombinadas nem servir de grupo
+        compound = any(aggregate is None and _AGGREGATE_CALL.search(item)
+                       for item, aggregate in zip(items, aggregates))
+        if any(functions) or compound:
+            mergeable = not compound and all(
+                aggregate[0] != "AVG" and "DISTINCT" not in aggregate[1].upper()
+                for aggregate in aggregates if aggregate
+            )
+            has_group_by = bool(_GROUP_BY.search(sql))
+            if mergeable and (has_group_by or all(functions)):
+                rows = _merge_aggregates(rows, functions)
+            else:
+                logger.warning("Agregação não pode ser recombinada localmente (AVG/DISTINCT/expressão); "
+                               "resultados parciais foram apenas concatenados")
+
+    order_by = _ORDER_BY.search(sql)
+    if order_by:
+        rows = _sort_rows(rows, _split_top_level(order_by.group("items")))
+
+    for limit in (top, max_rows):
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+    return rows
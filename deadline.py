@@ -0,0 +1,183 @@
+"""
+Prazo de ponta a ponta por requisição, dividido entre as etapas, e disjuntores por dependência
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, Any, Callable, List, Optional
+
+from config import DEADLINE_CONFIG
+
+logger = logging.getLogger("deadline")
+
+STAGES = ("intent", "sql", "execute", "answer")
+
+
+class DependencyUnavailable(Exception):
+    """Uma dependência (LLM ou banco) não pode atender dentro do prazo"""
+
+
+class DeadlineExceeded(DependencyUnavailable):
+    """O orçamento de tempo da requisição ou da etapa terminou"""
+
+    def __init__(self, stage: str, message: str = None):
+        super().__init__(message or f"Prazo esgotado na etapa '{stage}'")
+        self.stage = stage
+
+
+class CircuitOpenError(DependencyUnavailable):
+    """O disjuntor da dependência está aberto após falhas seguidas"""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"Disjuntor aberto para '{name}' (nova tentativa em {retry_in:.1f}s)")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class Deadline:
+    """
+    Prazo absoluto de uma requisição.
+
+    O tempo restante é repartido entre as etapas que ainda faltam, na proporção
+    de `stage_budgets`; o que uma etapa não usa passa para as seguintes.
+    """
+
+    def __init__(self, seconds: float, budgets: Dict[str, float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self.seconds = seconds
+        self.expires_at = clock() + seconds
+        self.budgets = budgets or DEADLINE_CONFIG.get("stage_budgets", {})
+
+    def remaining(self) -> float:
+        return max(self.expires_at - self.clock(), 0.0)
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def stage_timeout(self, stage: str, stages: List[str] = None) -> float:
+        """
+        Tempo disponível para a etapa
+
+        Args:
+            stage: Etapa atual
+            stages: Etapas restantes, incluindo a atual (padrão: a atual e as seguintes em STAGES)
+
+        Returns:
+            Segundos para a etapa
+
+        Raises:
+            DeadlineExceeded: Quando o prazo da requisição já terminou
+        """
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(stage)
+        if stages is None:
+            stages = list(STAGES[STAGES.index(stage):]) if stage in STAGES else [stage]
+        total = sum(self.budgets.get(name, 1.0) for name in stages)
+        share = self.budgets.get(stage, 1.0) / total if total else 1.0
+        return remaining * share
+
+
+class CircuitBreaker:
+    """
+    Disjuntor de uma dependência: fechado, aberto ou meio-aberto.
+
+    Após `failure_threshold` falhas seguidas (timeouts e indisponibilidade) o
+    disjuntor abre e as chamadas falham imediatamente por `reset_timeout`
+    segundos; depois disso uma única chamada de teste decide se ele fecha.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._stats = {"opened": 0, "rejected": 0}
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if self.clock() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        """
+        Autoriza uma chamada
+
+        Returns:
+            True quando a chamada é a chamada de teste do estado meio-aberto
+
+        Raises:
+            CircuitOpenError: Quando o disjuntor está aberto (ou já há uma chamada de teste)
+        """
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return False
+            if state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            self._stats["rejected"] += 1
+            retry_in = max(self.reset_timeout - (self.clock() - self._opened_at), 0.0)
+            raise CircuitOpenError(self.name, retry_in)
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            # A chamada de teste falhou, ou as falhas seguidas atingiram o limite
+            if self._probing or (self._opened_at is None and self._failures >= self.failure_threshold):
+                self._stats["opened"] += 1
+                logger.warning("Disjuntor aberto para %s após %s falha(s)", self.name, self._failures)
+                self._opened_at = self.clock()
+            self._probing = False
+
+    def abandon(self) -> None:
+        """Libera a chamada de teste que terminou sem sucesso nem falha da dependência"""
+        with self._lock:
+            self._probing = False
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats, state=self._state(), failures=self._failures)
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """Retorna (criando sob demanda) o disjuntor compartilhado da dependência"""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                name,
+                DEADLINE_CONFIG.get("breaker_failure_threshold", 5),
+                DEADLINE_CONFIG.get("breaker_reset_seconds", 30.0)
+            )
+            _breakers[name] = breaker
+        return breaker
+
+
+def breaker_stats() -> Dict[str, Any]:
+    with _breakers_lock:
+        return {name: breaker.get_stats() for name, breaker in _breakers.items()}
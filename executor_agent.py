@@ -4,32 +4,93 @@ Agente Executor para execução de consultas SQL/API
 
 import json
 import logging
+import math
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, List, Union
 
-import requests
-from config import EXECUTOR_CONFIG, DB_CONFIG, API_CONFIG, LOGGING_CONFIG
+from config import (EXECUTOR_CONFIG, DB_CONFIG, API_CONFIG, DATABASES_CONFIG, RESULT_STORE_CONFIG, AGGREGATE_CONFIG,
+                    POLICY_CONFIG, INCREMENTAL_CONFIG)
+from log_pipeline import setup_logging
+from result_serializer import EncoderPlan
+from result_store import ResultStore
+from db_router import DatabaseRegistry, get_database_registry, route_query, merge_results
+from api_client import APIClient
+from aggregate_cache import AggregateCache
+from incremental_refresh import IncrementalResults
+from deadline import DeadlineExceeded, DependencyUnavailable, get_breaker
+from cache_backend import CacheBackend, create_cache
+from policy_engine import PolicyEngine, RolePolicy
 
-logging.basicConfig(
-    level=LOGGING_CONFIG.get("level", logging.INFO),
-    format=LOGGING_CONFIG.get("format", '%(asctime)s - %(name)s - %(levelname)s - %(message)s'),
-    filename=LOGGING_CONFIG.get("file_path"),
-)
+setup_logging()
 
 logger = logging.getLogger("executor_agent")
 
+def _is_stall(error: Exception) -> bool:
+    """Timeouts e falhas de conexão (disparam o disjuntor); erros de SQL não contam"""
+    if isinstance(error, (TimeoutError, DependencyUnavailable)):
+        return True
+    state = error.args[0] if getattr(error, "args", None) and isinstance(error.args[0], str) else ""
+    # SQLSTATE do ODBC: HYT00/HYT01 (tempo esgotado) e classe 08 (conexão)
+    return state.startswith(("HYT", "08"))
+
+
 class ExecutorAgent:
-    def __init__(self, config: Dict[str, Any] = None):
+    def __init__(self, config: Dict[str, Any] = None, registry: DatabaseRegistry = None,
+                 api_client: APIClient = None, aggregates: AggregateCache = None,
+                 result_cache: CacheBackend = None, policy: PolicyEngine = None,
+                 incremental: IncrementalResults = None):
         self.config = config or EXECUTOR_CONFIG
         self.db_config = DB_CONFIG
         self.api_config = API_CONFIG
+        self.registry = registry or get_database_registry()
+        self.db_schema = self.config.get("db_schema", {})
+        self.max_rows = self.config.get("max_rows", EXECUTOR_CONFIG["max_rows"])
+        self._fan_out = ThreadPoolExecutor(max_workers=DATABASES_CONFIG.get("fan_out_workers", 8),
+                                           thread_name_prefix="db-fan-out")
+        self._api_client = api_client
+        self._api_client_lock = threading.Lock()
+        if aggregates is None and AGGREGATE_CONFIG.get("enabled"):
+            aggregates = AggregateCache(self.registry)
+        self.aggregates = aggregates
+        # Resultados recentes por (bancos, SQL, parâmetros), compartilhados entre workers no backend sqlite
+        self.result_cache = result_cache if result_cache is not None else create_cache("sql_result")
+        # Máscaras e filtros por perfil, compilados uma vez a partir dos regulamentos
+        if policy is None and POLICY_CONFIG.get("enabled"):
+            policy = PolicyEngine.from_regulations(self.config.get("regulations"))
+        self.policy = policy
+        # Resultados mantidos por chave primária, atualizados só com as linhas alteradas
+        if incremental is None and INCREMENTAL_CONFIG.get("enabled"):
+            incremental = IncrementalResults(self.registry, self.db_schema)
+        self.incremental = incremental
         logger.info("Agente Executor inicializado")
         
-    def execute_query(self, query_type: str, query_data: Union[str, Dict[str, Any]]) -> Dict[str, Any]:
+    def execute_query(self, query_type: str, query_data: Union[str, Dict[str, Any]],
+                      params: List[Any] = None, databases: Union[str, List[str]] = None,
+                      timeout: float = None, role: str = None, incremental: bool = False) -> Dict[str, Any]:
+        """
+        Executa uma consulta SQL ou chamada de API
+
+        Args:
+            query_type: sql ou api
+            query_data: SQL (parametrizado ou não) ou dados da chamada de API
+            params: Parâmetros da consulta SQL
+            databases: Banco(s) de destino; quando omitido, é definido pelo esquema
+            timeout: Orçamento da etapa em segundos (limitado por EXECUTOR_CONFIG["timeout"])
+            role: Perfil de acesso cujas políticas são aplicadas ao resultado SQL (padrão: perfil padrão)
+            incremental: Mantém o resultado por chave primária e, nas repetições, lê apenas
+                as linhas alteradas desde a última DataAlteracao vista
+
+        Returns:
+            Dicionário com o resultado da execução
+        """
         logger.info(f"Executando consulta do tipo {query_type}")
         result = {
             "query_type": query_type,
             "query_data": query_data,
+            "params": params,
+            "databases": None,
             "execution_time": None,
             "result": None,
             "error": None
@@ -39,60 +100,212 @@ class ExecutorAgent:
             start_time = time.time()
             
             if query_type == "sql":
-                result["result"] = self._execute_sql(query_data)
+                policy = self.policy.role(role) if self.policy is not None else None
+                if policy is not None:
+                    result["policy_role"] = policy.name
+                if databases is None:
+                    databases = route_query(query_data, self.db_schema, self.registry.default)
+                elif isinstance(databases, str):
+                    databases = [databases]
+                result["databases"] = databases
+                local_rows = self._answer_locally(query_data, params, databases, timeout)
+                refreshed = None
+                if local_rows is None and incremental:
+                    refreshed = self._refresh_incremental(query_data, params, databases, timeout, policy)
+                if local_rows is not None:
+                    result["result"] = policy.apply_records(local_rows) if policy is not None else local_rows
+                    result["local_aggregate"] = True
+                elif refreshed is not None:
+                    result["result"], result["incremental"] = refreshed
+                else:
+                    result["result"] = self._cached_sql(query_data, params, databases, timeout, policy)
+                result["truncated"] = bool(getattr(result["result"], "truncated", False)
+                                           or result.get("incremental") == "truncated")
             elif query_type == "api":
-                result["result"] = self._execute_api(query_data)
+                result["result"] = self._execute_api(query_data, timeout)
             else:
                 raise ValueError(f"Tipo de consulta não suportado: {query_type}")
             
             result["execution_time"] = time.time() - start_time
             logger.info(f"Consulta executada em {result['execution_time']:.2f} segundos")
             
+        except DependencyUnavailable as e:
+            logger.warning("Banco indisponível para a consulta: %s", e)
+            result["error"] = str(e)
+            result["unavailable"] = True
         except Exception as e:
             logger.error(f"Erro ao executar consulta: {str(e)}", exc_info=True)
             result["error"] = str(e)
             
         return result
     
-    def _execute_sql(self, sql_query: str) -> List[Dict[str, Any]]:
-        logger.info(f"Executando SQL: {sql_query}")
-        
-        import pyodbc
-
-        conn_str = (
-            f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-            f"SERVER={self.db_config['server']};"
-            f"DATABASE={self.db_config['database']};"
-            f"UID={self.db_config['username']};"
-            f"PWD={self.db_config['password']}"
+    def _answer_locally(self, sql_query: str, params: List[Any], databases: List[str],
+                        timeout: float = None) -> Union[List[Dict[str, Any]], None]:
+        """Responde contagens sobre Cadastro pelos agregados locais, quando possível"""
+        if self.aggregates is None or databases != [self.aggregates.database]:
+            return None
+        return self.aggregates.answer(sql_query, params, self._query_timeout(timeout))
+
+    def _refresh_incremental(self, sql_query: str, params: List[Any], databases: List[str],
+                             timeout: float = None, policy: RolePolicy = None):
+        """Resultado pela atualização incremental, ou None quando a consulta não é suportada"""
+        if self.incremental is None or len(databases) != 1:
+            return None
+        breaker = get_breaker(f"db:{databases[0]}")
+        breaker.allow()
+        try:
+            refreshed = self.incremental.fetch(sql_query, params, databases[0], self._query_timeout(timeout),
+                                               self.max_rows)
+        except Exception as e:
+            if not _is_stall(e):
+                breaker.record_success()
+                raise
+            breaker.record_failure()
+            raise DeadlineExceeded("execute", f"Tempo esgotado na consulta em {databases[0]}: {str(e)}") from e
+        breaker.record_success()
+        if refreshed is None:
+            return None
+        columns, rows, mode = refreshed
+        # O resultado guardado é compartilhado entre perfis; as políticas valem na saída
+        if policy is not None:
+            view = policy.view(columns)
+            columns, rows = view.columns, view.apply(rows)
+        return [dict(zip(columns, row)) for row in rows], mode
+
+    def _run_sql(self, sql_query: str, params: List[Any], databases: List[str],
+                 timeout: float = None, policy: RolePolicy = None) -> Union[List[Dict[str, Any]], ResultStore]:
+        if len(databases) == 1:
+            return self._execute_sql(sql_query, params, databases[0], timeout, policy)
+        return self._execute_fan_out(sql_query, params, databases, timeout, policy)
+
+    def _cached_sql(self, sql_query: str, params: List[Any], databases: List[str],
+                    timeout: float = None, policy: RolePolicy = None) -> Union[List[Dict[str, Any]], ResultStore]:
+        """Executa a consulta uma única vez por chave enquanto o resultado está no cache"""
+        if self.result_cache is None:
+            return self._run_sql(sql_query, params, databases, timeout, policy)
+        # O resultado guardado já está mascarado, então o perfil faz parte da chave
+        key = json.dumps([databases, sql_query, params or [], policy.name if policy else None],
+                         ensure_ascii=False, default=str)
+        # Resultados que foram para disco não são copiados para o cache
+        return self.result_cache.get_or_compute(
+            key, lambda: self._run_sql(sql_query, params, databases, timeout, policy),
+            should_cache=lambda rows: isinstance(rows, list)
         )
 
+    def _query_timeout(self, timeout: float = None) -> float:
+        """Limite da consulta: o orçamento da etapa, sem passar do timeout configurado"""
+        configured = self.config.get("timeout", EXECUTOR_CONFIG["timeout"])
+        return configured if timeout is None else min(timeout, configured)
+
+    def _execute_sql(self, sql_query: str, params: List[Any] = None, database: str = None,
+                     timeout: float = None, policy: RolePolicy = None) -> Union[List[Dict[str, Any]], ResultStore]:
+        database = database or self.registry.default
+        logger.info(f"Executando SQL em {database}: {sql_query} | Parâmetros: {params}")
+        timeout = self._query_timeout(timeout)
+        breaker = get_breaker(f"db:{database}")
+        breaker.allow()
+
         try:
-            with pyodbc.connect(conn_str) as conn:
+            with self.registry.pool(database).connection(timeout) as conn:
+                # Timeout de consulta do driver (segundos inteiros; o servidor cancela a instrução)
+                conn.timeout = max(1, math.ceil(timeout))
                 with conn.cursor() as cursor:
-                    cursor.execute(sql_query)
-                    columns = [column[0] for column in cursor.description]
-                    results = []
-                    for row in cursor.fetchall():
-                        results.append(dict(zip(columns, row)))
-                    return results
+                    if params:
+                        cursor.execute(sql_query, params)
+                    else:
+                        cursor.execute(sql_query)
+                    # Plano de codificação montado uma vez a partir de cursor.description
+                    plan = EncoderPlan.from_description(cursor.description)
+                    # Políticas de acesso aplicadas coluna a coluna em cada lote, antes de guardar
+                    view = policy.view(plan.columns) if policy is not None else None
+                    # Linhas lidas em lotes; o excedente ao buffer em memória vai para disco
+                    store = ResultStore(view.columns if view else plan.columns, RESULT_STORE_CONFIG)
+                    fetch_batch = RESULT_STORE_CONFIG.get("fetch_batch", 500)
+                    remaining = self.max_rows
+                    while remaining > 0:
+                        size = min(fetch_batch, remaining)
+                        rows = cursor.fetchmany(size)
+                        encoded = plan.encode_rows(rows)
+                        store.append_rows(view.apply(encoded) if view else encoded)
+                        remaining -= len(rows)
+                        if len(rows) < size:
+                            break
+                    if remaining <= 0 and cursor.fetchmany(1):
+                        store.truncated = True
+                        logger.warning("Resultado em %s cortado em %s linhas (EXECUTOR_MAX_ROWS)", database,
+                                       self.max_rows)
+            breaker.record_success()
+            return store.to_result()
         except Exception as e:
-            logger.error(f"Erro ao executar SQL: {str(e)}", exc_info=True)
+            if not _is_stall(e):
+                breaker.record_success()
+                logger.error(f"Erro ao executar SQL em {database}: {str(e)}", exc_info=True)
+                raise
+            breaker.record_failure()
+            raise DeadlineExceeded("execute", f"Tempo esgotado na consulta em {database}: {str(e)}") from e
+
+    def _execute_fan_out(self, sql_query: str, params: List[Any], databases: List[str],
+                         timeout: float = None, policy: RolePolicy = None
+                         ) -> Union[List[Dict[str, Any]], ResultStore]:
+        """
+        Executa a mesma consulta em vários bancos em paralelo e combina os resultados localmente
+
+        A combinação (reordenação e reagregação) lê todas as linhas parciais em
+        memória, inclusive as que cada banco gravou em disco: o pico é de até
+        `max_rows` linhas por banco. O resultado combinado volta a ser gravado em
+        disco quando passa do buffer em memória.
+        """
+        logger.info(f"Executando consulta em {len(databases)} bancos: {', '.join(databases)}")
+        futures = [
+            self._fan_out.submit(self._execute_sql, sql_query, params, database, timeout, policy)
+            for database in databases
+        ]
+        partials = [future.result() for future in futures]
+        merged = merge_results(sql_query, partials, self.max_rows, params)
+        for partial in partials:
+            if isinstance(partial, ResultStore):
+                partial.close()
+        truncated = any(getattr(partial, "truncated", False) for partial in partials)
+        if not merged or (not truncated and len(merged) <= RESULT_STORE_CONFIG.get("memory_rows", 2000)):
+            return merged
+        columns = list(merged[0])
+        store = ResultStore(columns, RESULT_STORE_CONFIG)
+        store.append_rows([tuple(row.get(column) for column in columns) for row in merged])
+        # Algum banco foi cortado no limite: o resultado combinado também é parcial
+        store.truncated = truncated
+        return store
     
-    def _execute_api(self, api_data: Dict[str, Any]) -> Union[Dict[str, Any], List[Dict[str, Any]]]:
-        logger.info(f"Executando chamada de API: {json.dumps(api_data)}")
-        
-        endpoint = api_data.get("endpoint", "/api/cadastro")
-        params = api_data.get("params", {})
-        
-        if endpoint == "/api/cadastro":
-            return [
-                {"Id": 1, "Nome": "João Silva", "Email": "joao@email.com", "DataInclusao": "2023-04-01T10:30:00", "Status": "Ativo"},
-                {"Id": 2, "Nome": "Maria Souza", "Email": "maria@email.com", "DataInclusao": "2023-05-05T14:20:00", "Status": "Ativo"},
-                {"Id": 3, "Nome": "Pedro Santos", "Email": "pedro@gmail.com", "DataInclusao": "2023-05-10T09:15:00", "Status": "Ativo"}
-            ]
-        else:
-            raise ValueError(f"Endpoint não suportado: {endpoint}")
+    @property
+    def api_client(self) -> APIClient:
+        """Cliente de API compartilhado, criado na primeira chamada"""
+        with self._api_client_lock:
+            if self._api_client is None:
+                api_references = self.config.get("api_references")
+                if api_references is None:
+                    from agent_initializer import AgentInitializer
+                    api_references = AgentInitializer()._load_api_references()
+                self._api_client = APIClient(api_references, self.api_config,
+                                             timeout=self.config.get("timeout", EXECUTOR_CONFIG["timeout"]))
+            return self._api_client
+
+    def _execute_api(self, api_data: Union[Dict[str, Any], List[Dict[str, Any]]], timeout: float = None) -> Any:
+        """
+        Executa uma ou várias chamadas de API
+
+        Args:
+            api_data: Chamada (endpoint, params, method), lista de chamadas ou
+                dicionário com a chave "calls"; várias chamadas rodam em paralelo
+
+        Returns:
+            Corpo da resposta, ou lista de corpos na ordem das chamadas
+        """
+        logger.info(f"Executando chamada de API: {json.dumps(api_data, ensure_ascii=False)}")
+
+        if isinstance(api_data, dict) and "calls" in api_data:
+            api_data = api_data["calls"]
+        if isinstance(api_data, list):
+            return self.api_client.execute_many(api_data, timeout)
+        return self.api_client.execute(api_data, timeout)
 
 if __name__ == "__main__":
     executor = ExecutorAgent()
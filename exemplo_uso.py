@@ -8,14 +8,10 @@ import os
 from intelligence_agent import IntelligenceAgent
 from executor_agent import ExecutorAgent
 from result_processor import ResultProcessor
-from config import LOGGING_CONFIG
+from log_pipeline import setup_logging
 
 # Configurar logger
-logging.basicConfig(
-    level=LOGGING_CONFIG.get("level", logging.INFO),
-    format=LOGGING_CONFIG.get("format", '%(asctime)s - %(name)s - %(levelname)s - %(message)s'),
-    filename=LOGGING_CONFIG.get("file_path"),
-)
+setup_logging()
 
 logger = logging.getLogger("exemplo_uso")
 
@@ -0,0 +1,322 @@
+"""
+Atualização incremental de resultados SQL pela marca d'água de DataAlteracao
+
+Todas as tabelas têm DataInclusao e DataAlteracao. Para consultas simples sobre
+uma tabela com chave primária conhecida, o resultado é guardado por chave
+primária junto com a maior DataAlteracao vista. Na atualização, só as linhas
+alteradas desde a marca d'água (menos uma margem) são lidas, com o mesmo
+predicado avaliado no banco como uma coluna (`CASE WHEN ... THEN 1 ELSE 0`):
+linhas que passam a atender entram ou são atualizadas, e as que deixaram de
+atender saem do resultado. Exclusões físicas não aparecem na leitura
+incremental e só são refletidas na recarga completa a cada `rebuild_seconds`.
+"""
+
+import datetime
+import logging
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+from config import INCREMENTAL_CONFIG
+from result_serializer import EncoderPlan
+
+logger = logging.getLogger("incremental_refresh")
+
+_QUERY = re.compile(
+    r"^\s*SELECT\s+(?P<items>.+?)\s+FROM\s+(?P<table>(?:\[?\w+\]?\.)?\[?\w+\]?)"
+    r"(?:\s+(?:AS\s+)?(?!(?:WITH|WHERE|ORDER)\b)(?P<alias>\w+))?"
+    r"(?P<hint>\s+WITH\s*\(\s*NOLOCK\s*\))?"
+    r"(?:\s+WHERE\s+(?P<where>.+?))?(?:\s+ORDER\s+BY\s+(?P<order>.+?))?\s*;?\s*$",
+    re.IGNORECASE | re.DOTALL
+)
+_UNSUPPORTED = re.compile(
+    r"\b(?:JOIN|GROUP\s+BY|HAVING|UNION|INTERSECT|EXCEPT|DISTINCT|TOP|APPLY|OPTION|OVER|"
+    r"COUNT|COUNT_BIG|SUM|AVG|MIN|MAX)\b",
+    re.IGNORECASE
+)
+_NOW = re.compile(r"\b(?:GETDATE|SYSDATETIME|GETUTCDATE|SYSUTCDATETIME)\s*\(\s*\)|\bCURRENT_TIMESTAMP\b",
+                  re.IGNORECASE)
+# Referências ao dia corrente (não à hora): o predicado muda só na virada do dia
+_TODAY = re.compile(
+    r"CAST\s*\(\s*(?:GETDATE|SYSDATETIME)\s*\(\s*\)\s+AS\s+date\s*\)"
+    r"|CONVERT\s*\(\s*date\s*,\s*(?:GETDATE|SYSDATETIME)\s*\(\s*\)\s*\)",
+    re.IGNORECASE
+)
+_ORDER_ITEM = re.compile(r"^(?:\w+\.)?\[?(?P<column>\w+)\]?(?:\s+(?P<direction>ASC|DESC))?$", re.IGNORECASE)
+
+# Colunas auxiliares acrescentadas ao SELECT
+_KEY, _CHANGED, _MATCHES = "_RowKey", "_Changed", "_Matches"
+
+
+def _strip_literals(sql: str) -> str:
+    return re.sub(r"'(?:[^']|'')*'", "''", sql)
+
+
+class _Unsupported(Exception):
+    """A consulta não pode ser mantida de forma incremental"""
+
+
+class IncrementalPlan:
+    """Consultas completa e incremental derivadas de uma consulta simples sobre uma tabela"""
+
+    def __init__(self, sql: str, db_schema: Dict[str, Any], config: Dict[str, Any]):
+        match = _QUERY.match(sql or "")
+        bare = _strip_literals(sql or "")
+        if not match or len(re.findall(r"\bSELECT\b", bare, re.IGNORECASE)) != 1 or _UNSUPPORTED.search(bare):
+            raise _Unsupported("consulta fora do formato SELECT simples sobre uma tabela")
+        items, where = match.group("items").strip(), (match.group("where") or "").strip()
+        if "," in match.group("table") or "?" in items:
+            raise _Unsupported("lista de colunas parametrizada")
+        without_today = _TODAY.sub("", _strip_literals(where))
+        if _NOW.search(without_today) or _NOW.search(_strip_literals(items)):
+            # Janelas deslizantes (DATEADD(..., GETDATE())) mudam sem que as linhas mudem
+            raise _Unsupported("predicado depende da hora corrente")
+        self.day_dependent = bool(_TODAY.search(where))
+
+        table = match.group("table").split(".")[-1].strip("[]")
+        fields = self._fields(db_schema, table)
+        keys = [field["nome"] for field in fields if field.get("is_primary_key")]
+        names = {field["nome"].lower() for field in fields}
+        change_columns = config.get("change_columns", ["DataAlteracao", "DataInclusao"])
+        if len(keys) != 1 or not all(column.lower() in names for column in change_columns):
+            raise _Unsupported(f"tabela {table} sem chave primária simples ou colunas de alteração")
+        prefix = f"{match.group('alias')}." if match.group("alias") else ""
+        source = match.group("table") + (f" {match.group('alias')}" if match.group("alias") else "")
+        source += match.group("hint") or ""
+        changed = f"COALESCE({', '.join(prefix + column for column in change_columns)})"
+        select = f"SELECT {items}, {prefix}{keys[0]} AS {_KEY}, {changed} AS {_CHANGED}"
+
+        self.table = table
+        self.order = self._order(match.group("order"))
+        self.full_sql = f"{select} FROM {source}" + (f" WHERE {where}" if where else "")
+        matches = f"CASE WHEN {where} THEN 1 ELSE 0 END" if where else "1"
+        since = " OR ".join(f"{prefix}{column} >= ?" for column in change_columns)
+        self.delta_sql = f"{select}, {matches} AS {_MATCHES} FROM {source} WHERE ({since})"
+        self.change_columns = change_columns
+
+    @staticmethod
+    def _fields(db_schema: Dict[str, Any], table: str) -> List[Dict[str, Any]]:
+        for name, definition in (db_schema or {}).items():
+            if name.lower() == table.lower() and isinstance(definition, dict):
+                return [field for field in definition.get("campos", []) if isinstance(field, dict) and "nome" in field]
+        raise _Unsupported(f"tabela {table} fora do esquema")
+
+    @staticmethod
+    def _order(order: Optional[str]) -> List[Tuple[str, bool]]:
+        """ORDER BY apenas sobre colunas do resultado, refeito localmente após cada mescla"""
+        if not order:
+            return []
+        spec = []
+        for item in order.split(","):
+            match = _ORDER_ITEM.match(item.strip())
+            if not match:
+                raise _Unsupported(f"ORDER BY por expressão: {item.strip()}")
+            spec.append((match.group("column"), (match.group("direction") or "").upper() == "DESC"))
+        return spec
+
+
+class _Entry:
+    """Resultado guardado: linhas por chave primária e marca d'água"""
+
+    def __init__(self, plan: IncrementalPlan):
+        self.plan = plan
+        self.lock = threading.Lock()
+        self.columns: List[str] = []
+        self.rows: Dict[Any, tuple] = {}
+        self.watermark: Optional[datetime.datetime] = None
+        self.built_at: Optional[float] = None
+        self.built_day: Optional[datetime.date] = None
+        self.refreshed_at: Optional[float] = None
+        self.ordered: List[tuple] = []
+
+
+class IncrementalResults:
+    """
+    Resultados mantidos por chave primária e atualizados pela marca d'água de DataAlteracao
+
+    Usado pelo executor quando a atualização incremental é pedida; consultas
+    fora do formato suportado seguem pelo caminho normal.
+    """
+
+    def __init__(self, registry, db_schema: Dict[str, Any], config: Dict[str, Any] = None,
+                 today=datetime.date.today):
+        """
+        Args:
+            registry: Registro de bancos (pools de conexão)
+            db_schema: Esquema do banco (chaves primárias e colunas de alteração)
+            config: Configuração (padrão: INCREMENTAL_CONFIG)
+            today: Data corrente (predicados sobre o dia são recarregados na virada do dia)
+        """
+        self.config = config or INCREMENTAL_CONFIG
+        self.registry = registry
+        self.db_schema = db_schema
+        self.today = today
+        self.overlap = datetime.timedelta(seconds=self.config.get("watermark_overlap_seconds", 60.0))
+        self.rebuild_seconds = self.config.get("rebuild_seconds", 3600.0)
+        self.min_refresh = self.config.get("min_refresh_seconds", 0.0)
+        self.max_results = self.config.get("max_results", 64)
+        self.fetch_batch = self.config.get("fetch_batch", 5000)
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[tuple, _Entry]" = OrderedDict()
+        self._plans: Dict[str, Optional[IncrementalPlan]] = {}
+        self.stats = {"full": 0, "delta": 0, "reused": 0, "unsupported": 0, "rows_read": 0}
+
+    def plan(self, sql: str) -> Optional[IncrementalPlan]:
+        """Plano incremental da consulta, ou None quando ela não pode ser mantida"""
+        if sql not in self._plans:
+            try:
+                self._plans[sql] = IncrementalPlan(sql, self.db_schema, self.config)
+            except _Unsupported as e:
+                logger.info("Consulta sem atualização incremental (%s): %s", e, sql)
+                self._plans[sql] = None
+        return self._plans[sql]
+
+    def fetch(self, sql: str, params: List[Any], database: str, timeout: float,
+              max_rows: int) -> Optional[Tuple[List[str], List[tuple], str]]:
+        """
+        Resultado atualizado da consulta
+
+        Args:
+            sql: Consulta SQL parametrizada
+            params: Parâmetros da consulta
+            database: Banco de destino
+            timeout: Limite da consulta em segundos
+            max_rows: Limite de linhas do resultado (acima dele, o resultado não é guardado)
+
+        Returns:
+            Tupla (colunas, linhas codificadas, modo: full, delta, cached ou
+            truncated, leitura completa cortada em `max_rows` e não guardada),
+            ou None quando a consulta não é suportada
+        """
+        plan = self.plan(sql)
+        if plan is None:
+            self.stats["unsupported"] += 1
+            return None
+        key = (database, sql, tuple(params or []))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry(plan)
+                while len(self._entries) > self.max_results:
+                    self._entries.popitem(last=False)
+            self._entries.move_to_end(key)
+
+        with entry.lock:
+            now = time.monotonic()
+            rebuild = (entry.built_at is None or now - entry.built_at > self.rebuild_seconds
+                       or (plan.day_dependent and entry.built_day != self.today()))
+            if rebuild:
+                mode = self._rebuild(entry, params, database, timeout, max_rows)
+            elif now - entry.refreshed_at < self.min_refresh:
+                mode = "cached"
+                self.stats["reused"] += 1
+            else:
+                mode = self._refresh(entry, params, database, timeout, max_rows)
+            columns, rows = entry.columns, entry.ordered
+            if mode in ("full", "delta"):
+                entry.refreshed_at = now
+        if mode == "truncated":
+            with self._lock:
+                self._entries.pop(key, None)
+        return columns, rows, mode
+
+    def _query(self, sql: str, params: List[Any], database: str, timeout: float,
+               limit: int) -> Tuple[List[str], List[tuple], List[Any], List[Any], bool]:
+        """Executa a consulta e separa as colunas auxiliares (chave, alteração, atende)"""
+        with self.registry.pool(database).connection(timeout) as conn:
+            conn.timeout = max(1, math.ceil(timeout))
+            with conn.cursor() as cursor:
+                if params:
+                    cursor.execute(sql, params)
+                else:
+                    cursor.execute(sql)
+                description = cursor.description
+                raw: List[tuple] = []
+                while len(raw) <= limit:
+                    batch = cursor.fetchmany(min(self.fetch_batch, limit + 1 - len(raw)))
+                    raw.extend(batch)
+                    if not batch:
+                        break
+        helpers = 3 if description[-1][0] == _MATCHES else 2
+        plan = EncoderPlan.from_description(description[:-helpers])
+        truncated = len(raw) > limit
+        raw = raw[:limit]
+        rows = plan.encode_rows(row[:-helpers] for row in raw)
+        keys = [row[-helpers] for row in raw]
+        extra = [row[-helpers + 1:] for row in raw]
+        self.stats["rows_read"] += len(raw)
+        return plan.columns, rows, keys, extra, truncated
+
+    def _advance(self, entry: _Entry, extra: List[tuple]) -> None:
+        for values in extra:
+            changed = values[0]
+            if changed is not None and (entry.watermark is None or changed > entry.watermark):
+                entry.watermark = changed
+
+    def _rebuild(self, entry: _Entry, params: List[Any], database: str, timeout: float, max_rows: int) -> str:
+        columns, rows, keys, extra, truncated = self._query(entry.plan.full_sql, params, database, timeout,
+                                                            max_rows)
+        entry.columns = columns
+        entry.rows = dict(zip(keys, rows))
+        entry.watermark = None
+        self._advance(entry, extra)
+        if entry.watermark is None:
+            # Resultado vazio: a marca d'água parte do relógio local, recuada pela margem
+            entry.watermark = datetime.datetime.now()
+        entry.built_at = time.monotonic()
+        entry.built_day = self.today()
+        entry.ordered = self._ordered(entry)
+        self.stats["full"] += 1
+        logger.info("Resultado incremental carregado (%s linhas) para %s", len(rows), entry.plan.table)
+        if truncated:
+            # Acima do limite o resultado truncado não pode ser mantido por diferença
+            entry.built_at = None
+            return "truncated"
+        return "full"
+
+    def _refresh(self, entry: _Entry, params: List[Any], database: str, timeout: float, max_rows: int) -> str:
+        since = entry.watermark - self.overlap
+        delta_params = list(params or []) + [since] * len(entry.plan.change_columns)
+        _, rows, keys, extra, truncated = self._query(entry.plan.delta_sql, delta_params, database, timeout,
+                                                      max_rows)
+        if truncated:
+            logger.info("Alterações demais desde a marca d'água; recarregando %s", entry.plan.table)
+            return self._rebuild(entry, params, database, timeout, max_rows)
+        inserted = updated = removed = 0
+        for key, row, values in zip(keys, rows, extra):
+            if values[1]:
+                if key in entry.rows:
+                    updated += entry.rows[key] != row
+                else:
+                    inserted += 1
+                entry.rows[key] = row
+            elif entry.rows.pop(key, None) is not None:
+                removed += 1
+        self._advance(entry, extra)
+        if len(entry.rows) > max_rows:
+            return self._rebuild(entry, params, database, timeout, max_rows)
+        if inserted or updated or removed:
+            entry.ordered = self._ordered(entry)
+        self.stats["delta"] += 1
+        logger.info("Resultado incremental de %s: %s linhas lidas, %s inseridas, %s atualizadas, %s removidas",
+                    entry.plan.table, len(rows), inserted, updated, removed)
+        return "delta"
+
+    @staticmethod
+    def _ordered(entry: _Entry) -> List[tuple]:
+        rows = list(entry.rows.values())
+        lowered = [column.lower() for column in entry.columns]
+        # Ordenações estáveis da última para a primeira chave; nulos primeiro no ASC, como no SQL Server
+        for column, descending in reversed(entry.plan.order):
+            if column.lower() not in lowered:
+                continue
+            index = lowered.index(column.lower())
+            rows.sort(key=lambda row: (row[index] is not None, row[index]), reverse=descending)
+        return rows
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.stats, results=len(self._entries))
@@ -3,42 +3,141 @@ Agente de Inteligência para conversão de linguagem natural em consultas SQL/AP
 """
 
 import logging
+import math
 import os
-from typing import Dict, Any
+import time
+from collections.abc import Sequence
+from contextlib import nullcontext
+from typing import Dict, Any, List, Optional
 
 from agent_initializer import AgentInitializer
 from agent_analyzer import IntentAnalyzer
 from query_generator import QueryGenerator
 from result_processor import ResultProcessor
 from executor_agent import ExecutorAgent
-from config import AGENT_CONFIG, LOGGING_CONFIG
+from llm_scheduler import PRIORITY_INTERACTIVE
+from single_flight import SingleFlight, normalize_question
+from similarity_index import SimilarityIndex
+from sql_templates import TemplateStore, extract_sql_literals, render_sql
+from session_context import SessionStore, refine_sql, is_follow_up, contextual_question
+from traffic_capture import TrafficRecorder
+from query_planner import QueryPlanner
+from deadline import Deadline, DependencyUnavailable
+from admission_control import AdmissionController, Overloaded
+from cache_backend import create_cache
+from result_serializer import encode_value
+from log_pipeline import setup_logging, log_payload
+from config import (
+    AGENT_CONFIG, SIMILARITY_CONFIG, TEMPLATE_CONFIG, SESSION_CONFIG, CAPTURE_CONFIG, DEADLINE_CONFIG,
+    PLANNER_CONFIG, ADMISSION_CONFIG
+)
 
 # Configurar logger
-logging.basicConfig(
-    level=LOGGING_CONFIG.get("level", logging.INFO),
-    format=LOGGING_CONFIG.get("format", '%(asctime)s - %(name)s - %(levelname)s - %(message)s'),
-    filename=LOGGING_CONFIG.get("file_path"),
-)
+setup_logging()
 
 logger = logging.getLogger("intelligence_agent")
 
+def schema_columns(db_schema: Dict[str, Any]) -> List[str]:
+    """Nomes de todas as colunas do esquema (usados nos refinamentos de sessão)"""
+    return [
+        field["nome"]
+        for table in db_schema.values() if isinstance(table, dict)
+        for field in table.get("campos", []) if isinstance(field, dict) and "nome" in field
+    ]
+
+
 class IntelligenceAgent:
-    def __init__(self, config: Dict[str, Any] = None):
+    def __init__(self, config: Dict[str, Any] = None, agent_data: Dict[str, Any] = None):
+        """
+        Args:
+            config: Configuração do agente (padrão: AGENT_CONFIG)
+            agent_data: Dados já carregados (ex.: pelo processo pai no modo prefork);
+                quando omitido, são carregados pelo AgentInitializer
+        """
         self.config = config or AGENT_CONFIG
         logger.info("Inicializando Agente de Inteligência")
         
-        initializer = AgentInitializer()
-        self.agent_data = initializer.initialize_agent()
+        if agent_data is None:
+            agent_data = AgentInitializer().initialize_agent()
+        self.agent_data = agent_data
         
         self.analyzer = IntentAnalyzer(self.agent_data)
         self.query_generator = QueryGenerator(self.agent_data)
         self.result_processor = ResultProcessor(self.agent_data)
         self.executor = ExecutorAgent(self.agent_data)
+        self.single_flight = SingleFlight()
+        self.schema_columns = self.agent_data.get("schema_columns")
+        if self.schema_columns is None:
+            self.schema_columns = schema_columns(self.agent_data.get("db_schema", {}))
+        self.similarity_index = SimilarityIndex(columns=self.schema_columns) if SIMILARITY_CONFIG.get("enabled") else None
+        self.template_store = TemplateStore() if TEMPLATE_CONFIG.get("enabled") else None
+        self.sessions = SessionStore() if SESSION_CONFIG.get("enabled") else None
+        self.traffic_recorder = TrafficRecorder() if CAPTURE_CONFIG.get("enabled") else None
+        self.planner = QueryPlanner() if PLANNER_CONFIG.get("enabled") else None
+        # Limites adaptativos e filas limitadas por etapa: sob sobrecarga, recusa rápida ou resposta degradada
+        self.admission = AdmissionController() if ADMISSION_CONFIG.get("enabled") else None
+        # SQL validado por pergunta normalizada (correspondência exata, compartilhado entre workers)
+        self.sql_cache = create_cache("nl_sql")
+        # Últimas respostas completas, usadas quando uma dependência não responde a tempo
+        self.answer_cache = create_cache("answer")
 
         logger.info("Agente de Inteligência inicializado com sucesso")
     
-    def process_query(self, query: str, execute_query: bool = False) -> Dict[str, Any]:
-        logger.info(f"Processando consulta: {query}")
+    def process_query(self, query: str, execute_query: bool = False,
+                      priority: int = PRIORITY_INTERACTIVE, session_id: str = None,
+                      timeout: float = None, role: str = None) -> Dict[str, Any]:
+        """
+        Processa uma consulta em linguagem natural.
+
+        Consultas idênticas (após normalização) em andamento ao mesmo tempo são
+        coalescidas: apenas uma percorre o pipeline e todas recebem o resultado.
+        Com `session_id`, perguntas de acompanhamento usam o contexto da sessão.
+        `timeout` é o prazo da requisição (padrão: DEADLINE_CONFIG["request_seconds"]),
+        repartido entre as etapas; quando uma dependência não responde a tempo, a
+        resposta é degradada (resposta em cache ou apenas o SQL/resultado).
+        `role` é o perfil de acesso cujas políticas (máscaras, colunas, filtros)
+        são aplicadas ao resultado (padrão: POLICY_CONFIG["default_role"]).
+        """
+        key = self._flight_key(query, execute_query, session_id, role, priority, timeout)
+        result, shared = self.single_flight.do(
+            key, lambda: self._process_query(query, execute_query, priority, session_id, timeout=timeout, role=role)
+        )
+        return self._caller_result(result, query, shared, session_id)
+
+    async def process_query_async(self, query: str, execute_query: bool = False,
+                                  priority: int = PRIORITY_INTERACTIVE, session_id: str = None,
+                                  timeout: float = None, role: str = None) -> Dict[str, Any]:
+        """Versão assíncrona de `process_query`, com a mesma coalescência de consultas"""
+        key = self._flight_key(query, execute_query, session_id, role, priority, timeout)
+        result, shared = await self.single_flight.do_async(
+            key, lambda: self._process_query(query, execute_query, priority, session_id, timeout=timeout, role=role)
+        )
+        return self._caller_result(result, query, shared, session_id)
+
+    def _flight_key(self, query: str, execute_query: bool, session_id: str = None, role: str = None,
+                    priority: int = PRIORITY_INTERACTIVE, timeout: float = None) -> tuple:
+        # Perguntas de sessões diferentes dependem de contextos diferentes; perfis diferentes veem dados diferentes.
+        # Prioridade e faixa de prazo também entram na chave: uma resposta degradada por um prazo curto
+        # (ou atrasada pela fila de lote) não é entregue a quem esperou com um prazo maior
+        timeout = timeout if timeout is not None else DEADLINE_CONFIG["request_seconds"]
+        timeout_bucket = math.ceil(math.log2(max(timeout, 1.0)))
+        return (normalize_question(query), bool(execute_query), session_id, role, priority, timeout_bucket)
+
+    def _caller_result(self, result: Dict[str, Any], query: str, shared: bool,
+                       session_id: str = None) -> Dict[str, Any]:
+        # Cada chamador recebe sua própria cópia do dicionário de resultado
+        caller_result = dict(result)
+        caller_result["query"] = query
+        caller_result["coalesced"] = shared
+        if self.traffic_recorder is not None:
+            self.traffic_recorder.record(caller_result, session_id)
+        return caller_result
+
+    def _process_query(self, query: str, execute_query: bool = False,
+                       priority: int = PRIORITY_INTERACTIVE, session_id: str = None,
+                       timeout: float = None, role: str = None) -> Dict[str, Any]:
+        logger.info("Processando consulta: %s", query)
+        deadline = Deadline(timeout if timeout is not None else DEADLINE_CONFIG["request_seconds"])
 
         result = {
             "query": query,
@@ -46,32 +145,291 @@ class IntelligenceAgent:
             "generated_query": None,
             "result": None,
             "response": None,
-            "error": None
+            "error": None,
+            "timings": {}
         }
+        timings = result["timings"]
+        started = time.perf_counter()
+        admitted_at = None
         
         try:
-            query_type, intent_data = self.analyzer.analyze_intent(query)
+            if self.admission is not None:
+                admitted_at = self.admission.acquire("request", deadline.remaining())
+            session = None
+            if session_id is not None and self.sessions is not None:
+                session = self.sessions.get(session_id)
+
+            # Acompanhamentos simples ("e só os inativos?") editam o SQL anterior sem chamar o LLM
+            refinement = None
+            question = session_question = query
+            if session and session.get("query_type") == "sql":
+                refinement = refine_sql(session.get("sql"), query, self.schema_columns)
+                if refinement or is_follow_up(query):
+                    session_question = f"{session['query']} ({query})"
+                if refinement is None and is_follow_up(query):
+                    question = contextual_question(session, query)
+
+            match = template = None
+            if refinement:
+                query_type, intent_data = session["query_type"], session["intent_data"]
+                result["session_refinement"] = {"previous_query": session["query"], "edits": refinement[1]}
+            else:
+                if question == query and self.sql_cache is not None:
+                    match = self.sql_cache.get(normalize_question(query))
+                    if match:
+                        match = dict(match, question=query, score=1.0)
+                if question == query and not match:
+                    # Perguntas semelhantes a uma já validada reaproveitam o SQL sem chamar o LLM
+                    match = self.similarity_index.lookup(query) if self.similarity_index is not None else None
+                    # Perguntas com o mesmo formato de uma já atendida só precisam dos novos literais
+                    if not match and self.template_store is not None:
+                        template = self.template_store.match(query)
+
+                if match:
+                    query_type, intent_data = match["query_type"], match["intent_data"]
+                    result["similarity_match"] = {"question": match["question"], "score": match["score"]}
+                elif template:
+                    query_type, intent_data = template["query_type"], template["intent_data"]
+                    result["template_match"] = {"question": template["source_question"]}
+                else:
+                    stage_start = time.perf_counter()
+                    with self._admit("intent", deadline):
+                        query_type, intent_data = self.analyzer.analyze_intent(
+                            question, priority, deadline.stage_timeout("intent"))
+                    timings["intent"] = time.perf_counter() - stage_start
             result["query_type"] = query_type
             result["intent_data"] = intent_data
-            
-            if query_type == "sql":
-                generated_query = self.query_generator.generate_sql_query(query, intent_data)
+
+            # Perguntas compostas viram subconsultas independentes, executadas em paralelo
+            sub_queries = None
+            if query_type == "sql" and self.planner is not None and not (refinement or match or template):
+                sub_queries = self.planner.plan(question, intent_data)
+
+            if sub_queries:
+                self._process_compound(result, sub_queries, intent_data, priority, deadline, role)
+                self._answer_stage(result, session_question, priority, deadline)
+                if result["response"] and not result.get("degraded") and question == query:
+                    self._remember_answer(query, result, role)
+            elif query_type == "sql":
+                if refinement:
+                    generated_query = refinement[0]
+                    sql, params = extract_sql_literals(generated_query)
+                elif template:
+                    sql, params = template["sql"], template["params"]
+                    generated_query = render_sql(sql, params)
+                else:
+                    if match:
+                        generated_query = match["sql"]
+                    else:
+                        stage_start = time.perf_counter()
+                        with self._admit("sql", deadline):
+                            generated_query = self.query_generator.generate_sql_query(
+                                question, intent_data, priority, deadline.stage_timeout("sql"))
+                        timings["sql"] = time.perf_counter() - stage_start
+                    sql, params = extract_sql_literals(generated_query)
                 result["generated_query"] = generated_query
-                result["result"] = self.executor.execute_query(query_type, generated_query)
-            
-                response = self.result_processor.process_result(
-                    query, 
-                    result["result"], 
-                    result["generated_query"]
-                )
-                result["response"] = response
-                
+                result["parameterized_query"] = {"sql": sql, "params": params}
+                stage_start = time.perf_counter()
+                with self._admit("execute", deadline):
+                    result["result"] = self.executor.execute_query(
+                        query_type, sql, params, timeout=deadline.stage_timeout("execute"), role=role)
+                    timings["execute"] = time.perf_counter() - stage_start
+                    if isinstance(result["result"], dict) and result["result"].get("unavailable"):
+                        raise DependencyUnavailable(result["result"]["error"])
+
+                validated = self._is_validated(result["result"])
+                # Perguntas que dependem do contexto da sessão não alimentam os caches globais
+                if validated and not (match or template or refinement) and question == query:
+                    if self.sql_cache is not None:
+                        self.sql_cache.set(normalize_question(query), {
+                            "sql": generated_query, "query_type": query_type, "intent_data": intent_data
+                        })
+                    if self.similarity_index is not None:
+                        self.similarity_index.add(query, generated_query, query_type, intent_data)
+                    if self.template_store is not None:
+                        self.template_store.learn(query, generated_query, query_type, intent_data)
+                if validated and session_id is not None and self.sessions is not None:
+                    self.sessions.update(session_id, session_question, query_type, intent_data, generated_query)
+
+                self._answer_stage(result, session_question, priority, deadline)
+                if result["response"] and not result.get("degraded") and question == query and not refinement:
+                    self._remember_answer(query, result, role)
+
+        except DependencyUnavailable as e:
+            logger.warning("Dependência indisponível ao processar consulta: %s", e)
+            if isinstance(e, Overloaded):
+                result["overloaded"] = e.stage
+            self._degrade(result, query, e, role)
         except Exception as e:
-            logger.error(f"Erro ao processar consulta: {str(e)}", exc_info=True)
+            logger.error("Erro ao processar consulta: %s", e, exc_info=True)
             result["error"] = str(e)
-        
+
+        if admitted_at is not None:
+            self.admission.release("request", admitted_at, dropped=bool(result.get("degraded")))
+        timings["total"] = time.perf_counter() - started
         return result
 
+    def _admit(self, stage: str, deadline: Deadline):
+        """Vaga da etapa no controle de admissão (sem controle, o bloco roda direto)"""
+        if self.admission is None:
+            return nullcontext()
+        return self.admission.admit(stage, deadline.remaining())
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Métricas das filas e limites de admissão por etapa e das consultas coalescidas"""
+        return {
+            "admission": self.admission.get_metrics() if self.admission is not None else None,
+            "single_flight": self.single_flight.get_stats()
+        }
+
+    def _answer_stage(self, result: Dict[str, Any], question: str, priority: int, deadline: Deadline) -> None:
+        """Uma única chamada ao processador de resultados; sem o LLM, um resumo local"""
+        stage_start = time.perf_counter()
+        try:
+            with self._admit("answer", deadline):
+                response = self.result_processor.process_result(
+                    question,
+                    result["result"],
+                    result["generated_query"],
+                    priority,
+                    deadline.stage_timeout("answer")
+                )
+        except DependencyUnavailable as e:
+            logger.warning("Resposta gerada sem o LLM (%s)", e)
+            response = self._sql_only_answer(result)
+            result["degraded"] = "sql_only"
+        result["timings"]["answer"] = time.perf_counter() - stage_start
+        result["response"] = response
+
+    def _reuse_sql(self, question: str) -> Optional[Dict[str, Any]]:
+        """SQL de uma subpergunta pelos caches ou templates, sem chamar o LLM"""
+        if self.sql_cache is not None:
+            cached = self.sql_cache.get(normalize_question(question))
+            if cached:
+                return {"source": "cache", "sql": cached["sql"]}
+        if self.similarity_index is not None:
+            match = self.similarity_index.lookup(question)
+            if match:
+                return {"source": "similarity", "sql": match["sql"]}
+        if self.template_store is not None:
+            template = self.template_store.match(question)
+            if template:
+                return {"source": "template", "sql": template["sql"], "params": template["params"]}
+        return None
+
+    def _process_compound(self, result: Dict[str, Any], sub_queries: List[str], intent_data: Dict[str, Any],
+                          priority: int, deadline: Deadline, role: str = None) -> None:
+        """
+        Gera e executa as subconsultas de uma pergunta composta e combina os resultados
+
+        O SQL vem dos caches/templates ou de uma única chamada em lote ao LLM; as
+        execuções rodam em paralelo, de modo que o tempo total fica próximo ao
+        da subconsulta mais lenta.
+        """
+        timings = result["timings"]
+        # Agrupamentos da pergunta original não se aplicam a cada parte
+        sub_intent = {key: value for key, value in intent_data.items() if key not in ("sub_queries", "group_by")}
+        items = [dict(self._reuse_sql(sub_query) or {"source": "llm"}, question=sub_query)
+                 for sub_query in sub_queries]
+        pending = [item for item in items if item["source"] == "llm"]
+        if pending:
+            stage_start = time.perf_counter()
+            with self._admit("sql", deadline):
+                generated = self.query_generator.generate_sql_batch(
+                    [item["question"] for item in pending], sub_intent, priority, deadline.stage_timeout("sql"))
+            timings["sql"] = time.perf_counter() - stage_start
+            for item, sql in zip(pending, generated):
+                item["sql"] = sql
+        for item in items:
+            if "params" in item:
+                item["generated_query"] = render_sql(item["sql"], item["params"])
+            else:
+                item["generated_query"] = item["sql"]
+                item["sql"], item["params"] = extract_sql_literals(item["sql"])
+
+        stage_start = time.perf_counter()
+        timeout = deadline.stage_timeout("execute")
+        # Uma vaga de execução para a pergunta composta; as subconsultas rodam no pool do planejador
+        with self._admit("execute", deadline):
+            executions = self.planner.run(items, lambda item: self.executor.execute_query(
+                "sql", item["sql"], item["params"], timeout=timeout, role=role))
+        timings["execute"] = time.perf_counter() - stage_start
+        for item, execution in zip(items, executions):
+            item["execution"] = execution
+            if isinstance(execution, dict) and execution.get("unavailable"):
+                raise DependencyUnavailable(execution["error"])
+            # Subperguntas são perguntas completas: alimentam os caches como qualquer outra
+            if item["source"] == "llm" and self._is_validated(execution):
+                if self.sql_cache is not None:
+                    self.sql_cache.set(normalize_question(item["question"]), {
+                        "sql": item["generated_query"], "query_type": "sql", "intent_data": sub_intent
+                    })
+                if self.similarity_index is not None:
+                    self.similarity_index.add(item["question"], item["generated_query"], "sql", sub_intent)
+                if self.template_store is not None:
+                    self.template_store.learn(item["question"], item["generated_query"], "sql", sub_intent)
+
+        result["sub_queries"] = [
+            {"question": item["question"], "generated_query": item["generated_query"], "source": item["source"]}
+            for item in items
+        ]
+        result["generated_query"] = ";\n".join(item["generated_query"] for item in items)
+        result["result"] = self.planner.combine(items)
+
+    def _answer_key(self, query: str, role: str = None) -> str:
+        # A resposta foi gerada a partir do resultado já mascarado para o perfil
+        return f"{role}|{normalize_question(query)}" if role else normalize_question(query)
+
+    def _remember_answer(self, query: str, result: Dict[str, Any], role: str = None) -> None:
+        if self.answer_cache is None:
+            return
+        self.answer_cache.set(self._answer_key(query, role), {
+            "response": result["response"],
+            "generated_query": result.get("generated_query"),
+            "answered_at": time.time()
+        })
+
+    def _cached_answer(self, query: str, role: str = None) -> Optional[Dict[str, Any]]:
+        if self.answer_cache is None:
+            return None
+        return self.answer_cache.get(self._answer_key(query, role))
+
+    def _degrade(self, result: Dict[str, Any], query: str, error: Exception, role: str = None) -> None:
+        """Resposta degradada: a última resposta completa para a pergunta ou, na falta dela, o SQL gerado"""
+        cached = self._cached_answer(query, role)
+        if cached:
+            result["response"] = cached["response"]
+            result["generated_query"] = result.get("generated_query") or cached["generated_query"]
+            result["degraded"] = "cached"
+            result["cached_at"] = cached["answered_at"]
+            return
+        result["error"] = str(error)
+        if result.get("generated_query"):
+            result["response"] = (
+                "Não foi possível consultar os dados a tempo. "
+                f"Consulta SQL gerada para a pergunta:\n{result['generated_query']}"
+            )
+            result["degraded"] = "sql_only"
+        else:
+            result["degraded"] = "unavailable"
+
+    def _sql_only_answer(self, result: Dict[str, Any]) -> str:
+        """Resumo local do resultado, usado quando o LLM não responde a tempo"""
+        rows = (result.get("result") or {}).get("result")
+        if rows is None:
+            rows = []
+        elif isinstance(rows, str) or not isinstance(rows, Sequence):
+            rows = [rows]
+        preview = [{key: encode_value(value) for key, value in row.items()} if isinstance(row, dict) else row
+                   for row in rows[:5]]
+        lines = [f"Consulta executada: {result.get('generated_query')}", f"Registros encontrados: {len(rows)}"]
+        lines.extend(str(row) for row in preview)
+        return "\n".join(lines)
+
+    def _is_validated(self, execution: Dict[str, Any]) -> bool:
+        """Uma consulta é considerada validada quando executou sem erro e retornou dados"""
+        return bool(execution) and not execution.get("error") and execution.get("result") is not None
+
 
 # Para testes locais
 if __name__ == "__main__":
@@ -83,4 +441,4 @@ if __name__ == "__main__":
     
     result = agent.process_query(test_query) 
     
-    """ print(json.dumps(result, indent=2, ensure_ascii=False))  """
\ No newline at end of file
+    log_payload(logger, "Resultado", result, level=logging.INFO)
\ No newline at end of file
@@ -0,0 +1,100 @@
+"""
+Leitura incremental de JSON em respostas por streaming
+"""
+
+import json
+from typing import Dict, Any, Iterator, Optional
+
+
+class IncrementalJSONParser:
+    """
+    Localiza o primeiro objeto JSON de nível superior à medida que os trechos chegam.
+
+    Cada trecho é examinado uma única vez, acompanhando a profundidade de
+    chaves/colchetes e se o cursor está dentro de uma string. Quando o objeto
+    de nível superior fecha, ele é decodificado e `done` passa a ser True;
+    o texto que vier depois (cercas de markdown, explicações) é ignorado.
+    """
+
+    def __init__(self):
+        self._text = ""
+        self._pos = 0
+        self._start = -1
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self.value: Optional[Dict[str, Any]] = None
+        self.done = False
+
+    def feed(self, chunk: str) -> Optional[Dict[str, Any]]:
+        """
+        Processa um novo trecho do stream
+
+        Args:
+            chunk: Texto recebido
+
+        Returns:
+            O objeto decodificado assim que estiver completo, ou None
+        """
+        if self.done:
+            return self.value
+        self._text += chunk
+        text = self._text
+        length = len(text)
+        i = self._pos
+
+        while i < length:
+            if self._start < 0:
+                start = text.find("{", i)
+                if start < 0:
+                    # Nada antes de um "{" é aproveitado; descarta o prefixo
+                    self._text, self._pos = "", 0
+                    return None
+                self._start, self._depth = start, 1
+                i = start + 1
+                continue
+
+            char = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        value = json.loads(text[self._start:i + 1])
+                    except json.JSONDecodeError:
+                        # Chaves soltas no texto: recomeça a busca após o "{" descartado
+                        i = self._start + 1
+                        self._start, self._in_string, self._escape = -1, False, False
+                        continue
+                    self.value, self.done = value, True
+                    self._text = ""
+                    return value
+            i += 1
+
+        self._pos = i
+        return None
+
+
+def consume_json_object(chunks: Iterator[str]) -> Dict[str, Any]:
+    """
+    Consumidor de stream que retorna assim que o objeto JSON de nível superior fecha
+
+    Raises:
+        ValueError: O stream terminou sem um objeto JSON completo
+    """
+    parser = IncrementalJSONParser()
+    for chunk in chunks:
+        value = parser.feed(chunk)
+        if parser.done:
+            return value
+    raise ValueError("Falha ao extrair JSON da resposta")
@@ -0,0 +1,248 @@
+"""
+Cliente compartilhado para chamadas ao Gemini passando pelo agendador de requisições
+"""
+
+import os
+import logging
+import time
+from typing import Dict, Any, Callable, Iterator, Optional
+
+from google import genai
+from google.genai import types
+from config import NLP_CONFIG, GEMINI_CONFIG
+from llm_scheduler import LLMRequestError, LLMScheduler, PRIORITY_INTERACTIVE, get_scheduler
+from model_router import ModelRouter, ModelTimeout, TimedStream, get_model_router
+from deadline import CircuitOpenError, DeadlineExceeded, get_breaker
+from context_cache import ContextCache, fallback_stream, get_context_cache
+
+logger = logging.getLogger("llm_client")
+
+
+def join_chunks(chunks: Iterator[str]) -> str:
+    """Consumidor padrão: concatena todo o texto do stream"""
+    return "".join(chunks)
+
+
+class _CountingStream:
+    """Repassa os trechos do stream contando os caracteres recebidos"""
+
+    def __init__(self, chunks: Iterator[str]):
+        self._chunks = iter(chunks)
+        self.chars = 0
+
+    def __iter__(self) -> "_CountingStream":
+        return self
+
+    def __next__(self) -> str:
+        chunk = next(self._chunks)
+        self.chars += len(chunk)
+        return chunk
+
+    def close(self) -> None:
+        close = getattr(self._chunks, "close", None)
+        if close:
+            close()
+
+
+class LLMClient:
+    """Executa chamadas em streaming ao Gemini através do agendador compartilhado"""
+
+    def __init__(self, scheduler: LLMScheduler = None, api_key: str = None, router: ModelRouter = None,
+                 context_cache: ContextCache = None):
+        self.scheduler = scheduler or get_scheduler()
+        self.api_key = api_key if api_key is not None else os.getenv("GEMINI_API_KEY", "")
+        self.router = router if router is not None else get_model_router()
+        self._client = None
+        # Prefixo estático (instruções + esquema) registrado no provedor e referenciado por handle
+        self.context_cache = context_cache if context_cache is not None else get_context_cache(self._get_client)
+
+    def _get_client(self) -> "genai.Client":
+        if self._client is None:
+            self._client = genai.Client(api_key=self.api_key)
+        return self._client
+
+    def stream(self, system_instruction: str, user_content: str, model: str = None,
+               cached_content: str = None) -> Iterator[str]:
+        """
+        Abre um stream de geração e devolve apenas os trechos de texto
+
+        Args:
+            system_instruction: Instrução de sistema do modelo
+            user_content: Conteúdo enviado como mensagem do usuário
+            model: Nome do modelo (padrão: GEMINI_CONFIG["model"])
+            cached_content: Handle do cache de contexto; a instrução de sistema já está nele
+
+        Returns:
+            Iterador com os trechos de texto na ordem em que chegam
+        """
+        content = [
+            types.Content(
+                role="user",
+                parts=[types.Part.from_text(text=user_content)]
+            )
+        ]
+
+        generate_config = types.GenerateContentConfig(
+            temperature=NLP_CONFIG["temperature"],
+            top_p=NLP_CONFIG["top_p"],
+            top_k=NLP_CONFIG["top_k"],
+            max_output_tokens=NLP_CONFIG["max_tokens"],
+            response_mime_type=GEMINI_CONFIG["response_mime_type"],
+            system_instruction=None if cached_content else [
+                types.Part.from_text(text=system_instruction)
+            ],
+            cached_content=cached_content
+        )
+
+        response = self._get_client().models.generate_content_stream(
+            model=model or GEMINI_CONFIG["model"],
+            contents=content,
+            config=generate_config,
+        )
+        try:
+            for chunk in response:
+                if chunk.text:
+                    yield chunk.text
+        finally:
+            close = getattr(response, "close", None)
+            if close:
+                close()
+
+    def _open_stream(self, stage: str, system_instruction: str, user_content: str,
+                     model: str = None, cached_content: str = None) -> Iterator[str]:
+        """Ponto de extensão para clientes alternativos (ex.: stub offline)"""
+        if cached_content:
+            return self.stream(system_instruction, user_content, model, cached_content=cached_content)
+        return self.stream(system_instruction, user_content, model)
+
+    def _open_with_context(self, stage: str, system_instruction: str, static_context: Optional[str],
+                           user_content: str, model: Optional[str]) -> Iterator[str]:
+        """Abre o stream referenciando o prefixo em cache, com o prompt completo como fallback"""
+        full_content = f"{static_context}{user_content}" if static_context else user_content
+        handle = None
+        if static_context and self.context_cache is not None:
+            handle = self.context_cache.handle(model, system_instruction, static_context, stage)
+        if handle is None:
+            return self._open_stream(stage, system_instruction, full_content, model)
+        return fallback_stream(
+            lambda: self._open_stream(stage, system_instruction, user_content, model, handle),
+            lambda: self._open_stream(stage, system_instruction, full_content, model),
+            lambda error: self.context_cache.invalidate(handle, error)
+        )
+
+    def generate(self, stage: str, system_instruction: str, user_content: str,
+                 priority: int = PRIORITY_INTERACTIVE, model: str = None,
+                 consume: Optional[Callable[[Iterator[str]], Any]] = None, complexity: str = None,
+                 timeout: float = None, static_context: str = None) -> Any:
+        """
+        Gera uma resposta para a etapa informada respeitando os limites do agendador
+
+        Args:
+            stage: Etapa do pipeline (intent, sql, answer)
+            system_instruction: Instrução de sistema do modelo
+            user_content: Conteúdo enviado como mensagem do usuário
+            priority: Prioridade da requisição no agendador
+            model: Nome do modelo; quando omitido, o roteador escolhe pela etapa e complexidade
+            consume: Função que consome o iterador de trechos (padrão: concatena tudo);
+                pode retornar antes do fim do stream
+            complexity: Nível de complexidade (simple, moderate, complex) usado no roteamento
+            timeout: Orçamento da etapa em segundos (fila, tentativas e leitura do stream)
+            static_context: Conteúdo idêntico entre chamadas (ex.: esquema), enviado antes de
+                `user_content`; com a instrução de sistema, forma o prefixo do cache de contexto
+
+        Returns:
+            O valor retornado por `consume`
+
+        Raises:
+            LLMRequestError: Quando a chamada falha de forma definitiva
+            DependencyUnavailable: Orçamento esgotado (o stream em andamento é cancelado)
+                ou disjuntor do modelo aberto
+        """
+        consume = consume or join_chunks
+        estimated_tokens = self.scheduler.estimate_tokens(system_instruction, (static_context or "") + user_content)
+        deadline = time.monotonic() + timeout if timeout is not None else None
+
+        def attempt(chosen_model: Optional[str], attempt_timeout: float = None,
+                    meter: Dict[str, Any] = None) -> Any:
+            breaker = get_breaker(f"llm:{chosen_model or GEMINI_CONFIG['model']}")
+            bounded_by_deadline = False
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise DeadlineExceeded(stage)
+                if attempt_timeout is None or remaining < attempt_timeout:
+                    attempt_timeout, bounded_by_deadline = remaining, True
+
+            probe = breaker.allow()
+            chunks = None
+            settled = False
+            try:
+                chunks = self._open_with_context(stage, system_instruction, static_context, user_content,
+                                                 chosen_model)
+                if meter is not None:
+                    chunks = meter["stream"] = _CountingStream(chunks)
+                if attempt_timeout:
+                    chunks = TimedStream(chunks, attempt_timeout)
+                result = consume(chunks)
+            except ModelTimeout as e:
+                breaker.record_failure()
+                settled = True
+                if bounded_by_deadline:
+                    raise DeadlineExceeded(stage) from e
+                raise
+            except DeadlineExceeded:
+                # O orçamento acabou sem resposta nem falha do modelo: não decide o disjuntor
+                raise
+            except Exception as e:
+                # Erros de conteúdo mostram que o modelo respondeu; só falhas transitórias contam
+                if self.scheduler.is_retryable(e):
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                settled = True
+                raise
+            else:
+                breaker.record_success()
+                settled = True
+            finally:
+                # Se o consumidor parou antes do fim, fecha o stream e libera a conexão
+                close = getattr(chunks, "close", None)
+                if close:
+                    close()
+                # Saídas sem resultado da dependência liberam a chamada de teste do meio-aberto
+                if probe and not settled:
+                    breaker.abandon()
+            return result
+
+        if model is not None or self.router is None:
+            return self.scheduler.submit(stage, lambda: attempt(model), priority=priority,
+                                         estimated_tokens=estimated_tokens, deadline=deadline)
+
+        # Cada modelo tem até SLO x timeout_factor; o último da lista só é limitado pelo orçamento.
+        # Cada tentativa passa pelo agendador (vaga, RPM e TPM); erros transitórios passam ao próximo
+        # modelo, e só o último repete as tentativas do agendador
+        candidates = self.router.candidates(stage, complexity or "moderate")
+        for index, candidate in enumerate(candidates):
+            last = index == len(candidates) - 1
+            meter: Dict[str, Any] = {}
+            start = time.monotonic()
+            try:
+                result = self.scheduler.submit(
+                    stage, lambda: attempt(candidate, None if last else self.router.timeout_for(stage), meter),
+                    priority=priority, estimated_tokens=estimated_tokens, deadline=deadline,
+                    max_retries=None if last else 0
+                )
+            except Exception as e:
+                cause = e.__cause__ if isinstance(e, LLMRequestError) and e.__cause__ is not None else e
+                if "stream" in meter:
+                    self.router.record(candidate, stage, time.monotonic() - start, estimated_tokens,
+                                       meter["stream"].chars // 4, error=cause)
+                fallback = isinstance(cause, (ModelTimeout, CircuitOpenError)) or self.scheduler.is_retryable(cause)
+                if last or isinstance(cause, DeadlineExceeded) or not fallback:
+                    raise
+                logger.warning("Modelo %s falhou na etapa %s (%s); tentando %s", candidate, stage, cause,
+                               candidates[index + 1])
+                continue
+            self.router.record(candidate, stage, time.monotonic() - start, estimated_tokens,
+                               meter["stream"].chars // 4)
+            return result
@@ -0,0 +1,279 @@
+"""
+Agendador compartilhado de requisições ao LLM com limites de taxa, prioridades e backoff
+"""
+
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from typing import Dict, Any, Callable, List, Optional
+
+from config import SCHEDULER_CONFIG
+from deadline import DeadlineExceeded, DependencyUnavailable
+
+logger = logging.getLogger("llm_scheduler")
+
+# Prioridades (valores menores são atendidos primeiro)
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+
+class LLMRequestError(Exception):
+    """Falha definitiva em uma requisição ao LLM (após esgotar as tentativas)"""
+
+    def __init__(self, stage: str, message: str, attempts: int = 1):
+        super().__init__(f"Falha na etapa '{stage}' após {attempts} tentativa(s): {message}")
+        self.stage = stage
+        self.attempts = attempts
+
+
+class TokenBucket:
+    """Balde de fichas reabastecido continuamente a uma taxa por minuto"""
+
+    def __init__(self, per_minute: float, capacity: float = None):
+        self.rate = per_minute / 60.0
+        self.capacity = float(capacity if capacity is not None else per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated = now
+
+    def time_until(self, amount: float, now: float = None) -> float:
+        """Segundos até que `amount` fichas estejam disponíveis (0 se já estiverem)"""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        if self.rate <= 0:
+            return float("inf")
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float) -> None:
+        self.tokens -= min(amount, self.capacity)
+
+
+class _Ticket:
+    """Entrada na fila de espera do agendador"""
+
+    __slots__ = ("priority", "seq", "stage", "tokens", "enqueued")
+
+    def __init__(self, priority: int, seq: int, stage: str, tokens: int):
+        self.priority = priority
+        self.seq = seq
+        self.stage = stage
+        self.tokens = tokens
+        self.enqueued = time.monotonic()
+
+    def __lt__(self, other: "_Ticket") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class LLMScheduler:
+    """
+    Coordena as chamadas ao LLM de todas as etapas do pipeline.
+
+    Aplica baldes de requisições e de tokens por minuto, atende a fila em ordem
+    de prioridade, limita a concorrência por etapa e repete falhas transitórias
+    com backoff exponencial com jitter.
+    """
+
+    def __init__(self, config: Dict[str, Any] = None):
+        self.config = config or SCHEDULER_CONFIG
+        self.request_bucket = TokenBucket(self.config["requests_per_minute"])
+        self.token_bucket = TokenBucket(self.config["tokens_per_minute"])
+        self.stage_limits = dict(self.config.get("stage_concurrency", {}))
+        self.max_retries = self.config.get("max_retries", 4)
+        self.backoff_base = self.config.get("backoff_base", 0.5)
+        self.backoff_max = self.config.get("backoff_max", 20.0)
+        self.retryable_codes = set(self.config.get("retryable_status_codes", [429, 500, 502, 503, 504]))
+
+        self._cond = threading.Condition()
+        self._waiting: List[_Ticket] = []
+        self._active: Dict[str, int] = {}
+        self._seq = itertools.count()
+        self._metrics = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "retries": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+            "wait_time_by_priority": {}
+        }
+
+    def estimate_tokens(self, *texts: str) -> int:
+        """Estimativa grosseira de tokens (~4 caracteres por token) mais a saída esperada"""
+        chars = sum(len(text) for text in texts if text)
+        return chars // 4 + self.config.get("expected_output_tokens", 512)
+
+    def submit(self, stage: str, func: Callable[[], Any], priority: int = PRIORITY_INTERACTIVE,
+               estimated_tokens: int = 0, deadline: float = None, max_retries: int = None) -> Any:
+        """
+        Executa `func` respeitando os limites do agendador
+
+        Args:
+            stage: Etapa do pipeline (intent, sql, answer)
+            func: Função sem argumentos que faz a chamada ao LLM
+            priority: Prioridade da requisição (PRIORITY_INTERACTIVE ou PRIORITY_BATCH)
+            estimated_tokens: Tokens estimados para o balde de tokens por minuto
+            deadline: Instante limite (time.monotonic) para obter vaga e para novas tentativas
+            max_retries: Novas tentativas em erros transitórios (padrão: configuração do agendador)
+
+        Returns:
+            O valor retornado por `func`
+
+        Raises:
+            LLMRequestError: Quando a chamada falha de forma definitiva
+            DependencyUnavailable: Prazo esgotado ou disjuntor aberto
+        """
+        with self._cond:
+            self._metrics["submitted"] += 1
+
+        max_retries = self.max_retries if max_retries is None else max_retries
+        attempt = 0
+        while True:
+            attempt += 1
+            self._acquire(stage, priority, estimated_tokens, deadline)
+            try:
+                result = func()
+            except Exception as e:
+                self._release(stage)
+                delay = self._backoff_delay(attempt)
+                within_deadline = deadline is None or time.monotonic() + delay < deadline
+                if attempt <= max_retries and self.is_retryable(e) and within_deadline:
+                    with self._cond:
+                        self._metrics["retries"] += 1
+                    logger.warning(f"Erro transitório na etapa {stage} (tentativa {attempt}): {str(e)}. "
+                                   f"Nova tentativa em {delay:.2f}s")
+                    time.sleep(delay)
+                    continue
+                with self._cond:
+                    self._metrics["failed"] += 1
+                if isinstance(e, (LLMRequestError, DependencyUnavailable)):
+                    raise
+                raise LLMRequestError(stage, str(e), attempt) from e
+            self._release(stage)
+            with self._cond:
+                self._metrics["completed"] += 1
+            return result
+
+    def _acquire(self, stage: str, priority: int, tokens: int, deadline: float = None) -> None:
+        ticket = _Ticket(priority, next(self._seq), stage, tokens)
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    left = deadline - now if deadline is not None else None
+                    if left is not None and left <= 0:
+                        raise DeadlineExceeded(stage, f"Prazo esgotado aguardando vaga na etapa '{stage}'")
+                    if self._next_eligible() is ticket:
+                        wait = max(self.request_bucket.time_until(1, now),
+                                   self.token_bucket.time_until(tokens, now))
+                        if wait <= 0:
+                            self.request_bucket.consume(1)
+                            self.token_bucket.consume(tokens)
+                            break
+                        self._cond.wait(wait if left is None else min(wait, left))
+                    else:
+                        self._cond.wait(left)
+            except BaseException:
+                self._remove(ticket)
+                self._cond.notify_all()
+                raise
+
+            self._remove(ticket)
+            self._active[stage] = self._active.get(stage, 0) + 1
+            self._record_wait(priority, time.monotonic() - ticket.enqueued)
+            self._cond.notify_all()
+
+    def _release(self, stage: str) -> None:
+        with self._cond:
+            self._active[stage] = max(0, self._active.get(stage, 0) - 1)
+            self._cond.notify_all()
+
+    def _next_eligible(self) -> Optional[_Ticket]:
+        """Primeiro ticket (em ordem de prioridade) cuja etapa tem vaga de concorrência"""
+        for ticket in sorted(self._waiting):
+            limit = self.stage_limits.get(ticket.stage)
+            if limit is None or self._active.get(ticket.stage, 0) < limit:
+                return ticket
+        return None
+
+    def _remove(self, ticket: _Ticket) -> None:
+        try:
+            self._waiting.remove(ticket)
+            heapq.heapify(self._waiting)
+        except ValueError:
+            pass
+
+    def _record_wait(self, priority: int, waited: float) -> None:
+        self._metrics["wait_time_total"] += waited
+        self._metrics["wait_time_max"] = max(self._metrics["wait_time_max"], waited)
+        stats = self._metrics["wait_time_by_priority"].setdefault(priority, {"count": 0, "total": 0.0})
+        stats["count"] += 1
+        stats["total"] += waited
+
+    def is_retryable(self, error: Exception) -> bool:
+        """Indica se o erro é transitório (limite de taxa ou indisponibilidade)"""
+        code = getattr(error, "code", None) or getattr(error, "status_code", None)
+        if code in self.retryable_codes:
+            return True
+        message = str(error).upper()
+        return "RESOURCE_EXHAUSTED" in message or "UNAVAILABLE" in message or "429" in message
+
+    def _backoff_delay(self, attempt: int) -> float:
+        """Backoff exponencial com jitter completo"""
+        ceiling = min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1)))
+        return random.uniform(0, ceiling)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Retorna as métricas atuais do agendador
+
+        Returns:
+            Dicionário com profundidade das filas, requisições ativas e tempos de espera
+        """
+        with self._cond:
+            queue_depth: Dict[str, int] = {}
+            for ticket in self._waiting:
+                queue_depth[ticket.stage] = queue_depth.get(ticket.stage, 0) + 1
+            granted = sum(stats["count"] for stats in self._metrics["wait_time_by_priority"].values())
+            return {
+                "queue_depth": queue_depth,
+                "queue_depth_total": len(self._waiting),
+                "active": dict(self._active),
+                "submitted": self._metrics["submitted"],
+                "completed": self._metrics["completed"],
+                "failed": self._metrics["failed"],
+                "retries": self._metrics["retries"],
+                "wait_time_avg": self._metrics["wait_time_total"] / granted if granted else 0.0,
+                "wait_time_max": self._metrics["wait_time_max"],
+                "wait_time_by_priority": {
+                    priority: {
+                        "count": stats["count"],
+                        "avg": stats["total"] / stats["count"] if stats["count"] else 0.0
+                    }
+                    for priority, stats in self._metrics["wait_time_by_priority"].items()
+                }
+            }
+
+
+_scheduler: Optional[LLMScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> LLMScheduler:
+    """Retorna o agendador compartilhado do processo"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler()
+        return _scheduler
@@ -0,0 +1,170 @@
+"""
+Cliente LLM offline para testes de carga: respostas sintéticas ou gravadas, com latência simulada
+"""
+
+import itertools
+import json
+import logging
+import re
+import threading
+import time
+from typing import Dict, Any, Callable, Iterator, List, Optional
+
+from config import CONTEXT_CACHE_CONFIG, GEMINI_CONFIG
+from context_cache import ContextCache
+from llm_client import LLMClient
+from llm_scheduler import LLMScheduler
+from single_flight import normalize_question
+
+logger = logging.getLogger("llm_stub")
+
+# Onde cada etapa coloca a pergunta do usuário no prompt
+_QUESTION_PATTERNS = {
+    "intent": re.compile(r"(?:^|\n\n)Consulta: (?P<question>.*)$", re.DOTALL),
+    "sql": re.compile(r"Consulta do usuário: (?P<question>.*?)\n\nGere uma consulta", re.DOTALL),
+    "answer": re.compile(r"Pergunta do usuário: (?P<question>.*?)\n\nResultados da consulta", re.DOTALL),
+}
+_ROW_COUNT = re.compile(r"\((\d+) registros encontrados\)")
+# Geração de SQL em lote (subconsultas de perguntas compostas)
+_BATCH_QUESTIONS = re.compile(r"Perguntas do usuário:\n(?P<questions>.*?)\n\nGere uma consulta", re.DOTALL)
+
+SYNTHETIC_INTENT = {"type": "sql", "entities": ["Cadastro"], "conditions": ["Ativo = 1"], "fields": ["*"]}
+SYNTHETIC_SQL = "SELECT COUNT(*) AS Total FROM Cadastro WITH (NOLOCK) WHERE Ativo = 1"
+
+
+class StubCacheAPI:
+    """
+    Simula a API de cached contents: handles com TTL pelo relógio informado e,
+    como no provedor, erro ao referenciar um handle expirado ou removido
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self.contents: Dict[str, Dict[str, Any]] = {}
+        self.operations: Dict[str, int] = {"create": 0, "update": 0, "delete": 0}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def create(self, model: str, system_instruction: str, content: str, ttl_seconds: float,
+               display_name: str) -> str:
+        with self._lock:
+            name = f"cachedContents/stub-{next(self._ids)}"
+            self.contents[name] = {"model": model, "tokens": (len(system_instruction) + len(content)) // 4,
+                                   "expires_at": self.clock() + ttl_seconds, "display_name": display_name}
+            self.operations["create"] += 1
+        return name
+
+    def update(self, name: str, ttl_seconds: float) -> None:
+        with self._lock:
+            self.lookup(name)["expires_at"] = self.clock() + ttl_seconds
+            self.operations["update"] += 1
+
+    def delete(self, name: str) -> None:
+        with self._lock:
+            self.contents.pop(name, None)
+            self.operations["delete"] += 1
+
+    def lookup(self, name: str, model: str = None) -> Dict[str, Any]:
+        entry = self.contents.get(name)
+        if entry is None or entry["expires_at"] <= self.clock() or (model and entry["model"] != model):
+            raise RuntimeError(f"404 NOT_FOUND: CachedContent not found (or permission denied): {name}")
+        return entry
+
+
+class StubLLMClient(LLMClient):
+    """
+    Substitui as chamadas ao Gemini mantendo o restante do pipeline (agendador,
+    leitura incremental, extração de SQL).
+
+    Com `recorded`, devolve a intenção, o SQL e a resposta capturados para a
+    mesma pergunta (e, opcionalmente, os tempos gravados de cada etapa); sem
+    gravação, usa respostas sintéticas com a latência configurada.
+    """
+
+    def __init__(self, scheduler: LLMScheduler = None, recorded: List[Dict[str, Any]] = None,
+                 first_token_latency: float = 0.2, chunk_latency: float = 0.01, chunk_size: int = 24,
+                 use_recorded_timings: bool = False, model_latencies: Dict[str, float] = None,
+                 router=None, context_cache: ContextCache = None, cached_token_rate: float = 0.25):
+        # Sem cache informado, simula a API de cached contents (nunca chama o provedor)
+        if context_cache is None and CONTEXT_CACHE_CONFIG.get("enabled"):
+            context_cache = ContextCache(StubCacheAPI())
+        super().__init__(scheduler=scheduler, api_key="offline", router=router, context_cache=context_cache)
+        self.recorded = {normalize_question(record["query"]): record
+                         for record in recorded or [] if record.get("query")}
+        self.first_token_latency = first_token_latency
+        self.chunk_latency = chunk_latency
+        self.chunk_size = chunk_size
+        self.use_recorded_timings = use_recorded_timings
+        # Latência até o primeiro trecho por modelo (perfis de modelos rápidos/lentos)
+        self.model_latencies = model_latencies or {}
+        self.calls: Dict[str, int] = {"intent": 0, "sql": 0, "answer": 0}
+        self.model_calls: Dict[str, int] = {}
+        # Tokens de entrada cobrados: integrais e lidos do cache (com desconto de `cached_token_rate`)
+        self.cached_token_rate = cached_token_rate
+        self.tokens: Dict[str, int] = {"input": 0, "cached": 0}
+        self._calls_lock = threading.Lock()
+
+    def _lookup(self, stage: str, user_content: str) -> Optional[Dict[str, Any]]:
+        pattern = _QUESTION_PATTERNS.get(stage)
+        match = pattern.search(user_content) if pattern else None
+        if not match:
+            return None
+        return self.recorded.get(normalize_question(match.group("question")))
+
+    def _response_text(self, stage: str, user_content: str, record: Optional[Dict[str, Any]]) -> str:
+        if stage == "intent":
+            intent = (record or {}).get("intent") or SYNTHETIC_INTENT
+            return json.dumps(intent, ensure_ascii=False) + "\n\nA intenção foi identificada a partir do esquema."
+        batch = _BATCH_QUESTIONS.search(user_content) if stage == "sql" else None
+        if batch:
+            queries = []
+            for line in batch.group("questions").splitlines():
+                question = line.split(". ", 1)[-1]
+                queries.append((self.recorded.get(normalize_question(question)) or {}).get("sql") or SYNTHETIC_SQL)
+            return json.dumps({"queries": queries}, ensure_ascii=False)
+        if stage == "sql":
+            sql = (record or {}).get("sql") or SYNTHETIC_SQL
+            return f"```sql\n{sql}\n```\n\nEsta consulta atende à pergunta usando o filtro solicitado."
+        if record and record.get("response"):
+            return record["response"]
+        rows = _ROW_COUNT.search(user_content)
+        return f"Foram encontrados {rows.group(1) if rows else 'alguns'} registros para a sua pergunta."
+
+    def token_usage(self) -> Dict[str, Any]:
+        """Tokens de entrada cobrados e economia em relação a enviar o prompt completo"""
+        with self._calls_lock:
+            tokens = dict(self.tokens)
+        billed = tokens["input"] + tokens["cached"] * self.cached_token_rate
+        uncached = tokens["input"] + tokens["cached"]
+        return dict(tokens, billed=billed, saved=uncached - billed,
+                    saved_ratio=(uncached - billed) / uncached if uncached else 0.0)
+
+    def _open_stream(self, stage: str, system_instruction: str, user_content: str,
+                     model: str = None, cached_content: str = None) -> Iterator[str]:
+        cached_tokens = 0
+        if cached_content:
+            # Como no provedor: handle expirado ou de outro modelo falha antes de gerar
+            cached_tokens = self.context_cache.api.lookup(cached_content, model or GEMINI_CONFIG["model"])["tokens"]
+        with self._calls_lock:
+            self.calls[stage] = self.calls.get(stage, 0) + 1
+            self.model_calls[model] = self.model_calls.get(model, 0) + 1
+            self.tokens["cached"] += cached_tokens
+            self.tokens["input"] += (len(user_content) + (0 if cached_content else len(system_instruction))) // 4
+        record = self._lookup(stage, user_content)
+        text = self._response_text(stage, user_content, record)
+        chunks = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)] or [""]
+
+        first_token = self.model_latencies.get(model, self.first_token_latency)
+        per_chunk = self.chunk_latency
+        recorded_time = ((record or {}).get("timings") or {}).get(stage)
+        if self.use_recorded_timings and recorded_time:
+            # Metade do tempo gravado até o primeiro trecho, o restante distribuído entre os trechos
+            first_token, per_chunk = recorded_time / 2, recorded_time / 2 / len(chunks)
+        return self._emit(chunks, first_token, per_chunk)
+
+    def _emit(self, chunks: List[str], first_token: float, per_chunk: float) -> Iterator[str]:
+        time.sleep(first_token)
+        for chunk in chunks:
+            if per_chunk:
+                time.sleep(per_chunk)
+            yield chunk
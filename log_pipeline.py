@@ -0,0 +1,181 @@
+"""
+Pipeline de logging não bloqueante: fila em memória e escrita em thread de fundo
+"""
+
+import atexit
+import datetime
+import decimal
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import threading
+from typing import Dict, Any, Optional, Sequence
+
+from config import LOGGING_CONFIG
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_handler: Optional["NonBlockingQueueHandler"] = None
+_setup_lock = threading.Lock()
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Enfileira registros sem bloquear a thread que está logando.
+
+    A formatação fica para a thread de escrita quando os argumentos são
+    imutáveis; argumentos mutáveis (listas, dicionários, objetos) são formatados
+    aqui, antes que a thread que loga os altere. Com a fila cheia, registros
+    abaixo de ERROR são descartados e contados; erros esperam até
+    `error_block_seconds` por espaço e, se a fila continuar cheia, são gravados
+    diretamente nos handlers de destino.
+    """
+
+    def __init__(self, log_queue: "queue.Queue", error_block_seconds: float = 0.5,
+                 fallback: Sequence[logging.Handler] = ()):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self.error_block_seconds = error_block_seconds
+        self.fallback = list(fallback)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Tracebacks são formatados aqui, enquanto os frames ainda representam o erro
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        if record.args and not _immutable(record.args):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+            return
+        except queue.Full:
+            if record.levelno < logging.ERROR:
+                self.dropped += 1
+                return
+        try:
+            self.queue.put(record, timeout=self.error_block_seconds)
+            return
+        except queue.Full:
+            pass
+        if not self.fallback:
+            self.dropped += 1
+            return
+        # Escrita síncrona: os handlers têm lock próprio, compartilhado com a thread de escrita
+        for handler in self.fallback:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+_IMMUTABLE = (str, bytes, int, float, complex, bool, type(None), decimal.Decimal, datetime.date, datetime.time,
+              datetime.timedelta)
+
+
+def _immutable(value: Any) -> bool:
+    """Argumentos que podem ser formatados depois, em outra thread, sem risco de mudar"""
+    if isinstance(value, _IMMUTABLE):
+        return True
+    if isinstance(value, (tuple, frozenset)):
+        return all(_immutable(item) for item in value)
+    if isinstance(value, _Payload):
+        return isinstance(value.value, (str, bytes))
+    return False
+
+
+class _Payload:
+    """
+    Conteúdo grande (prompt, resultado) serializado e truncado só quando o registro é formatado
+
+    Textos são formatados na thread de escrita; estruturas mutáveis, ao enfileirar.
+    """
+
+    __slots__ = ("value", "max_chars")
+
+    def __init__(self, value: Any, max_chars: int):
+        self.value = value
+        self.max_chars = max_chars
+
+    def __str__(self) -> str:
+        value = self.value
+        if not isinstance(value, str):
+            value = json.dumps(value, ensure_ascii=False, default=str)
+        if self.max_chars and len(value) > self.max_chars:
+            return f"{value[:self.max_chars]}... [+{len(value) - self.max_chars} caracteres]"
+        return value
+
+
+def setup_logging(config: Dict[str, Any] = None) -> logging.handlers.QueueListener:
+    """
+    Configura o logging do processo uma única vez
+
+    O logger raiz recebe apenas o handler de fila; arquivo e console ficam na
+    thread do QueueListener, fora do caminho das requisições.
+
+    Returns:
+        O listener em execução
+    """
+    global _listener, _handler
+    with _setup_lock:
+        if _listener is not None:
+            return _listener
+        config = config or LOGGING_CONFIG
+        formatter = logging.Formatter(config.get("format", '%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+
+        handlers = []
+        if config.get("file_path"):
+            handlers.append(logging.FileHandler(config["file_path"], encoding="utf-8"))
+        if config.get("console") or not handlers:
+            handlers.append(logging.StreamHandler())
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        log_queue: "queue.Queue" = queue.Queue(maxsize=config.get("queue_size", 10000))
+        _handler = NonBlockingQueueHandler(log_queue, config.get("error_block_seconds", 0.5), handlers)
+        root = logging.getLogger()
+        root.setLevel(config.get("level", logging.INFO))
+        root.addHandler(_handler)
+
+        _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+        return _listener
+
+
+def shutdown_logging() -> None:
+    """Esvazia a fila e encerra a thread de escrita"""
+    global _listener, _handler
+    with _setup_lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        logging.getLogger().removeHandler(_handler)
+        _listener = _handler = None
+
+
+def dropped_records() -> int:
+    """Registros descartados por fila cheia desde a configuração"""
+    return _handler.dropped if _handler is not None else 0
+
+
+def log_payload(logger: logging.Logger, label: str, payload: Any, level: int = None,
+                config: Dict[str, Any] = None) -> None:
+    """
+    Registra um conteúdo grande (prompt, intenção, resultado) com amostragem e limite de tamanho
+
+    Nada é serializado quando o nível está desabilitado ou o registro não é amostrado.
+    """
+    config = config or LOGGING_CONFIG
+    if level is None:
+        level = logging.getLevelName(config.get("payload_level", "DEBUG"))
+    if not logger.isEnabledFor(level):
+        return
+    rate = config.get("payload_sample_rate", 1.0)
+    if rate < 1.0 and random.random() >= rate:
+        return
+    logger.log(level, "%s: %s", label, _Payload(payload, config.get("payload_max_chars", 2000)))
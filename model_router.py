@@ -0,0 +1,303 @@
+"""
+Roteamento de modelos por etapa e complexidade da pergunta, guiado por SLOs de latência
+"""
+
+import json
+import logging
+import queue
+import re
+import threading
+import time
+import unicodedata
+from collections import deque
+from typing import Dict, Any, Iterator, List, Optional
+
+from config import MODEL_ROUTER_CONFIG
+from db_router import extract_tables
+from deadline import DeadlineExceeded, DependencyUnavailable
+
+logger = logging.getLogger("model_router")
+
+LEVELS = ("simple", "moderate", "complex")
+
+_CONDITION_CUES = re.compile(
+    r"\b(?:e|ou|entre|maior|menor|acima|abaixo|desde|ate|antes|depois|sem|exceto|nao|igual|contem|"
+    r"comeca|termina|ultim[oa]s?|hoje|ontem|ativos?|inativos?|por|agrupad[oa]s?|media|soma|total)\b"
+)
+_SQL_CONDITIONS = re.compile(r"\b(?:AND|OR|JOIN|GROUP\s+BY|HAVING|UNION|EXISTS|IN\s*\()", re.IGNORECASE)
+
+
+class ModelTimeout(DependencyUnavailable):
+    """O modelo não concluiu a geração dentro do tempo de fallback"""
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text or "")
+    return "".join(char for char in text if not unicodedata.combining(char)).lower()
+
+
+def _pruned_schema(db_schema: Dict[str, Any], tables: List[str]) -> Dict[str, Any]:
+    """Recorte do esquema com apenas as tabelas envolvidas"""
+    wanted = {table.lower() for table in tables}
+    return {name: table for name, table in (db_schema or {}).items() if name.lower() in wanted}
+
+
+def estimate_complexity(question: str, db_schema: Dict[str, Any] = None, intent_data: Dict[str, Any] = None,
+                        sql: str = None, result_count: int = None,
+                        config: Dict[str, Any] = None) -> Dict[str, Any]:
+    """
+    Estima localmente a complexidade de uma chamada
+
+    Usa o tamanho do recorte do esquema para as tabelas envolvidas, a quantidade
+    de tabelas e de condições (do SQL, da intenção ou, na falta deles, de
+    palavras da pergunta) e, na etapa de resposta, a quantidade de linhas.
+
+    Returns:
+        Dicionário com level (simple, moderate, complex), score e os fatores usados
+    """
+    config = config or MODEL_ROUTER_CONFIG
+    text = _normalize(question)
+    schema = db_schema or {}
+
+    if sql:
+        tables = extract_tables(sql)
+        conditions = len(_SQL_CONDITIONS.findall(sql)) + (1 if re.search(r"\bWHERE\b", sql, re.IGNORECASE) else 0)
+    else:
+        entities = [str(entity) for entity in (intent_data or {}).get("entities") or []]
+        tables = [name for name in schema if name in entities or _normalize(name) in text]
+        if intent_data and isinstance(intent_data.get("conditions"), list):
+            conditions = len(intent_data["conditions"])
+        else:
+            conditions = len(_CONDITION_CUES.findall(text))
+    if not tables and len(schema) == 1:
+        tables = list(schema)
+    pruned = _pruned_schema(schema, tables) if tables else schema
+    schema_chars = len(json.dumps(pruned, ensure_ascii=False)) if pruned else 0
+
+    score = max(len(tables) - 1, 0) * 2.0 + conditions + schema_chars / 4000
+    if result_count:
+        score += min(result_count / 100, 3.0)
+    thresholds = config.get("complexity_thresholds", {"moderate": 2.0, "complex": 5.0})
+    if score >= thresholds.get("complex", 5.0):
+        level = "complex"
+    elif score >= thresholds.get("moderate", 2.0):
+        level = "moderate"
+    else:
+        level = "simple"
+    return {"level": level, "score": round(score, 2), "tables": len(tables), "conditions": conditions,
+            "schema_chars": schema_chars}
+
+
+class _ModelStats:
+    """Janela de latências e contadores de um modelo em uma etapa"""
+
+    def __init__(self, window: int):
+        self.latencies: deque = deque(maxlen=window)
+        self.outcomes: deque = deque(maxlen=window)
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+    def failure_rate(self) -> float:
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+
+class ModelRouter:
+    """
+    Escolhe o modelo de cada chamada a partir da etapa e do nível de complexidade.
+
+    As rotas listam os modelos em ordem de preferência (do mais barato ao mais
+    capaz); é escolhido o primeiro cujo p90 recente cabe no SLO da etapa e cuja
+    taxa de falhas está abaixo do limite. Os demais ficam como fallback, usado
+    quando a chamada estoura o tempo (SLO x `timeout_factor`) ou falha.
+    """
+
+    def __init__(self, config: Dict[str, Any] = None):
+        self.config = config or MODEL_ROUTER_CONFIG
+        self.models = self.config.get("models", {})
+        self.routes = self.config.get("routes", {})
+        self.stage_routes = self.config.get("stage_routes", {})
+        self.slo = self.config.get("slo_seconds", {})
+        self.timeout_factor = self.config.get("timeout_factor", 2.0)
+        self.window = self.config.get("window", 50)
+        self.min_samples = self.config.get("min_samples", 5)
+        self.max_failure_rate = self.config.get("max_failure_rate", 0.2)
+        self._stats: Dict[tuple, _ModelStats] = {}
+        self._lock = threading.Lock()
+
+    def _preferences(self, stage: str, level: str) -> List[str]:
+        route = self.stage_routes.get(stage, {}).get(level) or self.routes.get(level) or ["default"]
+        models: List[str] = []
+        for name in route:
+            model = self.models.get(name, name)
+            if model and model not in models:
+                models.append(model)
+        return models
+
+    def _stats_for(self, model: str, stage: str) -> _ModelStats:
+        key = (model, stage)
+        if key not in self._stats:
+            self._stats[key] = _ModelStats(self.window)
+        return self._stats[key]
+
+    def candidates(self, stage: str, level: str = "moderate") -> List[str]:
+        """
+        Modelos a tentar, em ordem, para a etapa e o nível de complexidade
+
+        Returns:
+            Lista com o modelo escolhido primeiro e os fallbacks em seguida
+        """
+        models = self._preferences(stage, level if level in LEVELS else "moderate")
+        slo = self.slo.get(stage)
+        with self._lock:
+            healthy = []
+            for model in models:
+                stats = self._stats_for(model, stage)
+                if len(stats.latencies) < self.min_samples:
+                    healthy.append(model)
+                    continue
+                p90 = stats.percentile(0.9)
+                if (slo is None or p90 <= slo) and stats.failure_rate() <= self.max_failure_rate:
+                    healthy.append(model)
+            if healthy:
+                chosen = healthy[0]
+            else:
+                # Nenhum modelo dentro do SLO: usa o de menor latência observada
+                chosen = min(models, key=lambda model: self._stats_for(model, stage).percentile(0.9) or 0.0)
+        return [chosen] + [model for model in models if model != chosen]
+
+    def timeout_for(self, stage: str) -> Optional[float]:
+        """Tempo máximo de uma tentativa antes de passar para o próximo modelo"""
+        slo = self.slo.get(stage)
+        return slo * self.timeout_factor if slo else None
+
+    def record(self, model: str, stage: str, latency: float, tokens_in: int = 0, tokens_out: int = 0,
+               error: Exception = None) -> None:
+        """Registra o resultado de uma chamada para as próximas escolhas"""
+        with self._lock:
+            stats = self._stats_for(model, stage)
+            stats.calls += 1
+            stats.tokens_in += tokens_in
+            stats.tokens_out += tokens_out
+            stats.outcomes.append(error is None)
+            if isinstance(error, (ModelTimeout, DeadlineExceeded)):
+                stats.timeouts += 1
+                # O tempo real é ao menos o limite; entra na janela para afastar o modelo
+                stats.latencies.append(latency)
+            elif error is not None:
+                stats.failures += 1
+            else:
+                stats.latencies.append(latency)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Estatísticas por modelo e etapa
+
+        Returns:
+            Dicionário {modelo: {etapa: {calls, failures, timeouts, p50, p90, tokens_in, tokens_out}}}
+        """
+        with self._lock:
+            result: Dict[str, Any] = {}
+            for (model, stage), stats in self._stats.items():
+                result.setdefault(model, {})[stage] = {
+                    "calls": stats.calls,
+                    "failures": stats.failures,
+                    "timeouts": stats.timeouts,
+                    "failure_rate": stats.failure_rate(),
+                    "p50": stats.percentile(0.5),
+                    "p90": stats.percentile(0.9),
+                    "tokens_in": stats.tokens_in,
+                    "tokens_out": stats.tokens_out
+                }
+            return result
+
+
+class TimedStream:
+    """
+    Lê um stream em uma thread auxiliar e interrompe a leitura após `timeout` segundos
+
+    A thread só pede o próximo trecho quando o consumidor o solicita, então o
+    encerramento antecipado continua evitando a leitura do restante do stream.
+    """
+
+    _END = object()
+
+    def __init__(self, chunks: Iterator[str], timeout: float):
+        self._queue: "queue.Queue" = queue.Queue()
+        self._wanted = threading.Semaphore(0)
+        self._closed = threading.Event()
+        self._fetching = False
+        self._deadline = time.monotonic() + timeout
+        self._thread = threading.Thread(target=self._pump, args=(chunks,), daemon=True,
+                                        name="llm-timed-stream")
+        self._thread.start()
+
+    def _pump(self, chunks: Iterator[str]) -> None:
+        iterator = iter(chunks)
+        try:
+            while True:
+                self._wanted.acquire()
+                if self._closed.is_set():
+                    break
+                self._fetching = True
+                try:
+                    self._queue.put(next(iterator))
+                except StopIteration:
+                    self._queue.put(self._END)
+                    break
+                finally:
+                    self._fetching = False
+        except Exception as e:
+            self._queue.put(e)
+        finally:
+            close = getattr(chunks, "close", None)
+            if close:
+                close()
+
+    def __iter__(self) -> "TimedStream":
+        return self
+
+    def __next__(self) -> str:
+        self._wanted.release()
+        remaining = self._deadline - time.monotonic()
+        try:
+            item = self._queue.get(timeout=max(remaining, 0))
+        except queue.Empty:
+            self.close()
+            raise ModelTimeout("tempo limite excedido") from None
+        if item is self._END:
+            raise StopIteration
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    def close(self) -> None:
+        if not self._closed.is_set():
+            self._closed.set()
+            self._wanted.release()
+            # Sem leitura pendente, o stream de origem é fechado antes de retornar
+            if not self._fetching:
+                self._thread.join()
+
+
+_router: Optional[ModelRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_model_router() -> Optional[ModelRouter]:
+    """Retorna o roteador compartilhado do processo (None quando desabilitado)"""
+    global _router
+    if not MODEL_ROUTER_CONFIG.get("enabled"):
+        return None
+    with _router_lock:
+        if _router is None:
+            _router = ModelRouter()
+        return _router
@@ -0,0 +1,268 @@
+"""
+Políticas de acesso (LGPD) aplicadas aos resultados: mascaramento, remoção de colunas e filtros de linha
+
+As regras de data/regulations (chave "politicas_mascaramento", complementar a
+politicas_acesso.txt) são compiladas uma única vez, na inicialização, em um
+plano por perfil. Para cada resultado, o plano vira uma visão sobre as colunas
+do cursor, e os lotes de linhas são processados coluna a coluna: as linhas são
+transpostas, cada coluna sensível passa inteira pela sua função de máscara
+(`map`) e o resultado é transposto de volta, sem despachar por linha e campo.
+"""
+
+import logging
+import operator
+import re
+from itertools import compress
+from typing import Dict, Any, Callable, List, Optional, Sequence, Tuple
+
+from config import POLICY_CONFIG
+
+logger = logging.getLogger("policy_engine")
+
+_EMAIL = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+_CARD = re.compile(r"^\d{4}(?:[ -]?\d{4}){2}[ -]?\d{1,7}$")
+_NON_DIGIT = re.compile(r"\D")
+
+_OPERATORS = {
+    "=": operator.eq, "==": operator.eq, "!=": operator.ne, "<>": operator.ne,
+    ">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le,
+    "in": lambda value, allowed: value in allowed
+}
+
+
+def mask_email(value: Any) -> str:
+    """pessoa@gmail.com -> p***@gmail.com"""
+    local, at, domain = str(value).partition("@")
+    if not at:
+        return mask_partial(value)
+    return f"{local[:1]}***@{domain}"
+
+
+def mask_phone(value: Any) -> str:
+    """11999887766 -> *******7766"""
+    digits = _NON_DIGIT.sub("", str(value))
+    return "*" * max(len(digits) - 4, 4) + digits[-4:] if len(digits) > 4 else "****"
+
+
+def mask_card(value: Any) -> str:
+    """Apenas os 4 últimos dígitos do cartão ficam visíveis"""
+    digits = _NON_DIGIT.sub("", str(value))
+    return f"**** **** **** {digits[-4:]}" if len(digits) > 4 else "****"
+
+
+def mask_partial(value: Any) -> str:
+    """Documentos e outros identificadores: apenas os 2 últimos caracteres ficam visíveis"""
+    text = str(value)
+    return "*" * max(len(text) - 2, 4) + text[-2:] if len(text) > 2 else "****"
+
+
+def redact(value: Any) -> None:
+    return None
+
+
+MASKS: Dict[str, Callable[[Any], Any]] = {
+    "email": mask_email,
+    "telefone": mask_phone,
+    "cartao": mask_card,
+    "documento": mask_partial,
+}
+# Tipos reconhecidos pelo conteúdo, para colunas renomeadas no SQL (ex.: Email AS Contato)
+_DETECTORS = (("email", _EMAIL), ("cartao", _CARD))
+
+
+def _null_safe(mask: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    return lambda value: value if value is None else mask(value)
+
+
+class ResultView:
+    """
+    Plano de um resultado: colunas visíveis, máscara por coluna e filtros de linha
+
+    Criado por `RolePolicy.view` a partir dos nomes das colunas; a detecção pelo
+    conteúdo acontece no primeiro lote de linhas.
+    """
+
+    def __init__(self, policy: "RolePolicy", columns: Sequence[str]):
+        self.policy = policy
+        self.source_columns = list(columns)
+        names = [str(column).lower() for column in self.source_columns]
+        self.keep = [index for index, name in enumerate(names) if name not in policy.removed]
+        self.columns = [self.source_columns[index] for index in self.keep]
+        self.masks: Dict[int, Callable[[Any], Any]] = {}
+        for index in self.keep:
+            mask = policy.masks.get(names[index])
+            if mask is not None:
+                self.masks[index] = mask
+        self.filters: List[Tuple[int, Callable[[Any], bool]]] = []
+        self.blocked = False
+        for column, predicate in policy.row_filters:
+            if column not in names:
+                # Sem a coluna do filtro não há como garantir a restrição: nenhuma linha é liberada
+                self.blocked = True
+                break
+            self.filters.append((names.index(column), predicate))
+        self._detected = not policy.detect
+        removed = [column for column in self.source_columns if str(column).lower() in policy.removed]
+        if removed or self.masks or self.blocked:
+            logger.info("Perfil %s: colunas mascaradas %s, removidas %s%s", policy.name,
+                        [self.source_columns[index] for index in self.masks], removed,
+                        ", resultado bloqueado (coluna de filtro ausente)" if self.blocked else "")
+
+    @property
+    def identity(self) -> bool:
+        return (self._detected and not self.masks and not self.filters and not self.blocked
+                and len(self.keep) == len(self.source_columns))
+
+    def _detect(self, columns: List[tuple]) -> None:
+        """Reconhece e-mails e cartões pelo conteúdo em colunas de texto ainda sem máscara"""
+        self._detected = True
+        sample_size = self.policy.sample_size
+        for index in self.keep:
+            if index in self.masks:
+                continue
+            sample = [value for value in columns[index][:sample_size * 4] if value is not None][:sample_size]
+            if not sample or not all(isinstance(value, str) for value in sample):
+                continue
+            for kind, pattern in _DETECTORS:
+                if all(pattern.match(value) for value in sample):
+                    if kind not in self.policy.kind_masks:
+                        break
+                    self.masks[index] = self.policy.kind_masks[kind]
+                    logger.info("Perfil %s: coluna %s reconhecida como %s pelo conteúdo",
+                                self.policy.name, self.source_columns[index], kind)
+                    break
+
+    def apply(self, rows: List[tuple]) -> List[tuple]:
+        """
+        Aplica o plano a um lote de linhas (tuplas na ordem de `source_columns`)
+
+        Returns:
+            Linhas filtradas e mascaradas, na ordem de `columns`
+        """
+        if not rows or self.identity:
+            return rows
+        if self.blocked:
+            return []
+        columns = list(zip(*rows))
+        if not self._detected:
+            self._detect(columns)
+        if self.filters:
+            flags = [list(map(predicate, columns[index])) for index, predicate in self.filters]
+            keep_rows = flags[0] if len(flags) == 1 else list(map(all, zip(*flags)))
+            if not all(keep_rows):
+                columns = [tuple(compress(column, keep_rows)) for column in columns]
+                if not columns[0]:
+                    return []
+        output = []
+        for index in self.keep:
+            mask = self.masks.get(index)
+            output.append(columns[index] if mask is None else list(map(mask, columns[index])))
+        return list(zip(*output))
+
+
+class RolePolicy:
+    """Regras compiladas de um perfil de acesso"""
+
+    def __init__(self, name: str, definition: Dict[str, Any], mask_columns: Dict[str, List[str]],
+                 config: Dict[str, Any]):
+        self.name = name
+        self.detect = config.get("detect_by_content", True)
+        self.sample_size = config.get("sample_size", 20)
+        unmasked = {kind.lower() for kind in definition.get("sem_mascara", [])}
+        removed_kinds = {kind.lower() for kind in definition.get("dados_removidos", [])}
+        # Máscara por tipo de dado: removido (valor nulo), sem máscara (identidade) ou a máscara do tipo
+        self.kind_masks: Dict[str, Callable[[Any], Any]] = {}
+        for kind, mask in MASKS.items():
+            if kind in removed_kinds:
+                self.kind_masks[kind] = redact
+            elif kind in unmasked:
+                self.kind_masks[kind] = None
+            else:
+                self.kind_masks[kind] = _null_safe(mask)
+        self.removed = {column.lower() for column in definition.get("colunas_removidas", [])}
+        self.masks: Dict[str, Callable[[Any], Any]] = {}
+        for kind, columns in mask_columns.items():
+            for column in columns:
+                if kind in removed_kinds:
+                    self.removed.add(column.lower())
+                elif self.kind_masks.get(kind) is not None:
+                    self.masks[column.lower()] = self.kind_masks[kind]
+        self.kind_masks = {kind: mask for kind, mask in self.kind_masks.items() if mask is not None}
+        self.detect = self.detect and bool(self.kind_masks)
+        self.row_filters = [self._compile_filter(spec) for spec in definition.get("filtros_linha", [])]
+
+    def _compile_filter(self, spec: Dict[str, Any]) -> Tuple[str, Callable[[Any], bool]]:
+        op = str(spec.get("operador", "=")).lower()
+        if op not in _OPERATORS:
+            raise ValueError(f"Operador de filtro não suportado no perfil {self.name}: {op}")
+        compare, expected = _OPERATORS[op], spec.get("valor")
+        if op == "in":
+            expected = set(expected or [])
+        return spec["coluna"].lower(), lambda value: value is not None and compare(value, expected)
+
+    def view(self, columns: Sequence[str]) -> ResultView:
+        return ResultView(self, columns)
+
+    def apply_records(self, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Aplica as regras a um resultado em dicionários (ex.: agregados locais)"""
+        if not records:
+            return records
+        columns = list(records[0])
+        view = self.view(columns)
+        if view.identity:
+            return records
+        rows = view.apply([tuple(record.get(column) for column in columns) for record in records])
+        return [dict(zip(view.columns, row)) for row in rows]
+
+
+class PolicyEngine:
+    """Perfis de acesso compilados na inicialização"""
+
+    def __init__(self, policies: Dict[str, Any], config: Dict[str, Any] = None):
+        """
+        Args:
+            policies: Definição das políticas (mascaras, perfis, perfil_padrao)
+            config: Configuração (padrão: POLICY_CONFIG)
+        """
+        self.config = config or POLICY_CONFIG
+        mask_columns = {}
+        for kind, definition in policies.get("mascaras", {}).items():
+            if kind not in MASKS:
+                raise ValueError(f"Tipo de máscara desconhecido: {kind}")
+            mask_columns[kind] = list(definition.get("colunas", []))
+        self.roles = {
+            name.lower(): RolePolicy(name.lower(), definition, mask_columns, self.config)
+            for name, definition in policies.get("perfis", {}).items()
+        }
+        self.default_role = (self.config.get("default_role") or policies.get("perfil_padrao") or "").lower()
+        if self.default_role not in self.roles:
+            raise ValueError(f"Perfil padrão não definido nas políticas: {self.default_role!r}")
+        logger.info("Políticas de acesso compiladas para os perfis: %s", ", ".join(self.roles))
+
+    @classmethod
+    def from_regulations(cls, regulations: Dict[str, Any],
+                         config: Dict[str, Any] = None) -> Optional["PolicyEngine"]:
+        """
+        Compila as políticas carregadas dos regulamentos
+
+        Returns:
+            PolicyEngine, ou None quando os regulamentos não definem políticas
+        """
+        config = config or POLICY_CONFIG
+        policies = (regulations or {}).get(config.get("policy_key", "politicas_mascaramento"))
+        if not policies:
+            logger.warning("Nenhuma política de mascaramento encontrada nos regulamentos")
+            return None
+        return cls(policies, config)
+
+    def role(self, name: str = None) -> RolePolicy:
+        """
+        Regras de um perfil (padrão: perfil configurado)
+
+        Raises:
+            PermissionError: Perfil desconhecido
+        """
+        key = (name or self.default_role).lower()
+        if key not in self.roles:
+            raise PermissionError(f"Perfil de acesso desconhecido: {name}")
+        return self.roles[key]
@@ -0,0 +1,271 @@
+"""
+Modo prefork: o processo pai carrega os dados do agente uma vez, congela-os e cria os workers
+
+Os dados do agente (esquema, regulamentos, referências de API, instruções SQL e
+estruturas derivadas somente leitura) são montados no pai antes do fork. Com
+`gc.freeze()` esses objetos saem das gerações do coletor, que deixa de escrever
+nos cabeçalhos deles, então as páginas continuam compartilhadas (copy-on-write)
+entre todos os workers. Cada worker cria apenas o que é por processo: clientes
+do LLM, pools de conexão, caches e threads.
+
+Protocolo: linhas JSON sobre TCP. Cada linha de requisição tem `query` e,
+opcionalmente, `execute`, `session_id`, `timeout` e `role` (perfil de acesso); a resposta é o resultado
+de `IntelligenceAgent.process_query` em uma linha JSON. A linha `{"metrics": true}` devolve as
+métricas do worker que atendeu (filas e limites do controle de admissão).
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import signal
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable, Optional
+
+from config import PREFORK_CONFIG
+from agent_initializer import AgentInitializer
+from intelligence_agent import IntelligenceAgent, schema_columns
+from log_pipeline import setup_logging, shutdown_logging
+from query_generator import load_sql_instructions
+from result_serializer import encode_value
+
+logger = logging.getLogger("prefork")
+
+
+def build_shared_data() -> Dict[str, Any]:
+    """
+    Carrega os dados do agente e as estruturas derivadas somente leitura
+
+    Returns:
+        agent_data com schema_json, schema_columns e sql_instructions já prontos
+    """
+    agent_data = AgentInitializer().initialize_agent()
+    agent_data["schema_json"] = json.dumps(agent_data["db_schema"], ensure_ascii=False)
+    agent_data["schema_columns"] = schema_columns(agent_data["db_schema"])
+    agent_data["sql_instructions"] = load_sql_instructions()
+    return agent_data
+
+
+def memory_usage(pid: int) -> Optional[Dict[str, int]]:
+    """
+    Uso de memória de um processo em bytes, lido de /proc/<pid>/smaps_rollup (Linux)
+
+    Returns:
+        Dicionário com rss, pss, shared e uss (memória exclusiva do processo),
+        ou None quando a informação não está disponível
+    """
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as file:
+            for line in file:
+                name, _, value = line.partition(":")
+                parts = value.split()
+                if len(parts) == 2 and parts[1] == "kB":
+                    fields[name] = int(parts[0]) * 1024
+    except OSError:
+        return None
+    return {
+        "rss": fields.get("Rss", 0),
+        "pss": fields.get("Pss", 0),
+        "shared": fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0),
+        "uss": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+    }
+
+
+class PreforkServer:
+    """
+    Servidor prefork: um socket de escuta no pai e `workers` processos aceitando conexões nele
+
+    Workers que terminam inesperadamente são recriados a partir dos mesmos dados congelados.
+    """
+
+    def __init__(self, agent_factory: Callable[[Dict[str, Any]], Any] = None,
+                 shared_data: Dict[str, Any] = None, config: Dict[str, Any] = None):
+        """
+        Args:
+            agent_factory: Cria o agente do worker a partir dos dados compartilhados
+                (padrão: IntelligenceAgent(agent_data=...))
+            shared_data: Dados já carregados (padrão: build_shared_data() no start)
+            config: Configuração (padrão: PREFORK_CONFIG)
+        """
+        self.config = config or PREFORK_CONFIG
+        self.agent_factory = agent_factory or (lambda data: IntelligenceAgent(agent_data=data))
+        self.shared_data = shared_data
+        self.workers: Dict[int, int] = {}
+        self._socket: Optional[socket.socket] = None
+        self._stopping = False
+
+    @property
+    def address(self) -> tuple:
+        return self._socket.getsockname()
+
+    def start(self) -> None:
+        """Carrega os dados, congela o heap do pai e cria os workers"""
+        # Sem coleta até o fork: objetos criados agora não são movidos entre gerações
+        gc.disable()
+        try:
+            if self.shared_data is None:
+                self.shared_data = build_shared_data()
+            self._socket = socket.create_server((self.config.get("host", "127.0.0.1"), self.config.get("port", 0)),
+                                                backlog=self.config.get("backlog", 128))
+            gc.freeze()
+            for index in range(self.config.get("workers", 2)):
+                self._spawn(index)
+        finally:
+            gc.enable()
+        logger.info("Servidor prefork em %s:%s com %s worker(s)", *self.address[:2], len(self.workers))
+
+    def _spawn(self, index: int) -> None:
+        # A thread de escrita do log não sobrevive ao fork: o pai a encerra antes de cada
+        # fork (inclusive ao recriar um worker) e a recria depois; o filho cria a própria
+        shutdown_logging()
+        try:
+            pid = os.fork()
+        except OSError:
+            setup_logging()
+            raise
+        if pid == 0:
+            code = 0
+            try:
+                self._worker_main(index)
+            except BaseException:
+                logger.exception("Worker %s encerrado com erro", index)
+                code = 1
+            finally:
+                shutdown_logging()
+                os._exit(code)
+        setup_logging()
+        self.workers[pid] = index
+
+    def _worker_main(self, index: int) -> None:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        gc.enable()
+        setup_logging()
+        agent = self.agent_factory(self.shared_data)
+        logger.info("Worker %s (pid %s) pronto", index, os.getpid())
+        with ThreadPoolExecutor(max_workers=self.config.get("worker_threads", 8),
+                                thread_name_prefix=f"prefork-{index}") as pool:
+            while True:
+                conn, _ = self._socket.accept()
+                pool.submit(self._serve_connection, agent, conn)
+
+    def _serve_connection(self, agent: Any, conn: socket.socket) -> None:
+        with conn, conn.makefile("rwb") as stream:
+            for line in stream:
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                    if request.get("metrics"):
+                        result = dict(agent.get_metrics(), pid=os.getpid())
+                    else:
+                        result = agent.process_query(
+                            request["query"], bool(request.get("execute")),
+                            session_id=request.get("session_id"), timeout=request.get("timeout"),
+                            role=request.get("role")
+                        )
+                except Exception as e:
+                    logger.error("Erro ao atender requisição: %s", e, exc_info=True)
+                    result = {"error": str(e)}
+                payload = json.dumps(result, ensure_ascii=False, default=encode_value)
+                stream.write(payload.encode("utf-8") + b"\n")
+                stream.flush()
+
+    def memory_report(self) -> Dict[str, Any]:
+        """
+        Memória do pai e de cada worker
+
+        Returns:
+            Dicionário com parent, workers ({pid: uso}) e total_uss dos workers em bytes
+        """
+        workers = {pid: memory_usage(pid) for pid in self.workers}
+        return {
+            "parent": memory_usage(os.getpid()),
+            "workers": workers,
+            "total_uss": sum(usage["uss"] for usage in workers.values() if usage)
+        }
+
+    def log_memory_report(self) -> None:
+        report = self.memory_report()
+        for pid, usage in report["workers"].items():
+            if usage:
+                logger.info("Worker %s (pid %s): exclusiva %.1f MiB, RSS %.1f MiB, compartilhada %.1f MiB",
+                            self.workers[pid], pid, usage["uss"] / 2 ** 20, usage["rss"] / 2 ** 20,
+                            usage["shared"] / 2 ** 20)
+        logger.info("Memória exclusiva total dos workers: %.1f MiB", report["total_uss"] / 2 ** 20)
+
+    def serve_forever(self) -> None:
+        """Supervisiona os workers até SIGTERM/SIGINT, recriando os que terminarem"""
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+        interval = self.config.get("report_interval", 0)
+        next_report = time.monotonic() + interval
+        while not self._stopping:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                pid = 0
+            if pid and pid in self.workers:
+                index = self.workers.pop(pid)
+                if not self._stopping:
+                    logger.warning("Worker %s (pid %s) terminou (status %s); recriando", index, pid, status)
+                    self._spawn(index)
+                continue
+            if interval and time.monotonic() >= next_report:
+                self.log_memory_report()
+                next_report = time.monotonic() + interval
+            time.sleep(0.5)
+
+    def _request_stop(self, signum, frame) -> None:
+        self._stopping = True
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Encerra os workers e fecha o socket de escuta"""
+        self._stopping = True
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        give_up_at = time.monotonic() + timeout
+        while self.workers and time.monotonic() < give_up_at:
+            for pid in list(self.workers):
+                try:
+                    done, _ = os.waitpid(pid, os.WNOHANG)
+                except ChildProcessError:
+                    done = pid
+                if done:
+                    self.workers.pop(pid)
+            time.sleep(0.05)
+        for pid in self.workers:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        self.workers.clear()
+        if self._socket is not None:
+            self._socket.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=PREFORK_CONFIG["workers"])
+    parser.add_argument("--host", default=PREFORK_CONFIG["host"])
+    parser.add_argument("--port", type=int, default=PREFORK_CONFIG["port"])
+    parser.add_argument("--report-interval", type=float, default=PREFORK_CONFIG["report_interval"],
+                        help="Segundos entre relatórios de memória por worker (0 desabilita)")
+    args = parser.parse_args()
+
+    server = PreforkServer(config=dict(PREFORK_CONFIG, workers=args.workers, host=args.host, port=args.port,
+                                       report_interval=args.report_interval))
+    server.start()
+    try:
+        server.serve_forever()
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -5,37 +5,63 @@ Módulo de geração de consultas SQL para o Agente de Inteligência
 import os
 import json
 import logging
+import re
 from typing import Dict, Any, List
 
-from google import genai
-from google.genai import types
-from config import TRAINING_DATA, NLP_CONFIG, GEMINI_CONFIG
+from config import TRAINING_DATA, SQL_REWRITE_CONFIG
+from llm_client import LLMClient
+from log_pipeline import log_payload
+from sql_stream import consume_sql_statement
+from json_stream import consume_json_object
+from llm_scheduler import LLMRequestError, PRIORITY_INTERACTIVE
+from model_router import estimate_complexity
+from deadline import DependencyUnavailable
+from sql_rewriter import rewrite_sql
+from sql_projection import push_down
 
 logger = logging.getLogger("query_generator")
 
+_STATUS_CONDITION = re.compile(r"\bAtivo\]?\s*(?:=|<>|!=|IN\b)", re.IGNORECASE)
+
+
+def load_sql_instructions() -> Dict[str, Any]:
+    """Instruções SQL de queries.json (vazio quando o arquivo não existe)"""
+    try:
+        file_path = os.path.join(TRAINING_DATA["schemas_path"], "queries.json")
+        if os.path.exists(file_path):
+            with open(file_path, 'r', encoding='utf-8') as file:
+                return json.load(file).get("sql_instructions", {})
+        else:
+            logger.warning("Arquivo de instruções SQL não encontrado: %s", file_path)
+            return {}
+    except Exception as e:
+        logger.error("Erro ao carregar instruções SQL: %s", e)
+        return {}
+
+
 class QueryGenerator:
     def __init__(self, agent_config: Dict[str, Any]):
         self.model_name = agent_config["model_name"]
         self.db_schema = agent_config["db_schema"]
-        self.sql_instructions = self._load_sql_instructions()
-    
-    def _load_sql_instructions(self) -> Dict[str, Any]:
-        try:
-            file_path = os.path.join(TRAINING_DATA["schemas_path"], "queries.json")
-            if os.path.exists(file_path):
-                with open(file_path, 'r', encoding='utf-8') as file:
-                    return json.load(file).get("sql_instructions", {})
-            else:
-                logger.warning(f"Arquivo de instruções SQL não encontrado: {file_path}")
-                return {}
-        except Exception as e:
-            logger.error(f"Erro ao carregar instruções SQL: {str(e)}")
-            return {}
+        self.schema_json = agent_config.get("schema_json") or json.dumps(self.db_schema, ensure_ascii=False)
+        self.sql_instructions = agent_config.get("sql_instructions")
+        if self.sql_instructions is None:
+            self.sql_instructions = load_sql_instructions()
+        self.llm_client = LLMClient()
+        self._static_instruction = None
     
-    def generate_sql_query(self, query: str, intent_data: Dict[str, Any]) -> str:
-        return self._generate_with_gemini(query, intent_data)
+    def generate_sql_query(self, query: str, intent_data: Dict[str, Any],
+                           priority: int = PRIORITY_INTERACTIVE, timeout: float = None) -> str:
+        return self._generate_with_gemini(query, intent_data, priority, timeout)
     
-    def _generate_with_gemini(self, query: str, intent_data: Dict[str, Any]) -> str:
+    def _system_instruction(self) -> str:
+        """
+        Instruções de sistema numeradas, iguais em toda chamada
+
+        Montadas uma vez; com o esquema, formam o prefixo registrado no cache de contexto.
+        """
+        if self._static_instruction is not None:
+            return self._static_instruction
         instructions = []
         
         # Instruções gerais
@@ -63,7 +89,8 @@ class QueryGenerator:
         date_filters = self.sql_instructions.get("date_filters", [
             "Quando o usuário mencionar 'último mês', use: WHERE DataInclusao BETWEEN DATEADD(month, -1, GETDATE()) AND GETDATE()",
             "Quando o usuário mencionar 'última semana', use: WHERE DataInclusao BETWEEN DATEADD(week, -1, GETDATE()) AND GETDATE()",
-            "Quando o usuário mencionar 'hoje', use: WHERE CONVERT(date, DataInclusao) = CONVERT(date, GETDATE())"
+            "Quando o usuário mencionar 'hoje', use: WHERE DataInclusao >= CAST(GETDATE() AS date) "
+            "AND DataInclusao < DATEADD(day, 1, CAST(GETDATE() AS date))"
         ])
         
         instructions.append("\nFILTROS DE DATA:")
@@ -79,7 +106,18 @@ class QueryGenerator:
         instructions.append("\nFILTROS DE STATUS:")
         for i, filter_instruction in enumerate(status_filters, 1):
             instructions.append(f"{i}. {filter_instruction}")
-        
+
+        self._static_instruction = "\n".join(instructions)
+        return self._static_instruction
+
+    def _static_context(self) -> str:
+        """Esquema enviado antes da pergunta (parte estática do prompt)"""
+        return f"Esquema da tabela: {self.schema_json}\n\n"
+
+    def _relevant_examples(self, query: str) -> str:
+        """Exemplos de queries.json relevantes para a pergunta (parte variável do prompt)"""
+        instructions = []
+
         # Buscar exemplos relevantes do arquivo de instruções
         all_examples = self.sql_instructions.get("examples", [])
         relevant_examples = []
@@ -112,90 +150,112 @@ class QueryGenerator:
         
         # Adicionar exemplos relevantes ao contexto
         if relevant_examples:
-            instructions.append("\nEXEMPLOS RELEVANTES:")
+            instructions.append("EXEMPLOS RELEVANTES:")
             for i, example in enumerate(relevant_examples, 1):
                 instructions.append(f"Exemplo {i}:")
                 instructions.append(f"Query: {example.get('query')}")
                 instructions.append(f"SQL: {example.get('sql')}")
                 instructions.append("")
         
-        # Montar o sistema de instruções
-        system_instruction = "\n".join(instructions)
-        
-        # Incluir o schema da tabela e a consulta do usuário
+        return "\n".join(instructions) + "\n" if instructions else ""
+
+    def _generate_with_gemini(self, query: str, intent_data: Dict[str, Any],
+                              priority: int = PRIORITY_INTERACTIVE, timeout: float = None) -> str:
+        system_instruction = self._system_instruction()
+
+        # O esquema vai como contexto estático; os exemplos e a consulta do usuário variam por chamada
         user_content = (
-            f"Esquema da tabela: {json.dumps(self.db_schema, ensure_ascii=False)}\n\n"
+            f"{self._relevant_examples(query)}"
             f"Consulta do usuário: {query}\n\n"
             f"Gere uma consulta SQL válida baseada nesta consulta. "
             f"Certifique-se de incluir a cláusula WITH (NOLOCK) após a tabela."
         )
         
-        print(user_content)
+        log_payload(logger, "Prompt de geração de SQL", user_content)
+        complexity = estimate_complexity(query, self.db_schema, intent_data)
 
         try:
-            # Criar cliente Gemini
-            client = genai.Client(
-                api_key="",
-            )
-            
-            print(client)
-
-            # Preparar o conteúdo
-            content = [
-                types.Content(
-                    role="user",
-                    parts=[types.Part.from_text(text=user_content)]
-                )
-            ]
-            
-            # Configurar a geração
-            generate_config = types.GenerateContentConfig(
-                temperature=NLP_CONFIG["temperature"],
-                top_p=NLP_CONFIG["top_p"],
-                top_k=NLP_CONFIG["top_k"],
-                max_output_tokens=NLP_CONFIG["max_tokens"],
-                response_mime_type=GEMINI_CONFIG["response_mime_type"],
-                system_instruction=[
-                    types.Part.from_text(text=system_instruction)
-                ]
-            )
-            
-            # Gerar a consulta SQL
-            response_text = ""
-            for chunk in client.models.generate_content_stream(
-                model="gemini-2.0-flash",
-                contents=content,
-                config=generate_config,
-            ):
-                if chunk.text:
-                    response_text += chunk.text
-
-            print(response_text)
-            sql_query = response_text.strip()
-
-            if "```" in sql_query:
-                blocks = sql_query.split("```")
-                for block in blocks:
-                    if "SELECT" in block.upper() or "WITH" in block.upper():
-                        sql_query = block.strip()
-                        break
-            
-            # Verificar e corrigir filtros importantes
-            if "último mês" in query.lower() or "ultimo mes" in query.lower():
-                if "DATEADD(month, -1" not in sql_query:
-                    if "WHERE" in sql_query:
-                        sql_query = sql_query.replace("WHERE", "WHERE DataInclusao BETWEEN DATEADD(month, -1, GETDATE()) AND GETDATE() AND ")
-                    else:
-                        sql_query += " WHERE DataInclusao BETWEEN DATEADD(month, -1, GETDATE()) AND GETDATE()"
-            
-            if "ativo" in query.lower() and "Ativo = 1" not in sql_query and "Status = 'Ativo'" not in sql_query:
+            # Gerar a consulta SQL; o stream é encerrado ao fim da primeira instrução SELECT
+            sql_query = self.llm_client.generate("sql", system_instruction, user_content, priority=priority,
+                                                 consume=consume_sql_statement, complexity=complexity["level"],
+                                                 timeout=timeout, static_context=self._static_context())
+            return self._finish_sql(query, sql_query, intent_data)
+
+        except (LLMRequestError, DependencyUnavailable):
+            raise
+        except Exception as e:
+            logger.error("Erro ao gerar SQL com Gemini: %s", e)
+            raise LLMRequestError("sql", str(e)) from e
+
+    def generate_sql_batch(self, queries: List[str], intent_data: Dict[str, Any],
+                           priority: int = PRIORITY_INTERACTIVE, timeout: float = None) -> List[str]:
+        """
+        Gera o SQL de várias perguntas independentes em uma única chamada ao LLM
+
+        Args:
+            queries: Perguntas (ex.: subconsultas de uma pergunta composta)
+            intent_data: Intenção analisada da pergunta original
+            priority: Prioridade no agendador
+            timeout: Orçamento da etapa em segundos
+
+        Returns:
+            Uma consulta SQL por pergunta, na mesma ordem
+        """
+        if len(queries) == 1:
+            return [self.generate_sql_query(queries[0], intent_data, priority, timeout)]
+        system_instruction = self._system_instruction()
+        numbered = "\n".join(f"{i}. {query}" for i, query in enumerate(queries, 1))
+        user_content = (
+            f"{self._relevant_examples(' '.join(queries))}"
+            f"Perguntas do usuário:\n{numbered}\n\n"
+            f"Gere uma consulta SQL válida e independente para cada pergunta, incluindo a cláusula "
+            f"WITH (NOLOCK) após cada tabela. Responda apenas com um objeto JSON no formato "
+            f"{{\"queries\": [\"SQL da pergunta 1\", ...]}}, com {len(queries)} consultas na mesma ordem."
+        )
+
+        log_payload(logger, "Prompt de geração de SQL em lote", user_content)
+        complexity = estimate_complexity(" ".join(queries), self.db_schema, intent_data)
+
+        try:
+            response = self.llm_client.generate("sql", system_instruction, user_content, priority=priority,
+                                                consume=consume_json_object, complexity=complexity["level"],
+                                                timeout=timeout, static_context=self._static_context())
+            sql_queries = response.get("queries") if isinstance(response, dict) else None
+            if not isinstance(sql_queries, list) or len(sql_queries) != len(queries) \
+                    or not all(isinstance(sql, str) and sql.strip() for sql in sql_queries):
+                raise ValueError(f"esperadas {len(queries)} consultas na resposta em lote")
+            return [self._finish_sql(query, sql.strip().rstrip(";"), intent_data)
+                    for query, sql in zip(queries, sql_queries)]
+
+        except (LLMRequestError, DependencyUnavailable):
+            raise
+        except Exception as e:
+            logger.error("Erro ao gerar SQL em lote com Gemini: %s", e)
+            raise LLMRequestError("sql", str(e)) from e
+
+    def _finish_sql(self, query: str, sql_query: str, intent_data: Dict[str, Any]) -> str:
+        """Correções de filtros e reescritas aplicadas ao SQL gerado para a pergunta"""
+        # Verificar e corrigir filtros importantes
+        if "último mês" in query.lower() or "ultimo mes" in query.lower():
+            if "DATEADD(month, -1" not in sql_query:
                 if "WHERE" in sql_query:
-                    sql_query += " AND Ativo = 1"
+                    sql_query = sql_query.replace("WHERE", "WHERE DataInclusao BETWEEN DATEADD(month, -1, GETDATE()) AND GETDATE() AND ")
                 else:
-                    sql_query += " WHERE Ativo = 1"
-            
-            print(f"SQL gerado: {sql_query}")
-            return sql_query
-            
-        except Exception as e:
-            logger.error(f"Erro ao gerar SQL com Gemini: {str(e)}")
\ No newline at end of file
+                    sql_query += " WHERE DataInclusao BETWEEN DATEADD(month, -1, GETDATE()) AND GETDATE()"
+        
+        # "inativos" também contém "ativo": só palavras inteiras, e nunca sobre uma condição de Ativo já presente
+        if re.search(r"\bativos?\b", query.lower()) and not _STATUS_CONDITION.search(sql_query) \
+                and "Status = 'Ativo'" not in sql_query:
+            if "WHERE" in sql_query:
+                sql_query += " AND Ativo = 1"
+            else:
+                sql_query += " WHERE Ativo = 1"
+        
+        # Funções sobre colunas (CONVERT(date, DataInclusao) etc.) viram intervalos que usam índices
+        if SQL_REWRITE_CONFIG.get("enabled"):
+            sql_query, _ = rewrite_sql(sql_query)
+            # Contagens e colunas pedidas são resolvidas no banco em vez de trafegar SELECT *
+            sql_query, _ = push_down(sql_query, query, intent_data, self.db_schema)
+
+        logger.info("SQL gerado: %s", sql_query)
+        return sql_query
@@ -0,0 +1,198 @@
+"""
+Planejador de perguntas compostas: divisão em subconsultas independentes e combinação local
+
+Perguntas como "quantos ativos e quantos inativos cadastrados hoje e no último
+mês" pedem vários números independentes. Depois da análise de intenção, o
+planejador divide a pergunta em subperguntas (as `sub_queries` informadas pelo
+analisador ou, para contagens, o produto das alternativas de status e período
+coordenadas por "e"). Cada subpergunta é resolvida pelos caches/templates ou por
+uma única chamada em lote ao LLM, as consultas rodam em paralelo e os
+resultados são combinados em uma tabela antes da resposta.
+"""
+
+import itertools
+import logging
+import re
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable, List, Optional, Sequence
+
+from config import PLANNER_CONFIG
+from result_store import ResultStore
+
+logger = logging.getLogger("query_planner")
+
+_COUNT_CUES = re.compile(r"\b(?:quant[oa]s|quantidade|n[uú]mero de|total de)\b", re.IGNORECASE)
+# Dimensões que podem ser coordenadas na mesma pergunta
+_DIMENSIONS = {
+    "status": re.compile(r"\b(?:in)?ativ[oa]s?\b", re.IGNORECASE),
+    "periodo": re.compile(
+        r"\b(?:hoje|ontem|(?:[uú]ltim[oa]s?|nest[ea]|dest[ea]|est[ea])\s+(?:\d+\s+)?"
+        r"(?:dias?|semanas?|m[eê]s(?:es)?|anos?))\b",
+        re.IGNORECASE
+    ),
+}
+# Conectivo antes da última alternativa (" e quantos no ...", ", de ...")
+_BEFORE = re.compile(r"(?:\s*,\s*|\s+e\s+)(?:quant[oa]s\s+)?(?:(?:n|d)[oa]s?\s+|em\s+)?$", re.IGNORECASE)
+# Conectivo depois das demais alternativas ("ativos e quantos ...", "hoje, ...")
+_AFTER = re.compile(r"\s*(?:,|\be\b)\s*(?:quant[oa]s\s+)?", re.IGNORECASE)
+_PREPOSITION = re.compile(r"\b(?:n[oa]s?|d[oa]s?|em)\s+$", re.IGNORECASE)
+# Texto aceito entre duas alternativas da mesma dimensão: só a coordenação por "e" ou vírgula
+_COORDINATION = re.compile(r"\s*(?:,\s*(?:e\s+)?|e\s+)(?:quant[oa]s\s+)?(?:(?:n|d)[oa]s?\s+|em\s+)?",
+                           re.IGNORECASE)
+
+
+def _key(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(char for char in text if not unicodedata.combining(char)).lower()
+    return re.sub(r"\s+", " ", re.sub(r"(?<=[a-z])[ao]s?\b", "o", text))
+
+
+def split_question(question: str, max_sub_queries: int = 8) -> Optional[List[str]]:
+    """
+    Divide uma pergunta de contagem com alternativas coordenadas em subperguntas
+
+    Args:
+        question: Pergunta do usuário
+        max_sub_queries: Limite de subperguntas (acima dele, a pergunta não é dividida)
+
+    Returns:
+        Subperguntas, uma por combinação de alternativas, ou None quando a pergunta é simples
+    """
+    if not _COUNT_CUES.search(question or ""):
+        # Em listagens, "ativos e inativos" é uma única consulta (união), não duas perguntas
+        return None
+    compound = []
+    for pattern in _DIMENSIONS.values():
+        mentions = list(pattern.finditer(question))
+        if len({_key(mention.group(0)) for mention in mentions}) > 1:
+            # "hoje comparado com ontem", "ativos ou inativos": comparação ou alternativa, não
+            # contagens independentes; dividir produziria subperguntas truncadas
+            if not all(_COORDINATION.fullmatch(question, previous.end(), mention.start())
+                       for previous, mention in zip(mentions, mentions[1:])):
+                return None
+            compound.append(mentions)
+    if not compound:
+        return None
+    combinations = list(itertools.product(*compound))
+    if len(combinations) > max_sub_queries:
+        logger.info("Pergunta composta com %s combinações (limite %s) não foi dividida",
+                    len(combinations), max_sub_queries)
+        return None
+
+    sub_queries = []
+    for combination in combinations:
+        spans = []
+        for mentions, kept in zip(compound, combination):
+            for index, mention in enumerate(mentions):
+                if mention is kept:
+                    continue
+                start, end = mention.span()
+                # A última alternativa sai com o conectivo anterior; as demais, com o seguinte
+                before = _BEFORE.search(question[:start]) if index == len(mentions) - 1 else None
+                if before:
+                    start = before.start()
+                else:
+                    after = _AFTER.match(question, end)
+                    end = after.end() if after else end
+                    preposition = _PREPOSITION.search(question[:start])
+                    start = preposition.start() if preposition else start
+                spans.append((start, end))
+        text, position = [], 0
+        for start, end in sorted(spans):
+            text.append(question[position:max(start, position)])
+            position = max(position, end)
+        text.append(question[position:])
+        sub_query = re.sub(r"\s+", " ", "".join(text)).strip(" ,")
+        sub_query = re.sub(r"[\s,]+([?!.]*)$", r"\1", sub_query)
+        if sub_query not in sub_queries:
+            sub_queries.append(sub_query)
+    return sub_queries if len(sub_queries) > 1 else None
+
+
+def combine_results(sub_results: Sequence[Dict[str, Any]], rows_per_sub_query: int = 20) -> Dict[str, Any]:
+    """
+    Combina as execuções das subconsultas em um único resultado para o processador
+
+    Args:
+        sub_results: Dicionários com question, generated_query e execution (retorno do executor)
+        rows_per_sub_query: Linhas de cada subconsulta incluídas no resultado combinado
+
+    Returns:
+        Dicionário no formato do executor, com uma linha por registro de cada
+        subconsulta precedida da coluna "Pergunta"
+    """
+    rows: List[Dict[str, Any]] = []
+    errors = []
+    for sub_result in sub_results:
+        execution = sub_result.get("execution") or {}
+        question = sub_result["question"]
+        if execution.get("error"):
+            errors.append(f"{question}: {execution['error']}")
+            rows.append({"Pergunta": question, "Erro": execution["error"]})
+            continue
+        data = execution.get("result")
+        if isinstance(data, ResultStore):
+            data = data[:rows_per_sub_query]
+        if isinstance(data, list) and data:
+            for row in data[:rows_per_sub_query]:
+                rows.append({"Pergunta": question, **row} if isinstance(row, dict)
+                            else {"Pergunta": question, "Valor": row})
+        elif data:
+            rows.append({"Pergunta": question, "Valor": data})
+        else:
+            rows.append({"Pergunta": question, "Registros": 0})
+    times = [(sub_result.get("execution") or {}).get("execution_time") or 0 for sub_result in sub_results]
+    return {
+        "query_type": "sql",
+        "query_data": [sub_result.get("generated_query") for sub_result in sub_results],
+        "result": rows,
+        # Todas falharam: erro da execução; falhas parciais aparecem nas linhas
+        "error": "; ".join(errors) if errors and len(errors) == len(sub_results) else None,
+        "execution_time": max(times) if times else None,
+        "sub_queries": len(sub_results)
+    }
+
+
+class QueryPlanner:
+    """Divide perguntas compostas e executa as subconsultas em paralelo"""
+
+    def __init__(self, config: Dict[str, Any] = None):
+        """
+        Args:
+            config: Configuração (padrão: PLANNER_CONFIG)
+        """
+        self.config = config or PLANNER_CONFIG
+        self._pool = ThreadPoolExecutor(max_workers=self.config.get("workers", 8),
+                                        thread_name_prefix="sub-query")
+
+    def plan(self, question: str, intent_data: Dict[str, Any]) -> Optional[List[str]]:
+        """
+        Subperguntas independentes de uma pergunta composta
+
+        Usa as `sub_queries` da intenção quando o analisador as informou;
+        senão, tenta a divisão local das contagens coordenadas.
+
+        Returns:
+            Lista com duas ou mais subperguntas, ou None quando a pergunta é simples
+        """
+        limit = self.config.get("max_sub_queries", 8)
+        sub_queries = intent_data.get("sub_queries") if isinstance(intent_data, dict) else None
+        if isinstance(sub_queries, list):
+            sub_queries = [str(item).strip() for item in sub_queries if str(item or "").strip()]
+            if 1 < len(sub_queries) <= limit:
+                logger.info("Pergunta composta dividida pelo analisador: %s", sub_queries)
+                return sub_queries
+        sub_queries = split_question(question, limit)
+        if sub_queries:
+            logger.info("Pergunta composta dividida localmente: %s", sub_queries)
+        return sub_queries
+
+    def run(self, tasks: Sequence[Any], func: Callable[[Any], Any]) -> List[Any]:
+        """Executa `func` para cada tarefa em paralelo, preservando a ordem dos resultados"""
+        if len(tasks) == 1:
+            return [func(tasks[0])]
+        return list(self._pool.map(func, tasks))
+
+    def combine(self, sub_results: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+        return combine_results(sub_results, self.config.get("rows_per_sub_query", 20))
@@ -6,9 +6,13 @@ import json
 import logging
 from typing import Dict, Any, List, Union
 
-from google import genai
-from google.genai import types
-from config import NLP_CONFIG, GEMINI_CONFIG
+from llm_client import LLMClient
+from log_pipeline import log_payload
+from llm_scheduler import PRIORITY_INTERACTIVE
+from model_router import estimate_complexity
+from deadline import DependencyUnavailable
+from result_serializer import encode_value
+from result_store import ResultStore
 
 logger = logging.getLogger("result_processor")
 
@@ -16,29 +20,35 @@ class ResultProcessor:
     def __init__(self, agent_config: Dict[str, Any]):
         self.model_name = agent_config["model_name"]
         self.language = agent_config.get("language", "pt-BR")
+        self.llm_client = LLMClient()
     
     def process_result(self, query: str, result: Union[List[Dict[str, Any]], Dict[str, Any]], 
-                      sql_query: str = None) -> str:
+                      sql_query: str = None, priority: int = PRIORITY_INTERACTIVE, timeout: float = None) -> str:
         if not result:
             return "Não foram encontrados resultados para sua consulta."
         
         # Verificar qual modelo usar
-        return self._process_with_gemini(query, result, sql_query)
+        return self._process_with_gemini(query, result, sql_query, priority, timeout)
     
     def _process_with_gemini(self, query: str, result: Union[List[Dict[str, Any]], Dict[str, Any]], 
-                           sql_query: str = None) -> str:
+                           sql_query: str = None, priority: int = PRIORITY_INTERACTIVE,
+                           timeout: float = None) -> str:
         system_message = (
             "Você é um assistente especializado em explicar resultados de consultas de banco de dados. "
             "Sua tarefa é responder a pergunta do usuário com base nos resultados fornecidos. "
             "Seja conciso e direto, focando apenas nas informações relevantes para a pergunta."
         )
         
+        # Apenas a amostra usada no resumo vai ao prompt (resultados grandes ficam em disco)
+        if isinstance(result, dict) and isinstance(result.get("result"), (list, ResultStore)):
+            result = dict(result, result=result["result"][:20], row_count=len(result["result"]))
+
         # Formatar o resultado como JSON para o modelo
-        if isinstance(result, list):
-            formatted_result = json.dumps(result[:20], ensure_ascii=False, indent=2)  # Limitamos a 20 registros
+        if isinstance(result, (list, ResultStore)):
+            formatted_result = json.dumps(result[:20], ensure_ascii=False, indent=2, default=encode_value)  # Limitamos a 20 registros
             result_count = len(result)
         else:
-            formatted_result = json.dumps(result, ensure_ascii=False, indent=2)
+            formatted_result = json.dumps(result, ensure_ascii=False, indent=2, default=encode_value)
             result_count = 1
         
         sql_context = f"\nConsulta SQL executada: {sql_query}" if sql_query else ""
@@ -51,42 +61,18 @@ class ResultProcessor:
             f"Resuma os dados de forma útil e relevante para a pergunta."
         )
         
+        complexity = estimate_complexity(query, sql=sql_query, result_count=result_count)
+
         try:
-            client = genai.Client(
-                api_key="",
-            )
-            
-            content = [
-                types.Content(
-                    role="user",
-                    parts=[types.Part.from_text(text=user_content)]
-                )
-            ]
-            
-            generate_config = types.GenerateContentConfig(
-                temperature=NLP_CONFIG["temperature"],
-                top_p=NLP_CONFIG["top_p"],
-                top_k=NLP_CONFIG["top_k"],
-                max_output_tokens=NLP_CONFIG["max_tokens"],
-                response_mime_type=GEMINI_CONFIG["response_mime_type"],
-                system_instruction=[
-                    types.Part.from_text(text=system_message)
-                ]
-            )
-            
-            response_text = ""
-            for chunk in client.models.generate_content_stream(
-                model="gemini-2.0-flash",
-                contents=content,
-                config=generate_config,
-            ):
-                if chunk.text:
-                    response_text += chunk.text
+            response_text = self.llm_client.generate("answer", system_message, user_content, priority=priority,
+                                                     complexity=complexity["level"], timeout=timeout)
             
             answer = response_text.strip()
-            print(f"Resposta gerada para os resultados: {answer[:100]}...")
+            log_payload(logger, "Resposta gerada para os resultados", answer)
             return answer
             
+        except DependencyUnavailable:
+            raise
         except Exception as e:
-            logger.error(f"Erro ao processar resultado com Gemini: {str(e)}")
+            logger.error("Erro ao processar resultado com Gemini: %s", e)
             return None
\ No newline at end of file
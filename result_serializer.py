@@ -0,0 +1,342 @@
+"""
+Serialização de resultados com plano de codificação por coluna e formatos compactos
+"""
+
+import base64
+import datetime
+import decimal
+import json
+import logging
+import struct
+import sys
+import uuid
+from array import array
+from typing import Dict, Any, Callable, Iterable, List, Optional, Sequence, Tuple
+
+from config import SERIALIZATION_CONFIG
+
+logger = logging.getLogger("result_serializer")
+
+BINARY_MAGIC = b"AGCB"
+BINARY_VERSION = 1
+_HEADER = struct.Struct("<4sBI")
+_BLOCK = struct.Struct("<I")
+
+
+def encode_value(value: Any) -> Any:
+    """Codificador genérico, usado apenas quando o tipo da coluna é desconhecido"""
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return base64.b64encode(bytes(value)).decode("ascii")
+    if isinstance(value, Sequence):
+        # Ex.: ResultStore, materializado apenas quando o resultado completo é exportado
+        return list(value)
+    return str(value)
+
+
+def _encoder_for_type(type_code: Any, decimal_as: str) -> Optional[Callable[[Any], Any]]:
+    """
+    Escolhe o codificador de uma coluna a partir do tipo informado pelo driver
+
+    Returns:
+        Função de conversão, ou None quando o valor já é compatível com JSON
+    """
+    if not isinstance(type_code, type):
+        return encode_value
+    if issubclass(type_code, (str, bool, int, float)):
+        return None
+    if issubclass(type_code, (datetime.datetime, datetime.date, datetime.time)):
+        return type_code.isoformat
+    if issubclass(type_code, decimal.Decimal):
+        return str if decimal_as == "str" else float
+    if issubclass(type_code, (bytes, bytearray, memoryview)):
+        return lambda value: base64.b64encode(bytes(value)).decode("ascii")
+    if issubclass(type_code, uuid.UUID):
+        return str
+    return encode_value
+
+
+class EncoderPlan:
+    """
+    Plano de codificação compilado uma única vez por resultado.
+
+    A partir dos tipos das colunas, gera funções especializadas que convertem
+    uma linha inteira de uma vez, sem despachar por tipo a cada valor.
+    """
+
+    def __init__(self, columns: Sequence[str], type_codes: Sequence[Any], config: Dict[str, Any] = None):
+        self.config = config or SERIALIZATION_CONFIG
+        self.columns = list(columns)
+        self.type_codes = list(type_codes)
+        decimal_as = self.config.get("decimal_as", "float")
+        self.encoders = [_encoder_for_type(type_code, decimal_as) for type_code in self.type_codes]
+        self.encode_row = self._compile_row_encoder()
+        self.encode_record = self._compile_record_encoder()
+
+    @classmethod
+    def from_description(cls, description: Sequence[Sequence[Any]], config: Dict[str, Any] = None) -> "EncoderPlan":
+        """Cria o plano a partir de `cursor.description` (nome, tipo, ...)"""
+        return cls([column[0] for column in description],
+                   [column[1] if len(column) > 1 else None for column in description],
+                   config)
+
+    @classmethod
+    def from_records(cls, records: List[Dict[str, Any]], config: Dict[str, Any] = None) -> "EncoderPlan":
+        """Cria o plano inferindo os tipos pelo primeiro valor não nulo de cada coluna"""
+        columns: List[str] = []
+        for record in records:
+            for key in record:
+                if key not in columns:
+                    columns.append(key)
+        type_codes = []
+        for column in columns:
+            type_code = None
+            for record in records:
+                value = record.get(column)
+                if value is not None:
+                    type_code = type(value)
+                    break
+            type_codes.append(type_code if type_code is not None else str)
+        return cls(columns, type_codes, config)
+
+    def _value_expr(self, index: int) -> str:
+        if self.encoders[index] is None:
+            return f"r[{index}]"
+        return f"(None if r[{index}] is None else e{index}(r[{index}]))"
+
+    def _compile(self, body: str) -> Callable:
+        namespace = {f"e{index}": encoder for index, encoder in enumerate(self.encoders) if encoder}
+        namespace.update({f"k{index}": column for index, column in enumerate(self.columns)})
+        return eval(compile(f"lambda r: {body}", "<encoder_plan>", "eval"), namespace)
+
+    def _compile_row_encoder(self) -> Callable[[Sequence[Any]], tuple]:
+        if all(encoder is None for encoder in self.encoders):
+            return tuple
+        values = ", ".join(self._value_expr(index) for index in range(len(self.columns)))
+        return self._compile(f"({values},)" if self.columns else "()")
+
+    def _compile_record_encoder(self) -> Callable[[Sequence[Any]], Dict[str, Any]]:
+        items = ", ".join(f"k{index}: {self._value_expr(index)}" for index in range(len(self.columns)))
+        return self._compile(f"{{{items}}}")
+
+    def encode_rows(self, rows: Iterable[Sequence[Any]]) -> List[tuple]:
+        """Converte as linhas em tuplas com valores compatíveis com JSON"""
+        return list(map(self.encode_row, rows))
+
+    def to_records(self, rows: Iterable[Sequence[Any]]) -> List[Dict[str, Any]]:
+        """Converte as linhas em dicionários com valores compatíveis com JSON"""
+        return list(map(self.encode_record, rows))
+
+    def rows_from_records(self, records: Iterable[Dict[str, Any]]) -> List[tuple]:
+        """Converte dicionários (já codificados ou não) para tuplas codificadas na ordem do plano"""
+        columns = self.columns
+        return [self.encode_row([record.get(column) for column in columns]) for record in records]
+
+
+def to_ndjson(plan: EncoderPlan, rows: Iterable[Sequence[Any]]) -> str:
+    """Um objeto JSON compacto por linha (NDJSON)"""
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+    return "".join(dumps(plan.encode_record(row)) + "\n" for row in rows)
+
+
+def to_columnar_json(plan: EncoderPlan, rows: Iterable[Sequence[Any]]) -> str:
+    """JSON orientado a colunas: os nomes aparecem uma única vez"""
+    encoded = plan.encode_rows(rows)
+    data = {
+        "columns": plan.columns,
+        "rows": len(encoded),
+        "data": [list(values) for values in zip(*encoded)] if encoded else [[] for _ in plan.columns]
+    }
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def _null_bitmap(values: List[Any]) -> bytes:
+    bitmap = bytearray((len(values) + 7) // 8)
+    for index, value in enumerate(values):
+        if value is None:
+            bitmap[index >> 3] |= 1 << (index & 7)
+    return bytes(bitmap)
+
+
+def _read_bitmap(bitmap: bytes, count: int) -> List[bool]:
+    return [bool(bitmap[index >> 3] & (1 << (index & 7))) for index in range(count)]
+
+
+def _pack_array(typecode: str, values: Iterable[Any]) -> bytes:
+    packed = array(typecode, values)
+    if sys.byteorder != "little":
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def _unpack_array(typecode: str, data: bytes) -> array:
+    unpacked = array(typecode)
+    unpacked.frombytes(data)
+    if sys.byteorder != "little":
+        unpacked.byteswap()
+    return unpacked
+
+
+def _index_typecode(size: int) -> str:
+    return "B" if size <= 0xFF else "H" if size <= 0xFFFF else "I"
+
+
+def _column_kind(values: List[Any]) -> str:
+    kinds = {type(value) for value in values if value is not None}
+    if kinds <= {bool}:
+        return "bool"
+    if kinds <= {int}:
+        return "int64"
+    if kinds <= {int, float}:
+        return "float64"
+    if kinds <= {str}:
+        return "utf8"
+    return "json"
+
+
+def _encode_column(values: List[Any], config: Dict[str, Any]) -> Tuple[Dict[str, Any], bytes]:
+    count = len(values)
+    distinct: Dict[Any, int] = {}
+    max_cardinality = config.get("dictionary_max_cardinality", 1024)
+    for value in values:
+        key = (type(value), value)
+        if key not in distinct:
+            distinct[key] = len(distinct)
+            if len(distinct) > max_cardinality:
+                break
+
+    if count and len(distinct) <= max_cardinality and len(distinct) <= count * config.get("dictionary_max_ratio", 0.5):
+        dictionary = [value for _, value in distinct]
+        dictionary_bytes = json.dumps(dictionary, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        typecode = _index_typecode(len(dictionary))
+        indices = _pack_array(typecode, (distinct[(type(value), value)] for value in values))
+        meta = {"encoding": "dict", "index_type": typecode, "dict_size": len(dictionary)}
+        return meta, _BLOCK.pack(len(dictionary_bytes)) + dictionary_bytes + indices
+
+    kind = _column_kind(values)
+    bitmap = _null_bitmap(values)
+    if kind in ("int64", "bool"):
+        payload = _pack_array("q", (int(value) if value is not None else 0 for value in values))
+    elif kind == "float64":
+        payload = _pack_array("d", (float(value) if value is not None else 0.0 for value in values))
+    else:
+        if kind == "json":
+            texts = [json.dumps(value, ensure_ascii=False) if value is not None else "" for value in values]
+        else:
+            texts = [value if value is not None else "" for value in values]
+        blobs = [text.encode("utf-8") for text in texts]
+        offsets = [0]
+        for blob in blobs:
+            offsets.append(offsets[-1] + len(blob))
+        payload = _pack_array("I", offsets) + b"".join(blobs)
+    return {"encoding": kind}, bitmap + payload
+
+
+def to_binary_columnar(plan: EncoderPlan, rows: Iterable[Sequence[Any]], config: Dict[str, Any] = None) -> bytes:
+    """
+    Formato binário colunar
+
+    Colunas de baixa cardinalidade (ex.: Status) usam codificação por
+    dicionário; as demais usam vetores de inteiros/reais ou textos com offsets,
+    sempre acompanhados de um bitmap de nulos.
+    """
+    config = config or plan.config
+    encoded = plan.encode_rows(rows)
+    columns = [list(values) for values in zip(*encoded)] if encoded else [[] for _ in plan.columns]
+
+    metas = []
+    blocks = []
+    for name, values in zip(plan.columns, columns):
+        meta, block = _encode_column(values, config)
+        meta["name"] = name
+        metas.append(meta)
+        blocks.append(_BLOCK.pack(len(block)) + block)
+
+    header = json.dumps({"rows": len(encoded), "columns": metas}, ensure_ascii=False,
+                        separators=(",", ":")).encode("utf-8")
+    return _HEADER.pack(BINARY_MAGIC, BINARY_VERSION, len(header)) + header + b"".join(blocks)
+
+
+def read_binary_columnar(data: bytes) -> Dict[str, Any]:
+    """
+    Lê o formato binário colunar
+
+    Returns:
+        Dicionário com columns (nomes), rows (quantidade) e data (lista de valores por coluna)
+    """
+    magic, version, header_len = _HEADER.unpack_from(data, 0)
+    if magic != BINARY_MAGIC or version != BINARY_VERSION:
+        raise ValueError("Formato binário colunar inválido ou versão não suportada")
+    offset = _HEADER.size
+    header = json.loads(data[offset:offset + header_len].decode("utf-8"))
+    offset += header_len
+    count = header["rows"]
+    bitmap_len = (count + 7) // 8
+
+    result_columns = []
+    for meta in header["columns"]:
+        (block_len,) = _BLOCK.unpack_from(data, offset)
+        offset += _BLOCK.size
+        block = data[offset:offset + block_len]
+        offset += block_len
+
+        encoding = meta["encoding"]
+        if encoding == "dict":
+            (dict_len,) = _BLOCK.unpack_from(block, 0)
+            dictionary = json.loads(block[_BLOCK.size:_BLOCK.size + dict_len].decode("utf-8"))
+            indices = _unpack_array(meta["index_type"], block[_BLOCK.size + dict_len:])
+            values = [dictionary[index] for index in indices]
+        else:
+            nulls = _read_bitmap(block[:bitmap_len], count)
+            payload = block[bitmap_len:]
+            if encoding in ("int64", "bool"):
+                raw = _unpack_array("q", payload)
+                values = [bool(value) if encoding == "bool" else value for value in raw]
+            elif encoding == "float64":
+                values = list(_unpack_array("d", payload))
+            else:
+                offsets_len = (count + 1) * array("I").itemsize
+                offsets = _unpack_array("I", payload[:offsets_len])
+                blob = payload[offsets_len:]
+                values = [blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(count)]
+                if encoding == "json":
+                    values = [json.loads(value) if value else None for value in values]
+            values = [None if is_null else value for value, is_null in zip(values, nulls)]
+        result_columns.append(values)
+
+    return {
+        "columns": [meta["name"] for meta in header["columns"]],
+        "rows": count,
+        "data": result_columns
+    }
+
+
+def serialize_records(records: List[Dict[str, Any]], fmt: str = "json", plan: EncoderPlan = None) -> Any:
+    """
+    Serializa uma lista de registros (formato retornado pelo executor)
+
+    Args:
+        records: Lista de dicionários
+        fmt: json, ndjson, columnar ou binary
+        plan: Plano de codificação já compilado (opcional)
+
+    Returns:
+        Texto (json, ndjson, columnar) ou bytes (binary)
+    """
+    plan = plan or EncoderPlan.from_records(records)
+    rows = plan.rows_from_records(records)
+    identity = EncoderPlan(plan.columns, [str] * len(plan.columns), plan.config)
+    if fmt == "json":
+        return json.dumps(identity.to_records(rows), ensure_ascii=False, separators=(",", ":"))
+    if fmt == "ndjson":
+        return to_ndjson(identity, rows)
+    if fmt == "columnar":
+        return to_columnar_json(identity, rows)
+    if fmt == "binary":
+        return to_binary_columnar(identity, rows)
+    raise ValueError(f"Formato de serialização não suportado: {fmt}")
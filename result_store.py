@@ -0,0 +1,210 @@
+"""
+Armazenamento de resultados com buffer limitado em memória e transbordo para disco via mmap
+"""
+
+import json
+import logging
+import mmap
+import struct
+import tempfile
+import threading
+import weakref
+from bisect import bisect_right
+from collections.abc import Sequence
+from typing import Dict, Any, List, Optional, Union
+
+from config import RESULT_STORE_CONFIG
+
+logger = logging.getLogger("result_store")
+
+_OFFSET = struct.Struct("<Q")
+
+
+class _Segment:
+    """Bloco de linhas gravado no arquivo: por coluna, tabela de offsets seguida dos valores"""
+
+    __slots__ = ("start_row", "count", "columns")
+
+    def __init__(self, start_row: int, count: int, columns: List[tuple]):
+        self.start_row = start_row
+        self.count = count
+        # (posição da tabela de offsets, posição dos dados) de cada coluna
+        self.columns = columns
+
+
+def _close_file(handle) -> None:
+    try:
+        handle.close()
+    except Exception:
+        pass
+
+
+class ResultStore(Sequence):
+    """
+    Sequência de registros que mantém em memória apenas as primeiras linhas.
+
+    As linhas excedentes são agrupadas em blocos colunares e gravadas em um
+    arquivo temporário; a leitura é feita por mmap, com acesso aleatório por
+    índice ou fatia (paginação, amostras para resumo). O arquivo é removido em
+    `close()` ou automaticamente quando o objeto é liberado.
+    """
+
+    def __init__(self, columns: List[str], config: Dict[str, Any] = None):
+        self.config = config or RESULT_STORE_CONFIG
+        self.columns = list(columns)
+        self.memory_rows = self.config.get("memory_rows", 2000)
+        self.spill_batch = self.config.get("spill_batch", 1000)
+        self._head: List[tuple] = []
+        self._pending: List[tuple] = []
+        self._segments: List[_Segment] = []
+        self._segment_starts: List[int] = []
+        self._spilled_rows = 0
+        self._file = None
+        self._mmap: Optional[mmap.mmap] = None
+        self._mapped_size = 0
+        self._lock = threading.RLock()
+        self._finalizer = None
+        # Leitura cortada no limite de linhas do executor
+        self.truncated = False
+
+    # Escrita
+
+    def append_rows(self, rows: List[tuple]) -> None:
+        """Acrescenta linhas já codificadas, na ordem das colunas"""
+        with self._lock:
+            free = self.memory_rows - len(self._head)
+            if free > 0 and not self._segments and not self._pending:
+                self._head.extend(rows[:free])
+                rows = rows[free:]
+            for row in rows:
+                self._pending.append(row)
+                if len(self._pending) >= self.spill_batch:
+                    self._flush()
+
+    def _open_file(self) -> None:
+        # TemporaryFile é removido pelo sistema ao ser fechado (ou imediatamente, em POSIX)
+        self._file = tempfile.TemporaryFile(prefix="agent_result_", dir=self.config.get("spill_dir"))
+        self._finalizer = weakref.finalize(self, _close_file, self._file)
+        logger.info(f"Resultado excedeu {self.memory_rows} linhas em memória; gravando excedente em disco")
+
+    def _flush(self) -> None:
+        if not self._pending:
+            return
+        if self._file is None:
+            self._open_file()
+        rows, self._pending = self._pending, []
+        handle = self._file
+        handle.seek(0, 2)
+        position = handle.tell()
+        columns = []
+        for index in range(len(self.columns)):
+            encoded = [json.dumps(row[index], ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+                       for row in rows]
+            offsets = bytearray(_OFFSET.size * (len(encoded) + 1))
+            total = 0
+            for cell, value in enumerate(encoded):
+                _OFFSET.pack_into(offsets, cell * _OFFSET.size, total)
+                total += len(value)
+            _OFFSET.pack_into(offsets, len(encoded) * _OFFSET.size, total)
+            handle.write(offsets)
+            handle.write(b"".join(encoded))
+            columns.append((position, position + len(offsets)))
+            position += len(offsets) + total
+        self._segments.append(_Segment(self._spilled_rows, len(rows), columns))
+        self._segment_starts.append(self._spilled_rows)
+        self._spilled_rows += len(rows)
+
+    # Leitura
+
+    @property
+    def spilled(self) -> bool:
+        return self._file is not None
+
+    def __len__(self) -> int:
+        return len(self._head) + self._spilled_rows + len(self._pending)
+
+    def _view(self) -> mmap.mmap:
+        self._file.flush()
+        self._file.seek(0, 2)
+        size = self._file.tell()
+        if self._mmap is None or self._mapped_size != size:
+            if self._mmap is not None:
+                self._mmap.close()
+            self._mmap = mmap.mmap(self._file.fileno(), size, access=mmap.ACCESS_READ)
+            self._mapped_size = size
+        return self._mmap
+
+    def _read_cell(self, view: mmap.mmap, offsets_at: int, data_at: int, cell: int) -> Any:
+        start = _OFFSET.unpack_from(view, offsets_at + cell * _OFFSET.size)[0]
+        end = _OFFSET.unpack_from(view, offsets_at + (cell + 1) * _OFFSET.size)[0]
+        return json.loads(view[data_at + start:data_at + end])
+
+    def _spilled_row(self, view: mmap.mmap, index: int) -> tuple:
+        segment = self._segments[bisect_right(self._segment_starts, index) - 1]
+        cell = index - segment.start_row
+        return tuple(self._read_cell(view, offsets_at, data_at, cell) for offsets_at, data_at in segment.columns)
+
+    def rows(self, start: int = 0, stop: int = None) -> List[tuple]:
+        """Linhas codificadas (tuplas) no intervalo [start, stop)"""
+        with self._lock:
+            start, stop, _ = slice(start, stop).indices(len(self))
+            head_len = len(self._head)
+            result = self._head[start:min(stop, head_len)]
+            first = max(start, head_len) - head_len
+            last = stop - head_len
+            if last > first and self._spilled_rows:
+                view = self._view()
+                for index in range(first, min(last, self._spilled_rows)):
+                    result.append(self._spilled_row(view, index))
+            if last > self._spilled_rows:
+                result.extend(self._pending[max(first - self._spilled_rows, 0):last - self._spilled_rows])
+            return result
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[Dict[str, Any], List[Dict[str, Any]]]:
+        columns = self.columns
+        if isinstance(index, slice):
+            if index.step not in (None, 1):
+                return [self[i] for i in range(*index.indices(len(self)))]
+            return [dict(zip(columns, row)) for row in self.rows(index.start or 0, index.stop)]
+        length = len(self)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("Índice fora do resultado")
+        return dict(zip(columns, self.rows(index, index + 1)[0]))
+
+    def __iter__(self):
+        for start in range(0, len(self), self.spill_batch):
+            yield from self[start:start + self.spill_batch]
+
+    def page(self, number: int, size: int) -> List[Dict[str, Any]]:
+        """Página de registros (começando em 1)"""
+        start = (number - 1) * size
+        return self[start:start + size]
+
+    def to_result(self) -> Union[List[Dict[str, Any]], "ResultStore"]:
+        """Lista simples quando tudo coube em memória; caso contrário (ou truncado), o próprio armazenamento"""
+        if self.spilled or self.truncated:
+            return self
+        return self[:]
+
+    def close(self) -> None:
+        """Libera o mmap e remove o arquivo temporário"""
+        with self._lock:
+            if self._mmap is not None:
+                self._mmap.close()
+                self._mmap = None
+            if self._finalizer is not None:
+                self._finalizer()
+            self._file = None
+            self._segments, self._segment_starts = [], []
+            self._head, self._pending, self._spilled_rows = [], [], 0
+
+    def __enter__(self) -> "ResultStore":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __repr__(self) -> str:
+        return f"ResultStore(rows={len(self)}, spilled={self.spilled})"
@@ -0,0 +1,376 @@
+"""
+Contexto de conversa por sessão e refinamento local de SQL para perguntas de acompanhamento
+"""
+
+import logging
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+from config import SESSION_CONFIG
+
+logger = logging.getLogger("session_context")
+
+# Palavras que não mudam o sentido de uma pergunta de acompanhamento
+_FILLER = {
+    "e", "agora", "so", "apenas", "somente", "mas", "entao", "os", "as", "o", "a", "por", "pelo", "pela",
+    "de", "do", "da", "dos", "das", "no", "na", "nos", "nas", "em", "com", "que", "me", "mostre", "mostrar",
+    "liste", "listar", "traga", "quero", "ver", "cadastros", "registros", "resultados", "eles", "elas",
+    "deles", "mesmo", "mesma", "tambem", "isso", "considerando", "filtre", "filtrar", "primeiro", "agr"
+}
+_FOLLOW_UP_MARKERS = ("e ", "agora ", "so ", "apenas ", "somente ", "mas ", "entao ", "e se ", "eles ", "elas ",
+                      "esses ", "essas ", "estes ", "estas ", "desses ", "dessas ", "destes ", "destas ",
+                      "deles ", "delas ", "isso ", "disso ")
+# Pronomes que retomam o resultado anterior em qualquer posição ("quantos deles são do gmail?")
+_ANAPHORA = re.compile(r"\b(?:deles|delas|desses|dessas|destes|destas|nesses|nessas|neles|nelas)\b")
+
+_STATUS = re.compile(r"\b(in)?ativ[oa]s?\b")
+_DATE_N = re.compile(r"\bultim[oa]s\s+(\d+)\s+(dias?|semanas?|mes|meses|anos?)\b")
+_DATE_ONE = re.compile(r"\bultim[oa]\s+(semana|mes|ano)\b")
+_TODAY = re.compile(r"\bhoje\b")
+_YESTERDAY = re.compile(r"\bontem\b")
+_ORDER = re.compile(r"\b(?:orden\w*|classifi\w*)\s+(?:por|pelo|pela)\s+")
+_DIRECTION = re.compile(r"\s*(?:em ordem\s+)?(crescente|decrescente|asc|desc|do maior para o menor|"
+                        r"do menor para o maior)\b")
+_RECENT = re.compile(r"\b(?:(?:os|as)\s+)?mais\s+(recentes?|antig[oa]s?|nov[oa]s?|velh[oa]s?)(?:\s+primeiro)?\b")
+_TOP = [
+    re.compile(r"\b(?:top|limite(?:\s+de)?|primeir[oa]s)\s+(\d+)\b"),
+    re.compile(r"\b(\d+)\s+primeir[oa]s\b"),
+    re.compile(r"\b(?:apenas|so|somente)\s+(?:os\s+|as\s+)?(\d+)\b")
+]
+_UNITS = (("dia", "day"), ("semana", "week"), ("mes", "month"), ("ano", "year"))
+
+_COLUMN_ALIASES = {
+    "nome": "Nome", "email": "Email", "e-mail": "Email", "celular": "Celular", "documento": "Documento",
+    "data": "DataInclusao", "data de inclusao": "DataInclusao", "data de cadastro": "DataInclusao",
+    "data de alteracao": "DataAlteracao", "data de nascimento": "DataNascimento", "id": "CadastroId",
+    "codigo": "CadastroId"
+}
+
+_SQL_STATUS = re.compile(r"\b((?:\w+\.)?\[?Ativo\]?\s*=\s*)[01]\b", re.IGNORECASE)
+_SQL_STATUS_TEXT = re.compile(r"\b((?:\w+\.)?\[?Status\]?\s*=\s*N?)'(?:Ativo|Inativo)'", re.IGNORECASE)
+# Argumentos de função com um nível de parênteses aninhados, ex.: DATEADD(month, -1, GETDATE())
+_ARGS = r"\((?:[^()]|\([^()]*\))*\)"
+# Início de um dia: CAST(GETDATE() AS date), opcionalmente deslocado, como gerado pelo sql_rewriter
+_CAST_DAY = rf"CAST\s*\(\s*(?:GETDATE\s*\(\s*\)|DATEADD\s*{_ARGS})\s+AS\s+date\s*\)"
+_DAY = rf"(?:{_CAST_DAY}|DATEADD\s*\(\s*day\s*,\s*[-+]?\d+\s*,\s*{_CAST_DAY}\s*\))"
+_SQL_DATE = re.compile(
+    rf"(?:\w+\.)?\[?DataInclusao\]?\s*>=\s*{_DAY}\s+AND\s+(?:\w+\.)?\[?DataInclusao\]?\s*<\s*{_DAY}"
+    rf"|(?:\w+\.)?\[?DataInclusao\]?\s*>=\s*{_DAY}"
+    rf"|(?:\w+\.)?\[?DataInclusao\]?\s+BETWEEN\s+DATEADD\s*{_ARGS}\s+AND\s+GETDATE\s*\(\s*\)"
+    rf"|(?:\w+\.)?\[?DataInclusao\]?\s*>=?\s*DATEADD\s*{_ARGS}"
+    rf"|CONVERT\s*\(\s*date\s*,\s*(?:\w+\.)?\[?DataInclusao\]?\s*\)\s*=\s*"
+    rf"CONVERT\s*\(\s*date\s*,\s*(?:DATEADD\s*{_ARGS}|GETDATE\s*\(\s*\))\s*\)",
+    re.IGNORECASE
+)
+_SQL_TOP = re.compile(r"^(\s*SELECT\s+(?:DISTINCT\s+)?)TOP\s*(?:\(\s*\d+\s*\)|\d+)\s*", re.IGNORECASE)
+_SQL_SELECT_HEAD = re.compile(r"^(\s*SELECT\s+(?:DISTINCT\s+)?)", re.IGNORECASE)
+_SQL_WHERE = re.compile(r"\bWHERE\b", re.IGNORECASE)
+_SQL_TAIL = re.compile(r"\b(?:GROUP\s+BY|HAVING|ORDER\s+BY|OPTION)\b|;", re.IGNORECASE)
+_SQL_ORDER = re.compile(r"\s*\bORDER\s+BY\b.*?(?=\bOPTION\b|;|$)", re.IGNORECASE | re.DOTALL)
+_SQL_OPTION = re.compile(r"\bOPTION\b|;", re.IGNORECASE)
+_SQL_AGGREGATE = re.compile(r"\b(?:COUNT|COUNT_BIG|SUM|AVG|MIN|MAX)\s*\(", re.IGNORECASE)
+_SQL_GROUP_BY = re.compile(r"\bGROUP\s+BY\b", re.IGNORECASE)
+_SQL_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_SQL_MASKED = re.compile(r"'\x00(\d+)\x00'")
+# Rótulos de status ficam visíveis para a edição de Status = 'Ativo'/'Inativo'
+_SQL_STATUS_LABEL = re.compile(r"'(?:Ativo|Inativo)'", re.IGNORECASE)
+
+
+def _strip_accents(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text)
+    return "".join(char for char in text if not unicodedata.combining(char))
+
+
+def _normalize(question: str) -> str:
+    text = _strip_accents(question or "").lower()
+    text = re.sub(r"[?!.,;:]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def is_follow_up(question: str) -> bool:
+    """
+    Heurística: a pergunta parece depender da anterior (ex.: "e só os inativos?")
+
+    Exige uma marca de continuação no início ("e", "só", "apenas", "agora", um
+    pronome) ou um pronome que retome o resultado anterior; perguntas curtas sem
+    essas marcas ("Quantos ativos hoje?") são tratadas como novas.
+    """
+    text = _normalize(question) + " "
+    return text.startswith(_FOLLOW_UP_MARKERS) or bool(_ANAPHORA.search(text))
+
+
+def _resolve_column(text: str, position: int, columns: List[str]) -> Optional[Tuple[str, int]]:
+    """Coluna citada a partir de `position`, com a posição onde o nome termina"""
+    by_name = {column.lower(): column for column in columns}
+    aliases = dict(_COLUMN_ALIASES)
+    aliases.update(by_name)
+    for alias in sorted(aliases, key=len, reverse=True):
+        end = position + len(alias)
+        if text.startswith(alias, position) and (end == len(text) or not text[end].isalnum()):
+            column = aliases[alias]
+            if not columns or column.lower() in by_name:
+                return column, end
+    return None
+
+
+def _unit(word: str) -> str:
+    for prefix, unit in _UNITS:
+        if word.startswith(prefix):
+            return unit
+    raise ValueError(f"Unidade de tempo desconhecida: {word}")
+
+
+def derive_edits(question: str, columns: List[str] = None) -> Optional[List[Tuple]]:
+    """
+    Traduz uma pergunta de acompanhamento em edições estruturais do SQL anterior
+
+    Returns:
+        Lista de edições, ou None quando a pergunta contém algo que não pode ser
+        resolvido localmente (e deve ir ao LLM)
+    """
+    columns = columns or []
+    text = _normalize(question)
+    edits: List[Tuple] = []
+
+    def consume(match: re.Match) -> None:
+        nonlocal text
+        text = text[:match.start()] + " " + text[match.end():]
+
+    match = _ORDER.search(text)
+    if match:
+        resolved = _resolve_column(text, match.end(), columns)
+        if resolved is None:
+            return None
+        column, end = resolved
+        direction = _DIRECTION.match(text, end)
+        descending = bool(direction) and direction.group(1) in ("decrescente", "desc", "do maior para o menor")
+        edits.append(("order", column, "DESC" if descending else "ASC"))
+        text = text[:match.start()] + " " + text[direction.end() if direction else end:]
+    else:
+        match = _RECENT.search(text)
+        if match:
+            descending = match.group(1).startswith(("recente", "nov"))
+            edits.append(("order", "DataInclusao", "DESC" if descending else "ASC"))
+            consume(match)
+
+    for pattern, builder in (
+        (_DATE_N, lambda m: (_unit(m.group(2)), int(m.group(1)))),
+        (_DATE_ONE, lambda m: (_unit(m.group(1)), 1)),
+        (_TODAY, lambda m: ("today", 0)),
+        (_YESTERDAY, lambda m: ("yesterday", 0)),
+    ):
+        match = pattern.search(text)
+        if match:
+            unit, amount = builder(match)
+            edits.append(("date", unit, amount))
+            consume(match)
+            break
+
+    for pattern in _TOP:
+        match = pattern.search(text)
+        if match:
+            edits.append(("top", int(match.group(1))))
+            consume(match)
+            break
+
+    match = _STATUS.search(text)
+    if match:
+        edits.append(("status", 0 if match.group(1) else 1))
+        consume(match)
+
+    leftover = [word for word in text.split() if word not in _FILLER]
+    if not edits or leftover:
+        return None
+    return edits
+
+
+def _date_predicate(unit: str, amount: int) -> str:
+    # Intervalos semiabertos sobre a coluna, que usam o índice de DataInclusao
+    if unit == "today":
+        return "DataInclusao >= CAST(GETDATE() AS date) AND DataInclusao < DATEADD(day, 1, CAST(GETDATE() AS date))"
+    if unit == "yesterday":
+        return "DataInclusao >= DATEADD(day, -1, CAST(GETDATE() AS date)) AND DataInclusao < CAST(GETDATE() AS date)"
+    return f"DataInclusao BETWEEN DATEADD({unit}, -{amount}, GETDATE()) AND GETDATE()"
+
+
+def _add_condition(sql: str, condition: str) -> str:
+    where = _SQL_WHERE.search(sql)
+    if where is None:
+        tail = _SQL_TAIL.search(sql)
+        position = tail.start() if tail else len(sql.rstrip())
+        return f"{sql[:position].rstrip()} WHERE {condition} {sql[position:].lstrip()}".rstrip()
+    tail = _SQL_TAIL.search(sql, where.end())
+    end = tail.start() if tail else len(sql.rstrip())
+    existing = sql[where.end():end].strip()
+    if re.search(r"\bOR\b", existing, re.IGNORECASE):
+        existing = f"({existing})"
+    return f"{sql[:where.start()]}WHERE {existing} AND {condition} {sql[end:].lstrip()}".rstrip()
+
+
+def _mask_literals(sql: str) -> Tuple[str, List[str]]:
+    """Troca as strings do SQL por marcadores, para que as edições não alterem o conteúdo delas"""
+    literals: List[str] = []
+
+    def mask(match: re.Match) -> str:
+        if _SQL_STATUS_LABEL.fullmatch(match.group(0)):
+            return match.group(0)
+        literals.append(match.group(0))
+        return f"'\x00{len(literals) - 1}\x00'"
+
+    return _SQL_LITERAL.sub(mask, sql), literals
+
+
+def apply_edits(sql: str, edits: List[Tuple]) -> Optional[str]:
+    """
+    Aplica as edições ao SQL anterior
+
+    As edições são feitas com as strings mascaradas: um filtro como
+    `Obs = 'Ativo = 1'` ou `LIKE '%order by%'` não é tocado.
+
+    Returns:
+        Novo SQL, ou None quando a estrutura da consulta não permite a edição local
+    """
+    sql, literals = _mask_literals(sql.strip().rstrip(";").rstrip())
+    # Subconsultas e CTEs ficam para o LLM
+    if len(re.findall(r"\bSELECT\b", sql, re.IGNORECASE)) != 1:
+        return None
+
+    # Agregação sem GROUP BY devolve uma única linha: TOP e ORDER BY pedem outra consulta (ex.: listagem)
+    scalar_aggregate = bool(_SQL_AGGREGATE.search(sql)) and not _SQL_GROUP_BY.search(sql)
+    for edit in edits:
+        kind = edit[0]
+        if kind in ("top", "order") and scalar_aggregate:
+            return None
+        if kind == "status":
+            value = edit[1]
+            if _SQL_STATUS.search(sql):
+                sql = _SQL_STATUS.sub(lambda m: f"{m.group(1)}{value}", sql)
+            elif _SQL_STATUS_TEXT.search(sql):
+                label = "Ativo" if value else "Inativo"
+                sql = _SQL_STATUS_TEXT.sub(lambda m: f"{m.group(1)}'{label}'", sql)
+            else:
+                sql = _add_condition(sql, f"Ativo = {value}")
+        elif kind == "date":
+            predicate = _date_predicate(edit[1], edit[2])
+            if _SQL_DATE.search(sql):
+                sql = _SQL_DATE.sub(lambda m: predicate, sql, count=1)
+            else:
+                sql = _add_condition(sql, predicate)
+        elif kind == "top":
+            if _SQL_TOP.search(sql):
+                sql = _SQL_TOP.sub(lambda m: f"{m.group(1)}TOP {edit[1]} ", sql, count=1)
+            else:
+                sql = _SQL_SELECT_HEAD.sub(lambda m: f"{m.group(1)}TOP {edit[1]} ", sql, count=1)
+        elif kind == "order":
+            sql = _SQL_ORDER.sub("", sql).rstrip()
+            option = _SQL_OPTION.search(sql)
+            clause = f"ORDER BY {edit[1]} {edit[2]}"
+            if option:
+                sql = f"{sql[:option.start()].rstrip()} {clause} {sql[option.start():]}"
+            else:
+                sql = f"{sql} {clause}"
+    return _SQL_MASKED.sub(lambda m: literals[int(m.group(1))], sql)
+
+
+def describe_edit(edit: Tuple) -> str:
+    kind = edit[0]
+    if kind == "status":
+        return f"Ativo = {edit[1]}"
+    if kind == "date":
+        return _date_predicate(edit[1], edit[2])
+    if kind == "top":
+        return f"TOP {edit[1]}"
+    return f"ORDER BY {edit[1]} {edit[2]}"
+
+
+def refine_sql(sql: str, question: str, columns: List[str] = None) -> Optional[Tuple[str, List[str]]]:
+    """
+    Tenta resolver uma pergunta de acompanhamento editando o SQL anterior
+
+    Args:
+        sql: SQL executado na pergunta anterior
+        question: Pergunta de acompanhamento
+        columns: Colunas conhecidas do esquema (para resolver ORDER BY)
+
+    Returns:
+        (novo SQL, descrição das edições), ou None se for preciso usar o LLM
+    """
+    if not sql:
+        return None
+    edits = derive_edits(question, columns)
+    if not edits:
+        return None
+    refined = apply_edits(sql, edits)
+    if refined is None:
+        return None
+    return refined, [describe_edit(edit) for edit in edits]
+
+
+def contextual_question(state: Dict[str, Any], question: str) -> str:
+    """Pergunta enviada ao LLM quando o acompanhamento não pode ser resolvido localmente"""
+    previous_sql = f"\nSQL anterior: {state['sql']}" if state.get("sql") else ""
+    return f"Pergunta anterior: {state['query']}{previous_sql}\nPergunta de acompanhamento: {question}"
+
+
+class SessionStore:
+    """
+    Último contexto (pergunta, intenção e SQL) de cada sessão de conversa.
+
+    Sessões são descartadas por inatividade (TTL, contado a partir do último
+    acesso) e, acima do limite, as menos usadas recentemente saem primeiro (LRU).
+    """
+
+    def __init__(self, config: Dict[str, Any] = None):
+        self.config = config or SESSION_CONFIG
+        self.max_sessions = self.config.get("max_sessions", 1000)
+        self.ttl = self.config.get("ttl_seconds", 1800)
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            state = self._sessions.get(session_id)
+            if state is None:
+                return None
+            if time.monotonic() - state["updated_at"] > self.ttl:
+                del self._sessions[session_id]
+                return None
+            state["updated_at"] = time.monotonic()
+            self._sessions.move_to_end(session_id)
+            return dict(state)
+
+    def update(self, session_id: str, query: str, query_type: str, intent_data: Dict[str, Any],
+               sql: str = None) -> None:
+        with self._lock:
+            self._sessions[session_id] = {
+                "query": query,
+                "query_type": query_type,
+                "intent_data": intent_data,
+                "sql": sql,
+                "updated_at": time.monotonic()
+            }
+            self._sessions.move_to_end(session_id)
+            self._evict()
+
+    def clear(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def _evict(self) -> None:
+        # A ordem é a do último acesso: as sessões expiradas estão sempre no início
+        now = time.monotonic()
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if now - oldest["updated_at"] <= self.ttl:
+                break
+            self._sessions.popitem(last=False)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
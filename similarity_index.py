@@ -0,0 +1,352 @@
+"""
+Índice de similaridade (MinHash/LSH) sobre pares pergunta→SQL já validados
+"""
+
+import atexit
+import json
+import logging
+import os
+import random
+import re
+import threading
+import unicodedata
+import zlib
+from collections import OrderedDict
+from typing import Dict, Any, FrozenSet, Iterable, List, Optional
+
+from config import SIMILARITY_CONFIG
+
+logger = logging.getLogger("similarity_index")
+
+# Primo de Mersenne usado nas permutações (a*x + b) mod p
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_SEED = 1729
+
+STOPWORDS = {
+    "a", "as", "o", "os", "um", "uma", "uns", "umas", "de", "do", "da", "dos", "das",
+    "no", "na", "nos", "nas", "em", "com", "por", "para", "que", "qual", "quais",
+    "e", "me", "mostre", "mostrar", "liste", "listar", "exiba", "exibir", "traga",
+    "sao", "foram", "estao", "todos", "todas", "registrados", "registradas", "feitos", "feitas"
+}
+
+SYNONYMS = {
+    "passado": "ultimo",
+    "passada": "ultima",
+    "anterior": "ultimo",
+    "quantas": "quantos",
+    "quantidade": "quantos",
+    "total": "quantos",
+    "meses": "mes"
+}
+
+# Termos que mudam o significado da consulta e precisam coincidir exatamente
+_FEATURE_PATTERNS = [
+    (re.compile(r"^inativ"), "status:inativo"),
+    (re.compile(r"^ativ"), "status:ativo"),
+    (re.compile(r"^(hoje|ontem)$"), None),
+    (re.compile(r"^(semana|mes|ano|dia|dias)$"), None),
+    (re.compile(r"^quantos$"), "agg:count"),
+    (re.compile(r"^\d+$"), None),
+    (re.compile(r"^(janeiro|fevereiro|marco|abril|maio|junho|julho|agosto|setembro|outubro|novembro|dezembro)$"), None),
+    (re.compile(r"^(desc|decrescente|descendente)$"), "order:desc"),
+    (re.compile(r"^(asc|crescente|ascendente|alfabetica)$"), "order:asc"),
+    (re.compile(r"^(orden|classific|ordem)"), "order"),
+]
+
+
+def normalize_tokens(question: str) -> List[str]:
+    """
+    Normaliza a pergunta em uma lista de tokens comparáveis
+
+    Remove acentos e pontuação, descarta palavras vazias e aplica sinônimos;
+    as palavras seguem inteiras (o radical curto é tomado em `shingles`).
+    """
+    text = unicodedata.normalize("NFKD", question or "")
+    text = "".join(char for char in text if not unicodedata.combining(char)).lower()
+    tokens = []
+    for word in re.findall(r"\w+", text):
+        if word in STOPWORDS:
+            continue
+        word = SYNONYMS.get(word, word)
+        tokens.append(word)
+    return tokens
+
+
+def _feature(token: str, fields: FrozenSet[str]) -> Optional[str]:
+    for pattern, label in _FEATURE_PATTERNS:
+        if pattern.match(token):
+            return label or token
+    for name in (token, token[:-1] if token.endswith("s") else None):
+        if name and name in fields:
+            return f"field:{name}"
+    return None
+
+
+def field_names(columns: Iterable[str]) -> FrozenSet[str]:
+    """Nomes das colunas do esquema no formato dos tokens (sem acentos, minúsculos)"""
+    return frozenset(token for column in columns or () for token in normalize_tokens(column))
+
+
+def extract_features(tokens: List[str], fields: FrozenSet[str] = frozenset()) -> FrozenSet[str]:
+    """
+    Extrai os termos discriminantes (status, período, números, agregação, ordenação e campos)
+
+    Args:
+        tokens: Tokens normalizados da pergunta
+        fields: Nomes de colunas do esquema (ver `field_names`); citar outra coluna muda a consulta
+    """
+    features = set()
+    ordering = False
+    for token in tokens:
+        label = _feature(token, fields)
+        if label:
+            features.add(label)
+        # Coluna de ordenação: "ordenados por nome" e "ordenados por email" não são a mesma consulta
+        if ordering and (label is None or label.startswith("field:")):
+            features.add(f"order_by:{token}")
+        ordering = label == "order"
+    return frozenset(features)
+
+
+def shingles(tokens: List[str], size: int) -> set:
+    """Shingles de caracteres sobre os radicais ordenados (ordem das palavras é ignorada)"""
+    text = " ".join(sorted(token[:5] for token in tokens))
+    if len(text) <= size:
+        return {text}
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+class MinHasher:
+    """Gera assinaturas MinHash com permutações determinísticas"""
+
+    def __init__(self, num_perm: int, seed: int = _SEED):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self.params = [(rng.randint(1, _PRIME - 1), rng.randint(0, _PRIME - 1)) for _ in range(num_perm)]
+
+    def signature(self, shingle_set: set) -> List[int]:
+        hashes = [zlib.crc32(shingle.encode("utf-8")) for shingle in shingle_set]
+        return [
+            min(((a * h + b) % _PRIME) & _MAX_HASH for h in hashes)
+            for a, b in self.params
+        ]
+
+
+def estimate_similarity(sig_a: List[int], sig_b: List[int]) -> float:
+    """Similaridade de Jaccard estimada pela fração de posições iguais das assinaturas"""
+    if not sig_a or len(sig_a) != len(sig_b):
+        return 0.0
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / len(sig_a)
+
+
+class SimilarityIndex:
+    """
+    Índice de perguntas já respondidas com SQL validado.
+
+    As assinaturas MinHash são agrupadas em faixas (LSH) para que apenas
+    candidatos prováveis sejam comparados. O número de entradas é limitado e a
+    entrada menos usada recentemente é descartada primeiro.
+    """
+
+    def __init__(self, config: Dict[str, Any] = None, columns: Iterable[str] = None):
+        """
+        Args:
+            config: Configuração (padrão: SIMILARITY_CONFIG)
+            columns: Colunas do esquema; perguntas que citam colunas diferentes não se reaproveitam
+        """
+        self.config = config or SIMILARITY_CONFIG
+        self.fields = field_names(columns)
+        self.threshold = self.config.get("threshold", 0.8)
+        self.num_perm = self.config.get("num_perm", 64)
+        self.bands = self.config.get("bands", 16)
+        self.rows = self.num_perm // self.bands
+        self.shingle_size = self.config.get("shingle_size", 3)
+        self.max_entries = self.config.get("max_entries", 5000)
+        self.index_path = self.config.get("index_path")
+        self.autosave_every = self.config.get("autosave_every", 20)
+
+        self.hasher = MinHasher(self.num_perm)
+        self._lock = threading.RLock()
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        # Entrada atual de cada pergunta, para substituir sem percorrer o índice
+        self._by_question: Dict[str, int] = {}
+        self._buckets: List[Dict[int, set]] = [{} for _ in range(self.bands)]
+        self._next_id = 0
+        self._unsaved = 0
+
+        if self.index_path:
+            self.load()
+            atexit.register(self.save)
+
+    def _band_keys(self, signature: List[int]) -> List[int]:
+        return [
+            hash(tuple(signature[band * self.rows:(band + 1) * self.rows]))
+            for band in range(self.bands)
+        ]
+
+    def _fingerprint(self, question: str):
+        tokens = normalize_tokens(question)
+        return self.hasher.signature(shingles(tokens, self.shingle_size)), extract_features(tokens, self.fields)
+
+    def lookup(self, question: str) -> Optional[Dict[str, Any]]:
+        """
+        Procura uma pergunta semelhante já validada
+
+        Args:
+            question: Pergunta em linguagem natural
+
+        Returns:
+            Dicionário com question, query_type, intent_data, sql e score, ou None
+        """
+        signature, features = self._fingerprint(question)
+        with self._lock:
+            candidates = set()
+            for band, key in enumerate(self._band_keys(signature)):
+                candidates.update(self._buckets[band].get(key, ()))
+
+            best_id, best_score = None, 0.0
+            for entry_id in candidates:
+                entry = self._entries[entry_id]
+                if entry["features"] != features:
+                    continue
+                score = estimate_similarity(signature, entry["signature"])
+                if score > best_score:
+                    best_id, best_score = entry_id, score
+
+            if best_id is None or best_score < self.threshold:
+                return None
+
+            self._entries.move_to_end(best_id)
+            entry = self._entries[best_id]
+            entry["hits"] += 1
+            logger.info(f"Pergunta semelhante encontrada (similaridade {best_score:.2f}): {entry['question']}")
+            return {
+                "question": entry["question"],
+                "query_type": entry["query_type"],
+                "intent_data": entry["intent_data"],
+                "sql": entry["sql"],
+                "score": best_score
+            }
+
+    def add(self, question: str, sql: str, query_type: str = "sql",
+            intent_data: Dict[str, Any] = None) -> None:
+        """
+        Registra um par pergunta→SQL validado
+
+        Args:
+            question: Pergunta em linguagem natural
+            sql: Consulta SQL executada com sucesso
+            query_type: Tipo da consulta
+            intent_data: Dados de intenção associados
+        """
+        signature, features = self._fingerprint(question)
+        with self._lock:
+            self._insert({
+                "question": question,
+                "sql": sql,
+                "query_type": query_type,
+                "intent_data": intent_data or {},
+                "signature": signature,
+                "features": features,
+                "hits": 0
+            })
+
+            while len(self._entries) > self.max_entries:
+                oldest_id = next(iter(self._entries))
+                self._remove(oldest_id)
+
+            self._unsaved += 1
+            if self.index_path and self.autosave_every and self._unsaved >= self.autosave_every:
+                self.save()
+
+    def _insert(self, entry: Dict[str, Any]) -> None:
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = entry
+        # A mesma pergunta registrada de novo substitui a entrada anterior
+        previous = self._by_question.get(entry["question"])
+        if previous is not None:
+            self._remove(previous)
+        self._by_question[entry["question"]] = entry_id
+        for band, key in enumerate(self._band_keys(entry["signature"])):
+            self._buckets[band].setdefault(key, set()).add(entry_id)
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        if self._by_question.get(entry["question"]) == entry_id:
+            del self._by_question[entry["question"]]
+        for band, key in enumerate(self._band_keys(entry["signature"])):
+            bucket = self._buckets[band].get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[band][key]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def save(self) -> None:
+        """Persiste o índice em disco (escrita atômica)"""
+        if not self.index_path:
+            return
+        with self._lock:
+            if not self._unsaved:
+                return
+            data = {
+                "num_perm": self.num_perm,
+                "shingle_size": self.shingle_size,
+                "entries": [
+                    {
+                        "question": entry["question"],
+                        "sql": entry["sql"],
+                        "query_type": entry["query_type"],
+                        "intent_data": entry["intent_data"],
+                        "signature": entry["signature"],
+                        "hits": entry["hits"]
+                    }
+                    for entry in self._entries.values()
+                ]
+            }
+            self._unsaved = 0
+        try:
+            directory = os.path.dirname(self.index_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.index_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump(data, file, ensure_ascii=False)
+            os.replace(tmp_path, self.index_path)
+            logger.info(f"Índice de similaridade salvo em {self.index_path} ({len(data['entries'])} entradas)")
+        except Exception as e:
+            logger.error(f"Erro ao salvar índice de similaridade: {str(e)}")
+
+    def load(self) -> None:
+        """Carrega o índice persistido, recalculando assinaturas se os parâmetros mudaram"""
+        if not self.index_path or not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except Exception as e:
+            logger.error(f"Erro ao carregar índice de similaridade: {str(e)}")
+            return
+
+        same_params = (data.get("num_perm") == self.num_perm
+                       and data.get("shingle_size") == self.shingle_size)
+        with self._lock:
+            for item in data.get("entries", [])[-self.max_entries:]:
+                signature, features = self._fingerprint(item["question"]) if not same_params else (
+                    item["signature"], extract_features(normalize_tokens(item["question"]), self.fields)
+                )
+                self._insert({
+                    "question": item["question"],
+                    "sql": item["sql"],
+                    "query_type": item.get("query_type", "sql"),
+                    "intent_data": item.get("intent_data", {}),
+                    "signature": signature,
+                    "features": features,
+                    "hits": item.get("hits", 0)
+                })
+        logger.info(f"Índice de similaridade carregado de {self.index_path} ({len(self._entries)} entradas)")
@@ -0,0 +1,115 @@
+"""
+Coalescência de requisições idênticas em andamento (single-flight)
+"""
+
+import asyncio
+import logging
+import re
+import threading
+import unicodedata
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+logger = logging.getLogger("single_flight")
+
+
+def normalize_question(question: str) -> str:
+    """
+    Normaliza uma pergunta para uso como chave de coalescência
+
+    Converte para minúsculas, unifica a forma Unicode, colapsa espaços e remove
+    a pontuação final, de modo que variações triviais compartilhem a mesma chave.
+    """
+    text = unicodedata.normalize("NFKC", question or "").lower().strip()
+    text = re.sub(r"\s+", " ", text)
+    return text.rstrip(" ?!.;")
+
+
+class SingleFlight:
+    """
+    Garante que apenas uma computação por chave esteja em andamento.
+
+    Chamadas concorrentes com a mesma chave aguardam a computação líder e recebem
+    o mesmo resultado (ou a mesma exceção). Os caminhos síncrono (threads) e
+    assíncrono compartilham o mesmo mapa de computações em andamento.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight: Dict[Hashable, Future] = {}
+        self._stats = {"leaders": 0, "coalesced": 0}
+
+    def _join_or_lead(self, key: Hashable) -> Tuple[Future, bool]:
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self._stats["coalesced"] += 1
+                return future, False
+            future = Future()
+            self._in_flight[key] = future
+            self._stats["leaders"] += 1
+            return future, True
+
+    def _finish(self, key: Hashable, future: Future) -> None:
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    def _run(self, key: Hashable, future: Future, func: Callable[[], Any]) -> None:
+        try:
+            result = func()
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        finally:
+            self._finish(key, future)
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Executa `func` ou aguarda a execução em andamento com a mesma chave
+
+        Args:
+            key: Chave da computação
+            func: Função sem argumentos que produz o resultado
+
+        Returns:
+            Tupla (resultado, compartilhado), onde compartilhado indica que o
+            resultado veio de uma computação iniciada por outra chamada
+        """
+        future, leader = self._join_or_lead(key)
+        if leader:
+            self._run(key, future, func)
+        else:
+            logger.debug(f"Aguardando computação em andamento para a chave {key!r}")
+        return future.result(), not leader
+
+    async def do_async(self, key: Hashable, func: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Versão assíncrona de `do`; a função bloqueante roda em uma thread do executor padrão
+
+        Args:
+            key: Chave da computação
+            func: Função sem argumentos (bloqueante) que produz o resultado
+
+        Returns:
+            Tupla (resultado, compartilhado)
+        """
+        future, leader = self._join_or_lead(key)
+        if leader:
+            loop = asyncio.get_running_loop()
+            loop.run_in_executor(None, self._run, key, future, func)
+        else:
+            logger.debug(f"Aguardando computação em andamento para a chave {key!r}")
+        # shield: o cancelamento de um chamador não cancela a computação compartilhada
+        result = await asyncio.shield(asyncio.wrap_future(future))
+        return result, not leader
+
+    def in_flight(self) -> int:
+        """Número de computações em andamento"""
+        with self._lock:
+            return len(self._in_flight)
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._in_flight))
@@ -0,0 +1,179 @@
+"""
+Poda de colunas e agregação no banco para o SQL gerado
+
+O LLM costuma gerar `SELECT *` mesmo para perguntas de contagem ("Quantos
+cadastros...?"), e o executor trafega todas as colunas de todas as linhas só
+para o resultado ser contado depois. A partir da intenção (fields, aggregation,
+group_by), da pergunta e do esquema, este passo troca `SELECT *` pelas colunas
+pedidas e transforma perguntas de contagem em `COUNT(*)`/`GROUP BY`, de modo
+que a agregação acontece no SQL Server (ou nos agregados locais).
+"""
+
+import logging
+import re
+import unicodedata
+from typing import Dict, Any, List, Optional, Tuple
+
+from config import SQL_REWRITE_CONFIG
+
+logger = logging.getLogger("sql_projection")
+
+_SELECT_STAR = re.compile(
+    r"^\s*SELECT\s+(?P<top>TOP\s*(?:\(\s*\d+\s*\)|\d+)\s+)?\*\s+FROM\s+"
+    r"(?P<table>(?:\[?\w+\]?\.)?\[?\w+\]?)(?P<rest>.*)$",
+    re.IGNORECASE | re.DOTALL
+)
+_ORDER_BY = re.compile(r"\s+ORDER\s+BY\s+.*$", re.IGNORECASE | re.DOTALL)
+_UNSUPPORTED = re.compile(r"\b(?:JOIN|GROUP\s+BY|HAVING|UNION|INTERSECT|EXCEPT|DISTINCT|APPLY|OPTION)\b",
+                          re.IGNORECASE)
+_COUNT_CUES = re.compile(r"\b(?:quant[oa]s|quantidade|numero de|total de|contagem|contar|conte)\b")
+# "por" depois de "ordenados"/"classificados" é ordenação, não agrupamento
+_GROUP_CUE = re.compile(r"(?P<order>\b(?:ordenad|classificad)\w*\s+)?\bpor\s+(?:cada\s+)?(?P<key>[\w-]+)")
+_COUNT_INTENTS = {"count", "contagem", "contar", "quantidade", "count_distinct"}
+
+# Agrupamentos por data sobre a coluna de data configurada: (expressões, apelidos)
+_DATE_GROUPS = {
+    "dia": (["CAST({col} AS date)"], ["Dia"]),
+    "mes": (["YEAR({col})", "MONTH({col})"], ["Ano", "Mes"]),
+    "ano": (["YEAR({col})"], ["Ano"]),
+}
+_STATUS_WORDS = {"status", "situacao", "ativo", "ativos"}
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", str(text or ""))
+    return "".join(char for char in text if not unicodedata.combining(char)).lower()
+
+
+def _bare(name: str) -> str:
+    return str(name).split(".")[-1].strip("[] ")
+
+
+def _table_columns(db_schema: Dict[str, Any], table: str) -> List[str]:
+    wanted = _bare(table).lower()
+    for name, definition in (db_schema or {}).items():
+        if name.lower() == wanted and isinstance(definition, dict):
+            return [field["nome"] for field in definition.get("campos", []) if isinstance(field, dict) and "nome" in field]
+    return []
+
+
+class _Resolver:
+    """Resolve nomes da intenção ou palavras da pergunta para colunas da tabela"""
+
+    def __init__(self, columns: List[str], config: Dict[str, Any]):
+        self.columns = {_normalize(column): column for column in columns}
+        self.date_column = config.get("date_column", "DataInclusao")
+        status = [column for column in config.get("status_columns", ["Ativo"]) if _normalize(column) in self.columns]
+        self.status_column = self.columns[_normalize(status[0])] if status else None
+
+    def column(self, name: str) -> Optional[str]:
+        key = _normalize(_bare(name))
+        for candidate in (key, key[:-1] if key.endswith("s") else None, key.replace(" ", "")):
+            if candidate and candidate in self.columns:
+                return self.columns[candidate]
+        if key in _STATUS_WORDS:
+            return self.status_column
+        return None
+
+    def group(self, name: str) -> Optional[Tuple[List[str], List[Optional[str]]]]:
+        """Expressões e apelidos de agrupamento para um nome ("mes", "status", "Email")"""
+        key = _normalize(_bare(name))
+        key = {"meses": "mes", "dias": "dia", "anos": "ano", "data": "dia"}.get(key, key)
+        if key in _DATE_GROUPS and _normalize(self.date_column) in self.columns:
+            expressions, aliases = _DATE_GROUPS[key]
+            return [expression.format(col=self.date_column) for expression in expressions], list(aliases)
+        column = self.column(name)
+        if column is None:
+            return None
+        return [column], [None]
+
+
+def _is_count(question: str, intent_data: Dict[str, Any]) -> bool:
+    aggregation = intent_data.get("aggregation") or intent_data.get("operation")
+    if isinstance(aggregation, str) and _normalize(aggregation) in _COUNT_INTENTS:
+        return True
+    if aggregation:
+        # Outras agregações (soma, média...) ficam a cargo do SQL gerado
+        return False
+    return bool(_COUNT_CUES.search(_normalize(question)))
+
+
+def _group_names(question: str, intent_data: Dict[str, Any]) -> List[str]:
+    group_by = intent_data.get("group_by")
+    if isinstance(group_by, str):
+        group_by = [group_by]
+    if group_by:
+        return [str(name) for name in group_by]
+    return [match.group("key") for match in _GROUP_CUE.finditer(_normalize(question)) if not match.group("order")]
+
+
+def push_down(sql: str, question: str, intent_data: Dict[str, Any] = None, db_schema: Dict[str, Any] = None,
+              config: Dict[str, Any] = None) -> Tuple[str, List[str]]:
+    """
+    Troca `SELECT *` por contagem no banco ou pelas colunas pedidas
+
+    Só consultas simples sobre uma tabela (sem JOIN, GROUP BY, DISTINCT ou
+    subconsultas) são alteradas; na dúvida, o SQL é mantido.
+
+    Args:
+        sql: SQL gerado
+        question: Pergunta do usuário
+        intent_data: Intenção analisada (fields, aggregation, group_by)
+        db_schema: Esquema do banco
+        config: Configuração (padrão: SQL_REWRITE_CONFIG)
+
+    Returns:
+        Tupla (SQL, otimizações aplicadas: "count" e/ou "projection")
+    """
+    config = config or SQL_REWRITE_CONFIG
+    intent_data = intent_data if isinstance(intent_data, dict) else {}
+    match = _SELECT_STAR.match(sql or "")
+    if not match or len(re.findall(r"\bSELECT\b", sql, re.IGNORECASE)) != 1:
+        return sql, []
+    rest = match.group("rest").strip().rstrip(";")
+    body = _ORDER_BY.sub("", rest)
+    from_clause = re.split(r"\bWHERE\b", body, 1, flags=re.IGNORECASE)[0]
+    # Vírgula antes do WHERE é junção no formato antigo (FROM A, B)
+    if _UNSUPPORTED.search(re.sub(r"'[^']*'", "''", body)) or "," in from_clause:
+        return sql, []
+    columns = _table_columns(db_schema, match.group("table"))
+    if not columns:
+        return sql, []
+    resolver = _Resolver(columns, config)
+    source = f"{match.group('table')} {body}".strip()
+
+    if config.get("aggregate_pushdown", True) and not match.group("top") and _is_count(question, intent_data):
+        expressions: List[str] = []
+        selected: List[str] = []
+        for name in _group_names(question, intent_data):
+            group = resolver.group(name)
+            if group is None:
+                continue
+            for expression, alias in zip(*group):
+                if expression not in expressions:
+                    expressions.append(expression)
+                    selected.append(f"{expression} AS {alias}" if alias else expression)
+        if expressions:
+            aliases = [item.split(" AS ")[-1] for item in selected]
+            rewritten = (f"SELECT {', '.join(selected)}, COUNT(*) AS Total FROM {source} "
+                         f"GROUP BY {', '.join(expressions)} ORDER BY {', '.join(aliases)}")
+        else:
+            rewritten = f"SELECT COUNT(*) AS Total FROM {source}"
+        logger.info("Contagem levada ao banco: %s -> %s", sql, rewritten)
+        return rewritten, ["count"]
+
+    fields = intent_data.get("fields")
+    if config.get("projection_pruning", True) and isinstance(fields, list) and fields:
+        resolved = [resolver.column(field) for field in fields]
+        if all(resolved):
+            # Todos os campos pedidos voltam, inclusive os que também filtram (ex.: Email LIKE ...)
+            display = []
+            for column in resolved:
+                if column not in display:
+                    display.append(column)
+            if display:
+                top = match.group("top") or ""
+                rewritten = f"SELECT {top}{', '.join(display)} FROM {match.group('table')} {rest}".rstrip()
+                logger.info("Colunas podadas: %s -> %s", sql, rewritten)
+                return rewritten, ["projection"]
+    return sql, []
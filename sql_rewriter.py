@@ -0,0 +1,248 @@
+"""
+Reescrita do SQL gerado para predicados sargáveis (que permitem busca por índice)
+
+Funções aplicadas sobre a coluna (CONVERT(date, DataInclusao), YEAR(...),
+DATEDIFF(day, ...), ISNULL, UPPER/LOWER) impedem o uso de índices e forçam a
+leitura da tabela inteira. Cada padrão reconhecido é trocado por um intervalo
+semiaberto equivalente sobre a coluna original, por exemplo:
+
+    CONVERT(date, DataInclusao) = CONVERT(date, GETDATE())
+    -> DataInclusao >= CAST(GETDATE() AS date) AND DataInclusao < DATEADD(day, 1, CAST(GETDATE() AS date))
+"""
+
+import datetime
+import logging
+import re
+from typing import Dict, Any, Callable, List, Tuple
+
+from config import SQL_REWRITE_CONFIG
+
+logger = logging.getLogger("sql_rewriter")
+
+_COLUMN = r"(?:\[?\w+\]?\.)?\[?[A-Za-z_]\w*\]?"
+_NOW = r"(?:GETDATE\(\)|SYSDATETIME\(\)|CURRENT_TIMESTAMP)"
+_NOW_EXPR = rf"(?:{_NOW}|DATEADD\(\s*\w+\s*,\s*[-+]?\d+\s*,\s*{_NOW}\s*\))"
+_OPERATOR = r"(?P<op>>=|<=|=|<(?!>)|>)"
+
+
+def _date_value(name: str) -> str:
+    """Data sem hora: CONVERT/CAST de GETDATE() (ou DATEADD sobre ele) ou literal 'AAAA-MM-DD'"""
+    return (rf"(?:CONVERT\(\s*DATE\s*,\s*(?P<{name}_conv>{_NOW_EXPR})\s*\)"
+            rf"|CAST\(\s*(?P<{name}_cast>{_NOW_EXPR})\s+AS\s+DATE\s*\)"
+            rf"|(?P<{name}_lit>N?'\d{{4}}-?\d{{2}}-?\d{{2}}'))")
+
+
+def _date_column(name: str) -> str:
+    """Coluna convertida para data: CONVERT(date, col) ou CAST(col AS date)"""
+    return (rf"(?:CONVERT\(\s*DATE\s*,\s*(?P<{name}_a>{_COLUMN})\s*\)"
+            rf"|CAST\(\s*(?P<{name}_b>{_COLUMN})\s+AS\s+DATE\s*\))")
+
+
+_DATE_COMPARE = re.compile(rf"{_date_column('col')}\s*{_OPERATOR}\s*{_date_value('x')}", re.IGNORECASE)
+_DATE_COMPARE_SWAPPED = re.compile(rf"{_date_value('x')}\s*=\s*{_date_column('col')}", re.IGNORECASE)
+_DATE_BETWEEN = re.compile(
+    rf"{_date_column('col')}\s+BETWEEN\s+{_date_value('low')}\s+AND\s+{_date_value('high')}", re.IGNORECASE
+)
+_YEAR_VALUE = rf"\d{{4}}|YEAR\(\s*{_NOW}\s*\)"
+_MONTH_VALUE = rf"\d{{1,2}}|MONTH\(\s*{_NOW}\s*\)"
+_YEAR_MONTH = re.compile(
+    rf"YEAR\(\s*(?P<col>{_COLUMN})\s*\)\s*=\s*(?P<year>{_YEAR_VALUE})\s+AND\s+"
+    rf"MONTH\(\s*(?P<col2>{_COLUMN})\s*\)\s*=\s*(?P<month>{_MONTH_VALUE})", re.IGNORECASE
+)
+_MONTH_YEAR = re.compile(
+    rf"MONTH\(\s*(?P<col2>{_COLUMN})\s*\)\s*=\s*(?P<month>{_MONTH_VALUE})\s+AND\s+"
+    rf"YEAR\(\s*(?P<col>{_COLUMN})\s*\)\s*=\s*(?P<year>{_YEAR_VALUE})", re.IGNORECASE
+)
+_YEAR = re.compile(rf"YEAR\(\s*(?P<col>{_COLUMN})\s*\)\s*=\s*(?P<year>{_YEAR_VALUE})", re.IGNORECASE)
+_DATEDIFF = re.compile(
+    rf"DATEDIFF\(\s*(?:day|dd|d)\s*,\s*(?P<col>{_COLUMN})\s*,\s*(?P<now>{_NOW})\s*\)\s*"
+    rf"(?P<op><=|=|<(?!>))\s*(?P<days>\d+)", re.IGNORECASE
+)
+_ISNULL = re.compile(
+    rf"ISNULL\(\s*(?P<col>{_COLUMN})\s*,\s*(?P<fallback>N?'[^']*'|[-+]?\d+)\s*\)\s*=\s*(?P<value>N?'[^']*'|[-+]?\d+)",
+    re.IGNORECASE
+)
+_CASE = re.compile(rf"\b(?:UPPER|LOWER)\(\s*(?P<col>{_COLUMN})\s*\)\s*(?P<op>=|LIKE)\s*(?P<value>N?'[^']*')",
+                   re.IGNORECASE)
+_EMAIL_LIKE = re.compile(rf"(?P<col>{_COLUMN})\s+LIKE\s+N?'%@(?P<domain>[^%_\[\]']+)(?P<tail>%?)'", re.IGNORECASE)
+_WHERE = re.compile(r"\bWHERE\b(?P<where>.*?)(?=\bGROUP\s+BY\b|\bORDER\s+BY\b|\bHAVING\b|\bUNION\b|$)",
+                    re.IGNORECASE | re.DOTALL)
+
+
+def _column(match: "re.Match", name: str = "col") -> str:
+    return match.group(f"{name}_a") or match.group(f"{name}_b")
+
+
+def _day_start(match: "re.Match", name: str) -> str:
+    literal = match.group(f"{name}_lit")
+    if literal:
+        # 'YYYYMMDD' não depende de DATEFORMAT/idioma da sessão ao comparar com datetime
+        parts = re.match(r"^N?'(\d{4})-?(\d{2})-?(\d{2})'$", literal)
+        return f"'{''.join(parts.groups())}'" if parts else literal
+    return f"CAST({match.group(f'{name}_conv') or match.group(f'{name}_cast')} AS date)"
+
+
+def _next_day(day: str) -> str:
+    literal = re.match(r"^N?'(\d{4})-?(\d{2})-?(\d{2})'$", day)
+    if literal:
+        following = datetime.date(*(int(part) for part in literal.groups())) + datetime.timedelta(days=1)
+        return f"'{following:%Y%m%d}'"
+    return f"DATEADD(day, 1, {day})"
+
+
+def _range(column: str, start: str, end: str, match: "re.Match") -> str:
+    condition = f"{column} >= {start} AND {column} < {end}"
+    # Sob NOT o intervalo precisa de parênteses; com AND/OR a precedência já o mantém junto
+    if re.search(r"\bNOT\s*$", match.string[:match.start()], re.IGNORECASE):
+        return f"({condition})"
+    return condition
+
+
+def _bare_name(column: str) -> str:
+    return column.split(".")[-1].strip("[]").lower()
+
+
+class _Rewriter:
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+        self.rewrites: List[str] = []
+        self.status_columns = [name.lower() for name in config.get("status_columns", ["Ativo"])]
+        self.email_columns = [name.lower() for name in config.get("email_columns", ["Email"])]
+
+    def apply(self, sql: str, rule: str, pattern: "re.Pattern", replace: Callable[["re.Match"], str]) -> str:
+        def substitute(match: "re.Match") -> str:
+            replacement = replace(match)
+            if replacement != match.group(0):
+                logger.info("Reescrita sargável (%s): %s -> %s", rule, match.group(0), replacement)
+                self.rewrites.append(rule)
+            return replacement
+        return pattern.sub(substitute, sql)
+
+    def date_compare(self, match: "re.Match") -> str:
+        column, day, op = _column(match), _day_start(match, "x"), match.groupdict().get("op") or "="
+        if op == "=":
+            return _range(column, day, _next_day(day), match)
+        return {
+            ">=": f"{column} >= {day}",
+            ">": f"{column} >= {_next_day(day)}",
+            "<": f"{column} < {day}",
+            "<=": f"{column} < {_next_day(day)}",
+        }[op]
+
+    def date_between(self, match: "re.Match") -> str:
+        return _range(_column(match), _day_start(match, "low"), _next_day(_day_start(match, "high")), match)
+
+    def year_month(self, match: "re.Match") -> str:
+        column = match.group("col")
+        if column.lower() != match.group("col2").lower():
+            return match.group(0)
+        year, month = match.group("year"), match.group("month")
+        if year.isdigit() and month.isdigit():
+            if not 1 <= int(month) <= 12:
+                return match.group(0)
+            start = datetime.date(int(year), int(month), 1)
+            end = datetime.date(start.year + start.month // 12, start.month % 12 + 1, 1)
+            return _range(column, f"'{start:%Y%m%d}'", f"'{end:%Y%m%d}'", match)
+        start = f"DATEFROMPARTS({year}, {month}, 1)"
+        return _range(column, start, f"DATEADD(month, 1, {start})", match)
+
+    def year(self, match: "re.Match") -> str:
+        column, year = match.group("col"), match.group("year")
+        if year.isdigit():
+            return _range(column, f"'{int(year):04d}0101'", f"'{int(year) + 1:04d}0101'", match)
+        return _range(column, f"DATEFROMPARTS({year}, 1, 1)", f"DATEFROMPARTS({year} + 1, 1, 1)", match)
+
+    def datediff(self, match: "re.Match") -> str:
+        column, op, days = match.group("col"), match.group("op"), int(match.group("days"))
+        today = f"CAST({match.group('now')} AS date)"
+
+        def shifted(amount: int) -> str:
+            return today if amount == 0 else f"DATEADD(day, {amount}, {today})"
+
+        # DATEDIFF(day, col, hoje) conta viradas de dia: <= N equivale a col a partir de hoje - N
+        if op == "<":
+            if days == 0:
+                return match.group(0)
+            days -= 1
+        if op == "=":
+            return _range(column, shifted(-days), shifted(1 - days), match)
+        return f"{column} >= {shifted(-days)}"
+
+    def isnull(self, match: "re.Match") -> str:
+        if match.group("fallback").lower() == match.group("value").lower():
+            return match.group(0)
+        return f"{match.group('col')} = {match.group('value')}"
+
+    def case(self, match: "re.Match") -> str:
+        return f"{match.group('col')} {match.group('op').upper()} {match.group('value')}"
+
+    def email_like(self, match: "re.Match") -> str:
+        domain_column = self.config.get("email_domain_column")
+        column = match.group("col")
+        if not domain_column or _bare_name(column) not in self.email_columns:
+            return match.group(0)
+        if "." in column:
+            domain_column = f"{column.rsplit('.', 1)[0]}.{domain_column}"
+        domain = match.group("domain")
+        if match.group("tail"):
+            return f"{domain_column} LIKE '{domain}%'"
+        return f"{domain_column} = '{domain}'"
+
+    def status(self, sql: str) -> str:
+        """Normaliza condições de status (IN (1), <> 0) e remove repetições ligadas por AND"""
+        names = "|".join(re.escape(name) for name in self.status_columns)
+        if not names:
+            return sql
+        column = rf"(?P<col>(?:\[?\w+\]?\.)?\[?(?:{names})\]?)"
+        sql = self.apply(sql, "status", re.compile(rf"{column}\s+IN\s*\(\s*(?P<value>[01])\s*\)", re.IGNORECASE),
+                         lambda match: f"{match.group('col')} = {match.group('value')}")
+        sql = self.apply(sql, "status", re.compile(rf"{column}\s*(?:<>|!=)\s*(?P<value>[01])\b", re.IGNORECASE),
+                         lambda match: f"{match.group('col')} = {1 - int(match.group('value'))}")
+
+        where = _WHERE.search(sql)
+        if not where or re.search(r"\b(?:OR|SELECT)\b", where.group("where"), re.IGNORECASE):
+            return sql
+        text, kept, position, seen = where.group("where"), [], 0, set()
+        condition = re.compile(rf"(?P<and>\s+AND\s+)?{column}\s*=\s*(?P<value>[01])\b", re.IGNORECASE)
+        for match in condition.finditer(text):
+            key = (match.group("col").lower().replace("[", "").replace("]", ""), match.group("value"))
+            if key in seen and match.group("and"):
+                logger.info("Reescrita sargável (status): condição repetida removida: %s", match.group(0).strip())
+                self.rewrites.append("status")
+                kept.append(text[position:match.start()])
+                position = match.end()
+            seen.add(key)
+        if not position:
+            return sql
+        kept.append(text[position:])
+        return sql[:where.start("where")] + "".join(kept) + sql[where.end("where"):]
+
+
+def rewrite_sql(sql: str, config: Dict[str, Any] = None) -> Tuple[str, List[str]]:
+    """
+    Troca predicados não sargáveis por equivalentes que usam índices
+
+    Args:
+        sql: Consulta gerada (com literais)
+        config: Configuração (padrão: SQL_REWRITE_CONFIG)
+
+    Returns:
+        Tupla (SQL reescrito, regras aplicadas); cada reescrita também é registrada no log
+    """
+    config = config or SQL_REWRITE_CONFIG
+    if not sql:
+        return sql, []
+    rewriter = _Rewriter(config)
+    sql = rewriter.apply(sql, "data", _DATE_BETWEEN, rewriter.date_between)
+    sql = rewriter.apply(sql, "data", _DATE_COMPARE, rewriter.date_compare)
+    sql = rewriter.apply(sql, "data", _DATE_COMPARE_SWAPPED, rewriter.date_compare)
+    sql = rewriter.apply(sql, "ano_mes", _YEAR_MONTH, rewriter.year_month)
+    sql = rewriter.apply(sql, "ano_mes", _MONTH_YEAR, rewriter.year_month)
+    sql = rewriter.apply(sql, "ano", _YEAR, rewriter.year)
+    sql = rewriter.apply(sql, "datediff", _DATEDIFF, rewriter.datediff)
+    sql = rewriter.apply(sql, "isnull", _ISNULL, rewriter.isnull)
+    if config.get("case_insensitive_collation", True):
+        sql = rewriter.apply(sql, "maiusculas", _CASE, rewriter.case)
+    sql = rewriter.apply(sql, "dominio_email", _EMAIL_LIKE, rewriter.email_like)
+    sql = rewriter.status(sql)
+    return sql, rewriter.rewrites
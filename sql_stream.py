@@ -0,0 +1,207 @@
+"""
+Extração de SQL em respostas por streaming, encerrando no fim da primeira instrução SELECT
+"""
+
+import re
+from typing import Iterator, Optional
+
+_FENCE = "```"
+# Início de instrução no começo de uma linha: SELECT ou CTE (WITH nome [(colunas)] AS ()
+_START = re.compile(
+    r"^[ \t]*(?P<start>SELECT\b|WITH\s+\[?\w+\]?(?:\s*\([^)]*\))?\s+AS\s*\()|(?P<fence>```)",
+    re.IGNORECASE | re.MULTILINE
+)
+_SELECT = re.compile(r"\bSELECT\b", re.IGNORECASE)
+_NEXT_WORD = re.compile(r"\s*(\w+)\W", re.DOTALL)
+_BLANK_LINE = re.compile(r"\n[ \t]*\n")
+_OPEN_LINE = re.compile(r"\n[ \t]*\Z")
+# Palavras que indicam que a consulta continua depois de uma linha em branco
+_CONTINUATION = {
+    "SELECT", "FROM", "WHERE", "AND", "OR", "NOT", "JOIN", "INNER", "LEFT", "RIGHT", "FULL", "CROSS",
+    "OUTER", "ON", "GROUP", "ORDER", "HAVING", "UNION", "EXCEPT", "INTERSECT", "TOP", "AS", "CASE",
+    "WHEN", "THEN", "ELSE", "END", "OFFSET", "FETCH", "OPTION", "WITH", "IN", "EXISTS", "BETWEEN"
+}
+
+
+class StreamingSQLExtractor:
+    """
+    Acompanha cercas de markdown e limites de instrução trecho a trecho.
+
+    A instrução termina em `;`, no fechamento da cerca ou, fora de cercas, em
+    uma linha em branco seguida de texto que não continua a consulta. Strings,
+    identificadores entre colchetes, comentários e parênteses são respeitados.
+    """
+
+    def __init__(self):
+        self._text = ""
+        self._pos = 0
+        self._in_fence = False
+        self._fence_header = False
+        self._start = -1
+        self._depth = 0
+        self._quote: Optional[str] = None
+        self._comment: Optional[str] = None
+        self._blank_line_at = -1
+        self.statement: Optional[str] = None
+        self.done = False
+
+    def feed(self, chunk: str) -> Optional[str]:
+        """
+        Processa um novo trecho do stream
+
+        Returns:
+            A instrução SQL assim que estiver completa, ou None
+        """
+        if self.done:
+            return self.statement
+        self._text += chunk
+        while not self.done:
+            if self._start < 0:
+                if not self._seek():
+                    break
+            elif not self._scan_statement():
+                break
+        return self.statement if self.done else None
+
+    def finish(self) -> Optional[str]:
+        """Encerra a leitura e devolve a melhor instrução disponível"""
+        if self.done:
+            return self.statement
+        if self._start >= 0:
+            end = self._blank_line_at if self._blank_line_at >= 0 else len(self._text)
+            self._complete(self._text[self._start:end])
+        if not self.done:
+            # Sem instrução reconhecida: devolve o texto sem as cercas
+            text = self._text.replace(_FENCE + "sql", "").replace(_FENCE, "").strip()
+            self.statement, self.done = text or None, True
+        return self.statement
+
+    def _seek(self) -> bool:
+        """Procura a abertura de cerca ou o início da instrução; retorna False se precisa de mais texto"""
+        text = self._text
+        if self._fence_header:
+            newline = text.find("\n", self._pos)
+            if newline < 0:
+                return False
+            self._fence_header = False
+            self._pos = newline + 1
+
+        match = _START.search(text, self._pos)
+        if match is None:
+            # Recomeça da linha atual, que pode estar incompleta
+            last_newline = text.rfind("\n", self._pos)
+            if last_newline >= 0:
+                self._pos = last_newline + 1
+            return False
+        if match.group("fence"):
+            self._in_fence = not self._in_fence
+            self._fence_header = self._in_fence
+            self._pos = match.end()
+            return True
+        self._start = match.start("start")
+        self._pos = self._start
+        self._depth = 0
+        self._blank_line_at = -1
+        return True
+
+    def _scan_statement(self) -> bool:
+        """Avança dentro da instrução; retorna False se precisa de mais texto"""
+        text = self._text
+        length = len(text)
+        i = self._pos
+        while i < length:
+            char = text[i]
+            if self._comment == "--":
+                if char == "\n":
+                    self._comment = None
+                i += 1
+                continue
+            if self._comment == "/*":
+                if text.startswith("*/", i):
+                    self._comment = None
+                    i += 2
+                else:
+                    i += 1
+                continue
+            if self._quote:
+                if char == self._quote:
+                    # '' e ]] são escapes dentro de strings e identificadores
+                    if i + 1 >= length:
+                        break
+                    if text[i + 1] == self._quote:
+                        i += 2
+                        continue
+                    self._quote = None
+                i += 1
+                continue
+
+            if self._blank_line_at >= 0 and not char.isspace():
+                word = _NEXT_WORD.match(text, i)
+                if word is None:
+                    break
+                if word.group(1).upper() not in _CONTINUATION:
+                    return self._complete(text[self._start:self._blank_line_at], resume=i)
+                self._blank_line_at = -1
+
+            if char in "'\"":
+                self._quote = char
+            elif char == "[":
+                self._quote = "]"
+            elif char == "-" and text.startswith("--", i):
+                self._comment = "--"
+            elif char == "/" and text.startswith("/*", i):
+                self._comment = "/*"
+            elif char == "(":
+                self._depth += 1
+            elif char == ")":
+                self._depth -= 1
+            elif self._depth <= 0 and char == ";":
+                return self._complete(text[self._start:i], resume=i + 1)
+            elif char == "`":
+                if length - i < 3:
+                    break
+                if text.startswith(_FENCE, i):
+                    self._in_fence = False
+                    return self._complete(text[self._start:i], resume=i + 3)
+            elif char == "\n" and not self._in_fence and self._depth <= 0 and self._blank_line_at < 0:
+                blank = _BLANK_LINE.match(text, i)
+                if blank is None and _OPEN_LINE.match(text, i):
+                    break
+                if blank:
+                    self._blank_line_at = i
+                    i = blank.end()
+                    continue
+            i += 1
+        self._pos = i
+        return False
+
+    def _complete(self, statement: str, resume: int = None) -> bool:
+        statement = statement.strip()
+        if _SELECT.search(statement):
+            self.statement, self.done = statement, True
+            return True
+        # Não era uma consulta SELECT: continua procurando depois dela
+        self._start = -1
+        self._quote = self._comment = None
+        self._blank_line_at = -1
+        if resume is not None:
+            self._pos = resume
+        return not self.done and resume is not None
+
+
+def consume_sql_statement(chunks: Iterator[str]) -> str:
+    """
+    Consumidor de stream que retorna assim que a primeira instrução SELECT fica completa
+
+    Raises:
+        ValueError: Nenhuma instrução SQL foi encontrada na resposta
+    """
+    extractor = StreamingSQLExtractor()
+    for chunk in chunks:
+        statement = extractor.feed(chunk)
+        if extractor.done:
+            return statement
+    statement = extractor.finish()
+    if not statement:
+        raise ValueError("Nenhuma consulta SQL encontrada na resposta")
+    return statement
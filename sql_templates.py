@@ -0,0 +1,313 @@
+"""
+Templates de SQL parametrizado: extração de literais e reuso por formato de pergunta
+"""
+
+import calendar
+import logging
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+from config import TEMPLATE_CONFIG
+
+logger = logging.getLogger("sql_templates")
+
+MONTHS = {
+    "janeiro": 1, "fevereiro": 2, "marco": 3, "abril": 4, "maio": 5, "junho": 6,
+    "julho": 7, "agosto": 8, "setembro": 9, "outubro": 10, "novembro": 11, "dezembro": 12
+}
+
+EMAIL_PROVIDERS = ("gmail", "hotmail", "outlook", "yahoo", "icloud", "live", "uol", "bol", "terra")
+
+_SLOT_PATTERN = re.compile(
+    r"(?P<DOMAIN>@?\b[\w-]+(?:\.[\w-]+)*\.(?:com|net|org|br)(?:\.br)?\b|\b(?:%s)\b)"
+    r"|(?P<MONTH>\b(?:%s)\b)"
+    r"|(?P<YEAR>\b(?:19|20)\d{2}\b)"
+    r"|(?P<NUMBER>\b\d+\b)" % ("|".join(EMAIL_PROVIDERS), "|".join(MONTHS))
+)
+
+# Literais de string (com prefixo N opcional), TOP n e números comparados
+_LITERAL_PATTERN = re.compile(
+    r"(?P<string>N?'(?:[^']|'')*')"
+    r"|(?P<top>\bTOP\s+)(?P<top_value>\d+)\b"
+    r"|(?P<op>(?:<>|!=|>=|<=|=|<|>)\s*)(?P<number>-?\d+(?:\.\d+)?)\b",
+    re.IGNORECASE
+)
+
+_DATE_LITERAL = re.compile(r"^(\d{4})-(\d{2})-(\d{2})(.*)$")
+
+
+def _strip_accents(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text)
+    return "".join(char for char in text if not unicodedata.combining(char))
+
+
+def question_shape(question: str) -> Tuple[str, List[Tuple[str, str]]]:
+    """
+    Calcula o formato da pergunta, substituindo literais por marcadores
+
+    Args:
+        question: Pergunta em linguagem natural
+
+    Returns:
+        Tupla (formato, slots), onde slots é a lista ordenada de (tipo, valor)
+        Ex.: "cadastros de janeiro de 2023" -> ("cadastros de {MONTH} de {YEAR}",
+        [("MONTH", "janeiro"), ("YEAR", "2023")])
+    """
+    text = _strip_accents(question or "").lower().strip()
+    text = re.sub(r"\s+", " ", text).rstrip(" ?!.")
+    slots: List[Tuple[str, str]] = []
+
+    def replace(match: "re.Match") -> str:
+        kind = match.lastgroup
+        slots.append((kind, match.group(0).lstrip("@")))
+        return "{%s}" % kind
+
+    return _SLOT_PATTERN.sub(replace, text), slots
+
+
+def _extract(sql: str) -> Tuple[str, List[Any], List[str]]:
+    params: List[Any] = []
+    origins: List[str] = []
+
+    def replace(match: "re.Match") -> str:
+        if match.group("string") is not None:
+            literal = match.group("string")
+            if literal[0] in "Nn":
+                literal = literal[1:]
+            params.append(literal[1:-1].replace("''", "'"))
+            origins.append("string")
+            return "?"
+        if match.group("top") is not None:
+            params.append(int(match.group("top_value")))
+            origins.append("top")
+            return f"{match.group('top')}(?)"
+        number = match.group("number")
+        params.append(float(number) if "." in number else int(number))
+        origins.append("comparison")
+        return f"{match.group('op')}?"
+
+    return _LITERAL_PATTERN.sub(replace, sql), params, origins
+
+
+def extract_sql_literals(sql: str) -> Tuple[str, List[Any]]:
+    """
+    Retira os literais do SQL, substituindo-os por marcadores de parâmetro (?)
+
+    Args:
+        sql: Consulta SQL com literais
+
+    Returns:
+        Tupla (sql parametrizado, lista de parâmetros na ordem dos marcadores)
+    """
+    template_sql, params, _ = _extract(sql)
+    return template_sql, params
+
+
+def render_sql(sql: str, params: List[Any]) -> str:
+    """Reconstrói o SQL com os literais embutidos (apenas para exibição e logs)"""
+    values = iter(params)
+
+    def literal(_: "re.Match") -> str:
+        value = next(values)
+        if isinstance(value, str):
+            return "'" + value.replace("'", "''") + "'"
+        return str(value)
+
+    return re.sub(r"\?", literal, sql)
+
+
+def _slot_value(slots: List[Tuple[str, str]], kind: str, index: int) -> str:
+    return [value for slot_kind, value in slots if slot_kind == kind][index]
+
+
+def _find_slot(slots: List[Tuple[str, str]], kind: str, predicate) -> Optional[int]:
+    values = [value for slot_kind, value in slots if slot_kind == kind]
+    for index, value in enumerate(values):
+        if predicate(value):
+            return index
+    return None
+
+
+def _build_recipe(param: Any, origin: str, slots: List[Tuple[str, str]]) -> Dict[str, Any]:
+    """Descreve como recalcular um parâmetro a partir dos slots de uma nova pergunta"""
+    # Comparações com 0/1 são flags (ex.: Ativo = 1) e nunca vêm de números da pergunta
+    if isinstance(param, int) and (origin == "top" or param not in (0, 1)):
+        index = _find_slot(slots, "NUMBER", lambda value: int(value) == param)
+        if index is not None:
+            return {"kind": "slot", "slot": "NUMBER", "index": index}
+        return {"kind": "const", "value": param}
+
+    if isinstance(param, str):
+        date_match = _DATE_LITERAL.match(param)
+        if date_match:
+            year, month, day, suffix = date_match.groups()
+            last_day = calendar.monthrange(int(year), int(month))[1]
+            offset = 0
+            month_index = _find_slot(slots, "MONTH", lambda value: MONTHS[value] == int(month))
+            if month_index is None and int(day) == 1:
+                # Limite superior exclusivo (< primeiro dia do mês seguinte): relativo ao mês da pergunta
+                previous = int(month) - 1 or 12
+                month_index = _find_slot(slots, "MONTH", lambda value: MONTHS[value] == previous)
+                if month_index is not None:
+                    offset = 1
+                    year = str(int(year) - 1) if previous == 12 else year
+            year_index = _find_slot(slots, "YEAR", lambda value: value == year)
+            return {
+                "kind": "date",
+                "year": {"slot": year_index} if year_index is not None else {"value": int(year)},
+                "month": {"slot": month_index} if month_index is not None else {"value": int(month)},
+                "offset": offset,
+                "day": "start" if int(day) == 1 else "end" if int(day) == last_day else int(day),
+                "suffix": suffix
+            }
+
+        domain_index = _find_slot(slots, "DOMAIN", lambda value: value and value in param)
+        if domain_index is not None:
+            domain = _slot_value(slots, "DOMAIN", domain_index)
+            return {"kind": "format", "slot": "DOMAIN", "index": domain_index,
+                    "pattern": param.replace(domain, "{value}")}
+
+    return {"kind": "const", "value": param}
+
+
+def _apply_recipe(recipe: Dict[str, Any], slots: List[Tuple[str, str]]) -> Any:
+    kind = recipe["kind"]
+    if kind == "const":
+        return recipe["value"]
+    if kind == "slot":
+        return int(_slot_value(slots, recipe["slot"], recipe["index"]))
+    if kind == "format":
+        return recipe["pattern"].replace("{value}", _slot_value(slots, recipe["slot"], recipe["index"]))
+    if kind == "date":
+        year_spec, month_spec = recipe["year"], recipe["month"]
+        year = int(_slot_value(slots, "YEAR", year_spec["slot"])) if "slot" in year_spec else year_spec["value"]
+        month = MONTHS[_slot_value(slots, "MONTH", month_spec["slot"])] if "slot" in month_spec else month_spec["value"]
+        month += recipe.get("offset", 0)
+        if month > 12:
+            year, month = year + 1, month - 12
+        day = recipe["day"]
+        if day == "start":
+            day = 1
+        elif day == "end":
+            day = calendar.monthrange(year, month)[1]
+        return f"{year:04d}-{month:02d}-{day:02d}{recipe['suffix']}"
+    raise ValueError(f"Tipo de receita desconhecido: {kind}")
+
+
+class TemplateStore:
+    """
+    Armazena templates de SQL parametrizado indexados pelo formato da pergunta.
+
+    Uma pergunta nova com o mesmo formato de uma já atendida só precisa ter seus
+    literais extraídos localmente; o SQL do template é executado com os novos
+    parâmetros, sem chamada ao LLM.
+    """
+
+    def __init__(self, config: Dict[str, Any] = None):
+        self.config = config or TEMPLATE_CONFIG
+        self.max_templates = self.config.get("max_templates", 1000)
+        self._lock = threading.Lock()
+        self._templates: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def learn(self, question: str, sql: str, query_type: str = "sql",
+              intent_data: Dict[str, Any] = None) -> bool:
+        """
+        Registra o template derivado de um par pergunta→SQL validado
+
+        Returns:
+            True se o template foi registrado, False se os literais do SQL não
+            puderam ser relacionados com segurança aos valores da pergunta
+        """
+        shape, slots = question_shape(question)
+        if not slots:
+            return False
+
+        template_sql, params, origins = _extract(sql)
+        recipes = [_build_recipe(param, origin, slots) for param, origin in zip(params, origins)]
+
+        # Um literal de texto constante que contém um valor da pergunta indica dependência não mapeada
+        slot_values = [value for _, value in slots if len(value) >= 3]
+        for recipe in recipes:
+            if (recipe["kind"] == "const" and isinstance(recipe["value"], str)
+                    and any(value in recipe["value"] for value in slot_values)):
+                logger.debug(f"Template descartado, literal não mapeado: {recipe['value']!r}")
+                return False
+
+        # Datas com ano ou mês fixos em uma pergunta que informa ano/mês gerariam intervalos vazios ou invertidos
+        kinds = [kind for kind, _ in slots]
+        for recipe in recipes:
+            if recipe["kind"] == "date" and any(
+                    "value" in recipe[part] and slot_kind in kinds
+                    for part, slot_kind in (("year", "YEAR"), ("month", "MONTH"))):
+                logger.debug(f"Template descartado, data sem relação com a pergunta: {recipe}")
+                return False
+
+        # Todo valor da pergunta precisa alimentar algum parâmetro e não pode ter ficado embutido no SQL
+        used = {(recipe["slot"], recipe["index"]) for recipe in recipes if "slot" in recipe}
+        for recipe in recipes:
+            if recipe["kind"] == "date":
+                used.update(("YEAR" if part == "year" else "MONTH", recipe[part]["slot"])
+                            for part in ("year", "month") if "slot" in recipe[part])
+        for position, (kind, value) in enumerate(slots):
+            if (kind, kinds[:position].count(kind)) not in used:
+                logger.debug(f"Template descartado, valor da pergunta não usado como parâmetro: {value!r}")
+                return False
+            if re.search(r"\b%s\b" % re.escape(value), template_sql, re.IGNORECASE):
+                return False
+
+        try:
+            if [_apply_recipe(recipe, slots) for recipe in recipes] != params:
+                return False
+        except (ValueError, IndexError, KeyError):
+            return False
+
+        with self._lock:
+            self._templates[shape] = {
+                "sql": template_sql,
+                "recipes": recipes,
+                "query_type": query_type,
+                "intent_data": intent_data or {},
+                "source_question": question
+            }
+            self._templates.move_to_end(shape)
+            while len(self._templates) > self.max_templates:
+                self._templates.popitem(last=False)
+        logger.info(f"Template registrado para o formato: {shape}")
+        return True
+
+    def match(self, question: str) -> Optional[Dict[str, Any]]:
+        """
+        Procura um template para o formato da pergunta e calcula os parâmetros
+
+        Returns:
+            Dicionário com sql (parametrizado), params, query_type, intent_data e
+            source_question, ou None
+        """
+        shape, slots = question_shape(question)
+        with self._lock:
+            template = self._templates.get(shape)
+            if template is None:
+                return None
+            self._templates.move_to_end(shape)
+
+        try:
+            params = [_apply_recipe(recipe, slots) for recipe in template["recipes"]]
+        except (ValueError, IndexError, KeyError) as e:
+            logger.warning(f"Falha ao aplicar template para '{question}': {str(e)}")
+            return None
+
+        logger.info(f"Template reutilizado para '{question}' (origem: '{template['source_question']}')")
+        return {
+            "sql": template["sql"],
+            "params": params,
+            "query_type": template["query_type"],
+            "intent_data": template["intent_data"],
+            "source_question": template["source_question"]
+        }
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._templates)
@@ -0,0 +1,116 @@
+"""
+Servidor HTTP local que simula as APIs internas, para testes e benchmarks offline
+"""
+
+import argparse
+import hashlib
+import json
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List, Tuple
+from urllib.parse import urlsplit, parse_qs
+
+SAMPLE_CADASTROS = [
+    {"Id": 1, "Nome": "João Silva", "Email": "joao@email.com", "DataInclusao": "2023-04-01T10:30:00", "Status": "Ativo"},
+    {"Id": 2, "Nome": "Maria Souza", "Email": "maria@email.com", "DataInclusao": "2023-05-05T14:20:00", "Status": "Ativo"},
+    {"Id": 3, "Nome": "Pedro Santos", "Email": "pedro@gmail.com", "DataInclusao": "2023-05-10T09:15:00", "Status": "Ativo"},
+    {"Id": 4, "Nome": "Ana Lima", "Email": "ana@email.com", "DataInclusao": "2023-06-02T08:00:00", "Status": "Inativo"}
+]
+
+
+def _filter_cadastros(params: Dict[str, str]) -> List[Dict[str, Any]]:
+    rows = SAMPLE_CADASTROS
+    if params.get("nome"):
+        rows = [row for row in rows if params["nome"].lower() in row["Nome"].lower()]
+    if params.get("email"):
+        rows = [row for row in rows if row["Email"] == params["email"]]
+    if params.get("status"):
+        rows = [row for row in rows if row["Status"].lower() == params["status"].lower()]
+    if params.get("dataInclusao"):
+        rows = [row for row in rows if row["DataInclusao"] >= params["dataInclusao"]]
+    return rows
+
+
+class StubAPIHandler(BaseHTTPRequestHandler):
+    """Responde /api/cadastro com dados fixos, ETag e Last-Modified"""
+
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+    last_modified = formatdate(time.time(), usegmt=True)
+    stats = {"requests": 0, "not_modified": 0}
+    stats_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes = b"", headers: Dict[str, str] = None) -> None:
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        with self.stats_lock:
+            self.stats["requests"] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        url = urlsplit(self.path)
+        if url.path != "/api/cadastro":
+            self._send(404, b'{"erro": "Endpoint inexistente"}', {"Content-Type": "application/json"})
+            return
+
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        body = json.dumps(_filter_cadastros(params), ensure_ascii=False).encode("utf-8")
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        headers = {"ETag": etag, "Last-Modified": self.last_modified}
+
+        if self.headers.get("If-None-Match") == etag:
+            with self.stats_lock:
+                self.stats["not_modified"] += 1
+            self._send(304, headers=headers)
+            return
+        headers["Content-Type"] = "application/json; charset=utf-8"
+        self._send(200, body, headers)
+
+
+def start_stub_server(port: int = 0, latency: float = 0.0) -> Tuple[ThreadingHTTPServer, threading.Thread]:
+    """
+    Inicia o servidor em uma thread de fundo
+
+    Args:
+        port: Porta local (0 escolhe uma porta livre)
+        latency: Atraso artificial por requisição, em segundos
+
+    Returns:
+        Servidor e thread; use server.shutdown() para encerrar
+    """
+    handler = type("ConfiguredStubAPIHandler", (StubAPIHandler,), {
+        "latency": latency,
+        "stats": {"requests": 0, "not_modified": 0},
+        "stats_lock": threading.Lock()
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="stub-api-server", daemon=True)
+    thread.start()
+    return server, thread
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor local que simula as APIs internas")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--latency", type=float, default=0.0, help="Atraso por requisição (segundos)")
+    args = parser.parse_args()
+
+    server, thread = start_stub_server(args.port, args.latency)
+    print(f"Servidor de APIs simulado em http://127.0.0.1:{server.server_address[1]}/api/cadastro")
+    try:
+        thread.join()
+    except KeyboardInterrupt:
+        server.shutdown()
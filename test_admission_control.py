@@ -0,0 +1,128 @@
+"""
+Testes para o controle de admissão e descarte de carga
+"""
+
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+
+from admission_control import AdaptiveLimiter, AdmissionController, Overloaded
+from intelligence_agent import IntelligenceAgent
+
+CONFIG = {"initial_limit": 4, "min_limit": 1, "max_limit": 32, "max_queue": 2, "max_queue_wait_seconds": 0.1,
+          "tolerance": 1.5, "smoothing": 0.5, "backoff_ratio": 0.5, "baseline_window": 100}
+
+
+class TestAdaptiveLimiter(unittest.TestCase):
+
+    def test_full_queue_is_rejected_fast(self):
+        """Testar recusa imediata com a fila cheia e recusa após a espera máxima na fila"""
+        limiter = AdaptiveLimiter("request", dict(CONFIG, initial_limit=1, max_queue=0))
+        limiter.acquire()
+        started = time.perf_counter()
+        with self.assertRaises(Overloaded):
+            limiter.acquire()
+        self.assertLess(time.perf_counter() - started, 0.05)
+
+        limiter = AdaptiveLimiter("request", dict(CONFIG, initial_limit=1))
+        limiter.acquire()
+        with self.assertRaises(Overloaded):
+            limiter.acquire()
+        stats = limiter.get_stats()
+        self.assertEqual((stats["timed_out"], stats["queue_depth"], stats["inflight"]), (1, 0, 1))
+
+    def test_queued_request_runs_after_release(self):
+        """Testar que a requisição na fila ocupa a vaga liberada"""
+        limiter = AdaptiveLimiter("request", dict(CONFIG, initial_limit=1, max_queue_wait_seconds=2))
+        limiter.acquire()
+        admitted = threading.Event()
+        waiter = threading.Thread(target=lambda: (limiter.acquire(), admitted.set()))
+        waiter.start()
+        time.sleep(0.05)
+        self.assertEqual(limiter.get_stats()["queue_depth"], 1)
+        limiter.release(0.01)
+        waiter.join(1)
+        self.assertTrue(admitted.is_set())
+        self.assertEqual(limiter.get_stats()["inflight"], 1)
+
+    def test_limit_follows_latency_gradient(self):
+        """Testar crescimento com latência estável, redução quando ela sobe e corte por descarte"""
+        limiter = AdaptiveLimiter("intent", CONFIG)
+        for _ in range(10):
+            for _ in range(4):
+                limiter.acquire()
+            for _ in range(4):
+                limiter.release(0.1)
+        grown = limiter.limit
+        self.assertGreater(grown, 4)
+
+        for _ in range(10):
+            limiter.acquire()
+            limiter.release(2.0)
+        self.assertLess(limiter.limit, grown / 2)
+
+        shrunk = limiter.limit
+        limiter.acquire()
+        limiter.release(0.1, dropped=True)
+        self.assertAlmostEqual(limiter.limit, max(1, shrunk * 0.5))
+
+
+class TestAgentAdmission(unittest.TestCase):
+
+    def setUp(self):
+        """Preparar ambiente para testes"""
+        self.agent = IntelligenceAgent()
+        self.agent.sql_cache = self.agent.answer_cache = None
+        self.agent.similarity_index = self.agent.template_store = self.agent.planner = None
+        self.agent.admission = AdmissionController(dict(CONFIG, stages={
+            "request": {"initial_limit": 2, "max_queue": 0}
+        }))
+        self.agent.analyzer = MagicMock()
+        self.agent.analyzer.analyze_intent.side_effect = lambda *args: (time.sleep(0.3), ("sql", {}))[1]
+        self.agent.query_generator = MagicMock()
+        self.agent.query_generator.generate_sql_query.return_value = "SELECT 1"
+        self.agent.executor = MagicMock()
+        self.agent.executor.execute_query.return_value = {"result": [{"Total": 1}], "error": None}
+        self.agent.result_processor = MagicMock()
+        self.agent.result_processor.process_result.return_value = "Resposta"
+
+    def test_overload_is_shed_fast(self):
+        """Testar recusa rápida acima do limite e métricas das filas, sem afetar as admitidas"""
+        def ask(index):
+            started = time.perf_counter()
+            return self.agent.process_query(f"pergunta {index}"), time.perf_counter() - started
+
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            answers = list(pool.map(ask, range(6)))
+
+        served = [result for result, _ in answers if result["response"] == "Resposta"]
+        shed = [(result, elapsed) for result, elapsed in answers if result.get("overloaded")]
+        self.assertEqual(len(served), 2)
+        self.assertEqual(len(shed), 4)
+        for result, elapsed in shed:
+            self.assertEqual((result["overloaded"], result["degraded"]), ("request", "unavailable"))
+            self.assertIn("sobrecarregado", result["error"])
+            self.assertLess(elapsed, 0.2)
+
+        metrics = self.agent.get_metrics()["admission"]
+        self.assertEqual(metrics["request"]["rejected"], 4)
+        self.assertEqual(metrics["intent"]["admitted"], 2)
+        self.assertEqual(metrics["request"]["inflight"], 0)
+
+    def test_cached_answer_when_overloaded(self):
+        """Testar resposta em cache para perguntas já respondidas quando a requisição é recusada"""
+        self.agent.answer_cache = MagicMock()
+        self.agent.answer_cache.get.return_value = {"response": "Resposta anterior", "generated_query": "SELECT 1",
+                                                    "answered_at": 0}
+        self.agent.admission = AdmissionController(dict(CONFIG, initial_limit=1, max_queue=0))
+        self.agent.admission.acquire("request")
+
+        result = self.agent.process_query("pergunta")
+        self.assertEqual((result["response"], result["degraded"]), ("Resposta anterior", "cached"))
+        self.agent.analyzer.analyze_intent.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+"""
+Testes para os agregados locais de Cadastro
+"""
+
+import datetime
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from aggregate_cache import AggregateCache
+from executor_agent import ExecutorAgent
+
+TODAY = datetime.date(2024, 3, 15)
+
+
+def _row(cadastro_id, ativo, inclusao, alteracao=None):
+    return (cadastro_id, ativo, datetime.datetime.combine(inclusao, datetime.time(10, 30)), alteracao)
+
+
+class FakeRegistry:
+    """Registro com um único banco cujo cursor devolve as linhas configuradas"""
+
+    default = "default"
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.executed = []
+
+    def pool(self, name):
+        registry = self
+        pool = MagicMock()
+        connection = MagicMock()
+        pool.connection.return_value.__enter__.return_value = connection
+        cursor = MagicMock()
+        connection.cursor.return_value.__enter__.return_value = cursor
+
+        def execute(sql, params=None):
+            registry.executed.append((sql, params))
+            cursor.pending = list(registry.rows)
+
+        def fetchmany(size):
+            batch, cursor.pending = cursor.pending[:size], cursor.pending[size:]
+            return batch
+
+        cursor.execute.side_effect = execute
+        cursor.fetchmany.side_effect = fetchmany
+        return pool
+
+
+class TestAggregateCache(unittest.TestCase):
+
+    def setUp(self):
+        """Preparar ambiente para testes"""
+        self.registry = FakeRegistry([
+            _row(1, True, TODAY),
+            _row(2, False, TODAY),
+            _row(3, True, datetime.date(2024, 3, 1)),
+            _row(4, True, datetime.date(2024, 2, 10)),
+            _row(5, False, datetime.date(2023, 12, 31)),
+        ])
+        config = {"max_staleness_seconds": 0, "rebuild_seconds": 3600, "watermark_overlap_seconds": 60,
+                  "fetch_batch": 2}
+        self.cache = AggregateCache(self.registry, config=config, today=lambda: TODAY)
+        self.cache.refresh()
+
+    def test_counts_by_status_and_day(self):
+        """Testar contagens por Ativo e por dia de inclusão"""
+        self.assertEqual(self.cache.answer("SELECT COUNT(*) AS Total FROM Cadastro WITH (NOLOCK) WHERE Ativo = 1"),
+                         [{"Total": 3}])
+        self.assertEqual(self.cache.answer(
+            "SELECT COUNT(*) AS Total FROM Cadastro WITH (NOLOCK) "
+            "WHERE CONVERT(date, DataInclusao) = CONVERT(date, GETDATE())"), [{"Total": 2}])
+        self.assertEqual(self.cache.answer(
+            "SELECT COUNT(*) FROM Cadastro WHERE DataInclusao >= ? AND DataInclusao < ?",
+            ["2024-03-01", "2024-04-01"]), [{"": 3}])
+
+    def test_breakdowns(self):
+        """Testar quebras por Ativo e por mês com ordenação"""
+        rows = self.cache.answer("SELECT Ativo, COUNT(*) AS Total FROM Cadastro WITH (NOLOCK) "
+                                 "GROUP BY Ativo ORDER BY Total DESC")
+        self.assertEqual(rows, [{"Ativo": True, "Total": 3}, {"Ativo": False, "Total": 2}])
+        rows = self.cache.answer(
+            "SELECT YEAR(DataInclusao) AS Ano, MONTH(DataInclusao) AS Mes, COUNT(*) AS Total "
+            "FROM Cadastro c WITH (NOLOCK) WHERE c.Ativo = 1 "
+            "GROUP BY YEAR(c.DataInclusao), MONTH(c.DataInclusao) ORDER BY Ano, Mes")
+        self.assertEqual(rows, [{"Ano": 2024, "Mes": 2, "Total": 1}, {"Ano": 2024, "Mes": 3, "Total": 2}])
+
+    def test_unsupported_queries_fall_back(self):
+        """Testar que consultas fora do formato suportado vão para o banco"""
+        executed = len(self.registry.executed)
+        for sql in ("SELECT * FROM Cadastro WHERE Ativo = 1",
+                    "SELECT COUNT(*) FROM Cadastro WHERE DataInclusao >= DATEADD(day, -7, GETDATE())",
+                    "SELECT COUNT(*) FROM Cadastro WHERE Ativo = 1 OR Nome LIKE 'A%'",
+                    "SELECT COUNT(*) FROM Cadastro c JOIN Endereco e ON e.CadastroId = c.CadastroId"):
+            self.assertIsNone(self.cache.answer(sql), sql)
+        self.assertEqual(len(self.registry.executed), executed)
+
+    def test_incremental_refresh_applies_changes(self):
+        """Testar que a atualização lê só as alterações e move a linha entre os baldes"""
+        sql = "SELECT Ativo, COUNT(*) AS Total FROM Cadastro GROUP BY Ativo ORDER BY Ativo"
+        self.cache.answer(sql)
+        changed_at = datetime.datetime(2024, 3, 15, 12, 0)
+        self.registry.rows = [_row(1, False, TODAY, changed_at), _row(6, True, TODAY, changed_at)]
+
+        rows = self.cache.answer(sql)
+        self.assertEqual(rows, [{"Ativo": False, "Total": 3}, {"Ativo": True, "Total": 3}])
+        incremental_sql, params = self.registry.executed[-1]
+        self.assertIn("DataAlteracao >= ?", incremental_sql)
+        self.assertEqual(params[0], datetime.datetime(2024, 3, 15, 10, 29))
+
+        # Reler as mesmas linhas (sobreposição da marca d'água) não duplica contagens
+        self.assertEqual(self.cache.answer(sql), rows)
+        self.assertEqual(self.cache.get_stats()["full_refreshes"], 1)
+
+    def test_build_runs_off_the_request_path(self):
+        """Testar que a primeira carga roda em segundo plano e a conexão recebe o orçamento da etapa"""
+        cache = AggregateCache(self.registry, config={"max_staleness_seconds": 0, "fetch_batch": 2},
+                               today=lambda: TODAY)
+        sql = "SELECT COUNT(*) AS Total FROM Cadastro WITH (NOLOCK) WHERE Ativo = 1"
+        self.assertIsNone(cache.answer(sql, timeout=2.5))
+        for _ in range(100):
+            if not cache.get_stats()["building"]:
+                break
+            time.sleep(0.01)
+        self.assertEqual(cache.answer(sql, timeout=2.5), [{"Total": 3}])
+        self.assertEqual(cache.get_stats()["incremental_refreshes"], 1)
+
+        pool = MagicMock()
+        self.registry.pool = lambda name: pool
+        cache.answer(sql, timeout=2.5)
+        pool.connection.assert_called_once_with(2.5)
+        self.assertEqual(pool.connection.return_value.__enter__.return_value.timeout, 3)
+
+    def test_executor_uses_local_aggregates(self):
+        """Testar que o executor responde pelos agregados sem consultar o banco"""
+        agent = ExecutorAgent({"max_rows": 100}, registry=self.registry, aggregates=self.cache)
+        self.cache.refresh()
+        self.cache.max_staleness = 3600
+        executed = len(self.registry.executed)
+
+        result = agent.execute_query("sql", "SELECT COUNT(*) AS Total FROM Cadastro WITH (NOLOCK) WHERE Ativo = ?", [0])
+        self.assertTrue(result["local_aggregate"])
+        self.assertEqual(result["result"], [{"Total": 2}])
+        self.assertEqual(len(self.registry.executed), executed)
+
+
+if __name__ == '__main__':
+    unittest.main()
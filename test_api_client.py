@@ -0,0 +1,112 @@
+"""
+Testes para o cliente de APIs, usando o servidor simulado local
+"""
+
+import threading
+import time
+import unittest
+
+from api_client import APIClient
+from executor_agent import ExecutorAgent
+from stub_api_server import start_stub_server
+
+REFERENCES = {
+    "endpoints": {
+        "/api/cadastro": {
+            "metodos": ["GET", "POST"],
+            "parametros": {"nome": "", "email": "", "status": "", "dataInclusao": ""}
+        }
+    }
+}
+
+
+class TestAPIClient(unittest.TestCase):
+
+    def setUp(self):
+        """Preparar ambiente para testes"""
+        self.server, _ = start_stub_server()
+        self.config = {"host": "127.0.0.1", "port": self.server.server_address[1], "base_url": "/api",
+                       "per_host_limit": 2, "fan_out_workers": 4}
+        self.client = APIClient(REFERENCES, self.config)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_execute_with_filters(self):
+        """Testar chamada real com filtros"""
+        rows = self.client.execute({"endpoint": "/api/cadastro", "params": {"status": "Inativo"}})
+        self.assertEqual([row["Nome"] for row in rows], ["Ana Lima"])
+
+    def test_validation(self):
+        """Testar rejeição de endpoint, método e parâmetro fora das referências"""
+        with self.assertRaises(ValueError):
+            self.client.execute({"endpoint": "/api/financeiro"})
+        with self.assertRaises(ValueError):
+            self.client.execute({"endpoint": "/api/cadastro", "method": "DELETE"})
+        with self.assertRaises(ValueError):
+            self.client.execute({"endpoint": "/api/cadastro", "params": {"senha": "x"}})
+        self.assertEqual(self.server.RequestHandlerClass.stats["requests"], 0)
+
+    def test_conditional_cache(self):
+        """Testar revalidação com ETag e reaproveitamento do corpo em 304"""
+        call = {"endpoint": "/api/cadastro", "params": {"status": "Ativo"}}
+        first = self.client.execute(call)
+        second = self.client.execute(call)
+        self.assertEqual(first, second)
+        self.assertEqual(self.server.RequestHandlerClass.stats["not_modified"], 1)
+        self.assertEqual(self.client.get_stats()["not_modified"], 1)
+
+    def test_execute_many_respects_host_limit(self):
+        """Testar execução paralela limitada por host e ordem dos resultados"""
+        active = {"current": 0, "max": 0}
+        lock = threading.Lock()
+        original_get = self.client.session.get
+
+        def tracked_get(*args, **kwargs):
+            with lock:
+                active["current"] += 1
+                active["max"] = max(active["max"], active["current"])
+            time.sleep(0.05)
+            try:
+                return original_get(*args, **kwargs)
+            finally:
+                with lock:
+                    active["current"] -= 1
+
+        self.client.session.get = tracked_get
+        calls = [{"endpoint": "/api/cadastro", "params": {"status": status}}
+                 for status in ("Ativo", "Inativo", "Ativo", "Inativo")]
+        results = self.client.execute_many(calls)
+        self.assertEqual([len(rows) for rows in results], [3, 1, 3, 1])
+        self.assertLessEqual(active["max"], 2)
+
+
+class TestExecutorAPI(unittest.TestCase):
+
+    def test_executor_uses_api_client(self):
+        """Testar que o executor usa o cliente de API real"""
+        server, _ = start_stub_server()
+        try:
+            config = {"host": "127.0.0.1", "port": server.server_address[1], "base_url": "/api"}
+            client = APIClient(REFERENCES, config)
+            agent = ExecutorAgent({"api_references": REFERENCES}, api_client=client)
+            result = agent.execute_query("api", {"calls": [
+                {"endpoint": "/api/cadastro", "params": {"nome": "maria"}},
+                {"endpoint": "/api/cadastro", "params": {"email": "pedro@gmail.com"}}
+            ]})
+            self.assertIsNone(result["error"])
+            self.assertEqual(result["result"][0][0]["Nome"], "Maria Souza")
+            self.assertEqual(result["result"][1][0]["Id"], 3)
+
+            result = agent.execute_query("api", {"endpoint": "/api/inexistente"})
+            self.assertIn("Endpoint não suportado", result["error"])
+            client.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+"""
+Testes para os backends de cache (LRU em memória e SQLite compartilhado)
+"""
+
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from cache_backend import LRUCache, SQLiteCache, create_cache
+from executor_agent import ExecutorAgent
+
+SQLITE_CONFIG = {"busy_timeout": 5.0, "lease_seconds": 5.0, "poll_interval": 0.01, "touch_seconds": 0,
+                 "evict_every": 1}
+
+
+def _concurrent_compute(caches, key="k"):
+    """Chama get_or_compute ao mesmo tempo em várias threads e conta os cálculos"""
+    calls = []
+    start = threading.Barrier(len(caches))
+    results = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.1)
+        return {"linhas": [1, 2, 3]}
+
+    def worker(cache):
+        start.wait()
+        results.append(cache.get_or_compute(key, compute))
+
+    threads = [threading.Thread(target=worker, args=(cache,)) for cache in caches]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return calls, results
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_ttl_and_eviction(self):
+        """Testar expiração por TTL e descarte da entrada usada há mais tempo"""
+        cache = LRUCache("teste", ttl=0.05, max_entries=2)
+        cache.set("a", 1)
+        cache.set("b", 2, ttl=0)
+        self.assertEqual(cache.get("a"), 1)
+        cache.set("c", 3)
+        self.assertIsNone(cache.get("b"))
+        time.sleep(0.06)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get_stats()["evictions"], 1)
+
+    def test_single_computation(self):
+        """Testar que chamadas concorrentes da mesma chave calculam uma única vez"""
+        cache = LRUCache("teste")
+        calls, results = _concurrent_compute([cache] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{"linhas": [1, 2, 3]}] * 5)
+
+    def test_errors_and_rejected_values_are_not_cached(self):
+        """Testar que exceções e valores recusados por should_cache não são gravados"""
+        cache = LRUCache("teste")
+        with self.assertRaises(ValueError):
+            cache.get_or_compute("k", lambda: (_ for _ in ()).throw(ValueError("falha")))
+        self.assertEqual(cache.get_or_compute("k", lambda: "grande", should_cache=lambda value: False), "grande")
+        self.assertEqual(len(cache), 0)
+
+
+class TestSQLiteCache(unittest.TestCase):
+
+    def setUp(self):
+        """Preparar ambiente para testes"""
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "cache.sqlite3")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_shared_between_instances(self):
+        """Testar que um valor gravado por um worker é lido por outro, com TTL"""
+        writer = SQLiteCache("nl_sql", self.path, ttl=60, config=SQLITE_CONFIG)
+        reader = SQLiteCache("nl_sql", self.path, ttl=60, config=SQLITE_CONFIG)
+        writer.set("quantos cadastros", {"sql": "SELECT COUNT(*) FROM Cadastro"})
+        writer.set("expira", "x", ttl=0.05)
+        self.assertEqual(reader.get("quantos cadastros"), {"sql": "SELECT COUNT(*) FROM Cadastro"})
+        # Namespaces são independentes no mesmo arquivo
+        self.assertIsNone(SQLiteCache("answer", self.path, config=SQLITE_CONFIG).get("quantos cadastros"))
+        time.sleep(0.06)
+        self.assertIsNone(reader.get("expira"))
+
+    def test_eviction_by_size(self):
+        """Testar limite de entradas, descartando a usada há mais tempo"""
+        cache = SQLiteCache("teste", self.path, max_entries=2, config=SQLITE_CONFIG)
+        cache.set("a", 1)
+        time.sleep(0.01)
+        cache.set("b", 2)
+        time.sleep(0.01)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+
+    def test_single_computation_across_workers(self):
+        """Testar que workers com conexões próprias calculam a mesma chave uma única vez"""
+        caches = [SQLiteCache("teste", self.path, config=SQLITE_CONFIG) for _ in range(4)]
+        calls, results = _concurrent_compute(caches)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{"linhas": [1, 2, 3]}] * 4)
+
+    def test_create_cache(self):
+        """Testar escolha do backend e namespaces desabilitados"""
+        config = dict(SQLITE_CONFIG, backend="sqlite", sqlite_path=self.path,
+                      namespaces={"answer": {"ttl_seconds": 10, "max_entries": 5}, "sql_result": {"enabled": False}})
+        cache = create_cache("answer", config)
+        self.assertIsInstance(cache, SQLiteCache)
+        self.assertEqual(cache.max_entries, 5)
+        self.assertIsNone(create_cache("sql_result", config))
+        self.assertIsInstance(create_cache("answer", dict(config, backend="memory")), LRUCache)
+
+
+class TestExecutorResultCache(unittest.TestCase):
+
+    def test_repeated_query_hits_cache(self):
+        """Testar que a mesma consulta com os mesmos parâmetros não volta ao banco"""
+        registry = MagicMock()
+        registry.default = "cache-db"
+        agent = ExecutorAgent({"timeout": 30}, registry=registry, aggregates=MagicMock(database="outro"),
+                              result_cache=LRUCache("sql_result"))
+        agent._execute_sql = MagicMock(return_value=[{"Total": 3}])
+        sql = "SELECT COUNT(*) AS Total FROM Cadastro WHERE Ativo = ?"
+
+        self.assertEqual(agent.execute_query("sql", sql, [1])["result"], [{"Total": 3}])
+        self.assertEqual(agent.execute_query("sql", sql, [1])["result"], [{"Total": 3}])
+        agent.execute_query("sql", sql, [0])
+        self.assertEqual(agent._execute_sql.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
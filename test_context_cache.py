@@ -0,0 +1,106 @@
+"""
+Testes para o cache de contexto do prefixo estático dos prompts
+"""
+
+import unittest
+
+from config import SCHEDULER_CONFIG
+from context_cache import ContextCache
+from llm_scheduler import LLMScheduler
+from llm_stub import StubCacheAPI, StubLLMClient
+from query_generator import QueryGenerator
+
+CONFIG = {"ttl_seconds": 600, "renew_margin_seconds": 60, "min_tokens": 10, "retry_seconds": 120}
+SYSTEM = "INSTRUÇÕES GERAIS:\n1. Use o formato SQL Server"
+SCHEMA = {"Cadastro": {"campos": [{"nome": f"Campo{i}", "tipo": "varchar", "descricao": "Campo do cadastro"}
+                                  for i in range(40)]}}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FailingAPI:
+    def create(self, *args):
+        raise RuntimeError("caching indisponível para o modelo")
+
+
+class TestContextCache(unittest.TestCase):
+
+    def setUp(self):
+        """Preparar ambiente para testes"""
+        self.clock = Clock()
+        self.api = StubCacheAPI(self.clock)
+        self.cache = ContextCache(self.api, CONFIG, clock=self.clock)
+
+    def test_registered_once_and_renewed_before_expiry(self):
+        """Testar registro único por versão e renovação dentro da margem"""
+        name = self.cache.handle("modelo", SYSTEM, "Esquema: {...}" * 10, "sql")
+        self.assertEqual(self.cache.handle("modelo", SYSTEM, "Esquema: {...}" * 10, "sql"), name)
+        self.assertEqual(self.api.operations["create"], 1)
+
+        self.clock.now += 550
+        self.assertEqual(self.cache.handle("modelo", SYSTEM, "Esquema: {...}" * 10, "sql"), name)
+        self.assertEqual(self.api.operations["update"], 1)
+        self.assertEqual(self.api.contents[name]["expires_at"], self.clock.now + 600)
+
+    def test_new_data_version_replaces_handle(self):
+        """Testar que um novo esquema registra outro handle e remove o anterior"""
+        old = self.cache.handle("modelo", SYSTEM, "Esquema: v1" * 10, "sql")
+        new = self.cache.handle("modelo", SYSTEM, "Esquema: v2" * 10, "sql")
+        self.assertNotEqual(old, new)
+        self.assertNotIn(old, self.api.contents)
+        # Cada modelo tem o próprio handle
+        self.assertNotEqual(self.cache.handle("outro", SYSTEM, "Esquema: v2" * 10, "sql"), new)
+
+    def test_unavailable_cache_falls_back(self):
+        """Testar prefixo abaixo do mínimo e falha na criação sem interromper as chamadas"""
+        self.assertIsNone(self.cache.handle("modelo", "curto", "", "sql"))
+        cache = ContextCache(FailingAPI(), CONFIG, clock=self.clock)
+        self.assertIsNone(cache.handle("modelo", SYSTEM, "Esquema" * 20, "sql"))
+        self.assertIsNone(cache.handle("modelo", SYSTEM, "Esquema" * 20, "sql"))
+        self.assertEqual(cache.get_stats()["errors"], 1)
+
+
+class TestStubBilling(unittest.TestCase):
+
+    def _generator(self, context_cache):
+        generator = QueryGenerator({"model_name": "teste", "db_schema": SCHEMA, "sql_instructions": {}})
+        generator.llm_client = StubLLMClient(scheduler=LLMScheduler(dict(SCHEDULER_CONFIG, max_retries=0)),
+                                             first_token_latency=0, chunk_latency=0, router=None,
+                                             context_cache=context_cache)
+        return generator
+
+    def test_cached_prefix_reduces_billed_tokens(self):
+        """Testar economia de tokens cobrados e fallback transparente com handle expirado no provedor"""
+        clock = Clock()
+        api = StubCacheAPI(clock)
+        cached = self._generator(ContextCache(api, CONFIG, clock=clock))
+        plain = self._generator(ContextCache(api, dict(CONFIG, min_tokens=10 ** 9), clock=clock))
+        questions = ["quantos cadastros ativos hoje", "quantos inativos", "quantos no último mês"]
+        for question in questions:
+            self.assertTrue(cached.generate_sql_query(question, {}).startswith("SELECT"))
+            plain.generate_sql_query(question, {})
+
+        usage, baseline = cached.llm_client.token_usage(), plain.llm_client.token_usage()
+        # Um registro por modelo escolhido pelo roteador, não por chamada
+        models = len(cached.llm_client.model_calls)
+        self.assertEqual(api.operations["create"], models)
+        self.assertEqual(usage["input"] + usage["cached"], baseline["input"])
+        self.assertLess(usage["billed"], baseline["billed"] * 0.6)
+        self.assertGreater(usage["saved_ratio"], 0.4)
+
+        # Removido no provedor: a chamada refaz com o prompt completo e a seguinte registra de novo
+        api.contents.clear()
+        self.assertTrue(cached.generate_sql_query("quantos cadastros", {}).startswith("SELECT"))
+        self.assertEqual(cached.llm_client.context_cache.get_stats()["fallbacks"], 1)
+        cached.generate_sql_query("quantos cadastros", {})
+        self.assertEqual(api.operations["create"], models + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
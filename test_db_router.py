@@ -0,0 +1,195 @@
+"""
+Testes para o roteamento entre múltiplos bancos e os pools de conexão
+"""
+
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from connection_pool import ConnectionPool
+from db_router import DatabaseRegistry, route_query, merge_results, extract_tables
+from executor_agent import ExecutorAgent
+
+SCHEMA = {
+    "Cadastro": {"nome": "Cadastro", "databases": ["sp", "rj", "mg"]},
+    "Endereco": {"nome": "Endereco", "databases": ["sp", "rj"]},
+    "Auditoria": {"nome": "Auditoria"}
+}
+
+
+class FakeConnection:
+    """Conexão simulada que devolve linhas fixas por banco"""
+
+    def __init__(self, description, rows, delay=0.0):
+        self.description = description
+        self.rows = rows
+        self.delay = delay
+        self.closed = False
+
+    def cursor(self):
+        connection = self
+        cursor = MagicMock()
+        cursor.__enter__.return_value = cursor
+        cursor.description = connection.description
+
+        def fetchmany(size):
+            time.sleep(connection.delay)
+            return connection.rows[:size]
+
+        cursor.fetchmany.side_effect = fetchmany
+        return cursor
+
+    def close(self):
+        self.closed = True
+
+
+class TestRouting(unittest.TestCase):
+
+    def test_extract_tables(self):
+        """Testar extração de tabelas de FROM/JOIN"""
+        sql = "SELECT * FROM dbo.[Cadastro] c WITH (NOLOCK) JOIN Endereco e ON e.CadastroId = c.CadastroId"
+        self.assertEqual(extract_tables(sql), ["Cadastro", "Endereco"])
+
+    def test_route_by_schema(self):
+        """Testar roteamento pelos bancos declarados no esquema"""
+        self.assertEqual(route_query("SELECT * FROM Cadastro", SCHEMA, "default"), ["sp", "rj", "mg"])
+        self.assertEqual(route_query("SELECT * FROM Cadastro c JOIN Endereco e ON 1 = 1", SCHEMA, "default"),
+                         ["sp", "rj"])
+        self.assertEqual(route_query("SELECT * FROM Auditoria", SCHEMA, "default"), ["default"])
+
+    def test_route_without_common_database(self):
+        """Testar erro quando as tabelas não coexistem em um banco"""
+        with self.assertRaises(ValueError):
+            route_query("SELECT * FROM Cadastro c JOIN Auditoria a ON 1 = 1", SCHEMA, "default")
+
+
+class TestMergeResults(unittest.TestCase):
+
+    def test_concat_sort_and_top(self):
+        """Testar concatenação, reordenação e TOP"""
+        partials = [
+            [{"Nome": "Ana", "DataInclusao": "2023-05-03"}, {"Nome": "Bia", "DataInclusao": "2023-05-01"}],
+            [{"Nome": "Caio", "DataInclusao": "2023-05-04"}, {"Nome": "Davi", "DataInclusao": None}]
+        ]
+        rows = merge_results("SELECT TOP 3 * FROM Cadastro WITH (NOLOCK) ORDER BY DataInclusao DESC", partials)
+        self.assertEqual([row["Nome"] for row in rows], ["Caio", "Ana", "Bia"])
+
+    def test_parameterized_top_and_max_rows(self):
+        """Testar TOP (?) parametrizado e limite de linhas"""
+        partials = [[{"Id": i} for i in range(5)], [{"Id": i} for i in range(5, 10)]]
+        self.assertEqual(len(merge_results("SELECT TOP (?) * FROM Cadastro ORDER BY Id", partials, params=[7])), 7)
+        self.assertEqual(len(merge_results("SELECT * FROM Cadastro", partials, max_rows=4)), 4)
+
+    def test_top_placeholder_position(self):
+        """Testar TOP (?) resolvido pela posição do marcador, ignorando subconsultas e literais"""
+        partials = [[{"Id": i} for i in range(5)], [{"Id": i} for i in range(5, 10)]]
+        sql = ("WITH Recentes AS (SELECT TOP 1 Id FROM Cadastro WHERE Nome <> '?' AND Ativo = ?) "
+               "SELECT TOP (?) * FROM Cadastro WHERE Id NOT IN (SELECT Id FROM Recentes) ORDER BY Id")
+        self.assertEqual(len(merge_results(sql, partials, params=[1, 6])), 6)
+
+    def test_count_is_reaggregated(self):
+        """Testar reagregação de COUNT/SUM/MIN/MAX sem GROUP BY"""
+        partials = [[{"": 10, "Primeiro": "2023-01-02"}], [{"": 5, "Primeiro": "2023-01-01"}]]
+        rows = merge_results("SELECT COUNT(*), MIN(DataInclusao) AS Primeiro FROM Cadastro WITH (NOLOCK)", partials)
+        self.assertEqual(rows, [{"": 15, "Primeiro": "2023-01-01"}])
+
+    def test_compound_aggregate_is_not_reaggregated(self):
+        """Testar que expressões com agregações são apenas concatenadas"""
+        partials = [[{"Media": 10}], [{"Media": 20}]]
+        rows = merge_results("SELECT SUM(Valor)/COUNT(*) AS Media FROM Pedido", partials, 100, [])
+        self.assertEqual(rows, [{"Media": 10}, {"Media": 20}])
+        partials = [[{"Ativo": True, "Faixa": 3, "Total": 2}], [{"Ativo": True, "Faixa": 1, "Total": 4}]]
+        rows = merge_results("SELECT Ativo, MAX(Id) - MIN(Id) AS Faixa, COUNT(*) + 1 AS Total FROM Cadastro "
+                             "GROUP BY Ativo", partials)
+        self.assertEqual(len(rows), 2)
+        rows = merge_results("SELECT Ativo, COUNT(*) [Total] FROM Cadastro GROUP BY Ativo",
+                             [[{"Ativo": True, "Total": 2}], [{"Ativo": True, "Total": 4}]])
+        self.assertEqual(rows, [{"Ativo": True, "Total": 6}])
+
+    def test_group_by_is_reaggregated(self):
+        """Testar reagregação com GROUP BY"""
+        partials = [
+            [{"Ativo": True, "Total": 3}, {"Ativo": False, "Total": 1}],
+            [{"Ativo": True, "Total": 2}]
+        ]
+        rows = merge_results(
+            "SELECT Ativo, COUNT(*) AS Total FROM Cadastro WITH (NOLOCK) GROUP BY Ativo ORDER BY Total DESC",
+            partials
+        )
+        self.assertEqual(rows, [{"Ativo": True, "Total": 5}, {"Ativo": False, "Total": 1}])
+
+    def test_avg_is_not_reaggregated(self):
+        """Testar que AVG não é recombinado incorretamente"""
+        partials = [[{"Media": 2}], [{"Media": 4}]]
+        self.assertEqual(len(merge_results("SELECT AVG(Idade) AS Media FROM Cadastro", partials)), 2)
+
+
+class TestConnectionPool(unittest.TestCase):
+
+    def test_reuse_and_discard(self):
+        """Testar reaproveitamento e descarte de conexões"""
+        created = []
+        pool = ConnectionPool("sp", "DSN=sp", size=2, connect=lambda dsn: created.append(MagicMock()) or created[-1])
+
+        with pool.connection() as first:
+            pass
+        with pool.connection() as second:
+            pass
+        self.assertIs(first, second)
+
+        with self.assertRaises(RuntimeError):
+            with pool.connection():
+                raise RuntimeError("falha na consulta")
+        self.assertTrue(created[0].close.called)
+        self.assertEqual(pool.get_stats()["discarded"], 1)
+
+    def test_pool_size_limit(self):
+        """Testar limite de conexões simultâneas"""
+        pool = ConnectionPool("sp", "DSN=sp", size=1, timeout=0.05, connect=lambda dsn: MagicMock())
+        with pool.connection():
+            with self.assertRaises(TimeoutError):
+                with pool.connection():
+                    pass
+
+
+class TestExecutorFanOut(unittest.TestCase):
+
+    def test_fan_out_runs_concurrently_and_merges(self):
+        """Testar execução paralela em vários bancos com resultado combinado"""
+        description = [("", int)]
+        counts = {"sp": 10, "rj": 20, "mg": 30}
+
+        def connect(connection_string):
+            database = connection_string.split("DATABASE=")[1].split(";")[0]
+            return FakeConnection(description, [(counts[database],)], delay=0.1)
+
+        registry = DatabaseRegistry(
+            {name: {"server": "localhost", "database": name} for name in counts},
+            connect=connect
+        )
+        agent = ExecutorAgent({"db_schema": SCHEMA, "max_rows": 1000}, registry=registry)
+
+        start = time.time()
+        result = agent.execute_query("sql", "SELECT COUNT(*) FROM Cadastro WITH (NOLOCK)")
+        elapsed = time.time() - start
+
+        self.assertIsNone(result["error"])
+        self.assertEqual(result["databases"], ["sp", "rj", "mg"])
+        self.assertEqual(result["result"], [{"": 60}])
+        self.assertFalse(result["truncated"])
+        self.assertLess(elapsed, 0.25)
+
+    def test_explicit_database(self):
+        """Testar execução em um banco informado explicitamente, com o corte em max_rows sinalizado"""
+        registry = DatabaseRegistry(
+            {"sp": {"server": "localhost", "database": "sp"}},
+            connect=lambda connection_string: FakeConnection([("Id", int)], [(1,), (2,)])
+        )
+        agent = ExecutorAgent({"db_schema": SCHEMA, "max_rows": 1}, registry=registry)
+        result = agent.execute_query("sql", "SELECT Id FROM Cadastro", databases="sp")
+        self.assertEqual(list(result["result"]), [{"Id": 1}])
+        self.assertTrue(result["truncated"])
+
+
+if __name__ == '__main__':
+    unittest.main()
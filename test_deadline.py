@@ -0,0 +1,177 @@
+"""
+Testes para o prazo por requisição, os disjuntores e as respostas degradadas
+"""
+
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from config import SCHEDULER_CONFIG
+from deadline import CircuitBreaker, CircuitOpenError, Deadline, DeadlineExceeded, get_breaker
+from executor_agent import ExecutorAgent
+from intelligence_agent import IntelligenceAgent
+from llm_scheduler import LLMScheduler
+from llm_stub import StubLLMClient
+from model_router import ModelRouter
+
+SQL = "SELECT * FROM Cadastro WITH (NOLOCK) WHERE Ativo = 1"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestDeadline(unittest.TestCase):
+
+    def test_budget_flows_to_later_stages(self):
+        """Testar divisão do tempo restante entre as etapas que faltam"""
+        clock = FakeClock()
+        deadline = Deadline(10.0, {"intent": 1.0, "sql": 1.0, "execute": 2.0, "answer": 1.0}, clock)
+        self.assertAlmostEqual(deadline.stage_timeout("intent"), 2.0)
+        clock.now += 0.5
+        # A etapa anterior terminou cedo: as seguintes recebem o que sobrou
+        self.assertAlmostEqual(deadline.stage_timeout("sql"), 9.5 / 4)
+        self.assertAlmostEqual(deadline.stage_timeout("answer"), 9.5)
+        clock.now += 10
+        with self.assertRaises(DeadlineExceeded):
+            deadline.stage_timeout("execute")
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def test_open_half_open_close(self):
+        """Testar abertura após falhas seguidas, chamada de teste e fechamento"""
+        clock = FakeClock()
+        breaker = CircuitBreaker("llm", failure_threshold=2, reset_timeout=5.0, clock=clock)
+        breaker.record_failure()
+        breaker.allow()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+        with self.assertRaises(CircuitOpenError):
+            breaker.allow()
+
+        clock.now += 5
+        breaker.allow()  # chamada de teste
+        with self.assertRaises(CircuitOpenError):
+            breaker.allow()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+
+        clock.now += 5
+        breaker.allow()
+        breaker.record_success()
+        self.assertEqual(breaker.state, "closed")
+
+    def test_expired_deadline_releases_probe(self):
+        """Testar que prazo esgotado durante a chamada de teste não deixa o disjuntor aberto para sempre"""
+        clock = FakeClock()
+        breaker = get_breaker("llm:teste-meio-aberto")
+        breaker.clock = clock
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure()
+        clock.now += breaker.reset_timeout
+        client = StubLLMClient(scheduler=LLMScheduler(dict(SCHEDULER_CONFIG, max_retries=0)), router=None,
+                               first_token_latency=0, chunk_latency=0)
+
+        def expire(chunks):
+            raise DeadlineExceeded("answer")
+
+        with self.assertRaises(DeadlineExceeded):
+            client.generate("answer", "sistema", "Pergunta do usuário: x", model="teste-meio-aberto",
+                            consume=expire)
+        with self.assertRaises(DeadlineExceeded):
+            client.generate("answer", "sistema", "Pergunta do usuário: x", model="teste-meio-aberto",
+                            timeout=0)
+        self.assertEqual(breaker.state, "half_open")
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, "closed")
+
+
+class TestCancellation(unittest.TestCase):
+
+    def test_llm_stream_is_cancelled(self):
+        """Testar que o stream é abandonado quando o orçamento da etapa termina"""
+        router = ModelRouter({"models": {"default": "lento-deadline"}, "routes": {"moderate": ["default"]},
+                              "slo_seconds": {}})
+        client = StubLLMClient(scheduler=LLMScheduler(dict(SCHEDULER_CONFIG, max_retries=0)), router=router,
+                               first_token_latency=1.0, chunk_latency=0)
+        start = time.monotonic()
+        with self.assertRaises(DeadlineExceeded):
+            client.generate("answer", "sistema", "Pergunta do usuário: x", timeout=0.1)
+        self.assertLess(time.monotonic() - start, 0.5)
+
+    def test_db_timeout_trips_breaker(self):
+        """Testar timeout do cursor, erro de indisponibilidade e disjuntor do banco"""
+        registry = MagicMock()
+        registry.default = "deadline-db"
+        conn = MagicMock()
+        registry.pool.return_value.connection.return_value.__enter__.return_value = conn
+        conn.cursor.return_value.__enter__.return_value.execute.side_effect = \
+            Exception("HYT00", "[HYT00] Query timeout expired")
+        agent = ExecutorAgent({"timeout": 30}, registry=registry, aggregates=MagicMock(database="outro"))
+
+        result = agent.execute_query("sql", SQL, timeout=2.5)
+        self.assertTrue(result["unavailable"])
+        self.assertEqual(conn.timeout, 3)
+        registry.pool.return_value.connection.assert_called_with(2.5)
+
+        breaker = get_breaker("db:deadline-db")
+        for _ in range(breaker.failure_threshold):
+            agent.execute_query("sql", SQL)
+        calls = registry.pool.return_value.connection.call_count
+        result = agent.execute_query("sql", SQL)
+        self.assertIn("Disjuntor aberto", result["error"])
+        self.assertEqual(registry.pool.return_value.connection.call_count, calls)
+
+
+class TestDegradedAnswers(unittest.TestCase):
+
+    def setUp(self):
+        """Preparar ambiente para testes"""
+        agent = IntelligenceAgent()
+        agent.similarity_index = agent.template_store = agent.traffic_recorder = agent.sql_cache = None
+        agent.analyzer = MagicMock()
+        agent.analyzer.analyze_intent.return_value = ("sql", {"entities": ["Cadastro"]})
+        agent.query_generator = MagicMock()
+        agent.query_generator.generate_sql_query.return_value = SQL
+        agent.executor = MagicMock()
+        agent.executor.execute_query.return_value = {"result": [{"Id": 1}, {"Id": 2}], "error": None}
+        agent.result_processor = MagicMock()
+        self.agent = agent
+
+    def test_sql_only_answer_when_llm_times_out(self):
+        """Testar resposta local quando a etapa de resposta estoura o prazo"""
+        self.agent.result_processor.process_result.side_effect = DeadlineExceeded("answer")
+        result = self.agent.process_query("Quais cadastros ativos?")
+        self.assertEqual(result["degraded"], "sql_only")
+        self.assertIn("Registros encontrados: 2", result["response"])
+        self.assertIsNone(result["error"])
+
+    def test_cached_answer_when_dependency_unavailable(self):
+        """Testar uso da última resposta completa quando o LLM está indisponível"""
+        self.agent.result_processor.process_result.return_value = "Há 2 cadastros ativos."
+        self.agent.process_query("Quais cadastros ativos?")
+
+        self.agent.analyzer.analyze_intent.side_effect = CircuitOpenError("llm:modelo", 10.0)
+        result = self.agent.process_query("quais cadastros ativos")
+        self.assertEqual(result["degraded"], "cached")
+        self.assertEqual(result["response"], "Há 2 cadastros ativos.")
+
+    def test_stage_budgets_are_passed(self):
+        """Testar que cada etapa recebe um orçamento dentro do prazo da requisição"""
+        self.agent.result_processor.process_result.return_value = "ok"
+        self.agent.process_query("Quais cadastros ativos?", timeout=6.0)
+        intent_budget = self.agent.analyzer.analyze_intent.call_args[0][2]
+        execute_budget = self.agent.executor.execute_query.call_args[1]["timeout"]
+        self.assertLess(intent_budget, 6.0)
+        self.assertLess(execute_budget, 6.0)
+        self.assertGreater(execute_budget, intent_budget)
+
+
+if __name__ == '__main__':
+    unittest.main()
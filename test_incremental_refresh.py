@@ -0,0 +1,155 @@
+"""
+Testes para a atualização incremental de resultados pela marca d'água de DataAlteracao
+"""
+
+import datetime
+import unittest
+from unittest.mock import MagicMock
+
+from executor_agent import ExecutorAgent
+from incremental_refresh import IncrementalPlan, IncrementalResults
+
+SCHEMA = {
+    "Cadastro": {"campos": [
+        {"nome": "CadastroId", "is_primary_key": True},
+        {"nome": "Nome"}, {"nome": "Ativo"}, {"nome": "DataInclusao"}, {"nome": "DataAlteracao"}
+    ]},
+    "Log": {"campos": [{"nome": "Mensagem"}]}
+}
+SQL = "SELECT CadastroId, Nome FROM Cadastro WITH (NOLOCK) WHERE Ativo = ? ORDER BY Nome"
+CONFIG = {"min_refresh_seconds": 0, "rebuild_seconds": 3600, "watermark_overlap_seconds": 60,
+          "max_results": 8, "fetch_batch": 2, "change_columns": ["DataAlteracao", "DataInclusao"]}
+BASE = datetime.datetime(2024, 3, 15, 10, 0)
+
+
+class FakeTable:
+    """Registro com uma tabela Cadastro; o cursor avalia `Ativo = ?` e a marca d'água em Python"""
+
+    default = "default"
+
+    def __init__(self):
+        self.rows = {}
+        self.executed = []
+
+    def put(self, cadastro_id, nome, ativo, minutes):
+        self.rows[cadastro_id] = {"CadastroId": cadastro_id, "Nome": nome, "Ativo": ativo,
+                                  "Changed": BASE + datetime.timedelta(minutes=minutes)}
+
+    def pool(self, name):
+        table = self
+        pool = MagicMock()
+        connection = MagicMock()
+        pool.connection.return_value.__enter__.return_value = connection
+        cursor = MagicMock()
+        connection.cursor.return_value.__enter__.return_value = cursor
+
+        def execute(sql, params=None):
+            table.executed.append((sql, params))
+            delta = "_Matches" in sql
+            description = [("CadastroId", int), ("Nome", str), ("_RowKey", int), ("_Changed", datetime.datetime)]
+            if delta:
+                description.append(("_Matches", int))
+            cursor.description = description
+            pending = []
+            for row in table.rows.values():
+                matches = row["Ativo"] == params[0]
+                if delta and row["Changed"] >= params[1]:
+                    pending.append((row["CadastroId"], row["Nome"], row["CadastroId"], row["Changed"], int(matches)))
+                elif not delta and matches:
+                    pending.append((row["CadastroId"], row["Nome"], row["CadastroId"], row["Changed"]))
+            cursor.pending = pending
+
+        def fetchmany(size):
+            batch, cursor.pending = cursor.pending[:size], cursor.pending[size:]
+            return batch
+
+        cursor.execute.side_effect = execute
+        cursor.fetchmany.side_effect = fetchmany
+        return pool
+
+
+class TestIncrementalPlan(unittest.TestCase):
+
+    def test_queries_keep_the_predicate(self):
+        """Testar consultas completa e incremental com o mesmo predicado e as colunas auxiliares"""
+        plan = IncrementalPlan("SELECT c.Nome FROM Cadastro c WITH (NOLOCK) WHERE c.Ativo = ?", SCHEMA, CONFIG)
+        self.assertEqual(plan.full_sql, "SELECT c.Nome, c.CadastroId AS _RowKey, "
+                                        "COALESCE(c.DataAlteracao, c.DataInclusao) AS _Changed "
+                                        "FROM Cadastro c WITH (NOLOCK) WHERE c.Ativo = ?")
+        self.assertIn("CASE WHEN c.Ativo = ? THEN 1 ELSE 0 END AS _Matches", plan.delta_sql)
+        self.assertTrue(plan.delta_sql.endswith("WHERE (c.DataAlteracao >= ? OR c.DataInclusao >= ?)"))
+
+    def test_unsupported_queries(self):
+        """Testar que agregações, junções, janelas sobre a hora e tabelas sem chave ficam de fora"""
+        results = IncrementalResults(FakeTable(), SCHEMA, CONFIG)
+        for sql in ["SELECT COUNT(*) FROM Cadastro",
+                    "SELECT a.Nome FROM Cadastro a JOIN Log b ON a.CadastroId = b.CadastroId",
+                    "SELECT Nome FROM Cadastro WHERE DataInclusao >= DATEADD(day, -7, GETDATE())",
+                    "SELECT Mensagem FROM Log"]:
+            self.assertIsNone(results.plan(sql), sql)
+        plan = results.plan("SELECT Nome FROM Cadastro WHERE DataInclusao >= CAST(GETDATE() AS date)")
+        self.assertTrue(plan.day_dependent)
+
+
+class TestIncrementalResults(unittest.TestCase):
+
+    def setUp(self):
+        """Preparar ambiente para testes"""
+        self.table = FakeTable()
+        self.table.put(1, "Carla", True, 0)
+        self.table.put(2, "Ana", True, 5)
+        self.table.put(3, "Bruno", False, 10)
+        self.results = IncrementalResults(self.table, SCHEMA, CONFIG)
+
+    def test_merges_inserts_updates_and_rows_that_no_longer_match(self):
+        """Testar mescla das linhas alteradas desde a marca d'água, mantendo o ORDER BY"""
+        columns, rows, mode = self.results.fetch(SQL, [True], "default", 5, 100)
+        self.assertEqual((columns, rows, mode), (["CadastroId", "Nome"], [(2, "Ana"), (1, "Carla")], "full"))
+
+        self.table.put(3, "Bruno", True, 20)   # passa a atender
+        self.table.put(1, "Carla", False, 21)  # deixa de atender
+        self.table.put(2, "Alice", True, 22)   # atualizada
+        self.table.put(4, "Davi", True, 23)    # incluída
+        _, rows, mode = self.results.fetch(SQL, [True], "default", 5, 100)
+        self.assertEqual(mode, "delta")
+        self.assertEqual(rows, [(2, "Alice"), (3, "Bruno"), (4, "Davi")])
+
+        sql, params = self.table.executed[-1]
+        self.assertIn("_Matches", sql)
+        # Somente as alterações desde a maior DataAlteracao vista (10h05), recuada pela margem
+        since = BASE + datetime.timedelta(minutes=4)
+        self.assertEqual(params, [True, since, since])
+
+    def test_large_results_are_not_kept(self):
+        """Testar que resultados acima do limite de linhas são devolvidos sem ficar guardados"""
+        _, rows, mode = self.results.fetch(SQL, [True], "default", 5, 1)
+        self.assertEqual((len(rows), mode), (1, "truncated"))
+        self.assertEqual(self.results.get_stats()["results"], 0)
+
+
+class TestExecutorIncremental(unittest.TestCase):
+
+    def test_execute_query_incremental(self):
+        """Testar modo incremental no executor, com políticas aplicadas na saída"""
+        table = FakeTable()
+        table.put(1, "Ana", True, 0)
+        results = IncrementalResults(table, SCHEMA, CONFIG)
+        policy = MagicMock()
+        policy.name = "analista"
+        policy.role.return_value = policy
+        policy.view.return_value.columns = ["CadastroId"]
+        policy.view.return_value.apply.side_effect = lambda rows: [row[:1] for row in rows]
+        agent = ExecutorAgent({"max_rows": 100}, registry=table, aggregates=MagicMock(database="outro"),
+                              result_cache=MagicMock(), policy=policy, incremental=results)
+
+        result = agent.execute_query("sql", SQL, [True], incremental=True)
+        self.assertEqual((result["result"], result["incremental"]), ([{"CadastroId": 1}], "full"))
+        table.put(2, "Bruno", True, 30)
+        result = agent.execute_query("sql", SQL, [True], incremental=True)
+        self.assertEqual((result["result"], result["incremental"]), ([{"CadastroId": 1}, {"CadastroId": 2}],
+                                                                     "delta"))
+        agent.result_cache.get_or_compute.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+"""
+Testes para a leitura incremental de JSON em streaming
+"""
+
+import unittest
+from unittest.mock import patch
+
+from json_stream import IncrementalJSONParser, consume_json_object
+from llm_client import LLMClient
+from config import SCHEDULER_CONFIG
+from llm_scheduler import LLMScheduler, LLMRequestError
+
+
+def split_chunks(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class TestIncrementalJSONParser(unittest.TestCase):
+
+    def test_object_split_across_chunks(self):
+        """Testar objeto dividido em trechos arbitrários"""
+        text = '```json\n{"type": "sql", "entities": ["Cadastro"], "conditions": {"status": "Ativo"}}\n```'
+        for size in (1, 3, 7, len(text)):
+            parser = IncrementalJSONParser()
+            value = None
+            for chunk in split_chunks(text, size):
+                value = parser.feed(chunk)
+                if parser.done:
+                    break
+            self.assertEqual(value["conditions"], {"status": "Ativo"})
+
+    def test_braces_inside_strings(self):
+        """Testar chaves e aspas escapadas dentro de strings"""
+        parser = IncrementalJSONParser()
+        parser.feed('{"fields": ["a}b", "c\\"}{"], ')
+        self.assertFalse(parser.done)
+        self.assertEqual(parser.feed('"type": "api"}'), {"fields": ["a}b", 'c"}{'], "type": "api"})
+
+    def test_stray_brace_in_prose(self):
+        """Testar texto com chave solta antes do JSON"""
+        parser = IncrementalJSONParser()
+        self.assertEqual(parser.feed('Segue {resposta}: {"type": "sql"}'), {"type": "sql"})
+
+    def test_incomplete_stream(self):
+        """Testar stream encerrado sem objeto completo"""
+        with self.assertRaises(ValueError):
+            consume_json_object(iter(['{"type": ', '"sql"']))
+
+
+class TestEarlyTermination(unittest.TestCase):
+
+    def test_stream_is_closed_after_object(self):
+        """Testar que o stream é encerrado assim que o objeto fecha"""
+        consumed = []
+        closed = []
+
+        def fake_stream(system_instruction, user_content, model=None):
+            try:
+                for chunk in ['{"type": ', '"sql"}', '\nExplicação longa...', ' mais texto']:
+                    consumed.append(chunk)
+                    yield chunk
+            finally:
+                closed.append(True)
+
+        client = LLMClient(scheduler=LLMScheduler(dict(SCHEDULER_CONFIG, max_retries=0)), api_key="teste")
+        with patch.object(client, "stream", side_effect=fake_stream):
+            value = client.generate("intent", "sistema", "consulta", consume=consume_json_object)
+
+        self.assertEqual(value, {"type": "sql"})
+        self.assertEqual(len(consumed), 2)
+        self.assertEqual(closed, [True])
+
+    def test_invalid_stream_raises_llm_error(self):
+        """Testar erro definitivo quando não há JSON na resposta"""
+        client = LLMClient(scheduler=LLMScheduler(dict(SCHEDULER_CONFIG, max_retries=0)), api_key="teste")
+        with patch.object(client, "stream", return_value=iter(["sem json"])):
+            with self.assertRaises(LLMRequestError):
+                client.generate("intent", "sistema", "consulta", consume=consume_json_object)
+
+
+if __name__ == '__main__':
+    unittest.main()
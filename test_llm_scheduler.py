@@ -0,0 +1,177 @@
+"""
+Testes para o agendador de requisições ao LLM
+"""
+
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from llm_scheduler import (
+    LLMScheduler, LLMRequestError, TokenBucket, PRIORITY_INTERACTIVE, PRIORITY_BATCH
+)
+
+
+class QuotaError(Exception):
+    """Erro simulado de cota excedida"""
+    code = 429
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_time_until_after_consume(self):
+        """Testar tempo de espera após esgotar o balde"""
+        bucket = TokenBucket(60)  # 1 ficha por segundo
+        bucket.consume(60)
+        wait = bucket.time_until(2)
+        self.assertGreater(wait, 1.5)
+        self.assertLessEqual(wait, 2.0)
+
+    def test_request_larger_than_capacity(self):
+        """Testar pedido maior que a capacidade do balde"""
+        bucket = TokenBucket(10)
+        self.assertEqual(bucket.time_until(1000), 0.0)
+
+
+class TestLLMScheduler(unittest.TestCase):
+
+    def setUp(self):
+        """Preparar ambiente para testes"""
+        self.config = {
+            "requests_per_minute": 6000,
+            "tokens_per_minute": 1000000,
+            "expected_output_tokens": 10,
+            "stage_concurrency": {"intent": 1, "sql": 2, "answer": 2},
+            "max_retries": 3,
+            "backoff_base": 0.001,
+            "backoff_max": 0.01,
+            "retryable_status_codes": [429, 503]
+        }
+        self.scheduler = LLMScheduler(self.config)
+
+    def test_submit_returns_result(self):
+        """Testar execução simples"""
+        result = self.scheduler.submit("intent", lambda: "ok")
+        self.assertEqual(result, "ok")
+        metrics = self.scheduler.get_metrics()
+        self.assertEqual(metrics["completed"], 1)
+        self.assertEqual(metrics["queue_depth_total"], 0)
+
+    def test_retry_on_quota_error(self):
+        """Testar nova tentativa em erro de cota"""
+        calls = []
+
+        def flaky():
+            calls.append(1)
+            if len(calls) < 3:
+                raise QuotaError("RESOURCE_EXHAUSTED")
+            return "ok"
+
+        self.assertEqual(self.scheduler.submit("sql", flaky), "ok")
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(self.scheduler.get_metrics()["retries"], 2)
+
+    def test_non_retryable_error_raises(self):
+        """Testar que erros não transitórios não são repetidos"""
+        calls = []
+
+        def broken():
+            calls.append(1)
+            raise ValueError("resposta inválida")
+
+        with self.assertRaises(LLMRequestError) as ctx:
+            self.scheduler.submit("sql", broken)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(ctx.exception.stage, "sql")
+        self.assertEqual(self.scheduler.get_metrics()["failed"], 1)
+
+    def test_retries_exhausted(self):
+        """Testar falha definitiva após esgotar as tentativas"""
+        def always_fails():
+            raise QuotaError("quota")
+
+        with self.assertRaises(LLMRequestError) as ctx:
+            self.scheduler.submit("answer", always_fails)
+        self.assertEqual(ctx.exception.attempts, self.config["max_retries"] + 1)
+
+    def test_backoff_is_bounded(self):
+        """Testar limites do backoff com jitter"""
+        for attempt in range(1, 10):
+            delay = self.scheduler._backoff_delay(attempt)
+            self.assertGreaterEqual(delay, 0)
+            self.assertLessEqual(delay, self.config["backoff_max"])
+
+    def test_stage_concurrency_cap(self):
+        """Testar limite de concorrência por etapa"""
+        active = []
+        peak = []
+        lock = threading.Lock()
+
+        def work():
+            with lock:
+                active.append(1)
+                peak.append(len(active))
+            time.sleep(0.02)
+            with lock:
+                active.pop()
+            return True
+
+        threads = [threading.Thread(target=self.scheduler.submit, args=("intent", work)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(max(peak), 1)
+
+    def test_interactive_before_batch(self):
+        """Testar que consultas interativas passam à frente das consultas em lote"""
+        order = []
+        release = threading.Event()
+
+        def blocker():
+            release.wait(1)
+            return True
+
+        def record(name):
+            order.append(name)
+            return name
+
+        holder = threading.Thread(target=self.scheduler.submit, args=("intent", blocker))
+        holder.start()
+        time.sleep(0.02)
+
+        batch = threading.Thread(target=self.scheduler.submit,
+                                 args=("intent", lambda: record("batch")),
+                                 kwargs={"priority": PRIORITY_BATCH})
+        batch.start()
+        time.sleep(0.02)
+        interactive = threading.Thread(target=self.scheduler.submit,
+                                       args=("intent", lambda: record("interactive")),
+                                       kwargs={"priority": PRIORITY_INTERACTIVE})
+        interactive.start()
+        time.sleep(0.02)
+
+        self.assertEqual(self.scheduler.get_metrics()["queue_depth"], {"intent": 2})
+        release.set()
+        for thread in (holder, batch, interactive):
+            thread.join()
+
+        self.assertEqual(order, ["interactive", "batch"])
+
+    def test_request_rate_limit_waits(self):
+        """Testar espera imposta pelo limite de requisições por minuto"""
+        config = dict(self.config, requests_per_minute=60)  # 1 requisição por segundo
+        scheduler = LLMScheduler(config)
+        scheduler.request_bucket.tokens = 1
+
+        with patch.object(scheduler._cond, "wait", wraps=scheduler._cond.wait) as mock_wait:
+            scheduler.submit("sql", lambda: 1)
+            mock_wait.assert_not_called()
+            scheduler.request_bucket.updated -= 0.95  # quase uma ficha reabastecida
+            scheduler.submit("sql", lambda: 2)
+            self.assertTrue(mock_wait.called)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+"""
+Testes para o pipeline de logging não bloqueante
+"""
+
+import logging
+import queue
+import unittest
+from unittest.mock import MagicMock
+
+from log_pipeline import NonBlockingQueueHandler, log_payload
+
+
+class TestNonBlockingQueueHandler(unittest.TestCase):
+
+    def setUp(self):
+        """Preparar ambiente para testes"""
+        self.queue = queue.Queue(maxsize=2)
+        self.handler = NonBlockingQueueHandler(self.queue)
+        # Um logger por teste: o pytest anexa handlers próprios aos loggers já existentes sem propagação
+        self.logger = logging.getLogger(f"test_log_pipeline.handler.{self._testMethodName}")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.DEBUG)
+        self.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+
+    def test_full_queue_drops_without_blocking(self):
+        """Testar que a fila cheia descarta registros em vez de bloquear"""
+        for i in range(5):
+            self.logger.info("mensagem %s", i)
+        self.assertEqual(self.queue.qsize(), 2)
+        self.assertEqual(self.handler.dropped, 3)
+
+    def test_formatting_is_deferred(self):
+        """Testar que a mensagem só é formatada na thread que loga quando os argumentos são mutáveis"""
+        self.logger.info("consulta %s em %.2fs", "SELECT 1", 0.5)
+        record = self.queue.get_nowait()
+        self.assertEqual((record.msg, record.args), ("consulta %s em %.2fs", ("SELECT 1", 0.5)))
+
+        value = ["Cadastro", 3]
+        self.logger.info("conteúdo: %s", value)
+        value.append("alterado depois")
+        record = self.queue.get_nowait()
+        self.assertIsNone(record.args)
+        self.assertEqual(record.getMessage(), "conteúdo: ['Cadastro', 3]")
+
+    def test_errors_are_not_dropped(self):
+        """Testar que erros com a fila cheia esperam por espaço e depois são gravados diretamente"""
+        fallback = MagicMock(level=logging.NOTSET)
+        self.handler.error_block_seconds = 0.05
+        self.handler.fallback = [fallback]
+        for i in range(3):
+            self.logger.info("mensagem %s", i)
+        self.logger.error("erro com a fila cheia")
+        self.assertEqual(self.handler.dropped, 1)
+        fallback.handle.assert_called_once()
+        self.assertEqual(fallback.handle.call_args[0][0].getMessage(), "erro com a fila cheia")
+
+    def test_exception_text_is_kept(self):
+        """Testar que o traceback é preservado no registro enfileirado"""
+        try:
+            raise ValueError("falha")
+        except ValueError:
+            self.logger.error("erro", exc_info=True)
+        record = self.queue.get_nowait()
+        self.assertIsNone(record.exc_info)
+        self.assertIn("ValueError: falha", record.exc_text)
+
+
+class TestLogPayload(unittest.TestCase):
+
+    def setUp(self):
+        """Preparar ambiente para testes"""
+        self.queue = queue.Queue()
+        self.handler = NonBlockingQueueHandler(self.queue)
+        self.logger = logging.getLogger("test_log_pipeline.payload")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.DEBUG)
+        self.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+
+    def test_payload_is_truncated(self):
+        """Testar serialização e truncamento do conteúdo registrado"""
+        config = {"payload_level": "DEBUG", "payload_sample_rate": 1.0, "payload_max_chars": 10}
+        log_payload(self.logger, "Intenção", {"type": "sql", "entities": ["Cadastro"]}, config=config)
+        message = self.queue.get_nowait().getMessage()
+        self.assertTrue(message.startswith('Intenção: {"type": "... [+'))
+        self.assertTrue(message.endswith(" caracteres]"))
+
+    def test_disabled_level_and_sampling_skip(self):
+        """Testar que nível desabilitado ou amostragem zero não registram nada"""
+        self.logger.setLevel(logging.INFO)
+        log_payload(self.logger, "Prompt", "texto", config={"payload_level": "DEBUG"})
+        self.logger.setLevel(logging.DEBUG)
+        log_payload(self.logger, "Prompt", "texto", config={"payload_level": "DEBUG", "payload_sample_rate": 0.0})
+        self.assertTrue(self.queue.empty())
+
+
+if __name__ == '__main__':
+    unittest.main()
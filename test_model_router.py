@@ -0,0 +1,108 @@
+"""
+Testes para o roteamento de modelos por etapa e complexidade
+"""
+
+import unittest
+
+from config import SCHEDULER_CONFIG
+from llm_scheduler import LLMScheduler, PRIORITY_INTERACTIVE
+from llm_stub import StubLLMClient
+from model_router import ModelRouter, ModelTimeout, estimate_complexity
+
+SCHEMA = {
+    "Cadastro": {"nome": "Cadastro", "campos": [{"nome": "CadastroId"}, {"nome": "Ativo"}]},
+    "Endereco": {"nome": "Endereco", "campos": [{"nome": "EnderecoId"}, {"nome": "CadastroId"}]}
+}
+
+
+def _router(**overrides):
+    config = {
+        "models": {"fast": "rapido", "default": "padrao", "strong": "robusto"},
+        "routes": {"simple": ["fast", "default"], "moderate": ["default", "fast"], "complex": ["strong", "default"]},
+        "slo_seconds": {"intent": 0.05, "sql": 0.05, "answer": 0.05},
+        "timeout_factor": 1.0,
+        "window": 10,
+        "min_samples": 2,
+        "max_failure_rate": 0.5
+    }
+    config.update(overrides)
+    return ModelRouter(config)
+
+
+class TestComplexity(unittest.TestCase):
+
+    def test_levels(self):
+        """Testar níveis estimados a partir de tabelas, condições e tamanho do esquema"""
+        simple = estimate_complexity("quantos cadastros existem?", SCHEMA)
+        self.assertEqual(simple["level"], "simple")
+        self.assertEqual(simple["tables"], 1)
+
+        sql = ("SELECT c.Nome, COUNT(*) FROM Cadastro c JOIN Endereco e ON e.CadastroId = c.CadastroId "
+               "WHERE c.Ativo = 1 AND e.Cidade = 'SP' OR e.Cidade = 'RJ' GROUP BY c.Nome")
+        complex_ = estimate_complexity("cadastros ativos por cidade", SCHEMA, sql=sql)
+        self.assertEqual(complex_["level"], "complex")
+        self.assertEqual(complex_["tables"], 2)
+
+    def test_intent_conditions(self):
+        """Testar uso das condições da intenção na etapa de SQL"""
+        intent = {"entities": ["Cadastro"], "conditions": ["Ativo = 1", "DataInclusao >= hoje"]}
+        self.assertEqual(estimate_complexity("cadastros ativos de hoje", SCHEMA, intent)["conditions"], 2)
+
+
+class TestModelRouter(unittest.TestCase):
+
+    def test_candidates_follow_slo(self):
+        """Testar que um modelo fora do SLO deixa de ser a primeira escolha"""
+        router = _router()
+        self.assertEqual(router.candidates("intent", "simple"), ["rapido", "padrao"])
+        for _ in range(3):
+            router.record("rapido", "intent", 0.2)
+        self.assertEqual(router.candidates("intent", "simple"), ["padrao", "rapido"])
+        # A estatística é por etapa
+        self.assertEqual(router.candidates("sql", "simple"), ["rapido", "padrao"])
+
+    def test_fallback_on_timeout(self):
+        """Testar fallback para o próximo modelo quando o primeiro estoura o tempo"""
+        router = _router()
+        client = StubLLMClient(scheduler=LLMScheduler(dict(SCHEDULER_CONFIG, max_retries=0)), router=router,
+                               first_token_latency=0, chunk_latency=0,
+                               model_latencies={"robusto": 0.5, "padrao": 0.0})
+
+        answer = client.generate("answer", "sistema", "Pergunta do usuário: x\n\nResultados da consulta (2 ...)",
+                                 complexity="complex")
+        self.assertIn("registros", answer)
+        self.assertEqual(client.model_calls, {"robusto": 1, "padrao": 1})
+        # Cada tentativa ocupa uma vaga (e um token de RPM) do agendador
+        metrics = client.scheduler.get_metrics()
+        self.assertEqual((metrics["submitted"], metrics["completed"], metrics["failed"]), (2, 1, 1))
+        self.assertEqual(metrics["wait_time_by_priority"][PRIORITY_INTERACTIVE]["count"], 2)
+
+        stats = router.get_stats()
+        self.assertEqual(stats["robusto"]["answer"]["timeouts"], 1)
+        self.assertEqual(stats["padrao"]["answer"]["calls"], 1)
+        self.assertGreater(stats["padrao"]["answer"]["tokens_out"], 0)
+
+    def test_router_adapts_to_slow_model(self):
+        """Testar que, após timeouts repetidos, o modelo lento só é usado como fallback"""
+        router = _router()
+        client = StubLLMClient(scheduler=LLMScheduler(dict(SCHEDULER_CONFIG, max_retries=0)), router=router,
+                               first_token_latency=0, chunk_latency=0,
+                               model_latencies={"rapido": 0.3, "padrao": 0.0})
+        for _ in range(4):
+            client.generate("sql", "sistema", "Consulta do usuário: x\n\nGere uma consulta", complexity="simple")
+        self.assertEqual(client.model_calls["rapido"], 2)
+        self.assertEqual(client.model_calls["padrao"], 4)
+        self.assertEqual(router.candidates("sql", "simple")[0], "padrao")
+
+    def test_last_candidate_has_no_timeout(self):
+        """Testar que o último modelo da lista não é interrompido"""
+        router = _router(routes={"simple": ["fast"]})
+        client = StubLLMClient(scheduler=LLMScheduler(dict(SCHEDULER_CONFIG, max_retries=0)), router=router,
+                               first_token_latency=0, chunk_latency=0, model_latencies={"rapido": 0.1})
+        self.assertIn("intenção", client.generate("intent", "sistema", "Consulta: x", complexity="simple"))
+        self.assertEqual(router.get_stats()["rapido"]["intent"]["timeouts"], 0)
+        self.assertTrue(issubclass(ModelTimeout, Exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
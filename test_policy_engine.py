@@ -0,0 +1,118 @@
+"""
+Testes para as políticas de acesso aplicadas aos resultados
+"""
+
+import unittest
+from unittest.mock import MagicMock
+
+from agent_initializer import AgentInitializer
+from db_router import DatabaseRegistry
+from executor_agent import ExecutorAgent
+from policy_engine import PolicyEngine, mask_card, mask_email, mask_phone
+
+POLICIES = {
+    "perfil_padrao": "atendimento",
+    "mascaras": {
+        "email": {"colunas": ["Email"]},
+        "telefone": {"colunas": ["Celular"]},
+        "cartao": {"colunas": ["Cartao"]}
+    },
+    "perfis": {
+        "admin": {"sem_mascara": ["email", "telefone"]},
+        "atendimento": {},
+        "analista": {"dados_removidos": ["email", "telefone"], "colunas_removidas": ["Nome"]},
+        "parceiro": {"filtros_linha": [{"coluna": "Ativo", "operador": "=", "valor": True}]}
+    }
+}
+COLUMNS = ["CadastroId", "Nome", "Email", "Celular", "Cartao", "Ativo"]
+ROWS = [
+    (1, "Ana", "ana@gmail.com", "11999887766", "4111 1111 1111 1234", True),
+    (2, "Bruno", None, "11988776655", "5500000000005678", False),
+]
+CONFIG = {"detect_by_content": True, "sample_size": 20}
+
+
+class TestPolicyEngine(unittest.TestCase):
+
+    def setUp(self):
+        """Preparar ambiente para testes"""
+        self.engine = PolicyEngine(POLICIES, CONFIG)
+
+    def test_masks(self):
+        """Testar máscaras parciais de e-mail, telefone e cartão"""
+        self.assertEqual(mask_email("pessoa@gmail.com"), "p***@gmail.com")
+        self.assertEqual(mask_phone("(11) 99988-7766"), "*******7766")
+        self.assertEqual(mask_card("4111-1111-1111-1234"), "**** **** **** 1234")
+
+    def test_default_role_masks_columns(self):
+        """Testar máscara coluna a coluna no perfil padrão, preservando nulos"""
+        view = self.engine.role().view(COLUMNS)
+        self.assertEqual(view.columns, COLUMNS)
+        self.assertEqual(view.apply(ROWS), [
+            (1, "Ana", "a***@gmail.com", "*******7766", "**** **** **** 1234", True),
+            (2, "Bruno", None, "*******6655", "**** **** **** 5678", False),
+        ])
+
+    def test_roles(self):
+        """Testar cartão sempre parcial para o admin e remoção de colunas para o analista"""
+        admin = self.engine.role("ADMIN").view(COLUMNS).apply(ROWS)
+        self.assertEqual(admin[0][2:5], ("ana@gmail.com", "11999887766", "**** **** **** 1234"))
+        view = self.engine.role("analista").view(COLUMNS)
+        self.assertEqual(view.columns, ["CadastroId", "Cartao", "Ativo"])
+        self.assertEqual(view.apply(ROWS)[1], (2, "**** **** **** 5678", False))
+        with self.assertRaises(PermissionError):
+            self.engine.role("desconhecido")
+
+    def test_row_filters(self):
+        """Testar filtro de linha e bloqueio quando a coluna do filtro não está no resultado"""
+        partner = self.engine.role("parceiro")
+        self.assertEqual([row[0] for row in partner.view(COLUMNS).apply(ROWS)], [1])
+        view = partner.view(["CadastroId", "Nome"])
+        self.assertTrue(view.blocked)
+        self.assertEqual(view.apply([(1, "Ana")]), [])
+
+    def test_renamed_columns_detected_by_content(self):
+        """Testar que e-mails em colunas renomeadas no SQL também são mascarados ou removidos"""
+        rows = [(1, "ana@gmail.com"), (2, "bruno@empresa.com.br")]
+        self.assertEqual(self.engine.role().view(["Id", "Contato"]).apply(rows)[1], (2, "b***@empresa.com.br"))
+        self.assertEqual(self.engine.role("analista").view(["Id", "Contato"]).apply(rows)[0], (1, None))
+        self.assertEqual(self.engine.role("admin").view(["Id", "Contato"]).apply(rows), rows)
+
+    def test_apply_records(self):
+        """Testar aplicação a resultados em dicionários (agregados locais)"""
+        records = [{"Email": "ana@gmail.com", "Total": 2}]
+        self.assertEqual(self.engine.role().apply_records(records), [{"Email": "a***@gmail.com", "Total": 2}])
+        self.assertEqual(self.engine.role("analista").apply_records(records), [{"Total": 2}])
+
+
+class TestPolicyIntegration(unittest.TestCase):
+
+    def test_regulations_define_policies(self):
+        """Testar carga das políticas e do texto de politicas_acesso.txt pelos regulamentos"""
+        regulations = AgentInitializer()._load_regulations()
+        self.assertIn("Apenas números parciais de cartões", regulations["politicas_acesso"])
+        engine = PolicyEngine.from_regulations(regulations, CONFIG)
+        self.assertEqual(engine.default_role, "atendimento")
+        self.assertIn("nome", engine.role("analista").removed)
+        self.assertIsNone(PolicyEngine.from_regulations({}, CONFIG))
+
+    def test_executor_applies_role(self):
+        """Testar que o executor mascara os lotes antes de guardar e separa o cache por perfil"""
+        mock_conn = MagicMock()
+        mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+        mock_cursor.description = [(name, None) for name in COLUMNS]
+        mock_cursor.fetchmany.side_effect = lambda size: list(ROWS)
+        registry = DatabaseRegistry({}, connect=lambda connection_string: mock_conn)
+        agent = ExecutorAgent({"max_rows": 2}, registry=registry, aggregates=MagicMock(database="outro"),
+                              policy=PolicyEngine(POLICIES, CONFIG))
+
+        result = agent.execute_query("sql", "SELECT * FROM Cadastro")
+        self.assertEqual(result["policy_role"], "atendimento")
+        self.assertEqual(result["result"][0]["Email"], "a***@gmail.com")
+        result = agent.execute_query("sql", "SELECT * FROM Cadastro", role="analista")
+        self.assertNotIn("Email", result["result"][0])
+        self.assertIn("Perfil de acesso desconhecido", agent.execute_query("sql", "SELECT 1", role="x")["error"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+"""
+Testes para o modo prefork (dados compartilhados entre workers criados por fork)
+"""
+
+import json
+import os
+import signal
+import socket
+import unittest
+
+import log_pipeline
+from prefork import PreforkServer, memory_usage
+
+HAS_SMAPS = os.path.exists("/proc/self/smaps_rollup")
+
+
+class EchoAgent:
+    """Agente mínimo: responde com o pid do worker e um campo dos dados compartilhados"""
+
+    def __init__(self, data):
+        self.data = data
+
+    def process_query(self, query, execute_query=False, session_id=None, timeout=None, role=None):
+        listener = log_pipeline._listener
+        return {"query": query, "worker": os.getpid(), "tables": sorted(self.data["db_schema"]),
+                "logging": listener is not None and listener._thread is not None and listener._thread.is_alive()}
+
+
+def _ask(address, query):
+    with socket.create_connection(address, timeout=10) as conn, conn.makefile("rwb") as stream:
+        stream.write(json.dumps({"query": query}).encode("utf-8") + b"\n")
+        stream.flush()
+        return json.loads(stream.readline())
+
+
+@unittest.skipUnless(hasattr(os, "fork"), "fork indisponível")
+class TestPreforkServer(unittest.TestCase):
+
+    def setUp(self):
+        """Preparar ambiente para testes"""
+        shared = {"db_schema": {"Cadastro": {"campos": list(range(200000))}}}
+        self.server = PreforkServer(EchoAgent, shared,
+                                    {"workers": 2, "host": "127.0.0.1", "port": 0, "worker_threads": 2})
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_workers_serve_shared_data(self):
+        """Testar que os workers atendem usando os dados carregados no pai"""
+        result = _ask(self.server.address, "quantos cadastros?")
+        self.assertEqual(result["query"], "quantos cadastros?")
+        self.assertEqual(result["tables"], ["Cadastro"])
+        self.assertIn(result["worker"], self.server.workers)
+
+    def test_respawned_worker_has_own_log_writer(self):
+        """Testar que o worker recriado depois do início tem a própria thread de escrita do log"""
+        for pid, index in list(self.server.workers.items()):
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            del self.server.workers[pid]
+            self.server._spawn(index)
+        result = _ask(self.server.address, "quantos cadastros?")
+        self.assertIn(result["worker"], self.server.workers)
+        self.assertTrue(result["logging"])
+
+    @unittest.skipUnless(HAS_SMAPS, "smaps_rollup indisponível")
+    def test_memory_report(self):
+        """Testar que a memória exclusiva de cada worker é bem menor que a compartilhada"""
+        _ask(self.server.address, "aquecer")
+        report = self.server.memory_report()
+        self.assertEqual(len(report["workers"]), 2)
+        for usage in report["workers"].values():
+            self.assertGreater(usage["uss"], 0)
+            self.assertLess(usage["uss"], usage["rss"])
+            self.assertGreater(usage["shared"], 0)
+        self.assertEqual(report["total_uss"], sum(usage["uss"] for usage in report["workers"].values()))
+
+    def test_memory_usage_of_missing_process(self):
+        """Testar retorno vazio para um processo inexistente"""
+        self.assertIsNone(memory_usage(2 ** 22 + 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
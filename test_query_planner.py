@@ -0,0 +1,138 @@
+"""
+Testes para o planejador de perguntas compostas
+"""
+
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from cache_backend import LRUCache
+from config import SCHEDULER_CONFIG
+from intelligence_agent import IntelligenceAgent
+from llm_scheduler import LLMScheduler
+from llm_stub import StubLLMClient
+from query_generator import QueryGenerator
+from query_planner import QueryPlanner, combine_results, split_question
+
+COMPOUND = "quantos ativos e quantos inativos cadastrados hoje e no último mês"
+
+
+class TestSplitQuestion(unittest.TestCase):
+
+    def test_status_and_period_product(self):
+        """Testar divisão no produto das alternativas de status e período"""
+        self.assertEqual(split_question(COMPOUND), [
+            "quantos ativos cadastrados hoje",
+            "quantos ativos cadastrados no último mês",
+            "quantos inativos cadastrados hoje",
+            "quantos inativos cadastrados no último mês",
+        ])
+        self.assertEqual(split_question("Quantos cadastros hoje, ontem e na última semana?"), [
+            "Quantos cadastros hoje?", "Quantos cadastros ontem?", "Quantos cadastros na última semana?"
+        ])
+
+    def test_simple_questions_are_kept(self):
+        """Testar que perguntas simples, listagens e combinações acima do limite não são divididas"""
+        self.assertIsNone(split_question("Quantos cadastros ativos hoje?"))
+        self.assertIsNone(split_question("Quais cadastros ativos e inativos de hoje?"))
+        self.assertIsNone(split_question(COMPOUND, max_sub_queries=3))
+
+    def test_only_coordinated_alternatives_are_split(self):
+        """Testar que comparações e alternativas com "ou" não são divididas"""
+        self.assertIsNone(split_question("Quantos cadastros foram feitos hoje comparado com ontem?"))
+        self.assertIsNone(split_question("Quantos cadastros ativos ou inativos foram feitos hoje?"))
+        self.assertIsNone(split_question("Quantos cadastros hoje versus inativos no último mês?"))
+
+    def test_plan_prefers_analyzer_sub_queries(self):
+        """Testar uso das sub_queries informadas pelo analisador"""
+        planner = QueryPlanner({"max_sub_queries": 8, "workers": 2})
+        intent = {"sub_queries": ["quantos cadastros ativos", "quantos pedidos hoje"]}
+        self.assertEqual(planner.plan("quantos cadastros ativos e pedidos de hoje", intent), intent["sub_queries"])
+        self.assertIsNone(planner.plan("Quantos cadastros ativos?", {"sub_queries": None}))
+
+    def test_combine_results(self):
+        """Testar combinação local das subconsultas, com falhas parciais nas linhas"""
+        combined = combine_results([
+            {"question": "a", "generated_query": "SQL A", "execution": {"result": [{"Total": 3}], "error": None,
+                                                                       "execution_time": 0.2}},
+            {"question": "b", "generated_query": "SQL B", "execution": {"result": [], "error": None}},
+            {"question": "c", "generated_query": "SQL C", "execution": {"result": None, "error": "falhou"}},
+        ])
+        self.assertEqual(combined["result"], [
+            {"Pergunta": "a", "Total": 3}, {"Pergunta": "b", "Registros": 0}, {"Pergunta": "c", "Erro": "falhou"}
+        ])
+        self.assertIsNone(combined["error"])
+        self.assertEqual(combined["execution_time"], 0.2)
+
+
+class TestBatchGeneration(unittest.TestCase):
+
+    def test_one_llm_call_for_all_sub_queries(self):
+        """Testar geração do SQL das subconsultas em uma única chamada ao LLM"""
+        generator = QueryGenerator({"model_name": "teste", "db_schema": {}, "sql_instructions": {}})
+        generator.llm_client = StubLLMClient(scheduler=LLMScheduler(dict(SCHEDULER_CONFIG, max_retries=0)),
+                                             first_token_latency=0, chunk_latency=0)
+        queries = generator.generate_sql_batch(["quantos ativos hoje", "quantos inativos hoje"], {})
+        self.assertEqual(generator.llm_client.calls["sql"], 1)
+        self.assertEqual(len(queries), 2)
+        self.assertTrue(all(sql.startswith("SELECT COUNT(*)") for sql in queries))
+
+
+class TestIntelligenceAgentPlanner(unittest.TestCase):
+
+    def setUp(self):
+        """Preparar ambiente para testes"""
+        self.agent = IntelligenceAgent()
+        self.agent.sql_cache = self.agent.answer_cache = None
+        self.agent.similarity_index = self.agent.template_store = None
+        self.agent.planner = QueryPlanner({"max_sub_queries": 8, "workers": 4, "rows_per_sub_query": 20})
+        self.agent.analyzer = MagicMock()
+        self.agent.analyzer.analyze_intent.return_value = ("sql", {"aggregation": "count"})
+        self.agent.query_generator = MagicMock()
+        self.agent.query_generator.generate_sql_batch.side_effect = lambda questions, *args: [
+            f"SELECT COUNT(*) AS Total FROM Cadastro WITH (NOLOCK) WHERE Nome = '{question}'"
+            for question in questions
+        ]
+        self.running = []
+        self.lock = threading.Lock()
+
+        def execute(query_type, sql, params, timeout=None, role=None):
+            with self.lock:
+                self.running.append(params[0])
+            time.sleep(0.2)
+            return {"result": [{"Total": len(params[0])}], "error": None, "execution_time": 0.2}
+
+        self.agent.executor = MagicMock()
+        self.agent.executor.execute_query.side_effect = execute
+        self.agent.result_processor = MagicMock()
+        self.agent.result_processor.process_result.return_value = "Resumo"
+
+    def test_compound_question_runs_sub_queries_in_parallel(self):
+        """Testar subconsultas em paralelo e uma única chamada ao processador de resultados"""
+        started = time.perf_counter()
+        result = self.agent.process_query(COMPOUND)
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(result["response"], "Resumo")
+        self.assertEqual(len(result["sub_queries"]), 4)
+        self.agent.query_generator.generate_sql_batch.assert_called_once()
+        self.agent.query_generator.generate_sql_query.assert_not_called()
+        self.assertEqual(sorted(self.running), sorted(split_question(COMPOUND)))
+        # Próximo da subconsulta mais lenta (0,2 s), não da soma (0,8 s)
+        self.assertLess(elapsed, 0.6)
+        self.agent.result_processor.process_result.assert_called_once()
+        combined = self.agent.result_processor.process_result.call_args[0][1]
+        self.assertEqual(combined["result"][0], {"Pergunta": "quantos ativos cadastrados hoje", "Total": 31})
+
+    def test_sub_queries_reuse_cached_sql(self):
+        """Testar que subperguntas já validadas não voltam ao LLM"""
+        self.agent.sql_cache = LRUCache("nl_sql")
+        self.agent.process_query(COMPOUND)
+        result = self.agent.process_query("quantos ativos e quantos inativos cadastrados hoje e no último mês?")
+        self.agent.query_generator.generate_sql_batch.assert_called_once()
+        self.assertEqual({item["source"] for item in result["sub_queries"]}, {"cache"})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+"""
+Testes para a serialização de resultados
+"""
+
+import datetime
+import decimal
+import json
+import unittest
+from unittest.mock import MagicMock
+
+from result_serializer import (
+    EncoderPlan, to_ndjson, to_columnar_json, to_binary_columnar, read_binary_columnar, serialize_records
+)
+from executor_agent import ExecutorAgent
+from db_router import DatabaseRegistry
+
+DESCRIPTION = [
+    ("CadastroId", int, None, 10, 10, 0, False),
+    ("Nome", str, None, 100, 100, 0, False),
+    ("Saldo", decimal.Decimal, None, 10, 10, 2, True),
+    ("DataInclusao", datetime.datetime, None, 23, 23, 3, False),
+    ("Status", str, None, 20, 20, 0, False)
+]
+
+ROWS = [
+    (1, "João Silva", decimal.Decimal("10.50"), datetime.datetime(2023, 4, 1, 10, 30), "Ativo"),
+    (2, "Maria Souza", None, datetime.datetime(2023, 5, 5, 14, 20), "Ativo"),
+    (3, "Pedro Santos", decimal.Decimal("0.99"), datetime.datetime(2023, 5, 10, 9, 15), "Inativo"),
+    (4, "Ana Lima", decimal.Decimal("3"), datetime.datetime(2023, 5, 11, 8, 0), "Ativo")
+]
+
+
+class TestEncoderPlan(unittest.TestCase):
+
+    def setUp(self):
+        """Preparar ambiente para testes"""
+        self.plan = EncoderPlan.from_description(DESCRIPTION)
+
+    def test_records_are_json_safe(self):
+        """Testar conversão de datetime e Decimal"""
+        records = self.plan.to_records(ROWS)
+        self.assertEqual(records[0]["DataInclusao"], "2023-04-01T10:30:00")
+        self.assertEqual(records[0]["Saldo"], 10.5)
+        self.assertIsNone(records[1]["Saldo"])
+        json.dumps(records)
+
+    def test_plain_columns_have_no_encoder(self):
+        """Testar que colunas já compatíveis com JSON não são convertidas"""
+        self.assertIsNone(self.plan.encoders[0])
+        self.assertIsNone(self.plan.encoders[1])
+
+    def test_decimal_as_string(self):
+        """Testar opção de Decimal como texto"""
+        plan = EncoderPlan.from_description(DESCRIPTION, {"decimal_as": "str"})
+        self.assertEqual(plan.encode_row(ROWS[0])[2], "10.50")
+
+    def test_ndjson(self):
+        """Testar saída NDJSON"""
+        lines = to_ndjson(self.plan, ROWS).splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(json.loads(lines[2])["Status"], "Inativo")
+
+    def test_columnar_json(self):
+        """Testar saída JSON colunar"""
+        data = json.loads(to_columnar_json(self.plan, ROWS))
+        self.assertEqual(data["columns"][4], "Status")
+        self.assertEqual(data["data"][4], ["Ativo", "Ativo", "Inativo", "Ativo"])
+
+    def test_binary_roundtrip_with_dictionary(self):
+        """Testar ida e volta do formato binário e codificação por dicionário"""
+        payload = to_binary_columnar(self.plan, ROWS, {"dictionary_max_cardinality": 16,
+                                                       "dictionary_max_ratio": 0.5})
+        decoded = read_binary_columnar(payload)
+        expected = [list(values) for values in zip(*self.plan.encode_rows(ROWS))]
+        self.assertEqual(decoded["data"], expected)
+
+        header_len = int.from_bytes(payload[5:9], "little")
+        header = json.loads(payload[9:9 + header_len])
+        encodings = {column["name"]: column["encoding"] for column in header["columns"]}
+        self.assertEqual(encodings["Status"], "dict")
+        self.assertEqual(encodings["CadastroId"], "int64")
+
+    def test_serialize_records(self):
+        """Testar serialização de registros do executor"""
+        records = self.plan.to_records(ROWS)
+        decoded = read_binary_columnar(serialize_records(records, "binary"))
+        self.assertEqual(decoded["rows"], 4)
+        with self.assertRaises(ValueError):
+            serialize_records(records, "xml")
+
+
+class TestExecutorSerialization(unittest.TestCase):
+
+    def test_execute_sql_returns_encoded_records(self):
+        """Testar que o executor devolve registros já compatíveis com JSON"""
+        mock_conn = MagicMock()
+        mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+        mock_cursor.description = DESCRIPTION
+        mock_cursor.fetchmany.return_value = ROWS
+        registry = DatabaseRegistry({}, connect=lambda connection_string: mock_conn)
+
+        result = ExecutorAgent(registry=registry).execute_query("sql", "SELECT * FROM Cadastro WITH (NOLOCK)")
+
+        self.assertIsNone(result["error"])
+        self.assertEqual(result["result"][3]["DataInclusao"], "2023-05-11T08:00:00")
+        json.dumps(result)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+"""
+Testes para o armazenamento de resultados com transbordo para disco
+"""
+
+import gc
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from db_router import DatabaseRegistry
+from executor_agent import ExecutorAgent
+from result_processor import ResultProcessor
+from result_serializer import encode_value
+from result_store import ResultStore
+
+COLUMNS = ["Id", "Nome", "Saldo", "Ativo"]
+
+
+def make_rows(start, stop):
+    return [(i, f"Pessoa {i} ção", None if i % 7 == 0 else i / 4, i % 2 == 0) for i in range(start, stop)]
+
+
+class TestResultStore(unittest.TestCase):
+
+    def setUp(self):
+        """Preparar ambiente para testes"""
+        self.spill_dir = tempfile.mkdtemp()
+        self.config = {"memory_rows": 10, "spill_batch": 8, "spill_dir": self.spill_dir}
+
+    def tearDown(self):
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+    def test_small_result_stays_in_memory(self):
+        """Testar que resultados pequenos não vão para disco"""
+        store = ResultStore(COLUMNS, self.config)
+        store.append_rows(make_rows(0, 5))
+        self.assertFalse(store.spilled)
+        self.assertEqual(store.to_result(), [dict(zip(COLUMNS, row)) for row in make_rows(0, 5)])
+
+    def test_spill_and_random_access(self):
+        """Testar transbordo e acesso aleatório por índice e fatia"""
+        store = ResultStore(COLUMNS, self.config)
+        for start in range(0, 45, 9):
+            store.append_rows(make_rows(start, start + 9))
+        expected = [dict(zip(COLUMNS, row)) for row in make_rows(0, 45)]
+
+        self.assertTrue(store.spilled)
+        self.assertIs(store.to_result(), store)
+        self.assertEqual(len(store), 45)
+        self.assertEqual(list(store), expected)
+        self.assertEqual(store[7:23], expected[7:23])
+        self.assertEqual(store[-1], expected[-1])
+        self.assertEqual(store[::10], expected[::10])
+        self.assertEqual(store.page(3, 10), expected[20:30])
+        with self.assertRaises(IndexError):
+            store[45]
+
+    def test_cleanup_on_release(self):
+        """Testar remoção do arquivo temporário ao liberar o resultado"""
+        with patch("tempfile.TemporaryFile", side_effect=lambda **kwargs: tempfile.NamedTemporaryFile(**kwargs)):
+            store = ResultStore(COLUMNS, self.config)
+            store.append_rows(make_rows(0, 30))
+            store[25]
+            self.assertEqual(len(os.listdir(self.spill_dir)), 1)
+            del store
+            gc.collect()
+        self.assertEqual(os.listdir(self.spill_dir), [])
+
+    def test_json_export(self):
+        """Testar exportação completa pelo codificador genérico"""
+        store = ResultStore(COLUMNS, self.config)
+        store.append_rows(make_rows(0, 20))
+        data = json.loads(json.dumps({"result": store}, default=encode_value))
+        self.assertEqual(len(data["result"]), 20)
+        store.close()
+        self.assertEqual(len(store), 0)
+
+
+class TestExecutorResultStore(unittest.TestCase):
+
+    def test_large_result_is_spilled(self):
+        """Testar que o executor devolve um ResultStore para resultados grandes"""
+        rows = make_rows(0, 120)
+        mock_conn = MagicMock()
+        mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+        mock_cursor.description = [(name, None) for name in COLUMNS]
+        batches = [rows[i:i + 50] for i in range(0, len(rows), 50)] + [[]]
+        mock_cursor.fetchmany.side_effect = lambda size: batches.pop(0)
+
+        registry = DatabaseRegistry({}, connect=lambda connection_string: mock_conn)
+        config = {"memory_rows": 40, "spill_batch": 30, "fetch_batch": 50, "spill_dir": None}
+        with patch.dict("executor_agent.RESULT_STORE_CONFIG", config):
+            result = ExecutorAgent({"max_rows": 100}, registry=registry).execute_query("sql", "SELECT * FROM Cadastro")
+
+        self.assertIsNone(result["error"])
+        self.assertIsInstance(result["result"], ResultStore)
+        self.assertEqual(len(result["result"]), 100)
+        self.assertEqual(result["result"][99]["Nome"], "Pessoa 99 ção")
+
+
+class TestResultProcessorSample(unittest.TestCase):
+
+    def test_prompt_gets_only_a_sample(self):
+        """Testar que listas e ResultStore no resultado do executor vão ao prompt cortados em 20 linhas"""
+        processor = ResultProcessor({"model_name": "teste"})
+        processor.llm_client = MagicMock()
+        processor.llm_client.generate.return_value = "Resumo"
+        rows = [dict(zip(COLUMNS, row)) for row in make_rows(0, 500)]
+        store = ResultStore(COLUMNS, {"memory_rows": 10, "spill_batch": 8, "spill_dir": None})
+        store.append_rows(make_rows(0, 500))
+        for result in (rows, store):
+            processor.process_result("quantos cadastros", {"result": result, "error": None})
+            prompt = processor.llm_client.generate.call_args[0][2]
+            self.assertIn('"row_count": 500', prompt)
+            self.assertIn("Pessoa 19 ção", prompt)
+            self.assertNotIn("Pessoa 20 ção", prompt)
+        store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
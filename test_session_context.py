@@ -0,0 +1,147 @@
+"""
+Testes para o contexto de sessão e o refinamento local de SQL
+"""
+
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from intelligence_agent import IntelligenceAgent
+from session_context import SessionStore, refine_sql, derive_edits, is_follow_up
+
+COLUMNS = ["CadastroId", "Nome", "Email", "DataInclusao", "DataAlteracao", "Ativo"]
+BASE_SQL = ("SELECT * FROM Cadastro WITH (NOLOCK) "
+            "WHERE DataInclusao BETWEEN DATEADD(month, -1, GETDATE()) AND GETDATE() AND Ativo = 1")
+
+
+class TestRefineSQL(unittest.TestCase):
+
+    def test_toggle_status(self):
+        """Testar troca de ativos para inativos"""
+        sql, edits = refine_sql(BASE_SQL, "e só os inativos?", COLUMNS)
+        self.assertTrue(sql.endswith("AND Ativo = 0"))
+        self.assertEqual(edits, ["Ativo = 0"])
+
+    def test_add_status_respects_or(self):
+        """Testar inclusão de filtro de status preservando a precedência de OR"""
+        sql, _ = refine_sql("SELECT Nome FROM Cadastro WITH (NOLOCK) WHERE Email LIKE '%gmail%' OR "
+                            "Email LIKE '%hotmail%' ORDER BY Nome", "e só os ativos", COLUMNS)
+        self.assertIn("WHERE (Email LIKE '%gmail%' OR Email LIKE '%hotmail%') AND Ativo = 1 ORDER BY Nome", sql)
+
+    def test_change_date_window(self):
+        """Testar troca da janela de datas"""
+        sql, _ = refine_sql(BASE_SQL, "e nos últimos 7 dias?", COLUMNS)
+        self.assertIn("DataInclusao BETWEEN DATEADD(day, -7, GETDATE()) AND GETDATE()", sql)
+        self.assertNotIn("month", sql)
+        sql, _ = refine_sql(sql, "e hoje?", COLUMNS)
+        self.assertIn("DataInclusao >= CAST(GETDATE() AS date) AND "
+                      "DataInclusao < DATEADD(day, 1, CAST(GETDATE() AS date))", sql)
+        # O intervalo do dia é substituído, não acumulado
+        sql, _ = refine_sql(sql, "e ontem?", COLUMNS)
+        self.assertIn("DataInclusao >= DATEADD(day, -1, CAST(GETDATE() AS date)) AND "
+                      "DataInclusao < CAST(GETDATE() AS date)", sql)
+        self.assertEqual(sql.count("DataInclusao"), 2)
+
+    def test_order_and_top(self):
+        """Testar ORDER BY e TOP combinados"""
+        sql, edits = refine_sql(BASE_SQL, "ordene por nome decrescente e mostre apenas os 10 primeiros", COLUMNS)
+        self.assertTrue(sql.startswith("SELECT TOP 10 * FROM Cadastro"))
+        self.assertTrue(sql.endswith("ORDER BY Nome DESC"))
+        sql, _ = refine_sql(sql, "agora ordene por data de inclusão", COLUMNS)
+        self.assertTrue(sql.endswith("ORDER BY DataInclusao ASC"))
+        self.assertEqual(sql.count("ORDER BY"), 1)
+
+    def test_not_derivable_locally(self):
+        """Testar perguntas que precisam do LLM"""
+        self.assertIsNone(derive_edits("e só os inativos com email gmail?", COLUMNS))
+        self.assertIsNone(refine_sql(BASE_SQL, "ordene por salário", COLUMNS))
+        self.assertIsNone(refine_sql("SELECT COUNT(*) FROM Cadastro WITH (NOLOCK)", "ordene por nome", COLUMNS))
+        self.assertIsNone(refine_sql("SELECT COUNT(*) AS Total FROM Cadastro WITH (NOLOCK) WHERE Ativo = 1",
+                                     "e os 10 primeiros?", COLUMNS))
+        self.assertTrue(is_follow_up("e quantos são?"))
+        self.assertFalse(is_follow_up("Quais cadastros foram alterados no último ano por email?"))
+
+    def test_follow_up_needs_a_cue(self):
+        """Testar que perguntas curtas sem marca de continuação não são acompanhamentos"""
+        self.assertFalse(is_follow_up("Quantos ativos hoje?"))
+        self.assertFalse(is_follow_up("Cadastros do gmail"))
+        self.assertTrue(is_follow_up("só os inativos"))
+        self.assertTrue(is_follow_up("apenas 10"))
+        self.assertTrue(is_follow_up("Eles são do gmail?"))
+        self.assertTrue(is_follow_up("Quantos deles são do gmail?"))
+
+    def test_edits_skip_string_literals(self):
+        """Testar que as edições não alteram o conteúdo das strings do SQL"""
+        sql, _ = refine_sql("SELECT * FROM Cadastro WITH (NOLOCK) WHERE Obs = 'Ativo = 1' AND Ativo = 1",
+                            "e só os inativos?", COLUMNS)
+        self.assertEqual(sql, "SELECT * FROM Cadastro WITH (NOLOCK) WHERE Obs = 'Ativo = 1' AND Ativo = 0")
+
+        sql, _ = refine_sql("SELECT * FROM Cadastro WITH (NOLOCK) WHERE Obs LIKE '%order by%; it''s'",
+                            "ordene por nome", COLUMNS)
+        self.assertEqual(sql, "SELECT * FROM Cadastro WITH (NOLOCK) WHERE Obs LIKE '%order by%; it''s' "
+                              "ORDER BY Nome ASC")
+
+        sql, _ = refine_sql("SELECT * FROM Cadastro WHERE Status = 'Ativo'", "e os inativos?", COLUMNS)
+        self.assertEqual(sql, "SELECT * FROM Cadastro WHERE Status = 'Inativo'")
+
+
+class TestSessionStore(unittest.TestCase):
+
+    def test_lru_and_ttl(self):
+        """Testar descarte por LRU e por inatividade"""
+        store = SessionStore({"max_sessions": 2, "ttl_seconds": 0.05})
+        store.update("a", "q", "sql", {}, "SELECT 1")
+        store.update("b", "q", "sql", {}, "SELECT 2")
+        store.get("a")
+        store.update("c", "q", "sql", {}, "SELECT 3")
+        self.assertIsNone(store.get("b"))
+        self.assertEqual(store.get("a")["sql"], "SELECT 1")
+        time.sleep(0.06)
+        self.assertIsNone(store.get("c"))
+
+
+class TestIntelligenceAgentSessions(unittest.TestCase):
+
+    def setUp(self):
+        """Preparar ambiente para testes"""
+        self.agent = IntelligenceAgent()
+        self.agent.similarity_index = None
+        self.agent.template_store = None
+        self.agent.sessions = SessionStore({"max_sessions": 10, "ttl_seconds": 60})
+        self.agent.analyzer = MagicMock()
+        self.agent.analyzer.analyze_intent.return_value = ("sql", {"entities": ["Cadastro"]})
+        self.agent.query_generator = MagicMock()
+        self.agent.query_generator.generate_sql_query.return_value = BASE_SQL
+        self.agent.executor = MagicMock()
+        self.agent.executor.execute_query.return_value = {"result": [{"CadastroId": 1}], "error": None}
+        self.agent.result_processor = MagicMock()
+
+    def test_follow_up_is_refined_locally(self):
+        """Testar que o acompanhamento não chama o LLM para intenção e SQL"""
+        self.agent.process_query("Quais cadastros ativos do último mês?", session_id="s1")
+        result = self.agent.process_query("e só os inativos?", session_id="s1")
+
+        self.agent.analyzer.analyze_intent.assert_called_once()
+        self.agent.query_generator.generate_sql_query.assert_called_once()
+        self.assertEqual(result["session_refinement"]["edits"], ["Ativo = 0"])
+        self.assertIn("Ativo = 0", result["generated_query"])
+
+    def test_follow_up_falls_back_to_llm_with_context(self):
+        """Testar que acompanhamentos complexos vão ao LLM com o contexto anterior"""
+        self.agent.process_query("Quais cadastros ativos do último mês?", session_id="s1")
+        self.agent.process_query("e quantos são do gmail?", session_id="s1")
+
+        question = self.agent.analyzer.analyze_intent.call_args[0][0]
+        self.assertIn("Pergunta anterior: Quais cadastros ativos do último mês?", question)
+        self.assertIn(BASE_SQL, question)
+
+    def test_sessions_are_isolated(self):
+        """Testar que o contexto de uma sessão não vaza para outra"""
+        self.agent.process_query("Quais cadastros ativos do último mês?", session_id="s1")
+        result = self.agent.process_query("e só os inativos?", session_id="s2")
+        self.assertNotIn("session_refinement", result)
+        self.assertEqual(self.agent.analyzer.analyze_intent.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
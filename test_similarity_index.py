@@ -0,0 +1,129 @@
+"""
+Testes para o índice de similaridade de perguntas (MinHash/LSH)
+"""
+
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from similarity_index import SimilarityIndex, normalize_tokens, extract_features, field_names
+from intelligence_agent import IntelligenceAgent
+
+SQL_ATIVOS_MES = ("SELECT * FROM Cadastro WITH (NOLOCK) WHERE DataInclusao BETWEEN "
+                  "DATEADD(month, -1, GETDATE()) AND GETDATE() AND Ativo = 1")
+
+
+class TestSimilarityIndex(unittest.TestCase):
+
+    def setUp(self):
+        """Preparar ambiente para testes"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.config = {
+            "threshold": 0.8,
+            "num_perm": 64,
+            "bands": 16,
+            "shingle_size": 3,
+            "max_entries": 3,
+            "index_path": os.path.join(self.tmpdir.name, "index.json"),
+            "autosave_every": 0
+        }
+        self.index = SimilarityIndex(self.config)
+        self.index.add("cadastros ativos no último mês", SQL_ATIVOS_MES)
+
+    def tearDown(self):
+        """Limpar ambiente após testes"""
+        self.tmpdir.cleanup()
+
+    def test_paraphrases_match(self):
+        """Testar que paráfrases reutilizam o SQL armazenado"""
+        for question in ["quais cadastros ativos do ultimo mes?",
+                         "mostre ativos cadastrados mês passado"]:
+            match = self.index.lookup(question)
+            self.assertIsNotNone(match, question)
+            self.assertEqual(match["sql"], SQL_ATIVOS_MES)
+            self.assertGreaterEqual(match["score"], self.config["threshold"])
+
+    def test_discriminative_terms_block_match(self):
+        """Testar que mudanças de status, período ou agregação não reutilizam o SQL"""
+        for question in ["cadastros inativos no último mês",
+                         "cadastros ativos na última semana",
+                         "quantos cadastros ativos no último mês"]:
+            self.assertIsNone(self.index.lookup(question), question)
+
+    def test_features(self):
+        """Testar extração de termos discriminantes"""
+        features = extract_features(normalize_tokens("Quantos inativos em 2023?"))
+        self.assertEqual(features, {"status:inativo", "agg:count", "2023"})
+        features = extract_features(normalize_tokens("Nomes dos ativos ordenados por email desc"),
+                                    field_names(["Nome", "Email"]))
+        self.assertEqual(features, {"field:nome", "field:email", "status:ativo", "order", "order_by:email",
+                                    "order:desc"})
+
+    def test_ordering_and_fields_block_match(self):
+        """Testar que coluna e direção de ordenação e colunas citadas diferentes não reutilizam o SQL"""
+        index = SimilarityIndex(dict(self.config, index_path=None), columns=["Nome", "Email", "Ativo"])
+        index.add("cadastros ativos ordenados por nome", "SQL nome")
+        self.assertEqual(index.lookup("quais cadastros ativos ordenados por nome?")["sql"], "SQL nome")
+        for question in ["cadastros ativos ordenados por email",
+                         "cadastros ativos ordenados por nome desc",
+                         "cadastros ativos com email"]:
+            self.assertIsNone(index.lookup(question), question)
+
+        # Sem o esquema, a coluna depois de "ordenados" ainda distingue as consultas
+        index = SimilarityIndex(dict(self.config, index_path=None))
+        index.add("cadastros ativos ordenados por nome", "SQL nome")
+        self.assertIsNone(index.lookup("cadastros ativos ordenados por email"))
+
+    def test_same_question_replaces_entry(self):
+        """Testar que registrar a mesma pergunta substitui a entrada anterior"""
+        self.index.add("cadastros ativos no último mês", "SQL novo")
+        self.assertEqual(len(self.index), 1)
+        self.assertEqual(self.index.lookup("cadastros ativos no último mês")["sql"], "SQL novo")
+
+    def test_eviction_is_bounded(self):
+        """Testar descarte da entrada menos usada recentemente"""
+        self.index.add("cadastros com email gmail", "SQL 2")
+        self.index.add("cadastros mais recentes", "SQL 3")
+        self.index.lookup("cadastros ativos do último mês")  # torna a primeira entrada recente
+        self.index.add("cadastros de hoje", "SQL 4")
+
+        self.assertEqual(len(self.index), 3)
+        self.assertIsNotNone(self.index.lookup("cadastros ativos no último mês"))
+        self.assertIsNone(self.index.lookup("cadastros com email gmail"))
+
+    def test_persistence(self):
+        """Testar que o índice salvo é recarregado"""
+        self.index.save()
+        reloaded = SimilarityIndex(self.config)
+        match = reloaded.lookup("quais cadastros ativos do ultimo mes?")
+        self.assertIsNotNone(match)
+        self.assertEqual(match["sql"], SQL_ATIVOS_MES)
+
+
+class TestIntelligenceAgentSimilarity(unittest.TestCase):
+
+    def test_similar_question_skips_llm(self):
+        """Testar que pergunta semelhante pula a análise de intenção e a geração de SQL"""
+        agent = IntelligenceAgent()
+        agent.similarity_index = SimilarityIndex({"index_path": None, "threshold": 0.8})
+        agent.analyzer = MagicMock()
+        agent.analyzer.analyze_intent.return_value = ("sql", {"entities": ["Cadastro"]})
+        agent.query_generator = MagicMock()
+        agent.query_generator.generate_sql_query.return_value = SQL_ATIVOS_MES
+        agent.executor = MagicMock()
+        agent.executor.execute_query.return_value = {"result": [{"CadastroId": 1}], "error": None}
+        agent.result_processor = MagicMock()
+        agent.result_processor.process_result.return_value = "1 cadastro"
+
+        agent.process_query("cadastros ativos no último mês")
+        result = agent.process_query("mostre ativos cadastrados mês passado")
+
+        agent.analyzer.analyze_intent.assert_called_once()
+        agent.query_generator.generate_sql_query.assert_called_once()
+        self.assertEqual(result["generated_query"], SQL_ATIVOS_MES)
+        self.assertIn("similarity_match", result)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+"""
+Testes para a coalescência de consultas idênticas em andamento
+"""
+
+import asyncio
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from config import DEADLINE_CONFIG
+from single_flight import SingleFlight, normalize_question
+from intelligence_agent import IntelligenceAgent
+from llm_scheduler import PRIORITY_BATCH
+
+
+class TestNormalizeQuestion(unittest.TestCase):
+
+    def test_trivial_variations_share_key(self):
+        """Testar que variações triviais geram a mesma chave"""
+        self.assertEqual(
+            normalize_question("  Quantos cadastros   foram feitos HOJE? "),
+            normalize_question("quantos cadastros foram feitos hoje")
+        )
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def setUp(self):
+        """Preparar ambiente para testes"""
+        self.flight = SingleFlight()
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def _slow(self, value="ok", error=None):
+        with self.lock:
+            self.calls += 1
+        time.sleep(0.05)
+        if error:
+            raise error
+        return value
+
+    def test_threads_share_single_computation(self):
+        """Testar que chamadas concorrentes executam a função uma única vez"""
+        results = []
+
+        def call():
+            results.append(self.flight.do("k", self._slow))
+
+        threads = [threading.Thread(target=call) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual([value for value, _ in results], ["ok"] * 8)
+        self.assertEqual(sum(1 for _, shared in results if not shared), 1)
+        self.assertEqual(self.flight.in_flight(), 0)
+
+    def test_error_propagates_to_all_waiters(self):
+        """Testar propagação de exceção para todos os chamadores"""
+        errors = []
+
+        def call():
+            try:
+                self.flight.do("k", lambda: self._slow(error=RuntimeError("falhou")))
+            except RuntimeError as e:
+                errors.append(str(e))
+
+        threads = [threading.Thread(target=call) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(errors, ["falhou"] * 4)
+        # Depois da falha, a próxima chamada computa novamente
+        self.assertEqual(self.flight.do("k", lambda: "novo"), ("novo", False))
+
+    def test_async_callers_share_computation(self):
+        """Testar coalescência no caminho assíncrono"""
+        async def run():
+            return await asyncio.gather(*[self.flight.do_async("k", self._slow) for _ in range(5)])
+
+        results = asyncio.run(run())
+        self.assertEqual(self.calls, 1)
+        self.assertEqual([value for value, _ in results], ["ok"] * 5)
+
+    def test_async_error_propagates(self):
+        """Testar propagação de exceção no caminho assíncrono"""
+        async def run():
+            return await asyncio.gather(
+                *[self.flight.do_async("k", lambda: self._slow(error=ValueError("x"))) for _ in range(3)],
+                return_exceptions=True
+            )
+
+        results = asyncio.run(run())
+        self.assertEqual(self.calls, 1)
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+
+    def test_thread_and_async_share_computation(self):
+        """Testar que os caminhos síncrono e assíncrono compartilham a mesma computação"""
+        thread_result = []
+        thread = threading.Thread(target=lambda: thread_result.append(self.flight.do("k", self._slow)))
+        thread.start()
+        time.sleep(0.01)
+
+        value, shared = asyncio.run(self.flight.do_async("k", self._slow))
+        thread.join()
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(value, "ok")
+        self.assertTrue(shared)
+
+
+class TestIntelligenceAgentCoalescing(unittest.TestCase):
+
+    def test_duplicate_questions_run_pipeline_once(self):
+        """Testar que perguntas duplicadas simultâneas percorrem o pipeline uma vez"""
+        agent = IntelligenceAgent()
+        calls = []
+
+        def fake_process(query, execute_query=False, priority=0, session_id=None, timeout=None, role=None):
+            calls.append(query)
+            time.sleep(0.05)
+            return {"query": query, "response": "42 cadastros", "error": None}
+
+        results = []
+        with patch.object(agent, "_process_query", side_effect=fake_process):
+            threads = [
+                threading.Thread(target=lambda q=q: results.append(agent.process_query(q)))
+                for q in ["Quantos cadastros hoje?", "quantos cadastros hoje", "QUANTOS cadastros hoje?"]
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual({result["response"] for result in results}, {"42 cadastros"})
+        self.assertEqual(sorted(result["query"] for result in results),
+                         sorted(["Quantos cadastros hoje?", "quantos cadastros hoje", "QUANTOS cadastros hoje?"]))
+        self.assertEqual(sum(1 for result in results if result["coalesced"]), 2)
+
+    def test_different_deadlines_and_priorities_are_not_shared(self):
+        """Testar que prazos em faixas diferentes e prioridades diferentes não compartilham resultado"""
+        agent = IntelligenceAgent()
+        key = agent._flight_key("Quantos cadastros hoje?", False)
+        self.assertEqual(agent._flight_key("quantos cadastros hoje", False, timeout=DEADLINE_CONFIG["request_seconds"]),
+                         key)
+        self.assertEqual(agent._flight_key("quantos cadastros hoje", False, timeout=7),
+                         agent._flight_key("quantos cadastros hoje", False, timeout=5))
+        self.assertNotEqual(agent._flight_key("quantos cadastros hoje", False, timeout=1), key)
+        self.assertNotEqual(agent._flight_key("quantos cadastros hoje", False, priority=PRIORITY_BATCH), key)
+
+
+if __name__ == '__main__':
+    unittest.main()
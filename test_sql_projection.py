@@ -0,0 +1,79 @@
+"""
+Testes para a poda de colunas e a agregação no banco
+"""
+
+import datetime
+import unittest
+
+from aggregate_cache import AggregatePlan
+from sql_projection import push_down
+
+SCHEMA = {
+    "Cadastro": {"nome": "Cadastro", "campos": [
+        {"nome": "CadastroId"}, {"nome": "Nome"}, {"nome": "Email"}, {"nome": "Ativo"}, {"nome": "DataInclusao"}
+    ]}
+}
+CONFIG = {"status_columns": ["Ativo"], "date_column": "DataInclusao"}
+
+
+class TestPushDown(unittest.TestCase):
+
+    def test_count_question(self):
+        """Testar troca de SELECT * por COUNT(*) em perguntas de contagem, sem ORDER BY"""
+        sql, applied = push_down("SELECT * FROM Cadastro WITH (NOLOCK) WHERE Ativo = 1 ORDER BY DataInclusao DESC",
+                                 "Quantos cadastros ativos existem?", {}, SCHEMA, CONFIG)
+        self.assertEqual(sql, "SELECT COUNT(*) AS Total FROM Cadastro WITH (NOLOCK) WHERE Ativo = 1")
+        self.assertEqual(applied, ["count"])
+
+    def test_grouped_count(self):
+        """Testar GROUP BY por período ou coluna, reconhecível pelos agregados locais"""
+        sql, _ = push_down("SELECT * FROM Cadastro WITH (NOLOCK) WHERE Ativo = 1", "Quantos cadastros por mês?",
+                           {}, SCHEMA, CONFIG)
+        self.assertEqual(sql, "SELECT YEAR(DataInclusao) AS Ano, MONTH(DataInclusao) AS Mes, COUNT(*) AS Total "
+                              "FROM Cadastro WITH (NOLOCK) WHERE Ativo = 1 "
+                              "GROUP BY YEAR(DataInclusao), MONTH(DataInclusao) ORDER BY Ano, Mes")
+        AggregatePlan(sql, datetime.date(2024, 3, 15))
+
+        sql, _ = push_down("SELECT * FROM Cadastro", "Total de cadastros",
+                           {"aggregation": "count", "group_by": ["status"]}, SCHEMA, CONFIG)
+        self.assertEqual(sql, "SELECT Ativo, COUNT(*) AS Total FROM Cadastro GROUP BY Ativo ORDER BY Ativo")
+
+    def test_ordering_is_not_grouping(self):
+        """Testar que "ordenados por" não vira GROUP BY, a menos que a intenção peça o agrupamento"""
+        sql, _ = push_down("SELECT * FROM Cadastro WHERE Ativo = 1 ORDER BY Nome",
+                           "Quantos cadastros ativos ordenados por nome?", {}, SCHEMA, CONFIG)
+        self.assertEqual(sql, "SELECT COUNT(*) AS Total FROM Cadastro WHERE Ativo = 1")
+
+        sql, _ = push_down("SELECT * FROM Cadastro", "Quantos cadastros classificados por nome?",
+                           {"aggregation": "count", "group_by": ["Nome"]}, SCHEMA, CONFIG)
+        self.assertEqual(sql, "SELECT Nome, COUNT(*) AS Total FROM Cadastro GROUP BY Nome ORDER BY Nome")
+
+    def test_projection(self):
+        """Testar poda de colunas para os campos pedidos, mantendo os que também aparecem nos filtros"""
+        sql, applied = push_down("SELECT TOP 10 * FROM Cadastro WITH (NOLOCK) WHERE Ativo = 1 ORDER BY Nome",
+                                 "Liste nome e email dos ativos", {"fields": ["Nome", "Cadastro.Email"]},
+                                 SCHEMA, CONFIG)
+        self.assertEqual(sql, "SELECT TOP 10 Nome, Email FROM Cadastro WITH (NOLOCK) WHERE Ativo = 1 ORDER BY Nome")
+        self.assertEqual(applied, ["projection"])
+
+        sql, _ = push_down("SELECT * FROM Cadastro WHERE Email LIKE '%@gmail.com'",
+                           "Mostre nome e email dos cadastros do gmail", {"fields": ["Nome", "Email"]}, SCHEMA, CONFIG)
+        self.assertEqual(sql, "SELECT Nome, Email FROM Cadastro WHERE Email LIKE '%@gmail.com'")
+
+    def test_unchanged_when_unsure(self):
+        """Testar que o SQL é mantido quando a intenção ou a estrutura não permitem a otimização"""
+        cases = [
+            ("SELECT * FROM Cadastro WHERE Ativo = 1", "Quais cadastros ativos?", {"fields": ["*"]}),
+            ("SELECT * FROM Cadastro WHERE Ativo = 1", "Quais cadastros ativos?", {"fields": ["Nome", "Idade"]}),
+            ("SELECT * FROM Cadastro c JOIN Endereco e ON e.CadastroId = c.CadastroId", "Quantos?", {}),
+            ("SELECT * FROM Cadastro a, Endereco b", "Quantos?", {}),
+            ("SELECT TOP 5 * FROM Cadastro ORDER BY DataInclusao DESC", "Quantos dos mais recentes?", {}),
+            ("SELECT * FROM Cadastro", "Média de idade", {"aggregation": "avg"}),
+            ("SELECT * FROM Pedido", "Quantos pedidos?", {}),
+        ]
+        for sql, question, intent in cases:
+            self.assertEqual(push_down(sql, question, intent, SCHEMA, CONFIG), (sql, []), sql)
+
+
+if __name__ == '__main__':
+    unittest.main()
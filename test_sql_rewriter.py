@@ -0,0 +1,79 @@
+"""
+Testes para a reescrita de predicados não sargáveis
+"""
+
+import datetime
+import unittest
+
+from aggregate_cache import AggregatePlan
+from session_context import refine_sql
+from sql_rewriter import rewrite_sql
+
+CONFIG = {"status_columns": ["Ativo"], "email_columns": ["Email"], "email_domain_column": None,
+          "case_insensitive_collation": True}
+TODAY = ("DataInclusao >= CAST(GETDATE() AS date) AND "
+         "DataInclusao < DATEADD(day, 1, CAST(GETDATE() AS date))")
+
+
+class TestSqlRewriter(unittest.TestCase):
+
+    def test_today_becomes_half_open_range(self):
+        """Testar troca de CONVERT(date, coluna) = hoje por um intervalo sobre a coluna"""
+        sql, rewrites = rewrite_sql("SELECT COUNT(*) FROM Cadastro WITH (NOLOCK) "
+                                    "WHERE CONVERT(date, DataInclusao) = CONVERT(date, GETDATE())", CONFIG)
+        self.assertEqual(sql, f"SELECT COUNT(*) FROM Cadastro WITH (NOLOCK) WHERE {TODAY}")
+        self.assertEqual(rewrites, ["data"])
+        # Os agregados locais continuam reconhecendo a consulta reescrita
+        AggregatePlan(sql, datetime.date(2024, 3, 15))
+
+    def test_date_comparisons_and_between(self):
+        """Testar limites de comparação e BETWEEN sobre datas convertidas"""
+        sql, _ = rewrite_sql("SELECT * FROM Cadastro c WHERE CAST(c.DataInclusao AS date) "
+                             "BETWEEN '2024-01-01' AND '2024-01-31'", CONFIG)
+        self.assertIn("c.DataInclusao >= '20240101' AND c.DataInclusao < '20240201'", sql)
+        sql, _ = rewrite_sql("SELECT * FROM Cadastro WHERE CONVERT(date, DataInclusao) > '2024-01-31'", CONFIG)
+        self.assertIn("DataInclusao >= '20240201'", sql)
+        sql, _ = rewrite_sql("SELECT * FROM Cadastro WHERE NOT CONVERT(date, GETDATE()) = CONVERT(date, DataInclusao)",
+                             CONFIG)
+        self.assertIn(f"NOT ({TODAY})", sql)
+
+    def test_function_wrapped_columns(self):
+        """Testar YEAR/MONTH, DATEDIFF, ISNULL e UPPER sobre a coluna"""
+        sql, _ = rewrite_sql("SELECT * FROM Cadastro WHERE MONTH(DataInclusao) = 12 AND YEAR(DataInclusao) = 2023",
+                             CONFIG)
+        self.assertIn("DataInclusao >= '20231201' AND DataInclusao < '20240101'", sql)
+        sql, _ = rewrite_sql("SELECT * FROM Cadastro WHERE YEAR(DataInclusao) = YEAR(GETDATE())", CONFIG)
+        self.assertIn("DataInclusao < DATEFROMPARTS(YEAR(GETDATE()) + 1, 1, 1)", sql)
+        sql, rewrites = rewrite_sql("SELECT * FROM Cadastro WHERE DATEDIFF(day, DataInclusao, GETDATE()) < 7 "
+                                    "AND ISNULL(Ativo, 0) = 1 AND UPPER(Nome) LIKE 'JO%'", CONFIG)
+        self.assertEqual(sql, "SELECT * FROM Cadastro WHERE DataInclusao >= DATEADD(day, -6, CAST(GETDATE() AS date)) "
+                              "AND Ativo = 1 AND Nome LIKE 'JO%'")
+        self.assertEqual(rewrites, ["datediff", "isnull", "maiusculas"])
+
+    def test_email_domain(self):
+        """Testar LIKE '%@dominio' apenas quando há coluna de domínio configurada"""
+        sql = "SELECT * FROM Cadastro WHERE Email LIKE '%@gmail.com%'"
+        self.assertEqual(rewrite_sql(sql, CONFIG), (sql, []))
+        config = dict(CONFIG, email_domain_column="EmailDominio")
+        self.assertIn("EmailDominio LIKE 'gmail.com%'", rewrite_sql(sql, config)[0])
+        self.assertIn("c.EmailDominio = 'gmail.com'",
+                      rewrite_sql("SELECT * FROM Cadastro c WHERE c.Email LIKE '%@gmail.com'", config)[0])
+
+    def test_redundant_status(self):
+        """Testar remoção de condições de Ativo repetidas, sem mexer em expressões com OR"""
+        sql, _ = rewrite_sql("SELECT * FROM Cadastro WHERE Ativo=1 AND Nome LIKE 'A%' AND Ativo <> 0 "
+                             "ORDER BY Nome", CONFIG)
+        self.assertEqual(sql, "SELECT * FROM Cadastro WHERE Ativo=1 AND Nome LIKE 'A%' ORDER BY Nome")
+        sql = "SELECT * FROM Cadastro WHERE Ativo = 1 AND Nome LIKE 'A%' OR Ativo = 1"
+        self.assertEqual(rewrite_sql(sql, CONFIG), (sql, []))
+
+    def test_session_refinement_replaces_rewritten_range(self):
+        """Testar que o refinamento de sessão reconhece o intervalo reescrito"""
+        sql, _ = rewrite_sql("SELECT * FROM Cadastro WITH (NOLOCK) "
+                             "WHERE CONVERT(date, DataInclusao) = CONVERT(date, DATEADD(day, -1, GETDATE()))", CONFIG)
+        refined, _ = refine_sql(sql, "e hoje?", ["DataInclusao"])
+        self.assertEqual(refined, f"SELECT * FROM Cadastro WITH (NOLOCK) WHERE {TODAY}")
+
+
+if __name__ == '__main__':
+    unittest.main()
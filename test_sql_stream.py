@@ -0,0 +1,67 @@
+"""
+Testes para a extração de SQL em streaming
+"""
+
+import unittest
+
+from sql_stream import StreamingSQLExtractor, consume_sql_statement
+
+
+def run(text, size):
+    """Consome o texto em trechos de tamanho fixo, contando quantos foram lidos"""
+    chunks = [text[i:i + size] for i in range(0, len(text), size)]
+    read = []
+
+    def stream():
+        for chunk in chunks:
+            read.append(chunk)
+            yield chunk
+
+    return consume_sql_statement(stream()), len(read), len(chunks)
+
+
+class TestStreamingSQLExtractor(unittest.TestCase):
+
+    def test_fenced_statement_stops_at_closing_fence(self):
+        """Testar parada no fechamento da cerca, ignorando a explicação"""
+        text = ("Aqui está a consulta:\n```sql\nSELECT * FROM Cadastro WITH (NOLOCK)\nWHERE Nome = 'a;b'\n```\n"
+                "Explicação: a consulta retorna todos os cadastros com esse nome.")
+        for size in (1, 4, 9):
+            sql, read, total = run(text, size)
+            self.assertEqual(sql, "SELECT * FROM Cadastro WITH (NOLOCK)\nWHERE Nome = 'a;b'")
+            self.assertLess(read, total)
+
+    def test_semicolon_ends_statement(self):
+        """Testar fim da instrução em ponto e vírgula fora de strings e comentários"""
+        text = "-- conta; ativos\nSELECT COUNT(*) FROM [Cadastro;x] WHERE Nome = 'it''s';\n\nEsta consulta conta..."
+        sql, read, total = run(text, 3)
+        self.assertEqual(sql, "SELECT COUNT(*) FROM [Cadastro;x] WHERE Nome = 'it''s'")
+        self.assertLess(read, total)
+
+    def test_blank_line_inside_unfenced_query(self):
+        """Testar linha em branco que não encerra a consulta"""
+        text = "SELECT Nome\nFROM Cadastro WITH (NOLOCK)\n\nWHERE Ativo = 1\n\nEsta consulta retorna os ativos."
+        sql, _, _ = run(text, 2)
+        self.assertEqual(sql, "SELECT Nome\nFROM Cadastro WITH (NOLOCK)\n\nWHERE Ativo = 1")
+
+    def test_cte_and_non_sql_fence(self):
+        """Testar CTE e cercas que não contêm SQL"""
+        text = "```python\nprint(1)\n```\n```sql\nWITH ult AS (SELECT * FROM Cadastro) SELECT * FROM ult\n```"
+        sql, _, _ = run(text, 5)
+        self.assertEqual(sql, "WITH ult AS (SELECT * FROM Cadastro) SELECT * FROM ult")
+
+    def test_unterminated_statement_at_end_of_stream(self):
+        """Testar instrução sem terminador encerrada pelo fim do stream"""
+        extractor = StreamingSQLExtractor()
+        self.assertIsNone(extractor.feed("SELECT 1 FROM "))
+        extractor.feed("Cadastro")
+        self.assertEqual(extractor.finish(), "SELECT 1 FROM Cadastro")
+
+    def test_empty_response(self):
+        """Testar resposta sem SQL"""
+        with self.assertRaises(ValueError):
+            consume_sql_statement(iter(["", "```", "```"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
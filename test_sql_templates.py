@@ -0,0 +1,127 @@
+"""
+Testes para os templates de SQL parametrizado
+"""
+
+import unittest
+from unittest.mock import ANY, MagicMock
+
+from sql_templates import TemplateStore, question_shape, extract_sql_literals, render_sql
+from intelligence_agent import IntelligenceAgent
+
+SQL_JANEIRO = ("SELECT * FROM Cadastro WITH (NOLOCK) WHERE DataInclusao BETWEEN "
+               "'2023-01-01' AND '2023-01-31' AND Ativo = 1")
+
+
+class TestLiteralExtraction(unittest.TestCase):
+
+    def test_extract_literals(self):
+        """Testar extração de literais de texto, TOP e comparações"""
+        sql, params = extract_sql_literals(
+            "SELECT TOP 5 * FROM Cadastro WITH (NOLOCK) WHERE Nome = N'O''Brien' AND Ativo = 1 "
+            "AND DataInclusao >= DATEADD(month, -1, GETDATE())"
+        )
+        self.assertEqual(sql, "SELECT TOP (?) * FROM Cadastro WITH (NOLOCK) WHERE Nome = ? AND Ativo = ? "
+                              "AND DataInclusao >= DATEADD(month, -1, GETDATE())")
+        self.assertEqual(params, [5, "O'Brien", 1])
+
+    def test_render_roundtrip(self):
+        """Testar reconstrução do SQL com literais"""
+        sql, params = extract_sql_literals(SQL_JANEIRO)
+        self.assertEqual(render_sql(sql, params), SQL_JANEIRO)
+
+    def test_question_shape(self):
+        """Testar formato da pergunta com marcadores"""
+        shape, slots = question_shape("Cadastros de Março de 2023 com email gmail?")
+        self.assertEqual(shape, "cadastros de {MONTH} de {YEAR} com email {DOMAIN}")
+        self.assertEqual(slots, [("MONTH", "marco"), ("YEAR", "2023"), ("DOMAIN", "gmail")])
+
+
+class TestTemplateStore(unittest.TestCase):
+
+    def setUp(self):
+        """Preparar ambiente para testes"""
+        self.store = TemplateStore({"max_templates": 10})
+
+    def test_month_year_template(self):
+        """Testar reuso de template com mês e ano diferentes"""
+        self.assertTrue(self.store.learn("cadastros de janeiro de 2023", SQL_JANEIRO))
+        match = self.store.match("Cadastros de fevereiro de 2024")
+        self.assertEqual(match["params"], ["2024-02-01", "2024-02-29", 1])
+        self.assertEqual(match["sql"], extract_sql_literals(SQL_JANEIRO)[0])
+
+    def test_half_open_month_range(self):
+        """Testar limite superior exclusivo recalculado pelo mês da pergunta, com virada de ano"""
+        self.assertTrue(self.store.learn(
+            "Quantos cadastros de janeiro de 2023?",
+            "SELECT COUNT(*) FROM Cadastro WITH (NOLOCK) "
+            "WHERE DataInclusao >= '2023-01-01' AND DataInclusao < '2023-02-01'"
+        ))
+        self.assertEqual(self.store.match("Quantos cadastros de fevereiro de 2023?")["params"],
+                         ["2023-02-01", "2023-03-01"])
+        self.assertEqual(self.store.match("Quantos cadastros de dezembro de 2023?")["params"],
+                         ["2023-12-01", "2024-01-01"])
+
+    def test_date_not_tied_to_question_is_rejected(self):
+        """Testar que datas com mês fixo em perguntas com mês não viram template"""
+        self.assertFalse(self.store.learn(
+            "cadastros de janeiro de 2023",
+            "SELECT * FROM Cadastro WITH (NOLOCK) WHERE DataInclusao >= '2023-01-01' "
+            "AND DataInclusao < '2023-03-15'"
+        ))
+
+    def test_domain_template(self):
+        """Testar reuso de template com domínio de email diferente"""
+        self.store.learn("Liste os cadastros com email gmail",
+                         "SELECT * FROM Cadastro WITH (NOLOCK) WHERE Email LIKE '%@gmail.com%'")
+        match = self.store.match("liste os cadastros com email hotmail")
+        self.assertEqual(match["params"], ["%@hotmail.com%"])
+
+    def test_top_template(self):
+        """Testar reuso de template com quantidade diferente"""
+        self.store.learn("Mostre os 5 cadastros mais recentes",
+                         "SELECT TOP 5 * FROM Cadastro WITH (NOLOCK) ORDER BY DataInclusao DESC")
+        self.assertEqual(self.store.match("Mostre os 20 cadastros mais recentes")["params"], [20])
+
+    def test_unmapped_literal_is_rejected(self):
+        """Testar que valores da pergunta embutidos no SQL impedem o template"""
+        self.assertFalse(self.store.learn(
+            "cadastros dos últimos 15 dias",
+            "SELECT * FROM Cadastro WITH (NOLOCK) WHERE DataInclusao >= DATEADD(day, -15, GETDATE())"
+        ))
+        self.assertFalse(self.store.learn("cadastros ativos de 2023",
+                                          "SELECT * FROM Cadastro WITH (NOLOCK) WHERE Ativo = 1"))
+        self.assertEqual(len(self.store), 0)
+
+    def test_unknown_shape(self):
+        """Testar pergunta sem template conhecido"""
+        self.store.learn("cadastros de janeiro de 2023", SQL_JANEIRO)
+        self.assertIsNone(self.store.match("cadastros inativos de janeiro de 2023"))
+
+
+class TestIntelligenceAgentTemplates(unittest.TestCase):
+
+    def test_template_skips_llm_and_binds_params(self):
+        """Testar que pergunta com formato conhecido não chama o LLM e usa parâmetros"""
+        agent = IntelligenceAgent()
+        agent.similarity_index = None
+        agent.template_store = TemplateStore({"max_templates": 10})
+        agent.analyzer = MagicMock()
+        agent.analyzer.analyze_intent.return_value = ("sql", {"entities": ["Cadastro"]})
+        agent.query_generator = MagicMock()
+        agent.query_generator.generate_sql_query.return_value = SQL_JANEIRO
+        agent.executor = MagicMock()
+        agent.executor.execute_query.return_value = {"result": [{"CadastroId": 1}], "error": None}
+        agent.result_processor = MagicMock()
+
+        agent.process_query("cadastros de janeiro de 2023")
+        result = agent.process_query("cadastros de março de 2023")
+
+        agent.analyzer.analyze_intent.assert_called_once()
+        agent.query_generator.generate_sql_query.assert_called_once()
+        sql, params = extract_sql_literals(SQL_JANEIRO)
+        agent.executor.execute_query.assert_called_with("sql", sql, ["2023-03-01", "2023-03-31", 1], timeout=ANY, role=None)
+        self.assertIn("'2023-03-31'", result["generated_query"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+"""
+Testes para a captura e o replay de tráfego
+"""
+
+import gzip
+import json
+import shutil
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from intelligence_agent import IntelligenceAgent
+from llm_stub import StubLLMClient
+from traffic_capture import TrafficRecorder, read_capture, capture_files
+from traffic_replay import build_offline_agent, replay
+
+SQL = "SELECT * FROM Cadastro WITH (NOLOCK) WHERE Ativo = 1"
+
+
+class TestTrafficRecorder(unittest.TestCase):
+
+    def setUp(self):
+        """Preparar ambiente para testes"""
+        self.directory = tempfile.mkdtemp()
+        self.config = {"directory": self.directory, "max_bytes": 400, "backup_count": 3, "flush_every": 1}
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_rotation_and_backups(self):
+        """Testar rotação por tamanho e limite de arquivos mantidos"""
+        recorder = TrafficRecorder(self.config)
+        for i in range(30):
+            recorder.record({"query": f"pergunta {i}", "query_type": "sql", "generated_query": SQL,
+                             "timings": {"total": 0.1}, "result": {"result": [{"Id": 1}] * i, "error": None}})
+        recorder.close()
+
+        files = capture_files(self.directory)
+        self.assertEqual(len(files), 3)
+        with gzip.open(files[-1], "rt", encoding="utf-8") as file:
+            last = [json.loads(line) for line in file][-1]
+        self.assertEqual(last["query"], "pergunta 29")
+        self.assertEqual(last["row_count"], 29)
+        self.assertEqual(last["sql"], SQL)
+
+    def test_capture_from_agent(self):
+        """Testar que o agente grava pergunta, intenção, SQL, tempos e linhas"""
+        agent = IntelligenceAgent()
+        agent.similarity_index = agent.template_store = None
+        agent.traffic_recorder = TrafficRecorder(self.config)
+        agent.analyzer = MagicMock()
+        agent.analyzer.analyze_intent.return_value = ("sql", {"entities": ["Cadastro"]})
+        agent.query_generator = MagicMock()
+        agent.query_generator.generate_sql_query.return_value = SQL
+        agent.executor = MagicMock()
+        agent.executor.execute_query.return_value = {"result": [{"Id": 1}, {"Id": 2}], "error": None}
+        agent.result_processor = MagicMock()
+        agent.result_processor.process_result.return_value = "Há 2 cadastros ativos."
+
+        agent.process_query("Quais cadastros ativos?", session_id="s1")
+        agent.traffic_recorder.close()
+
+        [record] = list(read_capture([self.directory]))
+        self.assertEqual(record["query"], "Quais cadastros ativos?")
+        self.assertEqual(record["intent"], {"entities": ["Cadastro"]})
+        self.assertEqual(record["session_id"], "s1")
+        self.assertEqual(record["row_count"], 2)
+        self.assertEqual(record["response"], "Há 2 cadastros ativos.")
+        self.assertTrue({"intent", "sql", "execute", "answer", "total"} <= set(record["timings"]))
+
+
+class TestReplay(unittest.TestCase):
+
+    RECORDS = [
+        {"ts": 100.0, "query": "Quais cadastros ativos?", "intent": {"type": "sql", "entities": ["Cadastro"]},
+         "sql": SQL, "row_count": 3, "response": "Há 3 cadastros ativos.", "timings": {}},
+        {"ts": 100.05, "query": "Quantos cadastros inativos?", "intent": {"type": "sql"},
+         "sql": "SELECT COUNT(*) FROM Cadastro WITH (NOLOCK) WHERE Ativo = 0", "row_count": 1,
+         "response": "Há 1 cadastro inativo.", "timings": {}}
+    ]
+
+    def test_replay_with_recorded_responses(self):
+        """Testar replay offline com respostas gravadas"""
+        agent = build_offline_agent(self.RECORDS, llm="recorded", executor="stub", first_token_latency=0)
+        agent.similarity_index = agent.template_store = None
+        report = replay(agent, self.RECORDS, speed=1.0, concurrency=4)
+
+        self.assertEqual(report["requests"], 2)
+        self.assertEqual(report["errors"], 0)
+        self.assertGreaterEqual(report["duration"], 0.05)
+        self.assertGreater(report["throughput"], 0)
+        self.assertIn("intent", report["stages"])
+        self.assertEqual(agent.analyzer.llm_client.calls["sql"], 2)
+
+    def test_stub_uses_recorded_answers(self):
+        """Testar que o stub devolve a intenção e a resposta gravadas para a pergunta"""
+        client = StubLLMClient(recorded=self.RECORDS, first_token_latency=0, chunk_latency=0)
+        intent = client.generate("intent", "sistema", "Esquema: {}\n\nConsulta: quantos cadastros inativos")
+        self.assertTrue(intent.startswith('{"type": "sql"}'))
+        answer = client.generate("answer", "sistema",
+                                 "Pergunta do usuário: Quais cadastros ativos?\n\nResultados da consulta (3 ...)")
+        self.assertEqual(answer, "Há 3 cadastros ativos.")
+
+
+if __name__ == '__main__':
+    unittest.main()
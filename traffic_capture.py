@@ -0,0 +1,163 @@
+"""
+Captura das requisições do agente em JSONL compactado e rotativo, para replay em testes de carga
+"""
+
+import atexit
+import glob
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Any, Iterator, List, Optional
+
+from config import CAPTURE_CONFIG
+from result_serializer import encode_value
+
+logger = logging.getLogger("traffic_capture")
+
+_PREFIX = "traffic-"
+_SUFFIX = ".jsonl.gz"
+
+
+def _row_count(execution: Any) -> Optional[int]:
+    rows = execution.get("result") if isinstance(execution, dict) else None
+    try:
+        return len(rows) if rows is not None else None
+    except TypeError:
+        return None
+
+
+def build_record(result: Dict[str, Any], session_id: str = None,
+                 record_responses: bool = True) -> Dict[str, Any]:
+    """
+    Monta o registro de captura a partir do resultado de `process_query`
+
+    Args:
+        result: Resultado devolvido ao chamador
+        session_id: Sessão de conversa (quando houver)
+        record_responses: Inclui a resposta final, usada no replay com respostas gravadas
+
+    Returns:
+        Registro com pergunta, intenção, SQL, tempos por etapa e quantidade de linhas
+    """
+    execution = result.get("result")
+    source = "llm"
+    for key, name in (("session_refinement", "session"), ("similarity_match", "similarity"),
+                      ("template_match", "template")):
+        if result.get(key):
+            source = name
+    record = {
+        "ts": time.time(),
+        "session_id": session_id,
+        "query": result.get("query"),
+        "query_type": result.get("query_type"),
+        "intent": result.get("intent_data"),
+        "sql": result.get("generated_query"),
+        "params": (result.get("parameterized_query") or {}).get("params"),
+        "source": source,
+        "coalesced": result.get("coalesced", False),
+        "timings": result.get("timings", {}),
+        "row_count": _row_count(execution),
+        "error": result.get("error") or (execution.get("error") if isinstance(execution, dict) else None)
+    }
+    if record_responses:
+        record["response"] = result.get("response")
+    return record
+
+
+class TrafficRecorder:
+    """
+    Grava um registro JSON por requisição em arquivos gzip.
+
+    Quando o arquivo atual passa de `max_bytes` (não compactados), um novo
+    arquivo é iniciado; apenas os `backup_count` mais recentes são mantidos.
+    """
+
+    def __init__(self, config: Dict[str, Any] = None):
+        self.config = config or CAPTURE_CONFIG
+        self.directory = self.config.get("directory", "logs/traffic")
+        self.max_bytes = self.config.get("max_bytes", 20 * 1024 * 1024)
+        self.backup_count = self.config.get("backup_count", 10)
+        self.flush_every = self.config.get("flush_every", 20)
+        self.record_responses = self.config.get("record_responses", True)
+        self._lock = threading.Lock()
+        self._file = None
+        self._path = None
+        self._bytes = 0
+        self._pending = 0
+        self._sequence = 0
+        atexit.register(self.close)
+
+    def record(self, result: Dict[str, Any], session_id: str = None) -> None:
+        """Acrescenta o resultado de uma requisição ao arquivo de captura"""
+        try:
+            line = json.dumps(build_record(result, session_id, self.record_responses),
+                              ensure_ascii=False, default=encode_value) + "\n"
+            with self._lock:
+                if self._file is None or self._bytes >= self.max_bytes:
+                    self._rotate()
+                self._file.write(line)
+                self._bytes += len(line)
+                self._pending += 1
+                if self._pending >= self.flush_every:
+                    self._file.flush()
+                    self._pending = 0
+        except Exception as e:
+            # A captura nunca deve interromper o atendimento
+            logger.error(f"Erro ao gravar captura de tráfego: {str(e)}")
+
+    def _rotate(self) -> None:
+        if self._file is not None:
+            self._file.close()
+        os.makedirs(self.directory, exist_ok=True)
+        self._sequence += 1
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        self._path = os.path.join(self.directory, f"{_PREFIX}{stamp}-{os.getpid()}-{self._sequence:04d}{_SUFFIX}")
+        self._file = gzip.open(self._path, "at", encoding="utf-8")
+        self._bytes = 0
+        self._pending = 0
+        logger.info(f"Captura de tráfego gravando em {self._path}")
+        files = capture_files(self.directory)
+        for old_path in (files[:-self.backup_count] if self.backup_count > 0 else []):
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def capture_files(directory: str) -> List[str]:
+    """Arquivos de captura do diretório, do mais antigo para o mais recente"""
+    # O nome começa com a data/hora de criação, então a ordem alfabética é cronológica
+    return sorted(glob.glob(os.path.join(directory, f"{_PREFIX}*{_SUFFIX}")))
+
+
+def read_capture(paths: List[str]) -> Iterator[Dict[str, Any]]:
+    """
+    Lê registros capturados (arquivos .jsonl.gz ou .jsonl, ou diretórios)
+
+    Linhas truncadas no fim de um arquivo (processo interrompido) são ignoradas.
+    """
+    for path in paths:
+        files = capture_files(path) if os.path.isdir(path) else [path]
+        for file_path in files:
+            opener = gzip.open if file_path.endswith(".gz") else open
+            try:
+                with opener(file_path, "rt", encoding="utf-8") as file:
+                    for line in file:
+                        line = line.strip()
+                        if not line:
+                            continue
+                        try:
+                            yield json.loads(line)
+                        except json.JSONDecodeError:
+                            logger.warning(f"Registro inválido ignorado em {file_path}")
+            except (EOFError, OSError) as e:
+                logger.warning(f"Arquivo de captura incompleto {file_path}: {str(e)}")
@@ -0,0 +1,204 @@
+"""
+Replay de tráfego capturado contra o pipeline, com relatório de latência e vazão
+"""
+
+import argparse
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+
+from config import SIMILARITY_CONFIG, TEMPLATE_CONFIG
+from llm_stub import StubLLMClient
+from sql_templates import extract_sql_literals
+from traffic_capture import read_capture
+
+logger = logging.getLogger("traffic_replay")
+
+
+class StubExecutor:
+    """Executor offline: devolve a quantidade de linhas gravada para o SQL, no tempo gravado"""
+
+    def __init__(self, records: List[Dict[str, Any]], use_recorded_timings: bool = True, default_rows: int = 10):
+        self.use_recorded_timings = use_recorded_timings
+        self.default_rows = default_rows
+        self.by_sql: Dict[str, Dict[str, Any]] = {}
+        for record in records:
+            if record.get("sql"):
+                self.by_sql[extract_sql_literals(record["sql"])[0]] = record
+
+    def execute_query(self, query_type: str, query_data: Any, params: List[Any] = None,
+                      databases: Any = None, timeout: float = None, role: str = None) -> Dict[str, Any]:
+        record = self.by_sql.get(query_data) if isinstance(query_data, str) else None
+        row_count = (record or {}).get("row_count")
+        row_count = self.default_rows if row_count is None else row_count
+        execution_time = ((record or {}).get("timings") or {}).get("execute") or 0.0
+        if self.use_recorded_timings and execution_time:
+            time.sleep(execution_time)
+        return {
+            "query_type": query_type,
+            "query_data": query_data,
+            "params": params,
+            "databases": databases,
+            "execution_time": execution_time,
+            "result": [{"Id": index} for index in range(row_count)],
+            "error": None
+        }
+
+
+def build_offline_agent(records: List[Dict[str, Any]], llm: str = "stub", executor: str = "stub",
+                        use_recorded_timings: bool = True, first_token_latency: float = 0.2):
+    """
+    Monta um IntelligenceAgent que não depende do Gemini (e, opcionalmente, do banco)
+
+    Args:
+        records: Registros capturados
+        llm: "stub" (respostas sintéticas) ou "recorded" (respostas gravadas)
+        executor: "stub" (linhas simuladas) ou "real" (executa no banco configurado)
+        use_recorded_timings: Reproduz os tempos gravados de cada etapa
+        first_token_latency: Latência até o primeiro trecho nas respostas sintéticas
+    """
+    from intelligence_agent import IntelligenceAgent
+    from similarity_index import SimilarityIndex
+    from sql_templates import TemplateStore
+
+    agent = IntelligenceAgent()
+    client = StubLLMClient(
+        recorded=records if llm == "recorded" else None,
+        first_token_latency=first_token_latency,
+        use_recorded_timings=use_recorded_timings and llm == "recorded"
+    )
+    agent.analyzer.llm_client = client
+    agent.query_generator.llm_client = client
+    agent.result_processor.llm_client = client
+    if executor == "stub":
+        agent.executor = StubExecutor(records, use_recorded_timings)
+    # O replay não grava captura nem altera os caches persistidos
+    agent.traffic_recorder = None
+    if agent.similarity_index is not None:
+        agent.similarity_index = SimilarityIndex(dict(SIMILARITY_CONFIG, index_path=None))
+    if agent.template_store is not None:
+        agent.template_store = TemplateStore(dict(TEMPLATE_CONFIG))
+    return agent
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def replay(agent, records: List[Dict[str, Any]], speed: Optional[float] = None,
+           concurrency: int = 16) -> Dict[str, Any]:
+    """
+    Reenvia os registros ao agente
+
+    Args:
+        agent: Agente (real ou offline) com `process_query`
+        records: Registros capturados, em ordem
+        speed: Fator sobre os intervalos originais (1.0 = original, 2.0 = duas vezes
+            mais rápido); None envia tudo sem esperar
+        concurrency: Máximo de requisições simultâneas
+
+    Returns:
+        Relatório com latência, vazão, erros e tempos médios por etapa
+    """
+    latencies: List[float] = []
+    stage_times: Dict[str, List[float]] = {}
+    errors = 0
+    lock = threading.Lock()
+
+    def run(record: Dict[str, Any]) -> None:
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            result = agent.process_query(record["query"], session_id=record.get("session_id"))
+            failed = bool(result.get("error"))
+            timings = result.get("timings") or {}
+        except Exception as e:
+            logger.error(f"Erro no replay de '{record.get('query')}': {str(e)}")
+            failed, timings = True, {}
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            errors += failed
+            for stage, value in timings.items():
+                stage_times.setdefault(stage, []).append(value)
+
+    records = [record for record in records if record.get("query")]
+    base_ts = records[0].get("ts", 0) if records else 0
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="replay") as pool:
+        for record in records:
+            if speed:
+                delay = (record.get("ts", base_ts) - base_ts) / speed - (time.perf_counter() - started)
+                if delay > 0:
+                    time.sleep(delay)
+            pool.submit(run, record)
+    duration = time.perf_counter() - started
+
+    return {
+        "requests": len(records),
+        "errors": errors,
+        "duration": duration,
+        "throughput": len(records) / duration if duration else 0.0,
+        "latency": {
+            "avg": sum(latencies) / len(latencies) if latencies else 0.0,
+            "p50": _percentile(latencies, 0.50),
+            "p90": _percentile(latencies, 0.90),
+            "p99": _percentile(latencies, 0.99),
+            "max": max(latencies) if latencies else 0.0
+        },
+        "stages": {stage: sum(values) / len(values) for stage, values in stage_times.items()}
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"Requisições: {report['requests']} | Erros: {report['errors']} | "
+          f"Duração: {report['duration']:.2f} s | Vazão: {report['throughput']:.2f} req/s")
+    latency = report["latency"]
+    print("Latência (ms): " + " | ".join(f"{name} {latency[name] * 1000:.1f}"
+                                          for name in ("avg", "p50", "p90", "p99", "max")))
+    if report["stages"]:
+        print("Tempo médio por etapa (ms): " + " | ".join(f"{stage} {value * 1000:.1f}"
+                                                       for stage, value in sorted(report["stages"].items())))
+
+
+def _parse_speed(value: str) -> Optional[float]:
+    if value == "max":
+        return None
+    if value == "original":
+        return 1.0
+    return float(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("paths", nargs="+", help="Arquivos de captura (.jsonl.gz/.jsonl) ou diretórios")
+    parser.add_argument("--speed", default="original",
+                        help="original, max ou fator de aceleração (ex.: 10 = dez vezes mais rápido)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--llm", choices=["stub", "recorded"], default="recorded")
+    parser.add_argument("--executor", choices=["stub", "real"], default="stub")
+    parser.add_argument("--no-recorded-timings", action="store_true",
+                        help="Não reproduz os tempos gravados de LLM e execução")
+    parser.add_argument("--limit", type=int, default=None, help="Número máximo de registros")
+    parser.add_argument("--json", action="store_true", help="Imprime o relatório em JSON")
+    args = parser.parse_args()
+
+    records = list(read_capture(args.paths))
+    if args.limit:
+        records = records[:args.limit]
+    agent = build_offline_agent(records, args.llm, args.executor, not args.no_recorded_timings)
+    report = replay(agent, records, _parse_speed(args.speed), args.concurrency)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()